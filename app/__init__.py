@@ -22,11 +22,21 @@ def create_app(config_name=None):
     config_name = config_name or os.environ.get('FLASK_CONFIG', 'default')
     app.config.from_object(config[config_name])
     
+    # Database del registro contratti VoIP (bind 'contracts'), se non configurato in config.py
+    from app.utils.env_manager import CONTRACTS_DATABASE_URL
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds.setdefault('contracts', CONTRACTS_DATABASE_URL)
+    app.config['SQLALCHEMY_BINDS'] = binds
+    
     # Inizializzazione estensioni
     db.init_app(app)
     jwt.init_app(app)
     migrate.init_app(app, db)
     
+    # Job in background (dispatcher e pool avviati al primo uso in ogni worker)
+    from app.utils.background_jobs import job_runner
+    job_runner.init_app(app)
+    
     # Registrazione blueprints
     from app.auth import auth_bp
     from app.web import web_bp
@@ -48,7 +58,7 @@ def create_app(config_name=None):
     # register_error_handlers(app)
     
     # Importazione modelli per le migrazioni
-    from app.models import User, Role, Company
+    from app.models import User, Role, Company, Contract, ContractPhoneNumber, ContractRegistryState, BackgroundJob
     
     # Registrazione context processor per templates
     @app.context_processor
@@ -102,6 +112,9 @@ def create_app(config_name=None):
     # Middleware per caricare utente da sessione
     @app.before_request
     def load_user():
+        # I file statici non usano l'utente: nessuna query
+        if request.endpoint == 'static':
+            return
         from app.auth.jwt_session import load_unified_user
         load_unified_user()
     
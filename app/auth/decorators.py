@@ -1,7 +1,7 @@
 from functools import wraps
 from flask import jsonify, flash, redirect, url_for, g
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.user import User
+from app.auth.identity import get_active_user
 
 # ==================== DECORATORI WEB ====================
 
@@ -87,8 +87,7 @@ def api_role_required(*roles):
         @jwt_required()
         def decorated_function(*args, **kwargs):
             current_user_uid = get_jwt_identity()
-            # user = User.query.get(current_user_uid)
-            user = User.find_by_uid(current_user_uid) 
+            user = get_active_user(current_user_uid)
 
             if not user or not user.is_active or not user.is_email_confirmed:
                 return jsonify({
@@ -118,8 +117,7 @@ def api_admin_required(f):
     @jwt_required()
     def decorated_function(*args, **kwargs):
         current_user_uid = get_jwt_identity()
-        # user = User.query.get(current_user_uid)
-        user = User.find_by_uid(current_user_uid) 
+        user = get_active_user(current_user_uid)
         
         if not user or not user.is_active or not user.is_email_confirmed:
             return jsonify({
@@ -147,8 +145,7 @@ def api_moderator_required(f):
     @jwt_required()
     def decorated_function(*args, **kwargs):
         current_user_uid = get_jwt_identity()
-        # user = User.query.get(current_user_uid)
-        user = User.find_by_uid(current_user_uid) 
+        user = get_active_user(current_user_uid)
         
         if not user or not user.is_active or not user.is_email_confirmed:
             return jsonify({
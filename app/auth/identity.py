@@ -0,0 +1,247 @@
+"""
+Risoluzione dell'utente autenticato
+
+L'utente (JWT cookie o sessione) viene risolto una sola volta per richiesta e
+memorizzato in g: load_unified_user e i decoratori di autenticazione riusano
+lo stesso oggetto, caricato insieme ai ruoli con un'unica query.
+
+Per processo si tiene inoltre, per IDENTITY_CACHE_TTL secondi, lo stato
+dell'utente (esistente, attivo, email confermata, nomi dei ruoli): gli uid
+sconosciuti o disattivati vengono rifiutati senza interrogare il database e
+per gli utenti attivi si restituisce un CachedUser, che risponde ai controlli
+di stato e di ruolo dalla cache e carica l'utente solo se servono altri campi.
+Ogni flush (o istruzione DML) che modifica utenti, ruoli o user_roles
+invalida la cache del processo; tra worker diversi la validità è limitata dal
+TTL.
+"""
+import threading
+import time
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple, Union
+
+from flask import g, has_request_context
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models.user import User
+from app.models.role import Role, user_roles
+from app.utils.env_manager import IDENTITY_CACHE_TTL
+
+
+class Identity(NamedTuple):
+    """Stato di autorizzazione di un utente"""
+    exists: bool
+    is_active: bool
+    is_email_confirmed: bool
+    roles: Tuple[str, ...]
+    id: Optional[int]
+
+    @classmethod
+    def of(cls, user: Optional[User]) -> 'Identity':
+        if user is None:
+            return cls(False, False, False, (), None)
+        return cls(True, bool(user.is_active), bool(user.is_email_confirmed),
+                   tuple(user.get_role_names()), user.id)
+
+
+class CachedUser:
+    """
+    Utente attivo risolto dalla cache
+
+    Stato e ruoli vengono dall'Identity in cache; qualsiasi altro attributo
+    (o scrittura) carica l'utente dal database alla prima richiesta.
+    """
+
+    __slots__ = ('uid', '_identity', '_user')
+
+    def __init__(self, uid: str, identity: Identity):
+        object.__setattr__(self, 'uid', uid)
+        object.__setattr__(self, '_identity', identity)
+        object.__setattr__(self, '_user', None)
+
+    @property
+    def id(self) -> Optional[int]:
+        return self._identity.id
+
+    @property
+    def is_active(self) -> bool:
+        return self._identity.is_active
+
+    @property
+    def is_email_confirmed(self) -> bool:
+        return self._identity.is_email_confirmed
+
+    def get_role_names(self):
+        return list(self._identity.roles)
+
+    def has_role(self, role_name) -> bool:
+        return role_name in self._identity.roles
+
+    def has_any_role(self, role_names: Iterable[str]) -> bool:
+        return any(self.has_role(role_name) for role_name in role_names)
+
+    def has_all_roles(self, role_names: Iterable[str]) -> bool:
+        return all(self.has_role(role_name) for role_name in role_names)
+
+    def is_admin(self) -> bool:
+        return self.has_role('admin')
+
+    def can_manage_users(self) -> bool:
+        return self.has_any_role(['admin', 'moderator'])
+
+    def _load(self) -> User:
+        if self._user is None:
+            user = User.find_by_uid(self.uid)
+            if user is None:
+                _identity_cache.invalidate(self.uid)
+                raise LookupError(f"Utente {self.uid} non più presente")
+            object.__setattr__(self, '_user', user)
+        return self._user
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __repr__(self) -> str:
+        return f'<CachedUser {self.uid}>'
+
+
+class IdentityCache:
+    """Cache per processo uid -> Identity con scadenza"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[Identity, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, uid: str) -> Optional[Identity]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[uid]
+                return None
+            return entry[0]
+
+    def set(self, uid: str, identity: Identity) -> None:
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._entries[uid] = (identity, now + self.ttl)
+            # Pulizia delle voci scadute quando la cache cresce
+            if len(self._entries) > 1024:
+                for key in [key for key, (_, expires) in self._entries.items() if expires <= now]:
+                    del self._entries[key]
+
+    def invalidate(self, uid: Optional[str] = None) -> None:
+        """Invalida un utente o, senza uid, l'intera cache"""
+        with self._lock:
+            if uid is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(uid), None)
+
+
+_identity_cache = IdentityCache(IDENTITY_CACHE_TTL)
+
+
+def _request_users() -> Optional[Dict[str, Optional[User]]]:
+    """Utenti già risolti nella richiesta corrente (None fuori da una richiesta)"""
+    if not has_request_context():
+        return None
+    users = g.get('_identity_users')
+    if users is None:
+        users = g._identity_users = {}
+    return users
+
+
+def get_jwt_uid() -> Optional[str]:
+    """
+    uid presente nel JWT cookie della richiesta, verificato una sola volta
+
+    Returns:
+        uid o None se il token manca o non è valido
+    """
+    if has_request_context() and '_identity_jwt_uid' in g:
+        return g._identity_jwt_uid
+
+    try:
+        verify_jwt_in_request(optional=True)
+        uid = get_jwt_identity()
+    except Exception:
+        uid = None
+
+    if has_request_context():
+        g._identity_jwt_uid = uid
+    return uid
+
+
+def get_active_user(uid) -> Optional[Union[User, CachedUser]]:
+    """
+    Restituisce l'utente attivo con l'uid indicato
+
+    L'utente viene caricato con i ruoli in un'unica query e riusato per il
+    resto della richiesta. Se l'uid è in cache non si interroga il database:
+    gli uid sconosciuti o disattivati danno None, quelli attivi un CachedUser.
+
+    Args:
+        uid: UID dell'utente
+
+    Returns:
+        User (o CachedUser) attivo oppure None
+    """
+    if not uid:
+        return None
+    uid = str(uid)
+
+    users = _request_users()
+    if users is not None and uid in users:
+        return users[uid]
+
+    identity = _identity_cache.get(uid)
+    if identity is not None:
+        user = CachedUser(uid, identity) if identity.is_active else None
+    else:
+        user = User.find_by_uid(uid)
+        _identity_cache.set(uid, Identity.of(user))
+        if user is not None and not user.is_active:
+            user = None
+
+    if users is not None:
+        users[uid] = user
+    return user
+
+
+def invalidate_identity(uid=None) -> None:
+    """Invalida lo stato in cache di un utente (o di tutti)"""
+    _identity_cache.invalidate(uid)
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_on_flush(session, flush_context):
+    """Invalida la cache quando vengono scritti utenti o ruoli"""
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Role):
+            _identity_cache.invalidate()
+            return
+        if isinstance(obj, User) and obj.uid:
+            _identity_cache.invalidate(obj.uid)
+
+
+_IDENTITY_TABLES = frozenset((User.__tablename__, Role.__tablename__, user_roles.name))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _invalidate_on_execute(orm_execute_state):
+    """Invalida la cache per INSERT/UPDATE/DELETE eseguiti direttamente su utenti, ruoli o user_roles"""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if getattr(table, 'name', None) in _IDENTITY_TABLES:
+        _identity_cache.invalidate()
@@ -3,37 +3,25 @@ from flask import session, request, jsonify, redirect, url_for, g
 from flask_jwt_extended import (
     create_access_token, 
     set_access_cookies, 
-    unset_jwt_cookies,
-    verify_jwt_in_request,
-    get_jwt_identity
+    unset_jwt_cookies
 )
-from app.models.user import User
+from app.auth.identity import get_active_user, get_jwt_uid
 
 def unified_login_required(f):
     """Decorator che supporta sia sessioni che JWT cookies"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Prima prova JWT cookie
-        try:
-            verify_jwt_in_request(optional=True)
-            user_uid = get_jwt_identity()
-            if user_uid:
-                # USA find_by_uid invece di query.get
-                user = User.find_by_uid(user_uid)  # ← CAMBIATO
-                if user and user.is_active:
-                    g.user = user
-                    return f(*args, **kwargs)
-        except Exception:
-            pass
+        # Prima prova JWT cookie (utente già risolto da load_unified_user)
+        user = get_active_user(get_jwt_uid())
+        if user:
+            g.user = user
+            return f(*args, **kwargs)
         
         # Fallback su sessione esistente
-        user_uid = session.get('user_uid')
-        if user_uid:
-            # USA find_by_uid invece di query.get
-            user = User.find_by_uid(user_uid)  # ← CAMBIATO
-            if user and user.is_active:
-                g.user = user
-                return f(*args, **kwargs)
+        user = get_active_user(session.get('user_uid'))
+        if user:
+            g.user = user
+            return f(*args, **kwargs)
         
         # Nessuna autenticazione valida
         return redirect(url_for('auth.web_login'))
@@ -98,24 +86,16 @@ def unified_logout_user():
 def load_unified_user():
     """Carica l'utente da JWT cookie o sessione"""
     # Prima prova JWT cookie
-    try:
-        verify_jwt_in_request(optional=True)
-        user_uid = get_jwt_identity()
-        if user_uid:
-            # USA find_by_uid invece di query.get
-            user = User.find_by_uid(user_uid)  # ← CAMBIATO
-            if user and user.is_active:
-                g.user = user
-                return
-    except Exception:
-        pass
+    user = get_active_user(get_jwt_uid())
+    if user:
+        g.user = user
+        return
     
     # Fallback su sessione esistente
     user_uid = session.get('user_uid')
     if user_uid:
-        # USA find_by_uid invece di query.get
-        user = User.find_by_uid(user_uid)  # ← CAMBIATO
-        if user and user.is_active:
+        user = get_active_user(user_uid)
+        if user:
             g.user = user
         else:
             g.user = None
@@ -1,7 +1,6 @@
 from functools import wraps
 from flask import session, request, jsonify, redirect, url_for, g
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
-from app.models.user import User
+from app.auth.identity import get_active_user, get_jwt_uid
 
 def unified_api_login_required(f):
     """Decorator per API che supporta sia JWT cookies che sessioni"""
@@ -9,26 +8,17 @@ def unified_api_login_required(f):
     def decorated_function(*args, **kwargs):
         user = None
         
-        # Prima prova JWT cookie
-        try:
-            verify_jwt_in_request(optional=True)
-            user_uid_str = get_jwt_identity()
-            if user_uid_str:
-                # user_uid = int(user_uid_str)
-                # user = User.query.filter_by(uid=user_uid).first()
-                user = User.find_by_uid(user_uid_str) 
-                if user and user.is_active and user.is_email_confirmed:
-                    g.current_user = user
-                    return f(*args, **kwargs)
-        except Exception:
-            pass
+        # Prima prova JWT cookie (utente già risolto da load_unified_user)
+        user = get_active_user(get_jwt_uid())
+        if user and user.is_email_confirmed:
+            g.current_user = user
+            return f(*args, **kwargs)
         
         # Fallback su sessione Flask
         user_uid = session.get('user_uid')
         if user_uid:
-            # user = User.query.filter_by(uid=user_uid).first()
-            user = User.find_by_uid(user_uid) 
-            if user and user.is_active and user.is_email_confirmed:
+            user = get_active_user(user_uid)
+            if user and user.is_email_confirmed:
                 g.current_user = user
                 return f(*args, **kwargs)
         
@@ -48,26 +38,17 @@ def unified_api_admin_required(f):
     def decorated_function(*args, **kwargs):
         user = None
         
-        # Prima prova JWT cookie
-        try:
-            verify_jwt_in_request(optional=True)
-            user_uid_str = get_jwt_identity()
-            if user_uid_str:
-                # user_uid = int(user_uid_str)
-                # user = User.query.filter_by(uid=user_uid).first()
-                user = User.find_by_uid(user_uid_str) 
-                if user and user.is_active and user.is_email_confirmed and user.is_admin():
-                    g.current_user = user
-                    return f(*args, **kwargs)
-        except Exception:
-            pass
+        # Prima prova JWT cookie (utente già risolto da load_unified_user)
+        user = get_active_user(get_jwt_uid())
+        if user and user.is_email_confirmed and user.is_admin():
+            g.current_user = user
+            return f(*args, **kwargs)
         
         # Fallback su sessione Flask
         user_uid = session.get('user_uid')
         if user_uid:
-            # user = User.query.filter_by(uid=user_uid).first()
-            user = User.find_by_uid(user_uid) 
-            if user and user.is_active and user.is_email_confirmed and user.is_admin():
+            user = get_active_user(user_uid)
+            if user and user.is_email_confirmed and user.is_admin():
                 g.current_user = user
                 return f(*args, **kwargs)
         
@@ -97,25 +78,17 @@ def unified_api_moderator_required(f):
     def decorated_function(*args, **kwargs):
         user = None
         
-        # Prima prova JWT cookie
-        try:
-            verify_jwt_in_request(optional=True)
-            user_uid_str = get_jwt_identity()
-            if user_uid_str:
-                # user_uid = int(user_uid_str)
-                # user = User.query.filter_by(uid=user_uid).first()
-                user = User.find_by_uid(user_uid_str) 
-                if user and user.is_active and user.is_email_confirmed and user.can_manage_users():
-                    g.current_user = user
-                    return f(*args, **kwargs)
-        except Exception:
-            pass
+        # Prima prova JWT cookie (utente già risolto da load_unified_user)
+        user = get_active_user(get_jwt_uid())
+        if user and user.is_email_confirmed and user.can_manage_users():
+            g.current_user = user
+            return f(*args, **kwargs)
         
         # Fallback su sessione Flask
         user_uid = session.get('user_uid')
         if user_uid:
-            user = User.query.filter_by(uid=user_uid).first()
-            if user and user.is_active and user.is_email_confirmed and user.can_manage_users():
+            user = get_active_user(user_uid)
+            if user and user.is_email_confirmed and user.can_manage_users():
                 g.current_user = user
                 return f(*args, **kwargs)
         
@@ -1,6 +1,6 @@
 from functools import wraps
 from flask import session, redirect, url_for, g
-from app.models.user import User
+from app.auth.identity import get_active_user
 from app.auth.jwt_session import unified_login_required
 
 login_required = unified_login_required
@@ -21,9 +21,8 @@ def load_logged_in_user():
     if user_uid is None:
         g.user = None
     else:
-        g.user = User.find_by_uid(user_uid)
-        if g.user and not g.user.is_active:
-            g.user = None
+        g.user = get_active_user(user_uid)
+        if not g.user:
             session.clear()
 
 def login_user(user):
@@ -5,6 +5,8 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') 
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Registro contratti VoIP (default: SQLite in ARCHIVE_DIRECTORY/CONTACTS_FOLDER)
+    # SQLALCHEMY_BINDS = {'contracts': os.environ.get('CONTRACTS_DATABASE_URL')}
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
@@ -1,5 +1,7 @@
 from .user import User
 from .role import Role, user_roles
 from .company import Company
+from .contract import Contract, ContractPhoneNumber, ContractRegistryState
+from .job import BackgroundJob
 
-__all__ = ['User', 'Role', 'user_roles', 'Company']
\ No newline at end of file
+__all__ = ['User', 'Role', 'user_roles', 'Company', 'Contract', 'ContractPhoneNumber', 'ContractRegistryState', 'BackgroundJob']
\ No newline at end of file
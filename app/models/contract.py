@@ -0,0 +1,59 @@
+from app import db
+from datetime import datetime
+
+# Registro contratti VoIP: database separato (bind 'contracts', SQLite di default)
+# gestito da app/voip_cdr/cdr_contract_store.py. Il contenuto completo di ogni
+# contratto è in `data` (JSON, stesso formato di contracts.json); le colonne
+# odoo_client_id, contract_type e contract_name ne sono una copia indicizzata.
+
+class Contract(db.Model):
+    __tablename__ = 'contracts'
+    __bind_key__ = 'contracts'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    contract_code = db.Column(db.String(64), unique=True, nullable=False)
+    contract_name = db.Column(db.String(255), nullable=True)
+    odoo_client_id = db.Column(db.String(64), nullable=True, index=True)
+    contract_type = db.Column(db.String(64), nullable=True, index=True)
+    data = db.Column(db.Text, nullable=False)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    phone_numbers = db.relationship('ContractPhoneNumber', back_populates='contract',
+                                    cascade='all, delete-orphan', passive_deletes=True)
+
+    def __repr__(self):
+        return f'<Contract {self.contract_code}>'
+
+
+class ContractPhoneNumber(db.Model):
+    __tablename__ = 'contract_phone_numbers'
+    __bind_key__ = 'contracts'
+    __table_args__ = (
+        db.UniqueConstraint('contract_id', 'phone_number', name='uq_contract_phone_number'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    contract_id = db.Column(db.Integer, db.ForeignKey('contracts.id', ondelete='CASCADE'), nullable=False)
+    phone_number = db.Column(db.String(64), nullable=False, index=True)
+
+    contract = db.relationship('Contract', back_populates='phone_numbers')
+
+    def __repr__(self):
+        return f'<ContractPhoneNumber {self.phone_number}>'
+
+
+class ContractRegistryState(db.Model):
+    """Riga unica (id=1) con revisione del registro e metadati di contracts.json"""
+    __tablename__ = 'contract_registry_state'
+    __bind_key__ = 'contracts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+    exported_revision = db.Column(db.Integer, nullable=False, default=0)
+    metadata_json = db.Column(db.Text, nullable=True)
+    last_extraction_json = db.Column(db.Text, nullable=True)
+    imported_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<ContractRegistryState rev={self.revision}>'
@@ -0,0 +1,84 @@
+from app import db
+from datetime import datetime
+import json
+import uuid
+
+# Job in background (app/utils/background_jobs.py). La tabella è la fonte di
+# verità condivisa tra i worker: stato, avanzamento, richiesta di annullamento
+# e risultato sono leggibili da qualsiasi processo.
+#
+# unique_name vale name per i job registrati come unici: l'indice univoco
+# parziale sui job attivi impedisce che due invii concorrenti ne mettano in
+# coda due con lo stesso nome.
+
+_ACTIVE_CONDITION = "status IN ('queued', 'running')"
+
+class BackgroundJob(db.Model):
+    __tablename__ = 'background_jobs'
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    __table_args__ = (
+        db.Index('uq_background_jobs_unique_active', 'unique_name', unique=True,
+                 postgresql_where=db.text(_ACTIVE_CONDITION),
+                 sqlite_where=db.text(_ACTIVE_CONDITION)),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    name = db.Column(db.String(100), nullable=False, index=True)
+    unique_name = db.Column(db.String(100), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default=STATUS_QUEUED, index=True)
+    progress = db.Column(db.Float, nullable=False, default=0)
+    message = db.Column(db.String(255), nullable=True)
+    params_json = db.Column(db.Text, nullable=True)
+    result_json = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_by = db.Column(db.String(255), nullable=True)
+    worker = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    @property
+    def params(self):
+        return json.loads(self.params_json) if self.params_json else {}
+
+    @property
+    def result(self):
+        return json.loads(self.result_json) if self.result_json else None
+
+    def to_dict(self, include_result=True):
+        """Converte il job in dizionario"""
+        data = {
+            'job_id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'cancel_requested': self.cancel_requested,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'error': self.error
+        }
+
+        if include_result:
+            data['params'] = self.params
+            data['result'] = self.result
+
+        return data
+
+    def __repr__(self):
+        return f'<BackgroundJob {self.name} {self.id} {self.status}>'
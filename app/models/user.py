@@ -257,8 +257,8 @@ class User(db.Model):
     
     @classmethod
     def find_by_uid(cls, uid):
-        """Trova utente per UID"""
-        return cls.query.filter_by(uid=uid).first()
+        """Trova utente per UID (ruoli caricati nella stessa query)"""
+        return cls.query.options(db.joinedload(cls.roles)).filter_by(uid=uid).first()
     
     @classmethod
     def get_by_uid(cls, uid):
@@ -130,26 +130,7 @@ class Abbonamenti:
             )[0]
             
             # Trova o crea prodotto addebiti
-            product_ids = models.execute_kw(
-                self.odoo_db, uid, self.odoo_password,
-                'product.product', 'search',
-                [[('default_code', '=', 'VoIP_EXTRA')]]
-            )
-            
-            if not product_ids:
-                product_id = models.execute_kw(
-                    self.odoo_db, uid, self.odoo_password,
-                    'product.product', 'create',
-                    [{
-                        'name': 'Traffico VoIP extra soglia.',
-                        'default_code': 'VoIP_EXTRA',
-                        'type': 'service',
-                        'list_price': 0.0,
-                        'invoice_policy': 'order',
-                    }]
-                )
-            else:
-                product_id = product_ids[0]
+            product_id = self._get_prodotto_addebiti(models, uid)
             
             # Aggiungi riga addebito
             order_line_id = models.execute_kw(
@@ -180,6 +161,198 @@ class Abbonamenti:
                 'error': str(e)
             }
 
+    def _get_prodotto_addebiti(self, models, uid):
+        """
+        Trova o crea il prodotto usato per gli addebiti di traffico extra
+        
+        Returns:
+            int: ID del prodotto VoIP_EXTRA
+        """
+        product_ids = models.execute_kw(
+            self.odoo_db, uid, self.odoo_password,
+            'product.product', 'search',
+            [[('default_code', '=', 'VoIP_EXTRA')]]
+        )
+        
+        if product_ids:
+            return product_ids[0]
+        
+        return models.execute_kw(
+            self.odoo_db, uid, self.odoo_password,
+            'product.product', 'create',
+            [{
+                'name': 'Traffico VoIP extra soglia.',
+                'default_code': 'VoIP_EXTRA',
+                'type': 'service',
+                'list_price': 0.0,
+                'invoice_policy': 'order',
+            }]
+        )
+
+    def aggiungi_addebiti_batch(self, addebiti, chunk_size=100):
+        """
+        Aggiunge più addebiti con un numero fisso di chiamate a Odoo
+        
+        Autenticazione e prodotto vengono risolti una sola volta, gli abbonamenti
+        di tutti i partner con una sola search_read e le righe vengono create
+        a blocchi di chunk_size con un'unica create multi-record.
+        
+        Args:
+            addebiti (list): Lista di tuple (odoo_id, importo, descrizione) oppure
+                             di dict con chiavi odoo_id, importo, descrizione e
+                             opzionalmente contract_code
+            chunk_size (int): Numero massimo di righe per ogni create
+            
+        Returns:
+            dict: Riepilogo con 'risultati' nello stesso ordine di addebiti;
+                  ogni elemento ha lo stesso formato di aggiungi_addebito_a_partner
+        """
+        voci = []
+        for addebito in addebiti or []:
+            if isinstance(addebito, dict):
+                voci.append({
+                    'odoo_id': addebito.get('odoo_id'),
+                    'contract_code': addebito.get('contract_code'),
+                    'importo': addebito.get('importo'),
+                    'descrizione': addebito.get('descrizione', '')
+                })
+            else:
+                odoo_id, importo, descrizione = addebito
+                voci.append({
+                    'odoo_id': odoo_id,
+                    'contract_code': None,
+                    'importo': importo,
+                    'descrizione': descrizione
+                })
+        
+        risultati = [None] * len(voci)
+        riepilogo = {
+            'success': True,
+            'timestamp': datetime.now().isoformat(),
+            'totale': len(voci),
+            'applicati': 0,
+            'falliti': 0,
+            'risultati': risultati
+        }
+        
+        if not voci:
+            return riepilogo
+        
+        def fallito(indice, errore):
+            risultati[indice] = {
+                'success': False,
+                'error': errore
+            }
+        
+        try:
+            print(f"🔄 Aggiunta di {len(voci)} addebiti in blocco")
+            
+            # Connessione Odoo (una sola autenticazione per tutto il batch)
+            common = xmlrpc.client.ServerProxy(f'{self.odoo_url}/xmlrpc/2/common')
+            uid = common.authenticate(self.odoo_db, self.odoo_user, self.odoo_password, {})
+            
+            if not uid:
+                for i in range(len(voci)):
+                    fallito(i, 'Autenticazione Odoo fallita')
+                return self._chiudi_riepilogo_batch(riepilogo)
+            
+            models = xmlrpc.client.ServerProxy(f'{self.odoo_url}/xmlrpc/2/object')
+            
+            # Validazione partner
+            partner_ids = set()
+            for i, voce in enumerate(voci):
+                try:
+                    voce['odoo_id'] = int(voce['odoo_id'])
+                    voce['importo'] = float(voce['importo'])
+                    partner_ids.add(voce['odoo_id'])
+                except (TypeError, ValueError):
+                    fallito(i, f"Dati addebito non validi: partner {voce['odoo_id']}, importo {voce['importo']}")
+            
+            # Abbonamenti di tutti i partner: il primo nell'ordine di default
+            # di sale.order è lo stesso restituito dalla search singola
+            subscriptions = models.execute_kw(
+                self.odoo_db, uid, self.odoo_password,
+                'sale.order', 'search_read',
+                [[
+                    ('partner_id', 'in', sorted(partner_ids)),
+                    ('state', 'in', ['sale', 'done'])
+                ]],
+                {'fields': ['name', 'partner_id']}
+            ) if partner_ids else []
+            
+            subscription_by_partner = {}
+            for subscription in subscriptions:
+                partner = subscription.get('partner_id')
+                if partner:
+                    subscription_by_partner.setdefault(partner[0], subscription)
+            
+            product_id = self._get_prodotto_addebiti(models, uid)
+            
+            # Righe da creare
+            pendenti = []
+            for i, voce in enumerate(voci):
+                if risultati[i] is not None:
+                    continue
+                
+                subscription = subscription_by_partner.get(voce['odoo_id'])
+                if subscription is None:
+                    fallito(i, f"Nessun abbonamento attivo trovato per partner {voce['odoo_id']}")
+                    continue
+                
+                pendenti.append((i, subscription, {
+                    'order_id': subscription['id'],
+                    'product_id': product_id,
+                    'name': f"Dettaglio: \n{voce['descrizione']}",
+                    'product_uom_qty': 1.0,
+                    'price_unit': voce['importo'],
+                }))
+            
+            # Create multi-record a blocchi
+            for start in range(0, len(pendenti), max(1, int(chunk_size))):
+                blocco = pendenti[start:start + max(1, int(chunk_size))]
+                try:
+                    line_ids = models.execute_kw(
+                        self.odoo_db, uid, self.odoo_password,
+                        'sale.order.line', 'create',
+                        [[vals for _, _, vals in blocco]]
+                    )
+                    if not isinstance(line_ids, list):
+                        line_ids = [line_ids]
+                except Exception as e:
+                    for i, _, _ in blocco:
+                        fallito(i, str(e))
+                    continue
+                
+                for (i, subscription, vals), order_line_id in zip(blocco, line_ids):
+                    voce = voci[i]
+                    contratto = voce['contract_code'] or voce['odoo_id']
+                    risultati[i] = {
+                        'success': True,
+                        'message': f"Addebito di €{voce['importo']} aggiunto al contratto {contratto}",
+                        'subscription_id': subscription['id'],
+                        'subscription_name': subscription['name'],
+                        'partner_name': subscription['partner_id'][1] if subscription['partner_id'] else 'N/A',
+                        'order_line_id': order_line_id,
+                        'importo': voce['importo']
+                    }
+            
+        except Exception as e:
+            logger.error(f"Errore addebiti in blocco: {e}")
+            for i in range(len(voci)):
+                if risultati[i] is None:
+                    fallito(i, str(e))
+        
+        return self._chiudi_riepilogo_batch(riepilogo)
+
+    def _chiudi_riepilogo_batch(self, riepilogo):
+        """Calcola i contatori finali del riepilogo di aggiungi_addebiti_batch"""
+        risultati = riepilogo['risultati']
+        riepilogo['applicati'] = sum(1 for r in risultati if r and r.get('success'))
+        riepilogo['falliti'] = len(risultati) - riepilogo['applicati']
+        riepilogo['success'] = riepilogo['falliti'] == 0
+        print(f"📊 Addebiti in blocco: {riepilogo['applicati']} applicati, {riepilogo['falliti']} falliti")
+        return riepilogo
+
     def processa_addebiti_da_lista(self, contracts_list, target_contract_types=['41'], importo_default=25.50):
         """
         Processo principale: riceve lista contratti e applica addebiti ai tipi specificati
@@ -281,15 +454,18 @@ class Abbonamenti:
             
             print(f"\n🔄 Applicazione addebiti a {len(contratti_target)} contratti...")
             
-            for contratto in contratti_target:
-                print(f"\n   📌 Processando contratto {contratto['contract_code']}...")
-                
-                addebito_result = self.aggiungi_addebito_a_partner(
-                    odoo_id=contratto['odoo_id'],
-                    contract_code=contratto['contract_code'],
-                    importo=importo_default,
-                    descrizione=f"Addebito automatico tipo {contratto['contract_type']}"
-                )
+            batch_result = self.aggiungi_addebiti_batch([
+                {
+                    'odoo_id': contratto['odoo_id'],
+                    'contract_code': contratto['contract_code'],
+                    'importo': importo_default,
+                    'descrizione': f"Addebito automatico tipo {contratto['contract_type']}"
+                }
+                for contratto in contratti_target
+            ])
+            
+            for contratto, addebito_result in zip(contratti_target, batch_result['risultati']):
+                print(f"\n   📌 Contratto {contratto['contract_code']}...")
                 
                 if addebito_result['success']:
                     risultati['addebiti_applicati'] += 1
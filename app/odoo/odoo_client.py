@@ -6,6 +6,8 @@ import xmlrpc.client
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 import time
+import bisect
+import queue
 import threading
 from contextlib import contextmanager
 
@@ -24,6 +26,184 @@ except ImportError:
 
 logger = get_logger(__name__)
 
+
+class OdooRateLimiter:
+    """Token bucket per limitare le richieste al secondo senza serializzarle"""
+    
+    def __init__(self, rate: float, capacity: Optional[int] = None):
+        """
+        Args:
+            rate: Richieste al secondo consentite (<= 0 disabilita il limite)
+            capacity: Burst massimo di richieste consecutive (default 1)
+        """
+        self.rate = float(rate or 0)
+        self.capacity = max(1, int(capacity or 1))
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        
+        self.throttled = 0
+        self.total_wait = 0.0
+    
+    def acquire(self) -> float:
+        """Attende un token disponibile e restituisce i secondi di attesa"""
+        if self.rate <= 0:
+            return 0.0
+        
+        waited = 0.0
+        while True:
+            # Il lock protegge solo il conteggio dei token: l'attesa avviene fuori
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    if waited:
+                        self.throttled += 1
+                        self.total_wait += waited
+                    return waited
+                
+                wait_time = (1 - self._tokens) / self.rate
+            
+            time.sleep(wait_time)
+            waited += wait_time
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'max_requests_per_second': self.rate,
+            'burst': self.capacity,
+            'throttled_requests': self.throttled,
+            'total_throttle_wait': round(self.total_wait, 3)
+        }
+
+
+class OdooConnectionPool:
+    """Pool di proxy XML-RPC verso /xmlrpc/2/object con connessioni keep-alive"""
+    
+    # Limiti superiori (secondi) dei bucket dell'istogramma di latenza delle chiamate
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    
+    def __init__(self, url: str, size: int):
+        """
+        Args:
+            url: URL base del server Odoo
+            size: Numero massimo di richieste concorrenti
+        """
+        self.endpoint = f"{url}/xmlrpc/2/object"
+        self.size = max(1, int(size))
+        
+        # Ogni ServerProxy ha il proprio Transport (non thread-safe) che
+        # mantiene aperta la connessione HTTP tra una chiamata e l'altra
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        
+        self.created = 0
+        self.discarded = 0
+        self.requests = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.total_wait = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        # Un contatore per bucket più l'ultimo per le chiamate oltre il limite massimo
+        self.latency_counts = [0] * (len(self.LATENCY_BUCKETS) + 1)
+    
+    def _new_proxy(self) -> xmlrpc.client.ServerProxy:
+        with self._lock:
+            self.created += 1
+        return xmlrpc.client.ServerProxy(
+            self.endpoint,
+            allow_none=True,
+            use_datetime=True
+        )
+    
+    @staticmethod
+    def _close_proxy(proxy):
+        try:
+            proxy('close')()
+        except Exception:
+            pass
+    
+    @contextmanager
+    def connection(self):
+        """Presta un proxy del pool; lo scarta se la connessione si è rotta"""
+        start = time.monotonic()
+        self._slots.acquire()
+        try:
+            with self._lock:
+                self.total_wait += time.monotonic() - start
+                self.requests += 1
+                self.in_use += 1
+                self.peak_in_use = max(self.peak_in_use, self.in_use)
+            
+            try:
+                proxy = self._idle.get_nowait()
+            except queue.Empty:
+                proxy = self._new_proxy()
+            
+            healthy = True
+            call_start = time.monotonic()
+            try:
+                yield proxy
+            except xmlrpc.client.Fault:
+                # Errore applicativo Odoo: la connessione resta valida
+                raise
+            except Exception:
+                healthy = False
+                raise
+            finally:
+                self._record_latency(time.monotonic() - call_start)
+                if healthy:
+                    self._idle.put(proxy)
+                else:
+                    self._close_proxy(proxy)
+                    with self._lock:
+                        self.discarded += 1
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+    
+    def _record_latency(self, elapsed: float):
+        """Registra la durata di una chiamata nell'istogramma"""
+        index = bisect.bisect_left(self.LATENCY_BUCKETS, elapsed)
+        with self._lock:
+            self.latency_counts[index] += 1
+            self.total_latency += elapsed
+            self.max_latency = max(self.max_latency, elapsed)
+    
+    def clear(self):
+        """Chiude tutte le connessioni inattive"""
+        while True:
+            try:
+                proxy = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close_proxy(proxy)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = sum(self.latency_counts)
+            histogram = {f"le_{bound:g}s": count for bound, count in zip(self.LATENCY_BUCKETS, self.latency_counts)}
+            histogram[f"gt_{self.LATENCY_BUCKETS[-1]:g}s"] = self.latency_counts[-1]
+            return {
+                'pool_size': self.size,
+                'idle_connections': self._idle.qsize(),
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'connections_created': self.created,
+                'connections_discarded': self.discarded,
+                'requests': self.requests,
+                'total_pool_wait': round(self.total_wait, 3),
+                'latency_histogram': histogram,
+                'avg_latency': round(self.total_latency / calls, 3) if calls else 0.0,
+                'max_latency': round(self.max_latency, 3)
+            }
+
+
 class OdooClient:
     """Client Odoo consolidato per versione 18.2+ con gestione robusta delle connessioni"""
     
@@ -33,7 +213,6 @@ class OdooClient:
         
         # Connessione
         self.uid = None
-        self.models = None
         self.common = None
         self.version_info = None
         
@@ -41,27 +220,14 @@ class OdooClient:
         self._field_cache = {}
         self._model_cache = {}
         
-        # Gestione connessioni multiple e thread safety
+        # Gestione connessioni multiple e thread safety: il lock protegge solo
+        # l'autenticazione, le chiamate execute_kw viaggiano in parallelo sul pool
         self._connection_lock = threading.RLock()
-        self._last_request_time = 0
-        self._min_request_interval = 0.1  # 100ms tra richieste
+        self._pool = OdooConnectionPool(config.url, config.pool_size)
+        self._rate_limiter = OdooRateLimiter(config.max_requests_per_second, config.pool_size)
         self._max_retries = 3
         self._retry_delay = 0.5  # 500ms
     
-    @contextmanager
-    def _rate_limit(self):
-        """Context manager per limitare la frequenza delle richieste"""
-        with self._connection_lock:
-            current_time = time.time()
-            time_since_last = current_time - self._last_request_time
-            
-            if time_since_last < self._min_request_interval:
-                sleep_time = self._min_request_interval - time_since_last
-                time.sleep(sleep_time)
-            
-            self._last_request_time = time.time()
-            yield
-    
     def _create_fresh_connection(self):
         """Crea una nuova connessione XML-RPC"""
         try:
@@ -72,12 +238,8 @@ class OdooClient:
                 use_datetime=True
             )
             
-            # Inizializza models
-            self.models = xmlrpc.client.ServerProxy(
-                f"{self.config.url}/xmlrpc/2/object",
-                allow_none=True,
-                use_datetime=True
-            )
+            # Le connessioni verso models vengono create dal pool su richiesta
+            self._pool.clear()
             
             return True
             
@@ -158,66 +320,82 @@ class OdooClient:
         
         return any(error in str(exception_str) for error in connection_errors)
     
+    def _is_auth_error(self, exception_str: str) -> bool:
+        """Identifica errori di sessione/autenticazione che richiedono un nuovo login"""
+        auth_errors = [
+            'AccessDenied',
+            'Access Denied',
+            'SessionExpired',
+            'Session expired',
+            'Invalid credentials'
+        ]
+        
+        return any(error in str(exception_str) for error in auth_errors)
+    
     def _reset_connection(self):
         """Reset completo della connessione"""
         self.uid = None
-        self.models = None
         self.common = None
+        self._pool.clear()
         self.logger.info("Connessione resettata")
     
+    def _ensure_connected(self):
+        """Autentica una sola volta anche con più thread in attesa"""
+        if self.uid and self.common:
+            return
+        
+        with self._connection_lock:
+            if not self.uid or not self.common:
+                if not self.connect():
+                    raise OdooConnectionError("Impossibile connettersi ad Odoo")
+    
     def execute(self, model: str, method: str, *args, **kwargs):
         """Wrapper ottimizzato per execute_kw con gestione errori robusta e retry logic"""
+        # Context ottimizzato per 18.2+
+        if 'context' not in kwargs:
+            kwargs['context'] = self._get_default_context()
+        
+        # Gestione timeout per operazioni lunghe
+        if method in ['create', 'write', 'unlink'] and 'timeout' not in kwargs:
+            kwargs['timeout'] = 300
+        
         for attempt in range(self._max_retries):
+            uid = None
             try:
-                with self._rate_limit():
-                    # Verifica connessione
-                    if not self.uid or not self.models:
-                        if not self.connect():
-                            raise OdooConnectionError("Impossibile connettersi ad Odoo")
-                    
-                    # Context ottimizzato per 18.2+
-                    if 'context' not in kwargs:
-                        kwargs['context'] = self._get_default_context()
-                    
-                    # Gestione timeout per operazioni lunghe
-                    if method in ['create', 'write', 'unlink'] and 'timeout' not in kwargs:
-                        kwargs['timeout'] = 300
-                    
-                    # Esegui richiesta
-                    if kwargs:
-                        result = self.models.execute_kw(
-                            self.config.database, 
-                            self.uid, 
-                            self.config.api_key,
-                            model, 
-                            method, 
-                            list(args), 
-                            kwargs
-                        )
-                    else:
-                        result = self.models.execute_kw(
-                            self.config.database, 
-                            self.uid, 
-                            self.config.api_key,
-                            model, 
-                            method, 
-                            list(args)
-                        )
-                    
-                    return result
+                # Verifica connessione
+                self._ensure_connected()
+                uid = self.uid
+                
+                # Rate limit senza lock: solo l'attesa del token è serializzata
+                self._rate_limiter.acquire()
+                
+                # Esegui richiesta su una connessione del pool
+                with self._pool.connection() as models:
+                    return models.execute_kw(
+                        self.config.database, 
+                        uid, 
+                        self.config.api_key,
+                        model, 
+                        method, 
+                        list(args), 
+                        kwargs
+                    )
                     
             except Exception as e:
                 error_str = str(e)
                 
-                # Se è un errore di connessione e non è l'ultimo tentativo
-                if self._is_connection_error(error_str) and attempt < self._max_retries - 1:
+                # Se è un errore di connessione/sessione e non è l'ultimo tentativo
+                if (self._is_connection_error(error_str) or self._is_auth_error(error_str)) and attempt < self._max_retries - 1:
                     self.logger.warning(f"Errore connessione (tentativo {attempt + 1}/{self._max_retries}): {error_str}")
                     
-                    # Reset connessione
+                    # La connessione rotta è già stata scartata dal pool e le
+                    # altre restano valide; l'uid va però invalidato per forzare
+                    # una nuova autenticazione, salvo che un altro thread non
+                    # l'abbia già rinnovato
                     with self._connection_lock:
-                        self._reset_connection()
+                        if self.uid == uid:
+                            self.uid = None
                     
-                    # Attendi prima del retry
                     time.sleep(self._retry_delay * (attempt + 1))
                     continue
                 
@@ -229,6 +407,12 @@ class OdooClient:
         # Se arriviamo qui, tutti i tentativi sono falliti
         raise OdooExecutionError(f"Tutti i {self._max_retries} tentativi falliti per {model}.{method}")
     
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Statistiche del pool di connessioni e del rate limiter"""
+        stats = self._pool.get_stats()
+        stats.update(self._rate_limiter.get_stats())
+        return stats
+    
     def _get_default_context(self) -> Dict[str, Any]:
         """Context ottimizzato per Odoo 18.2+"""
         return {
@@ -298,9 +482,9 @@ class OdooClient:
                     'move_fields_count': len(move_fields)
                 },
                 'performance': {
-                    'min_request_interval': self._min_request_interval,
                     'max_retries': self._max_retries,
-                    'retry_delay': self._retry_delay
+                    'retry_delay': self._retry_delay,
+                    'pool': self.get_pool_stats()
                 },
                 'test_timestamp': datetime.now().isoformat()
             }
@@ -22,6 +22,8 @@ class OdooConfig:
     database: str
     username: str
     api_key: str
+    pool_size: int = 4
+    max_requests_per_second: float = 10.0
     
     def __post_init__(self):
         """Validazione configurazione dopo inizializzazione"""
@@ -37,7 +39,9 @@ class OdooConfig:
                 url=ODOO_URL,
                 database=ODOO_DB,
                 username=ODOO_USERNAME,
-                api_key=ODOO_API_KEY
+                api_key=ODOO_API_KEY,
+                pool_size=ODOO_POOL_SIZE,
+                max_requests_per_second=ODOO_MAX_REQUESTS_PER_SECOND
             )
             
         except Exception as e:
@@ -61,6 +65,9 @@ class OdooConfig:
         if not self.url.startswith(('http://', 'https://')):
             raise ConfigurationError("URL Odoo deve iniziare con http:// o https://")
         
+        if self.pool_size < 1:
+            raise ConfigurationError("ODOO_POOL_SIZE deve essere almeno 1")
+        
         logger.info("Configurazione Odoo validata con successo")
         return True
     
@@ -158,45 +158,49 @@ class OdooSubscriptionManager:
                 fields=['name', 'price_unit', 'product_uom_qty', 'price_subtotal', 'product_id']
             )
             
-            extra_lines = []
-            regular_lines = []
-            
-            for line in lines:
-                # Aggiunge informazioni prodotto
-                product_info = None
-                if line.get('product_id'):
-                    if isinstance(line['product_id'], list) and len(line['product_id']) > 1:
-                        product_info = {
-                            'id': line['product_id'][0],
-                            'name': line['product_id'][1]
-                        }
-                    elif isinstance(line['product_id'], int):
-                        product_info = {
-                            'id': line['product_id'],
-                            'name': 'N/A'
-                        }
-                
-                line['product_info'] = product_info
-                
-                if 'EXTRA_TRAFFIC_' in line['name']:
-                    extra_lines.append(line)
-                else:
-                    regular_lines.append(line)
-            
-            return {
-                'total_lines': len(lines),
-                'extra_lines': len(extra_lines),
-                'regular_lines': len(regular_lines),
-                'extra_amount': sum(line['price_subtotal'] for line in extra_lines),
-                'regular_amount': sum(line['price_subtotal'] for line in regular_lines),
-                'extra_details': extra_lines,
-                'regular_details': regular_lines,
-                'all_lines': lines
-            }
+            return self._summarize_order_lines(lines)
             
         except Exception:
             return None
     
+    def _summarize_order_lines(self, lines: List[Dict]) -> Dict:
+        """Separa righe regolari e di traffico extra e calcola i totali"""
+        extra_lines = []
+        regular_lines = []
+        
+        for line in lines:
+            # Aggiunge informazioni prodotto
+            product_info = None
+            if line.get('product_id'):
+                if isinstance(line['product_id'], list) and len(line['product_id']) > 1:
+                    product_info = {
+                        'id': line['product_id'][0],
+                        'name': line['product_id'][1]
+                    }
+                elif isinstance(line['product_id'], int):
+                    product_info = {
+                        'id': line['product_id'],
+                        'name': 'N/A'
+                    }
+            
+            line['product_info'] = product_info
+            
+            if 'EXTRA_TRAFFIC_' in line['name']:
+                extra_lines.append(line)
+            else:
+                regular_lines.append(line)
+        
+        return {
+            'total_lines': len(lines),
+            'extra_lines': len(extra_lines),
+            'regular_lines': len(regular_lines),
+            'extra_amount': sum(line['price_subtotal'] for line in extra_lines),
+            'regular_amount': sum(line['price_subtotal'] for line in regular_lines),
+            'extra_details': extra_lines,
+            'regular_details': regular_lines,
+            'all_lines': lines
+        }
+    
     def format_date(self, date_string: Optional[str]) -> Optional[Dict]:
         """Formatta date per JSON"""
         if date_string:
@@ -211,6 +215,120 @@ class OdooSubscriptionManager:
                 return {"raw": date_string}
         return None
     
+    def _build_subscription(self, order: Dict, lines_analysis: Optional[Dict],
+                            recurring_fields: List[str]) -> Dict:
+        """Costruisce la struttura JSON di un abbonamento a partire da ordine e righe"""
+        partner_info = {
+            "id": order['partner_id'][0] if order['partner_id'] else None,
+            "name": order['partner_id'][1] if order['partner_id'] else None
+        }
+        
+        currency_info = {
+            "id": order['currency_id'][0] if order.get('currency_id') else None,
+            "name": order['currency_id'][1] if order.get('currency_id') else 'EUR'
+        }
+        
+        amount = order.get('amount_total', 0)
+        
+        # Campi ricorrenza
+        recurring_info = {}
+        for field_name in recurring_fields:
+            if field_name in order and order[field_name]:
+                recurring_info[field_name] = order[field_name]
+        
+        # Struttura abbonamento
+        subscription = {
+            "id": order['id'],
+            "name": order['name'],
+            "partner": partner_info,
+            "state": order['state'],
+            "amount_total": amount,
+            "currency": currency_info,
+            "dates": {
+                "order_date": self.format_date(order.get('date_order'))
+            },
+            "invoice_status": order.get('invoice_status'),
+            "recurring_fields": recurring_info,
+            "has_extra_traffic": False,
+            "extra_traffic_amount": 0,
+            "lines_summary": {
+                "total_lines": 0,
+                "regular_lines": 0,
+                "extra_lines": 0,
+                "regular_amount": 0,
+                "extra_amount": 0
+            }
+        }
+        
+        # Aggiunge analisi righe
+        if lines_analysis:
+            subscription.update({
+                "has_extra_traffic": lines_analysis['extra_lines'] > 0,
+                "extra_traffic_amount": lines_analysis['extra_amount'],
+                "lines_summary": {
+                    "total_lines": lines_analysis['total_lines'],
+                    "regular_lines": lines_analysis['regular_lines'],
+                    "extra_lines": lines_analysis['extra_lines'],
+                    "regular_amount": lines_analysis['regular_amount'],
+                    "extra_amount": lines_analysis['extra_amount']
+                }
+            })
+            
+            # Dettagli traffico extra
+            if lines_analysis['extra_details']:
+                subscription['extra_traffic_details'] = []
+                for line in lines_analysis['extra_details']:
+                    line_detail = {
+                        "name": line['name'],
+                        "amount": line['price_subtotal'],
+                        "quantity": line.get('product_uom_qty', 1),
+                        "unit_price": line.get('price_unit', 0),
+                        "product": line.get('product_info')
+                    }
+                    
+                    # Estrae periodo se possibile
+                    if 'EXTRA_TRAFFIC_' in line['name']:
+                        try:
+                            parts = line['name'].split('EXTRA_TRAFFIC_')[1].split('_')
+                            if len(parts) >= 2:
+                                line_detail['traffic_period'] = {
+                                    "year": int(parts[0]),
+                                    "month": int(parts[1]),
+                                    "period_string": f"{parts[1]}/{parts[0]}"
+                                }
+                        except:
+                            pass
+                    
+                    subscription['extra_traffic_details'].append(line_detail)
+            
+            # Dettagli righe regolari (prodotti abbonamento)
+            if lines_analysis['regular_details']:
+                subscription['subscription_products'] = []
+                for line in lines_analysis['regular_details']:
+                    product_detail = {
+                        "name": line['name'],
+                        "amount": line['price_subtotal'],
+                        "quantity": line.get('product_uom_qty', 1),
+                        "unit_price": line.get('price_unit', 0),
+                        "product": line.get('product_info')
+                    }
+                    subscription['subscription_products'].append(product_detail)
+            
+            # Riepilogo tutti i prodotti
+            subscription['all_products'] = []
+            for line in lines_analysis['all_lines']:
+                product_summary = {
+                    "name": line['name'],
+                    "amount": line['price_subtotal'],
+                    "quantity": line.get('product_uom_qty', 1),
+                    "unit_price": line.get('price_unit', 0),
+                    "product": line.get('product_info'),
+                    "type": "extra_traffic" if 'EXTRA_TRAFFIC_' in line['name'] else "subscription"
+                }
+                subscription['all_products'].append(product_summary)
+        
+        return subscription
+    
     def get_subscriptions_json(self, partner_id: Optional[int] = None, limit: int = 100) -> Optional[Dict]:
         """Recupera abbonamenti e restituisce JSON"""
         try:
@@ -321,102 +439,8 @@ class OdooSubscriptionManager:
                 json_data['summary']['partner_breakdown'][partner_name]['subscriptions_count'] += 1
                 json_data['summary']['partner_breakdown'][partner_name]['total_amount'] += amount
                 
-                # Campi ricorrenza
-                recurring_info = {}
-                for field_name in recurring_fields:
-                    if field_name in order and order[field_name]:
-                        recurring_info[field_name] = order[field_name]
-                
-                # Struttura abbonamento
-                subscription = {
-                    "id": order['id'],
-                    "name": order['name'],
-                    "partner": partner_info,
-                    "state": order['state'],
-                    "amount_total": amount,
-                    "currency": currency_info,
-                    "dates": {
-                        "order_date": self.format_date(order.get('date_order'))
-                    },
-                    "invoice_status": order.get('invoice_status'),
-                    "recurring_fields": recurring_info,
-                    "has_extra_traffic": False,
-                    "extra_traffic_amount": 0,
-                    "lines_summary": {
-                        "total_lines": 0,
-                        "regular_lines": 0,
-                        "extra_lines": 0,
-                        "regular_amount": 0,
-                        "extra_amount": 0
-                    }
-                }
-                
-                # Aggiunge analisi righe
-                if lines_analysis:
-                    subscription.update({
-                        "has_extra_traffic": lines_analysis['extra_lines'] > 0,
-                        "extra_traffic_amount": lines_analysis['extra_amount'],
-                        "lines_summary": {
-                            "total_lines": lines_analysis['total_lines'],
-                            "regular_lines": lines_analysis['regular_lines'],
-                            "extra_lines": lines_analysis['extra_lines'],
-                            "regular_amount": lines_analysis['regular_amount'],
-                            "extra_amount": lines_analysis['extra_amount']
-                        }
-                    })
-                    
-                    # Dettagli traffico extra
-                    if lines_analysis['extra_details']:
-                        subscription['extra_traffic_details'] = []
-                        for line in lines_analysis['extra_details']:
-                            line_detail = {
-                                "name": line['name'],
-                                "amount": line['price_subtotal'],
-                                "quantity": line.get('product_uom_qty', 1),
-                                "unit_price": line.get('price_unit', 0),
-                                "product": line.get('product_info')
-                            }
-                            
-                            # Estrae periodo se possibile
-                            if 'EXTRA_TRAFFIC_' in line['name']:
-                                try:
-                                    parts = line['name'].split('EXTRA_TRAFFIC_')[1].split('_')
-                                    if len(parts) >= 2:
-                                        line_detail['traffic_period'] = {
-                                            "year": int(parts[0]),
-                                            "month": int(parts[1]),
-                                            "period_string": f"{parts[1]}/{parts[0]}"
-                                        }
-                                except:
-                                    pass
-                            
-                            subscription['extra_traffic_details'].append(line_detail)
-                    
-                    # Dettagli righe regolari (prodotti abbonamento)
-                    if lines_analysis['regular_details']:
-                        subscription['subscription_products'] = []
-                        for line in lines_analysis['regular_details']:
-                            product_detail = {
-                                "name": line['name'],
-                                "amount": line['price_subtotal'],
-                                "quantity": line.get('product_uom_qty', 1),
-                                "unit_price": line.get('price_unit', 0),
-                                "product": line.get('product_info')
-                            }
-                            subscription['subscription_products'].append(product_detail)
-                    
-                    # Riepilogo tutti i prodotti
-                    subscription['all_products'] = []
-                    for line in lines_analysis['all_lines']:
-                        product_summary = {
-                            "name": line['name'],
-                            "amount": line['price_subtotal'],
-                            "quantity": line.get('product_uom_qty', 1),
-                            "unit_price": line.get('price_unit', 0),
-                            "product": line.get('product_info'),
-                            "type": "extra_traffic" if 'EXTRA_TRAFFIC_' in line['name'] else "subscription"
-                        }
-                        subscription['all_products'].append(product_summary)
+                # Struttura abbonamento con analisi righe
+                subscription = self._build_subscription(order, lines_analysis, recurring_fields)
                 
                 json_data['subscriptions'].append(subscription)
             
@@ -434,7 +458,95 @@ class OdooSubscriptionManager:
             self.logger.error(f"Errore recupero abbonamenti: {e}")
             return None
         
-    def verifica_abbonamento(subscription_id, request_path):
+    def build_subscription_index(self, subscription_ids: List[int]) -> Optional[Dict[int, Dict]]:
+        """
+        Costruisce l'indice degli abbonamenti per una run di fatturazione
+        
+        Scarica in blocco solo gli ordini richiesti (una search_read su sale.order)
+        e tutte le loro righe (una search_read su sale.order.line), invece di
+        ripetere get_subscriptions_json() per ogni contratto.
+        
+        Args:
+            subscription_ids: ID degli abbonamenti (sale.order) da verificare
+            
+        Returns:
+            Dizionario {subscription_id: abbonamento} nello stesso formato di
+            get_subscriptions_json(), None in caso di errore di comunicazione
+        """
+        try:
+            ids = sorted({int(sub_id) for sub_id in subscription_ids if sub_id})
+            if not ids:
+                return {}
+            
+            available_fields = self.get_available_fields()
+            recurring_fields = self.find_recurring_fields(available_fields)
+            
+            order_fields = [
+                'id', 'name', 'partner_id', 'state', 'amount_total',
+                'date_order', 'invoice_status', 'order_line', 'currency_id'
+            ]
+            
+            # Stessi filtri di get_orders_with_filters, limitati agli ID richiesti
+            subscription_domain = [('state', 'in', ['sale', 'done'])]
+            if 'is_subscription' in available_fields:
+                subscription_domain.append(('is_subscription', '=', True))
+            elif 'subscription' in available_fields:
+                subscription_domain.append(('subscription', '!=', False))
+            
+            orders = self.client.execute(
+                'sale.order', 'search_read',
+                [('id', 'in', ids)] + subscription_domain,
+                fields=order_fields + recurring_fields
+            )
+            
+            # Come get_subscriptions_json: ricerca manuale (sugli stessi ID) solo se
+            # i filtri diretti non trovano nessun abbonamento in assoluto
+            if not orders and not self.client.execute('sale.order', 'search_count', subscription_domain):
+                all_orders = self.client.execute(
+                    'sale.order', 'search_read',
+                    [('id', 'in', ids), ('state', 'in', ['sale', 'done'])],
+                    fields=order_fields
+                )
+                orders = self.identify_subscriptions_manually(all_orders)
+            
+            # Righe di tutti gli ordini in un'unica chiamata, raggruppate per ordine
+            lines_by_order: Dict[int, List[Dict]] = {}
+            order_ids = [order['id'] for order in orders if order.get('order_line')]
+            if order_ids:
+                lines = self.client.execute(
+                    'sale.order.line', 'search_read',
+                    [('order_id', 'in', order_ids)],
+                    fields=['order_id', 'name', 'price_unit', 'product_uom_qty', 'price_subtotal', 'product_id']
+                )
+                for line in lines:
+                    order_ref = line.pop('order_id', None)
+                    order_id = order_ref[0] if isinstance(order_ref, list) else order_ref
+                    lines_by_order.setdefault(order_id, []).append(line)
+            
+            index = {}
+            for order in orders:
+                lines_analysis = None
+                if order.get('order_line'):
+                    lines_analysis = self._summarize_order_lines(lines_by_order.get(order['id'], []))
+                index[order['id']] = self._build_subscription(order, lines_analysis, recurring_fields)
+            
+            self.logger.info(f"Indice abbonamenti costruito: {len(index)}/{len(ids)} trovati")
+            return index
+            
+        except Exception as e:
+            self.logger.error(f"Errore costruzione indice abbonamenti: {e}")
+            return None
+    
+    def verifica_abbonamento(subscription_id, request_path, subscription_index: Optional[Dict[int, Dict]] = None):
+        """
+        Verifica l'esistenza di un abbonamento e ne restituisce il dettaglio
+        
+        Args:
+            subscription_id: ID dell'abbonamento
+            request_path: Path della richiesta (determina il formato select/full)
+            subscription_index: Indice da build_subscription_index(); se fornito
+                                evita di scaricare tutti gli abbonamenti da Odoo
+        """
 
         from app.odoo.odoo_utils import (
             build_api_response, build_select2_response, 
@@ -449,23 +561,27 @@ class OdooSubscriptionManager:
                 # Determina il formato dal path
                 format_type = 'select' if '/select/' in request_path else 'full'
                 
-                # Recupera tutti gli abbonamenti (potremmo ottimizzare recuperando solo quello specifico)
-                json_data = odoo_manager.subscriptions.get_subscriptions_json()
-                
-                if json_data is None:
-                    return build_api_response(
-                        False, 
-                        message="Errore nel recupero dei dati da Odoo", 
-                        error_code="ODOO_CONNECTION_ERROR", 
-                        status_code=500
-                    )
-                
-                # Cerca l'abbonamento specifico
-                subscription = None
-                for sub in json_data.get('subscriptions', []):
-                    if sub['id'] == subscription_id:
-                        subscription = sub
-                        break
+                if subscription_index is not None:
+                    # Lookup diretto nell'indice della run di fatturazione
+                    subscription = subscription_index.get(subscription_id)
+                else:
+                    # Recupera tutti gli abbonamenti (potremmo ottimizzare recuperando solo quello specifico)
+                    json_data = odoo_manager.subscriptions.get_subscriptions_json()
+                    
+                    if json_data is None:
+                        return build_api_response(
+                            False, 
+                            message="Errore nel recupero dei dati da Odoo", 
+                            error_code="ODOO_CONNECTION_ERROR", 
+                            status_code=500
+                        )
+                    
+                    # Cerca l'abbonamento specifico
+                    subscription = None
+                    for sub in json_data.get('subscriptions', []):
+                        if sub['id'] == subscription_id:
+                            subscription = sub
+                            break
                 
                 if subscription is None:
                     return build_api_response(
@@ -0,0 +1,103 @@
+from flask import request, jsonify, url_for, g
+from app.auth.unified_decorators import unified_api_admin_required
+from app.utils.background_jobs import job_runner
+from app.logger import get_logger
+logger = get_logger(__name__)
+
+
+def job_accepted_response(job, created):
+    """Risposta 202 per un job messo in coda (o già attivo)"""
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'created': created,
+        'message': 'Job messo in coda' if created else 'Job già in esecuzione',
+        'status_url': url_for('api_voip_cdr.get_job', job_id=job.id),
+        'progress_url': url_for('api_voip_cdr.get_job_progress', job_id=job.id)
+    }), 202
+
+
+def register_api_jobs_routes(api_bp):
+    # ############################# #
+    # JOB IN BACKGROUND ########### #
+    # ############################# #
+
+    @api_bp.route('jobs', methods=['POST'])
+    @unified_api_admin_required
+    def submit_job():
+        """
+        Mette in coda un job registrato
+
+        Body JSON: {"name": nome del job, "params": {...}}
+
+        Returns:
+            202 con job_id e URL di stato
+        """
+        try:
+            data = request.get_json() or {}
+            name = data.get('name')
+            if name not in job_runner.handlers:
+                return jsonify({'success': False, 'message': f'Job non valido: {name}'}), 400
+
+            job, created = job_runner.submit(name, data.get('params') or {}, created_by=g.current_user.uid)
+            return job_accepted_response(job, created)
+
+        except Exception as e:
+            logger.error(f"Errore invio job: {e}")
+            return jsonify({'success': False, 'message': str(e)}), 500
+
+    @api_bp.route('jobs', methods=['GET'])
+    @unified_api_admin_required
+    def list_jobs():
+        """Ultimi job (parametri: name, limit)"""
+        try:
+            limit = min(max(request.args.get('limit', 20, type=int), 1), 200)
+            jobs = job_runner.list_jobs(request.args.get('name'), limit)
+            return jsonify({'success': True, 'jobs': [job.to_dict(include_result=False) for job in jobs]})
+
+        except Exception as e:
+            logger.error(f"Errore elenco job: {e}")
+            return jsonify({'success': False, 'message': str(e)}), 500
+
+    @api_bp.route('jobs/<job_id>', methods=['GET'])
+    @unified_api_admin_required
+    def get_job(job_id):
+        """Stato completo del job, con parametri e risultato"""
+        try:
+            job = job_runner.get(job_id)
+            if job is None:
+                return jsonify({'success': False, 'message': f'Job {job_id} non trovato'}), 404
+            return jsonify({'success': True, 'job': job.to_dict()})
+
+        except Exception as e:
+            logger.error(f"Errore lettura job {job_id}: {e}")
+            return jsonify({'success': False, 'message': str(e)}), 500
+
+    @api_bp.route('jobs/<job_id>/progress', methods=['GET'])
+    @unified_api_admin_required
+    def get_job_progress(job_id):
+        """Stato e avanzamento del job senza risultato (per il polling)"""
+        try:
+            job = job_runner.get(job_id)
+            if job is None:
+                return jsonify({'success': False, 'message': f'Job {job_id} non trovato'}), 404
+            return jsonify({'success': True, 'job': job.to_dict(include_result=False)})
+
+        except Exception as e:
+            logger.error(f"Errore lettura avanzamento job {job_id}: {e}")
+            return jsonify({'success': False, 'message': str(e)}), 500
+
+    @api_bp.route('jobs/<job_id>/cancel', methods=['POST'])
+    @unified_api_admin_required
+    def cancel_job(job_id):
+        """Annulla un job in coda o richiede l'interruzione di uno in esecuzione"""
+        try:
+            job = job_runner.cancel(job_id)
+            if job is None:
+                return jsonify({'success': False, 'message': f'Job {job_id} non trovato'}), 404
+            return jsonify({'success': True, 'job': job.to_dict(include_result=False)})
+
+        except Exception as e:
+            logger.error(f"Errore annullamento job {job_id}: {e}")
+            return jsonify({'success': False, 'message': str(e)}), 500
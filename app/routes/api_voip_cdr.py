@@ -11,7 +11,10 @@ from datetime import datetime
 from app.utils.env_manager import *
 from app.logger import get_logger       
 from app.voip_cdr.cdr_categories import CDRAnalyticsEnhanced
-import json
+from app.voip_cdr.cdr_registry import ContractRegistry
+from app.utils.background_jobs import job_runner
+from app.routes.api_jobs import job_accepted_response
+import app.voip_cdr.cdr_jobs  # registra i job aggiorna_dati_ftp e genera_extra_soglia
 from pathlib import Path
 logger = get_logger(__name__)
 
@@ -474,17 +477,14 @@ def register_api_voip_cdr_routes(api_voip_cdr):
         """
         try:
             contracts_file = Path(CONTACT_FILE)
-            print(contracts_file)
-            if not contracts_file.exists():
+            contracts_data = ContractRegistry.instance(contracts_file).data()
+            if contracts_data is None:
                 return jsonify({
                     'success': False,
                     'message': 'File configurazione contratti non trovato',
                     'suggestion': 'Esegui prima estrazione codici contratto'
                 })
             
-            with open(contracts_file, 'r', encoding='utf-8') as f:
-                contracts_data = json.load(f)
-            
             return jsonify({
                 'success': True,
                 'config_file': str(contracts_file),
@@ -569,46 +569,41 @@ def register_api_voip_cdr_routes(api_voip_cdr):
             
             # Carica configurazione esistente
             contracts_file = Path(CONTACT_FILE)
+            registry = ContractRegistry.instance(contracts_file)
             
-            if not contracts_file.exists():
+            if not registry.exists():
                 return jsonify({
                     'success': False,
                     'message': 'File configurazione contratti non trovato'
                 }), 404
             
-            with open(contracts_file, 'r', encoding='utf-8') as f:
-                contracts_data = json.load(f)
-            
             # Verifica esistenza contratto
-            if str(contract_code) not in contracts_data.get('contracts', {}):
+            if registry.get(contract_code) is None:
                 return jsonify({
                     'success': False,
                     'message': f'Codice contratto {contract_code} non trovato'
                 }), 404
             
             # Aggiorna informazioni contratto
-            contract = contracts_data['contracts'][str(contract_code)]
-            
+            changes = {}
             if 'contract_name' in data:
-                contract['contract_name'] = data['contract_name'].strip() if data['contract_name'] is not None else None
+                changes['contract_name'] = data['contract_name'].strip() if data['contract_name'] is not None else None
             if 'odoo_client_id' in data:
-                contract['odoo_client_id'] = data['odoo_client_id'].strip()
+                changes['odoo_client_id'] = data['odoo_client_id'].strip()
             if 'contract_type' in data:
-                contract['contract_type'] = data['contract_type'].strip()
+                changes['contract_type'] = data['contract_type'].strip()
             if 'payment_term' in data:
-                contract['payment_term'] = data['payment_term'].strip()
+                changes['payment_term'] = data['payment_term'].strip()
             if 'notes' in data:
-                contract['notes'] = data['notes'].strip()
-            
-            contract['last_updated'] = datetime.now().isoformat()
+                changes['notes'] = data['notes'].strip()
             
-            # Aggiorna metadata
-            contracts_data['metadata']['last_updated'] = datetime.now().isoformat()
-            contracts_data['metadata']['manual_updates'] = contracts_data['metadata'].get('manual_updates', 0) + 1
-            
-            # Salva configurazione aggiornata
-            with open(contracts_file, 'w', encoding='utf-8') as f:
-                json.dump(contracts_data, f, indent=2, ensure_ascii=False)
+            # Salva configurazione aggiornata (scrittura atomica, registro aggiornato)
+            contract = registry.update_contract(contract_code, changes)
+            if contract is None:
+                return jsonify({
+                    'success': False,
+                    'message': f'Codice contratto {contract_code} non trovato'
+                }), 404
             
             logger.info(f"✅ Contratto {contract_code} aggiornato")
             
@@ -664,54 +659,43 @@ def register_api_voip_cdr_routes(api_voip_cdr):
     # @admin_required
     def clienti_traffico_voip(periodo):
         """
-        Recupera dati cliente per DataTables da JSON aggregati, filtrando per anno o anno+mese.
+        Recupera dati cliente per DataTables dall'indice dei riepiloghi mensili,
+        filtrando per anno o anno+mese.
         """
-        from app.voip_cdr.cdr_processor import (
-            JSONFileManager,
-            JSONAggregator,
-        )
+        from app.voip_cdr.cdr_summary import CDRSummaryIndex
         now = datetime.now()
 
         try:
+            summary_index = CDRSummaryIndex()
+
             if not periodo:
                 # Nessun parametro → mese corrente
                 anno = now.strftime('%Y')
                 mese = now.strftime('%m')
-                file_path = Path(ANALYTICS_OUTPUT_FOLDER) / anno / f"aggregate_files_{anno}_{mese}.json"
 
                 logger.info(f"📋 Richiesta dati cliente per mese corrente: {anno}_{mese}")
-                json_manager = JSONFileManager()
-                datatables_json = json_manager.transform_from_multiple_files([file_path])
+                datatables_json = summary_index.get_month(anno, mese)
                 return jsonify(datatables_json)
 
             parts = periodo.split("_")
 
             if len(parts) == 1:
-                # ✅ Solo anno → aggregazione dinamica dei file annuali
+                # ✅ Solo anno → somma dei riepiloghi mensili dell'indice
                 anno = parts[0]
-                path = Path(ANALYTICS_OUTPUT_FOLDER) / anno
 
                 logger.info(f"📋 Richiesta aggregata per l'anno intero: {anno}")
-                aggregator = JSONAggregator()
-                result = aggregator.aggregate_files(path)
-
-                json_manager = JSONFileManager()
-                datatables_json = json_manager.transform_from_string(json.dumps(result, indent=4))
+                datatables_json = summary_index.get_year(anno)
                 return jsonify(datatables_json)
 
             elif len(parts) == 2:
-                # ✅ Anno e mese → singolo file
+                # ✅ Anno e mese → singolo mese
                 anno, mese = parts
 
                 if not mese.isdigit() or not (1 <= int(mese) <= 12):
                     return jsonify({"data": [], "error": f"Mese non valido: {mese}"}), 400
 
-                nome_file = f"aggregate_files_{anno}_{mese}.json"
-                file_path = Path(ANALYTICS_OUTPUT_FOLDER) / anno / nome_file
-
                 logger.info(f"📋 Richiesta dati cliente per mese specifico: {anno}_{mese}")
-                json_manager = JSONFileManager()
-                datatables_json = json_manager.transform_from_multiple_files([file_path])
+                datatables_json = summary_index.get_month(anno, mese)
                 return jsonify(datatables_json)
 
             else:
@@ -720,117 +704,101 @@ def register_api_voip_cdr_routes(api_voip_cdr):
         except Exception as e:
             logger.error(f"❌ Errore endpoint AJAX: {e}")
             return jsonify({'data': [], 'error': str(e)}), 500
-        
+
+    @api_voip_cdr.route('contracts/<contract_id>/calls/datatable/serverside/<periodo>', methods=['GET'])
+    @unified_api_admin_required
+    def contract_calls_serverside(contract_id, periodo):
+        """
+        Chiamate di un contratto per DataTables in modalità server-side
+
+        Legge dal dettaglio indicizzato del mese (periodo YYYY_MM) solo la pagina
+        richiesta, con gli ordinamenti precomputati per contratto. Parametri
+        DataTables: draw, start, length, search[value], order[0][column],
+        order[0][dir] e columns[i][data] (nome della colonna ordinata).
+        """
+        from app.voip_cdr.cdr_reports import CDRContractDetailStore
+
+        draw = request.args.get('draw', 1, type=int)
+        empty = {'draw': draw, 'recordsTotal': 0, 'recordsFiltered': 0, 'data': []}
+
+        try:
+            parts = periodo.split("_")
+            if len(parts) != 2 or not parts[0].isdigit() or not parts[1].isdigit() or not (1 <= int(parts[1]) <= 12):
+                return jsonify(dict(empty, error=f"Periodo non valido: {periodo}")), 400
+            anno, mese = parts
+
+            start = max(request.args.get('start', 0, type=int), 0)
+            length = request.args.get('length', 10, type=int)
+            search_value = request.args.get('search[value]', '')
+
+            # Colonna di ordinamento: nome da columns[i][data], altrimenti posizione in CALL_COLUMNS
+            order_column = None
+            order_index = request.args.get('order[0][column]', type=int)
+            if order_index is not None:
+                order_column = request.args.get(f'columns[{order_index}][data]')
+                if order_column not in CDRContractDetailStore.CALL_COLUMNS and 0 <= order_index < len(CDRContractDetailStore.CALL_COLUMNS):
+                    order_column = CDRContractDetailStore.CALL_COLUMNS[order_index]
+            order_dir = request.args.get('order[0][dir]', 'asc')
+
+            store = CDRContractDetailStore.for_month(anno, mese)
+            page = store.query_calls(contract_id, start, length, order_column, order_dir, search_value)
+            if page is None:
+                return jsonify(dict(empty, error=f"Contratto {contract_id} non presente nel periodo {periodo}")), 404
+
+            logger.info(f"📋 Chiamate contratto {contract_id} {periodo}: {page['recordsFiltered']} filtrate, {len(page['data'])} in pagina")
+            return jsonify(dict(page, draw=draw))
+
+        except Exception as e:
+            logger.error(f"❌ Errore endpoint server-side chiamate: {e}")
+            return jsonify(dict(empty, error=str(e))), 500
+
 
     # Aggiunge il traffico voip extra soglia sugli abbonamenti di ODOO
     @api_voip_cdr.route('genera_extra_soglia', methods=['POST'])
     @unified_api_admin_required
     def genera_extra_soglia():
         """
-        API per ottenere la configurazione contratti salvata
+        API per inserire il traffico extra soglia sugli abbonamenti Odoo
+        
+        L'elaborazione viene eseguita in background (job genera_extra_soglia).
         
         Returns:
-            JSON con configurazione contratti corrente
+            202 con job_id; risultato da /api/jobs/<job_id>
         """
         try:
-             # Inserisce il traffico voip extra soglia nel contratto corrente del cliente su ODOO
-            from app.voip_cdr.fatturazione import processa_contratti_attivi
-            periodo = request.get_json()
-            result = processa_contratti_attivi(periodo)
-            
-            if isinstance(result, (dict, list)):
-                # print(json.dumps(result, indent=4, ensure_ascii=False))
-                return json.dumps(result, indent=4, ensure_ascii=False)
-            else:
-                # print(result)
-                return result
-            # return jsonify({
-            #     'success': True,
-            #     'config_file': str(contracts_file),
-            #     'contracts_count': len(contracts_data.get('contracts', {})),
-            #     'last_updated': contracts_data.get('metadata', {}).get('last_updated'),
-            #     'data': contracts_data
-            # })
+            periodo = request.get_json(silent=True)
+            job, created = job_runner.submit('genera_extra_soglia', {'periodo': periodo}, created_by=g.current_user.uid)
+            return job_accepted_response(job, created)
             
         except Exception as e:
-            logger.error(f"Errore lettura configurazione: {e}")
+            logger.error(f"Errore avvio generazione extra soglia: {e}")
             return jsonify({
                 'success': False,
-                'message': f'Errore lettura configurazione: {str(e)}'
+                'message': f'Errore avvio generazione extra soglia: {str(e)}'
             }), 500
         
-    # Aggiunge il traffico voip extra soglia sugli abbonamenti di ODOO
+    # Scarica i CDR dall'FTP e rigenera i dati del mese
     @api_voip_cdr.route('aggiorna_dati_ftp', methods=['POST'])
     @unified_api_admin_required
     def aggiorna_dati_ftp():
         """
         API per scaricare dall'ftp tutti i CDR aggiornati
         
+        Download, conversione, aggiornamento contratti, aggregazione e dettaglio
+        per contratto vengono eseguiti in background (job aggiorna_dati_ftp).
+        
         Returns:
-            JSON con configurazione contratti corrente
+            202 con job_id; risultato da /api/jobs/<job_id>
         """
         try:
-            from app.voip_cdr.ftp_downloader import FTPDownloader
-            downloader = FTPDownloader()
-
-            data = request.get_json()
-            
-            pattern = data.get('pattern')
-            test_ftp = data.get('test_ftp', False)
-
-            if(not pattern):
-                pattern_to_use = SPECIFIC_FILENAME
-            else:
-                pattern_to_use = pattern   
-
-            if(not test_ftp):
-                test_ftp_to_use = FTP_TEST
-            else:
-                test_ftp_to_use = test_ftp   
-
-            # ✅ Chiama il metodo sull'istanza
-            ftp_response = downloader.process_files(pattern_to_use, test_ftp_to_use) #'RIV_20943_%Y-%m*.CDR', False
-
-            logger.info(f"Risultato: {ftp_response} ")
-
-            if(ftp_response['success'] == True):      
-                # Elenco di file scaricati dall'ftp
-                files = ftp_response['files']
-                # files = ['RIV_15232_MESE_1_2025-02-03-13.19.21.CDR']
-
-                # Carico le classi necessarie
-                from app.voip_cdr.cdr_processor import CDRProcessor, CDRAggregator, CDRContractsGenerator, JSONFileManager, JSONAggregator
-
-                # Converte ogni CDR scaricato in un json inserendo già i prezzi con markup secondo la tabella nel json categorie 
-                processor = CDRProcessor(files[0])
-                json_to_cdr = json.loads(processor.process_files(files, riprocessa=True))
-                json_file = json_to_cdr['nome_file']
-            
-                # Genera il json dei contatti attivi estrapolandoli dal CDR
-                generator = CDRContractsGenerator(json_file)
-                generator.save_contracts_json()
-                print(json_file)
-
-                # Unisce tutti i json appena elaborati in un unico json, aggrega le chiamate per ogni singolo Cliente(contratto), 
-                # genera un record di costo totale per ogni categoria oltre ad un record costo globale che somma tutte le categorie. 
-                aggregator = CDRAggregator()
-                aggregate_json = aggregator.aggregate_cdr_data(json_file)
-                print (aggregate_json)
-
-                # Genera un file json per ogni Cliente (contratto) con tutti idati presenti nel json globale.
-                aggregate_json_file = aggregate_json['file_name']
-                detailed_json = aggregator.split_aggregate_to_contracts(aggregate_json_file)
-                return detailed_json
-            else:
-                logger.error(f"Errore lettura configurazione: {ftp_response}")
-                return jsonify({
-                'success': False,
-                'message': f'Errore lettura configurazione: {str(ftp_response)}'
-            }), 500
+            data = request.get_json(silent=True) or {}
+            params = {'pattern': data.get('pattern'), 'test_ftp': data.get('test_ftp', False)}
+            job, created = job_runner.submit('aggiorna_dati_ftp', params, created_by=g.current_user.uid)
+            return job_accepted_response(job, created)
             
         except Exception as e:
-            logger.error(f"Errore lettura configurazione: {e}")
+            logger.error(f"Errore avvio aggiornamento FTP: {e}")
             return jsonify({
                 'success': False,
-                'message': f'Errore lettura configurazione: {str(e)}'
+                'message': f'Errore avvio aggiornamento FTP: {str(e)}'
             }), 500
\ No newline at end of file
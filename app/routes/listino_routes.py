@@ -15,6 +15,7 @@ import logging
 from datetime import datetime
 import tempfile
 from pathlib import Path
+from app.voip_cdr import cdr_json
 
 # logger = logging.getLogger(__name__)
 # Import dei logger esistenti se disponibili
@@ -305,8 +306,8 @@ def create_listino_routes(app, secure_config):
                 }
             }
             
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(save_data_with_metadata, f, indent=2, ensure_ascii=False)
+            # Indentato: il listino salvato viene anche consultato a mano
+            cdr_json.dump(save_data_with_metadata, json_path, pretty=True)
             
             # Prepara i dati per il CSV
             if isinstance(data, dict) and 'current' in data and isinstance(data['current'], list):
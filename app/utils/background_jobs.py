@@ -0,0 +1,383 @@
+"""
+Job in background senza broker esterno
+
+Le operazioni lunghe (download FTP ed elaborazione CDR, fatturazione Odoo)
+vengono registrate come job con `job_runner.register(nome)` e inviate con
+`job_runner.submit(...)`, che salva il job nella tabella background_jobs e
+restituisce subito il suo id.
+
+Ogni processo (worker gunicorn) avvia al primo uso un thread dispatcher e un
+pool di JOBS_MAX_WORKERS thread. Il dispatcher prende in carico i job in coda
+con un UPDATE condizionato sullo stato (un job viene eseguito da un solo
+processo), aggiorna l'heartbeat dei propri job e ne propaga le richieste di
+annullamento. I job unici non possono avere due istanze attive: l'invio si
+appoggia a un indice univoco parziale e la presa in carico non avvia un job
+se ne è già in esecuzione uno con lo stesso nome. I job "running" senza heartbeat da JOBS_STALE_SECONDS (worker
+terminato o riavviato) vengono marcati come falliti da qualsiasi processo.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import exists, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.logger import get_logger
+from app.models.job import BackgroundJob
+from app.utils.env_manager import JOBS_MAX_WORKERS, JOBS_POLL_INTERVAL, JOBS_STALE_SECONDS
+
+logger = get_logger(__name__)
+
+_jobs = BackgroundJob.__table__
+
+
+class JobCancelled(Exception):
+    """Sollevata dal job (check_cancelled) quando ne è stato richiesto l'annullamento"""
+
+
+class JobContext:
+    """Passato come primo argomento alla funzione del job: avanzamento e annullamento"""
+
+    # Intervallo minimo tra due scritture dell'avanzamento
+    PROGRESS_INTERVAL = 1.0
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._cancel = threading.Event()
+        self._last_write = 0.0
+
+    def progress(self, percent: float, message: Optional[str] = None, force: bool = False) -> None:
+        """
+        Aggiorna l'avanzamento del job
+
+        Gli aggiornamenti più ravvicinati di PROGRESS_INTERVAL vengono scartati,
+        anche se hanno un messaggio, salvo force.
+
+        Args:
+            percent: Percentuale di completamento (0-100)
+            message: Descrizione della fase in corso
+            force: Scrive comunque (cambi di fase)
+        """
+        now = time.monotonic()
+        if not force and now - self._last_write < self.PROGRESS_INTERVAL:
+            return
+        self._last_write = now
+
+        values = {'progress': max(0.0, min(float(percent), 100.0)), 'heartbeat_at': datetime.utcnow()}
+        if message is not None:
+            values['message'] = message[:255]
+        with db.engine.begin() as conn:
+            conn.execute(update(_jobs).where(_jobs.c.id == self.job_id).values(**values))
+
+    def cancelled(self) -> bool:
+        """True se è stato richiesto l'annullamento"""
+        return self._cancel.is_set()
+
+    def check_cancelled(self) -> None:
+        """Solleva JobCancelled se è stato richiesto l'annullamento"""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+
+class JobRunner:
+    """Registro delle funzioni dei job ed esecuzione nel pool del processo"""
+
+    def __init__(self):
+        self.handlers: Dict[str, Tuple[Callable[..., Any], bool]] = {}
+        self.app = None
+        self.worker_id = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running: Dict[str, JobContext] = {}
+        self._executor = None
+
+    def init_app(self, app) -> None:
+        """Collega il runner all'app; dispatcher e pool partono al primo uso nel processo"""
+        self.app = app
+        app.extensions['job_runner'] = self
+        app.before_request(self._ensure_started)
+
+    def register(self, name: str, unique: bool = True):
+        """
+        Decoratore per registrare la funzione di un job
+
+        La funzione riceve il JobContext e i parametri del job come keyword e
+        restituisce un risultato serializzabile in JSON.
+
+        Args:
+            name: Nome del job
+            unique: Se True un nuovo invio restituisce il job già attivo con lo stesso nome
+        """
+        def decorator(func):
+            self.handlers[name] = (func, unique)
+            return func
+        return decorator
+
+    # ==================== AVVIO PER PROCESSO ====================
+
+    def _ensure_started(self) -> None:
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self.app is None:
+                self.app = current_app._get_current_object()
+
+            BackgroundJob.__table__.create(db.engine, checkfirst=True)
+
+            # Dopo un fork lo stato del processo padre non è valido
+            self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+            self._running = {}
+            self._wakeup = threading.Event()
+            self._executor = ThreadPoolExecutor(max_workers=JOBS_MAX_WORKERS, thread_name_prefix='job')
+            threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True).start()
+            self._pid = os.getpid()
+
+        logger.info(f"🧵 Job runner avviato ({self.worker_id}, {JOBS_MAX_WORKERS} thread)")
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            try:
+                with self.app.app_context():
+                    self._heartbeat()
+                    self._recover_stale()
+                    self._claim_jobs()
+            except Exception as e:
+                logger.error(f"❌ Errore dispatcher job: {e}")
+
+            self._wakeup.wait(JOBS_POLL_INTERVAL)
+            self._wakeup.clear()
+
+    def _heartbeat(self) -> None:
+        """Aggiorna l'heartbeat dei job del processo e ne legge le richieste di annullamento"""
+        job_ids = list(self._running)
+        if not job_ids:
+            return
+
+        with db.engine.begin() as conn:
+            conn.execute(update(_jobs).where(_jobs.c.id.in_(job_ids)).values(heartbeat_at=datetime.utcnow()))
+            cancelled = conn.execute(
+                select(_jobs.c.id).where(_jobs.c.id.in_(job_ids), _jobs.c.cancel_requested.is_(True))
+            ).scalars().all()
+
+        for job_id in cancelled:
+            context = self._running.get(job_id)
+            if context is not None:
+                context._cancel.set()
+
+    def _recover_stale(self) -> None:
+        """Marca come falliti i job il cui processo non aggiorna più l'heartbeat"""
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            recovered = conn.execute(
+                update(_jobs)
+                .where(_jobs.c.status == BackgroundJob.STATUS_RUNNING,
+                       _jobs.c.heartbeat_at < now - timedelta(seconds=JOBS_STALE_SECONDS))
+                .values(status=BackgroundJob.STATUS_FAILED, finished_at=now,
+                        error='Processo del job interrotto', message='Interrotto')
+            ).rowcount
+        if recovered:
+            logger.warning(f"⚠️ {recovered} job interrotti marcati come falliti")
+
+    def _claim_jobs(self) -> None:
+        """Prende in carico i job in coda fino a saturare il pool del processo"""
+        free = JOBS_MAX_WORKERS - len(self._running)
+        if free <= 0 or not self.handlers:
+            return
+
+        with db.engine.connect() as conn:
+            candidates = conn.execute(
+                select(_jobs.c.id, _jobs.c.name)
+                .where(_jobs.c.status == BackgroundJob.STATUS_QUEUED, _jobs.c.name.in_(list(self.handlers)))
+                .order_by(_jobs.c.created_at)
+                .limit(free)
+            ).all()
+
+        running = _jobs.alias('running')
+        for job_id, name in candidates:
+            now = datetime.utcnow()
+            conditions = [_jobs.c.id == job_id, _jobs.c.status == BackgroundJob.STATUS_QUEUED]
+            if self.handlers[name][1]:
+                # Un job unico non parte finché ne è in esecuzione uno con lo stesso nome
+                conditions.append(~exists().where(running.c.name == name,
+                                                  running.c.status == BackgroundJob.STATUS_RUNNING))
+            with db.engine.begin() as conn:
+                # Solo un processo vince l'aggiornamento da "queued" a "running"
+                claimed = conn.execute(
+                    update(_jobs)
+                    .where(*conditions)
+                    .values(status=BackgroundJob.STATUS_RUNNING, worker=self.worker_id,
+                            started_at=now, heartbeat_at=now, message='In esecuzione')
+                ).rowcount
+            if not claimed:
+                continue
+
+            context = JobContext(job_id)
+            self._running[job_id] = context
+            self._executor.submit(self._execute, context, name)
+            logger.info(f"▶️ Job {name} {job_id} avviato su {self.worker_id}")
+
+    def _execute(self, context: JobContext, name: str) -> None:
+        status, result_json, error = BackgroundJob.STATUS_SUCCEEDED, None, None
+        try:
+            with self.app.app_context():
+                with db.engine.connect() as conn:
+                    params_json = conn.execute(select(_jobs.c.params_json).where(_jobs.c.id == context.job_id)).scalar()
+                params = json.loads(params_json) if params_json else {}
+
+                result = self.handlers[name][0](context, **params)
+
+                # Risposte in stile Flask (dati, status) e JSON in stringa vengono salvati come dati
+                if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], int):
+                    result = result[0]
+                if isinstance(result, str):
+                    try:
+                        result = json.loads(result)
+                    except ValueError:
+                        pass
+                if isinstance(result, dict) and result.get('success') is False:
+                    status = BackgroundJob.STATUS_FAILED
+                    detail = result.get('error')
+                    if isinstance(detail, dict):
+                        detail = detail.get('message')
+                    error = str(result.get('message') or detail or 'Operazione non riuscita')
+                result_json = json.dumps(result, ensure_ascii=False, default=str)
+
+        except JobCancelled:
+            status = BackgroundJob.STATUS_CANCELLED
+        except Exception as e:
+            status, error = BackgroundJob.STATUS_FAILED, str(e)
+            logger.error(f"❌ Job {name} {context.job_id} fallito: {e}\n{traceback.format_exc()}")
+        finally:
+            self._running.pop(context.job_id, None)
+            self._wakeup.set()
+
+        messages = {
+            BackgroundJob.STATUS_SUCCEEDED: 'Completato',
+            BackgroundJob.STATUS_FAILED: 'Errore',
+            BackgroundJob.STATUS_CANCELLED: 'Annullato'
+        }
+        values = {'status': status, 'result_json': result_json, 'error': error,
+                  'finished_at': datetime.utcnow(), 'message': messages[status]}
+        if status == BackgroundJob.STATUS_SUCCEEDED:
+            values['progress'] = 100.0
+
+        try:
+            with self.app.app_context(), db.engine.begin() as conn:
+                conn.execute(update(_jobs).where(_jobs.c.id == context.job_id).values(**values))
+        except Exception as e:
+            logger.error(f"❌ Impossibile salvare l'esito del job {context.job_id}: {e}")
+        logger.info(f"⏹️ Job {name} {context.job_id}: {status}")
+
+    # ==================== API ====================
+
+    def submit(self, name: str, params: Optional[Dict[str, Any]] = None,
+               created_by: Optional[str] = None) -> Tuple[BackgroundJob, bool]:
+        """
+        Mette in coda un job
+
+        Args:
+            name: Nome del job registrato
+            params: Parametri (serializzabili in JSON) passati alla funzione
+            created_by: UID dell'utente che ha richiesto il job
+
+        Returns:
+            (job, creato); creato è False se è stato restituito un job unico già attivo
+
+        Raises:
+            ValueError: se il job non è registrato
+        """
+        if name not in self.handlers:
+            raise ValueError(f"Job non registrato: {name}")
+        self._ensure_started()
+        unique = self.handlers[name][1]
+        params_json = json.dumps(params or {}, ensure_ascii=False)
+
+        while True:
+            if unique:
+                active = (BackgroundJob.query
+                          .filter(BackgroundJob.unique_name == name,
+                                  BackgroundJob.status.in_(BackgroundJob.ACTIVE_STATUSES))
+                          .first())
+                if active is not None:
+                    return active, False
+
+            job = BackgroundJob(name=name, unique_name=name if unique else None, params_json=params_json,
+                                created_by=created_by, message='In coda')
+            db.session.add(job)
+            try:
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if not unique:
+                    raise
+                # Un altro invio concorrente ha messo in coda lo stesso job unico
+
+        self._wakeup.set()
+        logger.info(f"📥 Job {name} {job.id} in coda")
+        return job, True
+
+    def get(self, job_id: str) -> Optional[BackgroundJob]:
+        """Restituisce il job (da qualsiasi processo sia eseguito)"""
+        self._ensure_started()
+        return db.session.get(BackgroundJob, job_id)
+
+    def list_jobs(self, name: Optional[str] = None, limit: int = 20) -> List[BackgroundJob]:
+        """Ultimi job, opzionalmente filtrati per nome"""
+        self._ensure_started()
+        query = BackgroundJob.query
+        if name:
+            query = query.filter(BackgroundJob.name == name)
+        return query.order_by(BackgroundJob.created_at.desc()).limit(limit).all()
+
+    def cancel(self, job_id: str) -> Optional[BackgroundJob]:
+        """
+        Richiede l'annullamento di un job
+
+        Un job in coda viene annullato subito; uno in esecuzione si ferma al
+        successivo check_cancelled della sua funzione.
+
+        Returns:
+            Job aggiornato o None se non esiste
+        """
+        job = self.get(job_id)
+        if job is None or not job.is_active:
+            return job
+
+        with db.engine.begin() as conn:
+            cancelled = conn.execute(
+                update(_jobs)
+                .where(_jobs.c.id == job_id, _jobs.c.status == BackgroundJob.STATUS_QUEUED)
+                .values(status=BackgroundJob.STATUS_CANCELLED, cancel_requested=True,
+                        finished_at=datetime.utcnow(), message='Annullato')
+            ).rowcount
+            if not cancelled:
+                conn.execute(
+                    update(_jobs)
+                    .where(_jobs.c.id == job_id, _jobs.c.status == BackgroundJob.STATUS_RUNNING)
+                    .values(cancel_requested=True, message='Annullamento richiesto')
+                )
+
+        # Job di questo processo: annullamento immediato, gli altri al prossimo heartbeat
+        context = self._running.get(job_id)
+        if context is not None:
+            context._cancel.set()
+
+        db.session.refresh(job)
+        logger.info(f"🛑 Annullamento richiesto per il job {job_id}")
+        return job
+
+
+job_runner = JobRunner()
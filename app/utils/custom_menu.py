@@ -1,6 +1,4 @@
 # custom_menu.py
-from flask import g
-from .menu_structure import get_menu_structure
 from .menu import MenuManager
 
 class CustomMenuManager:
@@ -18,27 +16,23 @@ class CustomMenuManager:
     @staticmethod
     def get_menu_item_by_endpoint(endpoint):
         """Trova un item del menu principale per endpoint"""
-        def search_items(items):
-            for item in items:
-                if item.get('endpoint') == endpoint:
-                    return item
-                if 'children' in item:
-                    found = search_items(item['children'])
-                    if found:
-                        return found
-            return None
-        
-        menu_items = get_menu_structure()
-        return search_items(menu_items)
+        return MenuManager.get_menu_item_by_endpoint(endpoint)
     
     @staticmethod
     def create_custom_menu_from_endpoints(endpoints, validate_permissions=True, validate_endpoints=True, include_children=False):
         """Crea un menu personalizzato da una lista di endpoint"""
-        custom_menu = []
-        user_roles = []
+        user_roles = MenuManager.current_user_roles()
         
-        if hasattr(g, 'user') and g.user:
-            user_roles = g.user.get_role_names()
+        # Menu memorizzato per lista di endpoint, ruoli e opzioni
+        return MenuManager.memoized(
+            ('custom', tuple(endpoints), frozenset(user_roles), validate_permissions, validate_endpoints, include_children),
+            lambda: CustomMenuManager.build_custom_menu(endpoints, user_roles, validate_permissions, validate_endpoints, include_children)
+        )
+    
+    @staticmethod
+    def build_custom_menu(endpoints, user_roles, validate_permissions, validate_endpoints, include_children):
+        """Costruisce il menu personalizzato per i ruoli indicati"""
+        custom_menu = []
         
         for endpoint in endpoints:
             # Se l'endpoint contiene "children:", gestisci il caso speciale
@@ -95,18 +89,7 @@ class CustomMenuManager:
     @staticmethod
     def get_children_by_parent_title(parent_title):
         """Trova i figli di un item del menu per titolo del parent"""
-        def search_items(items):
-            for item in items:
-                if item.get('title') == parent_title and 'children' in item:
-                    return item['children']
-                if 'children' in item:
-                    found = search_items(item['children'])
-                    if found:
-                        return found
-            return []
-        
-        menu_items = get_menu_structure()
-        return search_items(menu_items)
+        return MenuManager.cache().children_by_title.get(parent_title, [])
     
     @staticmethod
     def get_predefined_menu(menu_name, validate_permissions=True, validate_endpoints=True):
@@ -144,47 +127,17 @@ def get_children_menu(endpoints_or_titles, validate_permissions=True, validate_e
     if isinstance(endpoints_or_titles, str):
         endpoints_or_titles = [endpoints_or_titles]
     
-    result_items = []
-    user_roles = []
-    
-    if hasattr(g, 'user') and g.user:
-        user_roles = g.user.get_role_names()
-    
-    def find_item_by_endpoint(target_endpoint, items):
-        """Trova un item specifico per endpoint (ricerca ricorsiva)"""
-        for item in items:
-            # Salta le sezioni
-            if item.get('type') == 'section':
-                continue
-                
-            # Controlla l'endpoint corrente
-            if item.get('endpoint') == target_endpoint:
-                return item
-            
-            # Cerca nei children se esistono
-            if 'children' in item:
-                found = find_item_by_endpoint(target_endpoint, item['children'])
-                if found:
-                    return found
-        return None
+    user_roles = MenuManager.current_user_roles()
     
-    def find_item_by_title(target_title, items):
-        """Trova un item specifico per titolo (ricerca ricorsiva)"""
-        for item in items:
-            # Salta le sezioni
-            if item.get('type') == 'section':
-                continue
-                
-            # Controlla il titolo corrente
-            if item.get('title') == target_title:
-                return item
-            
-            # Cerca nei children se esistono
-            if 'children' in item:
-                found = find_item_by_title(target_title, item['children'])
-                if found:
-                    return found
-        return None
+    # Risultato memorizzato per termini, ruoli e opzioni
+    return MenuManager.memoized(
+        ('children', tuple(endpoints_or_titles), frozenset(user_roles), validate_permissions, validate_endpoints),
+        lambda: _build_children_menu(endpoints_or_titles, user_roles, validate_permissions, validate_endpoints)
+    )
+
+def _build_children_menu(endpoints_or_titles, user_roles, validate_permissions, validate_endpoints):
+    """Costruisce il risultato di get_children_menu per i ruoli indicati"""
+    result_items = []
     
     def validate_item(item):
         """Valida un item secondo i parametri di validazione"""
@@ -198,15 +151,13 @@ def get_children_menu(endpoints_or_titles, validate_permissions=True, validate_e
                 
         return True
     
-    menu_items = get_menu_structure()
-    
     for search_term in endpoints_or_titles:
         # Prima prova a trovare per endpoint
-        found_item = find_item_by_endpoint(search_term, menu_items)
+        found_item = MenuManager.get_menu_item_by_endpoint(search_term)
         
         # Se non trovato per endpoint, prova per titolo
         if not found_item:
-            found_item = find_item_by_title(search_term, menu_items)
+            found_item = MenuManager.cache().items_by_title.get(search_term)
         
         if not found_item:
             continue
@@ -233,6 +184,4 @@ def get_children_menu(endpoints_or_titles, validate_permissions=True, validate_e
             if validate_item(found_item):
                 result_items.append(found_item.copy())
     
-    return result_items
-    
     return result_items
\ No newline at end of file
@@ -90,6 +90,11 @@ CDR_JSON_FOLDER = os.getenv('CDR_JSON_FOLDER')
 CDR_FTP_FOLDER = os.getenv('CDR_FTP_FOLDER')
 CONTACTS_FOLDER = os.getenv('CONTACTS_FOLDER')
 CONTACT_FILE = os.path.join(ARCHIVE_DIRECTORY, CONTACTS_FOLDER,os.getenv('CONTACT_FILE')) 
+# Registro contratti su database (bind SQLAlchemy 'contracts'); contracts.json resta come esportazione
+CONTRACTS_DATABASE_URL = os.getenv('CONTRACTS_DATABASE_URL', 'sqlite:///' + os.path.join(ARCHIVE_DIRECTORY, CONTACTS_FOLDER, 'contracts.sqlite3'))
+CONTRACTS_EXPORT_DELAY = float(os.getenv('CONTRACTS_EXPORT_DELAY', '10'))
+# Processi per la lettura parallela dei CDR (0 = numero di CPU, 1 = seriale)
+CDR_PARSE_WORKERS = int(os.getenv('CDR_PARSE_WORKERS', '1'))
 
 
 # Odoo
@@ -97,6 +102,20 @@ ODOO_URL = os.getenv('ODOO_URL')
 ODOO_DB = os.getenv('ODOO_DB')
 ODOO_USERNAME = os.getenv('ODOO_USERNAME')
 ODOO_API_KEY = os.getenv('ODOO_API_KEY')
+ODOO_POOL_SIZE = int(os.getenv('ODOO_POOL_SIZE', '4'))
+ODOO_MAX_REQUESTS_PER_SECOND = float(os.getenv('ODOO_MAX_REQUESTS_PER_SECOND', '10'))
+# Cache delle route (app/utils/simple_cache.py): numero massimo di voci e dimensione approssimativa
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '256'))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# Backend della cache: "memory" (per processo) o "sqlite" (condiviso tra i worker del nodo)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory').strip().lower()
+CACHE_SQLITE_PATH = os.path.join(PROJECT_ROOT, os.getenv('CACHE_SQLITE_PATH', 'cache/route_cache.sqlite3'))
+# Stato utente (attivo, conferma email, ruoli) in cache per processo (app/auth/identity.py); 0 = disattivata
+IDENTITY_CACHE_TTL = float(os.getenv('IDENTITY_CACHE_TTL', '30'))
+# Job in background (app/utils/background_jobs.py): thread per worker, polling della coda e timeout heartbeat in secondi
+JOBS_MAX_WORKERS = max(int(os.getenv('JOBS_MAX_WORKERS', '2')), 1)
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', '2'))
+JOBS_STALE_SECONDS = float(os.getenv('JOBS_STALE_SECONDS', '120'))
 # config/cdr_categories.json
 
 # JSON_FILE_NAME  = f"cdr_data_{datetime.now().strftime('%Y_%m')}.json"
@@ -4,10 +4,42 @@ Menu Manager - Gestisce il menu dinamico basato sui ruoli utente.
 La struttura del menu è definita in menu_structure.py
 """
 
-from flask import g, url_for, current_app
+from flask import g, url_for, current_app, has_request_context
 import logging
 from .menu_structure import get_menu_structure, get_menu_config as get_menu_structure_config
 
+class MenuCache:
+    """
+    Indici della struttura del menu e risultati già filtrati per l'app corrente.
+    
+    La struttura è statica: i percorsi per endpoint e titolo vengono calcolati
+    una volta, la validità degli endpoint al primo controllo e i menu filtrati
+    una volta per insieme di ruoli.
+    """
+    
+    def __init__(self, menu_items):
+        self.paths = {}             # endpoint -> [item radice, ..., item]
+        self.items_by_title = {}    # titolo -> primo item (non sezione) con quel titolo
+        self.children_by_title = {} # titolo -> figli del primo parent con quel titolo
+        self.endpoints = {}         # endpoint -> esiste nell'app
+        self.results = {}           # chiave (tipo, ruoli, opzioni) -> menu filtrato
+        self._index(menu_items, [])
+    
+    def _index(self, items, path):
+        for item in items:
+            current_path = path + [item]
+            endpoint = item.get('endpoint')
+            title = item.get('title')
+            
+            # Come la ricerca lineare: None corrisponde al primo item senza endpoint
+            if endpoint not in self.paths:
+                self.paths[endpoint] = current_path
+            if item.get('type') != 'section' and title not in self.items_by_title:
+                self.items_by_title[title] = item
+            if item.get('children'):
+                self.children_by_title.setdefault(title, item['children'])
+                self._index(item['children'], current_path)
+
 class MenuManager:
     """Gestisce il menu dinamico basato sui ruoli utente"""
     
@@ -15,14 +47,56 @@ class MenuManager:
         self.menu_items = get_menu_structure()
         self.config = get_menu_structure_config()
     
+    @staticmethod
+    def cache():
+        """Restituisce gli indici del menu dell'app corrente (creati al primo uso)"""
+        cache = current_app.extensions.get('menu_cache')
+        if cache is None:
+            cache = current_app.extensions.setdefault('menu_cache', MenuCache(get_menu_structure()))
+        return cache
+    
+    @staticmethod
+    def memoized(key, builder):
+        """Restituisce il risultato memorizzato per la chiave, calcolandolo con builder la prima volta"""
+        # Fuori da una richiesta url_for non è affidabile: nessuna memorizzazione
+        if not has_request_context():
+            return builder()
+        
+        results = MenuManager.cache().results
+        try:
+            if key not in results:
+                results[key] = builder()
+            return results[key]
+        except TypeError:
+            # Chiave non hashable (es. liste annidate): calcolo diretto
+            return builder()
+    
+    @staticmethod
+    def current_user_roles():
+        """Ruoli dell'utente corrente"""
+        if hasattr(g, 'user') and g.user:
+            return g.user.get_role_names()
+        return []
+    
     @staticmethod
     def endpoint_exists(endpoint_name):
         """Verifica se un endpoint esiste nell'applicazione Flask"""
         if not endpoint_name:
             return False
         
+        if has_request_context():
+            endpoints = MenuManager.cache().endpoints
+            exists = endpoints.get(endpoint_name)
+            if exists is None:
+                exists = endpoints[endpoint_name] = MenuManager._build_url(endpoint_name)
+            return exists
+        
+        return MenuManager._build_url(endpoint_name)
+    
+    @staticmethod
+    def _build_url(endpoint_name):
+        """Prova a generare l'URL per l'endpoint"""
         try:
-            # Prova a generare l'URL per l'endpoint
             url_for(endpoint_name)
             return True
         except:
@@ -106,10 +180,17 @@ class MenuManager:
             validate_endpoints = get_menu_structure_config().get('validate_endpoints_by_default', True)
             
         # Ottieni i ruoli dell'utente corrente
-        user_roles = []
-        if hasattr(g, 'user') and g.user:
-            user_roles = g.user.get_role_names()
+        user_roles = MenuManager.current_user_roles()
         
+        # Menu filtrato una sola volta per insieme di ruoli
+        return MenuManager.memoized(
+            ('menu', frozenset(user_roles), bool(validate_endpoints)),
+            lambda: MenuManager.build_menu(user_roles, validate_endpoints)
+        )
+    
+    @staticmethod
+    def build_menu(user_roles, validate_endpoints):
+        """Filtra la struttura completa del menu per i ruoli indicati"""
         filtered_menu = []
         menu_items = get_menu_structure()
         
@@ -186,9 +267,7 @@ class MenuManager:
         
         count_items(menu)
         
-        user_roles = []
-        if hasattr(g, 'user') and g.user:
-            user_roles = g.user.get_role_names()
+        user_roles = MenuManager.current_user_roles()
         
         return {
             'total_items': total_items,
@@ -255,19 +334,13 @@ class MenuManager:
     @staticmethod
     def get_menu_item_by_endpoint(endpoint_name):
         """Trova un item del menu per il suo endpoint"""
-        def search_items(items):
-            for item in items:
-                if item.get('endpoint') == endpoint_name:
-                    return item
-                
-                if 'children' in item:
-                    found = search_items(item['children'])
-                    if found:
-                        return found
-            return None
-        
-        menu_items = get_menu_structure()
-        return search_items(menu_items)
+        path = MenuManager.get_menu_path(endpoint_name)
+        return path[-1] if path else None
+    
+    @staticmethod
+    def get_menu_path(endpoint_name):
+        """Restituisce gli item dalla radice fino a quello con l'endpoint indicato"""
+        return MenuManager.cache().paths.get(endpoint_name)
     
     @staticmethod
     # def get_breadcrumb_for_endpoint(endpoint_name):
@@ -289,19 +362,7 @@ class MenuManager:
     #     breadcrumb = search_items(menu_items)
     #     return [item for item in breadcrumb if item] if breadcrumb else []
     def get_breadcrumb_for_endpoint(endpoint_name):
-        def search_items(items, path=[]):
-            for item in items:
-                current_path = path + [item]
-                if item.get('endpoint') == endpoint_name:
-                    return current_path
-                if 'children' in item:
-                    found = search_items(item['children'], current_path)
-                    if found:
-                        return found
-            return None
-
-        menu_items = get_menu_structure()
-        breadcrumb_items = search_items(menu_items)
+        breadcrumb_items = MenuManager.get_menu_path(endpoint_name)
         if not breadcrumb_items:
             return []
 
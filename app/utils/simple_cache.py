@@ -1,23 +1,493 @@
 """
-Sistema di cache semplice per le route Odoo esistenti - VERSIONE SEMPLIFICATA
+Sistema di cache per le route Odoo esistenti
+
+Cache LRU con scadenza per singola voce:
+- ogni voce ha il proprio timeout (quello del decorator che l'ha creata)
+- eviction LRU limitata per numero di voci e dimensione approssimativa
+- single-flight: richieste concorrenti sulla stessa chiave mancante eseguono
+  la funzione una sola volta, le altre attendono il risultato
+- contatori di hit/miss/eviction esposti da get_cache_stats()
+
+Il contenuto è conservato da un backend scelto con CACHE_BACKEND:
+- "memory" (default): dizionario LRU nel processo, eviction in O(1)
+- "sqlite": database SQLite in modalità WAL (CACHE_SQLITE_PATH) condiviso
+  da tutti i worker gunicorn del nodo, quindi hit e invalidazioni
+  (clear_cache_pattern) valgono per tutti i processi
+
+Le risposte con status di errore (>= 400) non vengono messe in cache.
 """
+from collections import OrderedDict
 from functools import wraps
 import hashlib
 import json
+import os
+import pickle
+import sqlite3
+import sys
+import threading
 import time
-from flask import request
+from flask import request, has_request_context, Response
 import logging
+from app.utils.env_manager import *
 
 logger = logging.getLogger(__name__)
 
-# Cache in memoria semplice
-_memory_cache = {}
-_cache_timestamps = {}
+# Timeout di default delle voci (secondi)
 CACHE_TIMEOUT = 300  # 5 minuti default
 
+
+class _CacheEntry:
+    """Voce della cache in memoria: valore, scadenza e dimensione stimata"""
+    __slots__ = ('value', 'created_at', 'expires_at', 'size')
+
+    def __init__(self, value, timeout, size):
+        self.value = value
+        self.created_at = time.time()
+        self.expires_at = time.monotonic() + timeout
+        self.size = size
+
+
+class _Flight:
+    """Caricamento in corso di una chiave (single-flight)"""
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def _approx_size(value, _depth=0):
+    """Dimensione approssimativa in byte di un valore (risposte Flask comprese)"""
+    if _depth > 3:
+        return sys.getsizeof(value)
+    # Response di Flask/Werkzeug: conta il corpo
+    if hasattr(value, 'get_data') and not getattr(value, 'is_streamed', False):
+        try:
+            return len(value.get_data()) + 512
+        except Exception:
+            return sys.getsizeof(value)
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(_approx_size(item, _depth + 1) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            _approx_size(k, _depth + 1) + _approx_size(v, _depth + 1) for k, v in value.items()
+        )
+    return sys.getsizeof(value)
+
+
+def _is_cacheable(result):
+    """Le risposte di errore (status >= 400) non vengono messe in cache"""
+    response = result
+    status = None
+    if isinstance(result, tuple) and result:
+        response = result[0]
+        if len(result) > 1 and isinstance(result[1], int):
+            status = result[1]
+    if status is None:
+        status = getattr(response, 'status_code', 200)
+    return status < 400
+
+
+class _StoredResponse:
+    """Risposta Flask ridotta a corpo, status e header per la serializzazione"""
+    __slots__ = ('body', 'status', 'headers')
+
+    def __init__(self, response):
+        self.body = response.get_data()
+        self.status = response.status_code
+        self.headers = list(response.headers.items())
+
+    def __getstate__(self):
+        return (self.body, self.status, self.headers)
+
+    def __setstate__(self, state):
+        self.body, self.status, self.headers = state
+
+    def to_response(self):
+        return Response(self.body, status=self.status, headers=self.headers)
+
+
+def _encode_value(value):
+    """Serializza un valore per un backend condiviso (risposte Flask comprese)"""
+    def convert(item):
+        if isinstance(item, Response):
+            return _StoredResponse(item)
+        if isinstance(item, tuple):
+            return tuple(convert(element) for element in item)
+        return item
+    return pickle.dumps(convert(value), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _decode_value(data):
+    """Ricostruisce un valore salvato con _encode_value"""
+    def convert(item):
+        if isinstance(item, _StoredResponse):
+            return item.to_response()
+        if isinstance(item, tuple):
+            return tuple(convert(element) for element in item)
+        return item
+    return convert(pickle.loads(data))
+
+
+class MemoryCacheBackend:
+    """Backend in memoria del processo: OrderedDict LRU con limite di voci e di byte"""
+
+    name = "Memory LRU"
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        """
+        Args:
+            max_entries: Numero massimo di voci
+            max_bytes: Dimensione approssimativa massima del contenuto
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        return entry
+
+    def get(self, key):
+        """Valore in cache (None se assente o scaduto); aggiorna l'ordine LRU"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry.value
+            self._remove(key)
+            self.expirations += 1
+            return None
+
+    def set(self, key, value, timeout):
+        """Inserisce una voce con il proprio timeout ed esegue l'eviction LRU"""
+        size = _approx_size(value)
+        if size > self.max_bytes:
+            logger.warning(f"Cache SET ignorato: voce {key} troppo grande ({size} byte)")
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CacheEntry(value, timeout, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                return True
+            return False
+
+    def clear(self, pattern=""):
+        """Rimuove le voci la cui chiave contiene pattern (tutte se vuoto)"""
+        with self._lock:
+            keys_to_remove = [key for key in self._entries if pattern in key] if pattern else list(self._entries)
+            for key in keys_to_remove:
+                self._remove(key)
+            return len(keys_to_remove)
+
+    def stats(self):
+        with self._lock:
+            created = [entry.created_at for entry in self._entries.values()]
+            return {
+                "cache_size": len(self._entries),
+                "cache_bytes": self._bytes,
+                "cache_keys": list(self._entries.keys())[-10:],  # Ultime 10 chiavi usate
+                "oldest_entry": min(created) if created else None,
+                "newest_entry": max(created) if created else None
+            }
+
+
+class SQLiteCacheBackend:
+    """
+    Backend condiviso tra processi: database SQLite in modalità WAL
+
+    Ogni thread di ogni processo usa una propria connessione (ricreata dopo
+    un fork). In WAL le letture non bloccano la scrittura, quindi gli hit dei
+    worker procedono in parallelo; l'ordine LRU è dato da accessed_at,
+    aggiornato al massimo una volta al secondo per voce.
+    """
+
+    name = "SQLite WAL"
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed ON cache_entries (accessed_at);
+    """
+
+    def __init__(self, path, max_entries=256, max_bytes=64 * 1024 * 1024, busy_timeout=5.0):
+        """
+        Args:
+            path: File del database (le cartelle mancanti vengono create)
+            max_entries: Numero massimo di voci
+            max_bytes: Dimensione massima del contenuto serializzato
+            busy_timeout: Attesa massima in secondi su un database bloccato
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self.evictions = 0
+        self.expirations = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().executescript(self._SCHEMA)
+
+    def _connection(self):
+        """Connessione del thread corrente (nuova dopo un fork del processo)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, accessed_at = row
+        now = time.time()
+        if expires_at <= now:
+            conn.execute("DELETE FROM cache_entries WHERE key = ? AND expires_at = ?", (key, expires_at))
+            self.expirations += 1
+            return None
+        if now - accessed_at >= 1:
+            conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return _decode_value(value)
+
+    def set(self, key, value, timeout):
+        data = _encode_value(value)
+        if len(data) > self.max_bytes:
+            logger.warning(f"Cache SET ignorato: voce {key} troppo grande ({len(data)} byte)")
+            return
+
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, size, created_at, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now + timeout, now)
+            )
+            self._evict(conn, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn, now):
+        """Rimuove le voci scadute e poi le meno usate finché i limiti sono rispettati"""
+        self.expirations += conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,)).rowcount
+
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM cache_entries ORDER BY accessed_at"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM cache_entries WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def delete(self, key):
+        return self._connection().execute("DELETE FROM cache_entries WHERE key = ?", (key,)).rowcount > 0
+
+    def clear(self, pattern=""):
+        """Rimuove per tutti i processi le voci la cui chiave contiene pattern"""
+        conn = self._connection()
+        if pattern:
+            return conn.execute("DELETE FROM cache_entries WHERE instr(key, ?) > 0", (pattern,)).rowcount
+        return conn.execute("DELETE FROM cache_entries").rowcount
+
+    def stats(self):
+        conn = self._connection()
+        count, total, oldest, newest = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(created_at), MAX(created_at) FROM cache_entries"
+        ).fetchone()
+        keys = [row[0] for row in conn.execute(
+            "SELECT key FROM cache_entries ORDER BY accessed_at DESC LIMIT 10"
+        )]
+        return {
+            "cache_size": count,
+            "cache_bytes": total,
+            "cache_keys": keys,
+            "oldest_entry": oldest,
+            "newest_entry": newest,
+            "cache_path": self.path
+        }
+
+
+class CacheStore:
+    """Cache delle route: single-flight e contatori sopra un backend intercambiabile"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'loads': 0,
+            'load_errors': 0,
+            'coalesced': 0
+        }
+
+    def get(self, key):
+        """Valore in cache (None se assente, scaduto o backend non disponibile)"""
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Cache GET error: {e}")
+            value = None
+        with self._lock:
+            self._stats['hits' if value is not None else 'misses'] += 1
+        return value
+
+    def _peek(self, key):
+        """Come get ma senza aggiornare i contatori"""
+        try:
+            return self.backend.get(key)
+        except Exception:
+            return None
+
+    def set(self, key, value, timeout=None):
+        """Salva una voce con il proprio timeout (CACHE_TIMEOUT se non indicato)"""
+        try:
+            self.backend.set(key, value, CACHE_TIMEOUT if timeout is None else timeout)
+        except Exception as e:
+            logger.warning(f"Cache SET error: {e}")
+
+    def get_or_load(self, key, loader, timeout=None, cacheable=None):
+        """
+        Valore in cache oppure risultato di loader(), eseguito una sola volta per chiave
+
+        Le richieste concorrenti sulla stessa chiave mancante attendono il
+        caricamento in corso invece di rieseguire loader; se loader solleva
+        un'eccezione questa viene propagata anche a chi attendeva.
+
+        Args:
+            key: Chiave
+            loader: Funzione senza argomenti che produce il valore
+            timeout: Scadenza della voce in secondi
+            cacheable: Funzione che decide se il risultato va salvato (default: sempre)
+
+        Returns:
+            Valore in cache o appena caricato
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        return self.load(key, loader, timeout, cacheable)
+
+    def load(self, key, loader, timeout=None, cacheable=None):
+        """Come get_or_load, per chi ha già registrato il miss con get()"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            # Caricata da un'altra richiesta (o da un altro worker) dopo il get()
+            value = self._peek(key)
+            if value is not None:
+                flight.value = value
+                return value
+
+            value = loader()
+            self._stats['loads'] += 1
+            if value is not None and (cacheable is None or cacheable(value)):
+                self.set(key, value, timeout)
+            flight.value = value
+            return value
+        except BaseException as e:
+            self._stats['load_errors'] += 1
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def clear(self, pattern=""):
+        return self.backend.clear(pattern)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._stats)
+            in_flight = len(self._flights)
+        return {
+            "cache_type": self.backend.name,
+            **self.backend.stats(),
+            "max_entries": self.backend.max_entries,
+            "max_bytes": self.backend.max_bytes,
+            "in_flight": in_flight,
+            **counters,
+            "evictions": self.backend.evictions,
+            "expirations": self.backend.expirations
+        }
+
+
+def _create_backend():
+    """Backend configurato con CACHE_BACKEND; in caso di errore torna alla memoria"""
+    if CACHE_BACKEND == 'sqlite':
+        try:
+            return SQLiteCacheBackend(CACHE_SQLITE_PATH, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES)
+        except Exception as e:
+            logger.error(f"Cache SQLite non disponibile ({CACHE_SQLITE_PATH}): {e} - uso la cache in memoria")
+    elif CACHE_BACKEND != 'memory':
+        logger.warning(f"CACHE_BACKEND '{CACHE_BACKEND}' non riconosciuto - uso la cache in memoria")
+    return MemoryCacheBackend(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES)
+
+
+_cache = CacheStore(_create_backend())
+
+
 class SimpleCache:
-    """Cache semplice solo in memoria"""
-    
+    """Accesso alla cache condivisa delle route"""
+
     @staticmethod
     def _generate_cache_key(prefix, *args, **kwargs):
         """Genera chiave cache univoca"""
@@ -25,55 +495,61 @@ class SimpleCache:
             'prefix': prefix,
             'args': args,
             'kwargs': kwargs,
-            'query_params': dict(request.args) if request else {}
+            'query_params': dict(request.args) if has_request_context() else {}
         }
-        
+
         key_string = json.dumps(key_data, sort_keys=True, default=str)
         key_hash = hashlib.md5(key_string.encode()).hexdigest()[:12]
         return f"{prefix}_{key_hash}"
-    
+
     @staticmethod
     def get(key):
         """Recupera dalla cache"""
         try:
-            if key in _memory_cache:
-                timestamp = _cache_timestamps.get(key, 0)
-                if time.time() - timestamp < CACHE_TIMEOUT:
-                    return _memory_cache[key]
-                else:
-                    # Scaduto, rimuovi
-                    _memory_cache.pop(key, None)
-                    _cache_timestamps.pop(key, None)
-            return None
+            return _cache.get(key)
         except Exception as e:
             logger.warning(f"Cache GET error: {e}")
             return None
-    
+
     @staticmethod
     def set(key, value, timeout=None):
-        """Imposta in cache"""
+        """Imposta in cache con il timeout della singola voce"""
         try:
-            _memory_cache[key] = value
-            _cache_timestamps[key] = time.time()
-            
-            # Pulizia automatica (mantieni solo 100 elementi)
-            if len(_memory_cache) > 100:
-                # Rimuovi i 20 più vecchi
-                oldest_keys = sorted(_cache_timestamps.items(), key=lambda x: x[1])[:20]
-                for old_key, _ in oldest_keys:
-                    _memory_cache.pop(old_key, None)
-                    _cache_timestamps.pop(old_key, None)
-                    
+            _cache.set(key, value, timeout)
         except Exception as e:
             logger.warning(f"Cache SET error: {e}")
 
+    @staticmethod
+    def get_or_load(key, loader, timeout=None):
+        """Recupera dalla cache o esegue loader una sola volta per chiave"""
+        return _cache.get_or_load(key, loader, timeout, cacheable=_is_cacheable)
+
+    @staticmethod
+    def load(key, loader, timeout=None):
+        """Esegue loader una sola volta per chiave dopo un miss e salva il risultato"""
+        return _cache.load(key, loader, timeout, cacheable=_is_cacheable)
+
+
+def _timed_loader(f, cache_key, args, kwargs):
+    """Esegue la funzione originale registrando il tempo di esecuzione"""
+    def loader():
+        logger.info(f"⏳ Cache MISS: {cache_key} - Executing...")
+        start_time = time.time()
+        result = f(*args, **kwargs)
+        execution_time = time.time() - start_time
+        logger.info(f"✅ Executed in {execution_time:.3f}s - Caching result")
+        return result
+    return loader
+
+
 def cached_route(timeout=300, key_prefix="odoo_api"):
     """
     Decorator per aggiungere cache alle route esistenti
+
+    Args:
+        timeout: Scadenza in secondi delle voci create da questa route
+        key_prefix: Prefisso delle chiavi (usato da clear_cache_pattern)
     """
-    global CACHE_TIMEOUT
-    CACHE_TIMEOUT = timeout  # Imposta il timeout globalmente
-    
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
@@ -81,26 +557,15 @@ def cached_route(timeout=300, key_prefix="odoo_api"):
             cache_key = SimpleCache._generate_cache_key(
                 f"{key_prefix}_{f.__name__}", *args, **kwargs
             )
-            
+
             # Prova a recuperare dalla cache
             cached_result = SimpleCache.get(cache_key)
             if cached_result is not None:
                 logger.info(f"🚀 Cache HIT: {cache_key}")
                 return cached_result
-            
-            # Esegui la funzione originale
-            logger.info(f"⏳ Cache MISS: {cache_key} - Executing...")
-            start_time = time.time()
-            
-            result = f(*args, **kwargs)
-            
-            execution_time = time.time() - start_time
-            logger.info(f"✅ Executed in {execution_time:.3f}s - Caching result")
-            
-            # Salva in cache
-            SimpleCache.set(cache_key, result, timeout)
-            
-            return result
+
+            # Esegue la funzione originale (una sola volta per chiave) e salva in cache
+            return SimpleCache.load(cache_key, _timed_loader(f, cache_key, args, kwargs), timeout)
         return decorated_function
     return decorator
 
@@ -114,71 +579,61 @@ def cached_route_with_retry(timeout=300, key_prefix="odoo_api", max_retries=2):
             cache_key = SimpleCache._generate_cache_key(
                 f"{key_prefix}_{f.__name__}", *args, **kwargs
             )
-            
+
             # Prova cache
             cached_result = SimpleCache.get(cache_key)
             if cached_result is not None:
                 logger.info(f"🚀 Cache HIT: {cache_key}")
                 return cached_result
-            
-            # Esegui con retry
-            last_error = None
-            for attempt in range(max_retries + 1):
-                try:
-                    logger.info(f"⏳ Cache MISS: {cache_key} - Attempt {attempt + 1}")
-                    start_time = time.time()
-                    
-                    result = f(*args, **kwargs)
-                    
-                    execution_time = time.time() - start_time
-                    logger.info(f"✅ Executed in {execution_time:.3f}s - Caching result")
-                    
-                    # Salva in cache solo se successo
-                    SimpleCache.set(cache_key, result, timeout)
-                    return result
-                    
-                except Exception as e:
-                    last_error = e
-                    if "ODOO_CONNECTION_ERROR" in str(e) and attempt < max_retries:
-                        logger.warning(f"🔄 Tentativo {attempt + 1} fallito, riprovo...")
-                        time.sleep(1)  # Pausa prima del retry
-                        continue
-                    else:
-                        raise e
-            
-            # Se arriva qui, tutti i tentativi sono falliti
-            raise last_error
-            
+
+            def load_with_retry():
+                # Esegui con retry
+                last_error = None
+                for attempt in range(max_retries + 1):
+                    try:
+                        logger.info(f"⏳ Cache MISS: {cache_key} - Attempt {attempt + 1}")
+                        start_time = time.time()
+
+                        result = f(*args, **kwargs)
+
+                        execution_time = time.time() - start_time
+                        logger.info(f"✅ Executed in {execution_time:.3f}s - Caching result")
+                        return result
+
+                    except Exception as e:
+                        last_error = e
+                        if "ODOO_CONNECTION_ERROR" in str(e) and attempt < max_retries:
+                            logger.warning(f"🔄 Tentativo {attempt + 1} fallito, riprovo...")
+                            time.sleep(1)  # Pausa prima del retry
+                            continue
+                        else:
+                            raise e
+
+                # Se arriva qui, tutti i tentativi sono falliti
+                raise last_error
+
+            # Salva in cache solo se successo
+            return SimpleCache.load(cache_key, load_with_retry, timeout)
+
         return decorated_function
     return decorator
 
 def clear_cache_pattern(pattern=""):
     """Pulisce la cache per pattern specifico"""
     try:
-        if pattern:
-            keys_to_remove = [key for key in _memory_cache.keys() if pattern in key]
-        else:
-            keys_to_remove = list(_memory_cache.keys())
-            
-        for key in keys_to_remove:
-            _memory_cache.pop(key, None)
-            _cache_timestamps.pop(key, None)
-        
-        logger.info(f"🧹 Cache cleared for pattern: '{pattern}' - {len(keys_to_remove)} keys removed")
+        removed = _cache.clear(pattern)
+        logger.info(f"🧹 Cache cleared for pattern: '{pattern}' - {removed} keys removed")
         return True
     except Exception as e:
         logger.error(f"Error clearing cache: {e}")
         return False
 
 def get_cache_stats():
-    """Statistiche della cache"""
+    """Statistiche della cache: dimensione, limiti e contatori hit/miss/eviction"""
     try:
-        return {
-            "cache_type": "Memory",
-            "cache_size": len(_memory_cache),
-            "cache_keys": list(_memory_cache.keys())[:10],  # Prime 10 chiavi
-            "oldest_entry": min(_cache_timestamps.values()) if _cache_timestamps else None,
-            "newest_entry": max(_cache_timestamps.values()) if _cache_timestamps else None
-        }
+        stats = _cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        return stats
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
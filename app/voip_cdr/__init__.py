@@ -9,6 +9,8 @@ create_listino_routes(admin_voip_cdr)
 api_voip_cdr = Blueprint('api_voip_cdr', __name__, url_prefix='/api')
 from app.routes.api_voip_cdr import register_api_voip_cdr_routes
 register_api_voip_cdr_routes(api_voip_cdr)
+from app.routes.api_jobs import register_api_jobs_routes
+register_api_jobs_routes(api_voip_cdr)
 
 api_odoo = Blueprint('api_odoo', __name__, url_prefix='/api')
 from app.routes.odoo import register_api_odoo_routes
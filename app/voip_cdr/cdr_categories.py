@@ -13,6 +13,8 @@ from typing import Dict, List, Any, Optional
 from dataclasses import dataclass, asdict
 from collections import defaultdict
 from app.utils.env_manager import *
+from app.voip_cdr.cdr_tariff import CDRTariffEngine
+from app.voip_cdr import cdr_json
 
 logger = logging.getLogger(__name__)
 
@@ -183,12 +185,14 @@ class CDRCategoriesManager:
         self.global_markup_percent = float(os.getenv('VOIP_MARKUP_PERCENT', 0.0))
         
         self.categories: Dict[str, CDRCategory] = {}
+        self._tariff_engine: Optional[CDRTariffEngine] = None
         logger.info(f"🔧 CDR Categories Manager - File config: {self.config_file}")
         logger.info(f"💰 Markup globale da config: {self.global_markup_percent}%")
         self.load_categories()
 
     def load_categories(self):
         """Carica le categorie dal file di configurazione"""
+        self._tariff_engine = None
         try:
             if self.config_file.exists():
                 with open(self.config_file, 'r', encoding='utf-8') as f:
@@ -225,6 +229,8 @@ class CDRCategoriesManager:
     
     def save_categories(self):
         """Salva le categorie nel file di configurazione"""
+        # Ogni modifica passa da qui: il matcher verrà ricompilato al prossimo uso
+        self._tariff_engine = None
         try:
             if self.config_file.exists():
                 backup_file = Path(str(self.config_file) + f'.backup.{datetime.now().strftime("%Y%m%d_%H%M%S")}')
@@ -236,8 +242,7 @@ class CDRCategoriesManager:
             for cat_name, category in self.categories.items():
                 data[cat_name] = asdict(category)
             
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            cdr_json.dump(data, self.config_file, pretty=True)
             
             logger.info(f"Categorie salvate in {self.config_file}")
             return True
@@ -386,16 +391,21 @@ class CDRCategoriesManager:
         
         return result
     
+    def get_tariff_engine(self) -> CDRTariffEngine:
+        """Restituisce il matcher compilato delle categorie, ricostruendolo se invalidato"""
+        if self._tariff_engine is None:
+            self._tariff_engine = CDRTariffEngine(
+                {name: asdict(category) for name, category in self.categories.items()}
+            )
+        return self._tariff_engine
+    
     def classify_call_type(self, call_type: str) -> Optional[CDRCategory]:
         """Classifica un tipo di chiamata e restituisce la categoria corrispondente"""
         if not call_type:
             return None
         
-        for category in self.categories.values():
-            if category.is_active and category.matches_pattern(call_type):
-                return category
-        
-        return None
+        category_name = self.get_tariff_engine().classify(call_type)
+        return self.categories.get(category_name) if category_name else None
     
     def calculate_call_cost(self, call_type: str, duration_seconds: int, unit: str = 'per_minute') -> Dict[str, Any]:
         """Calcola il costo di una chiamata basato sulla categoria"""
@@ -966,8 +976,7 @@ class CDRAnalyticsEnhanced:
                 'categories_statistics': self.categories_manager.get_statistics()
             }
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(report, f, indent=2, ensure_ascii=False)
+            cdr_json.dump(report, filepath, pretty=True)
             
             logger.info(f"📄 Report contratto con categorie salvato: {filepath}")
             return str(filepath)
@@ -1101,8 +1110,7 @@ class CDRAnalyticsEnhanced:
                 }
             }
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(summary_report, f, indent=2, ensure_ascii=False)
+            cdr_json.dump(summary_report, filepath, pretty=True)
             
             logger.info(f"📊 Report summary globale con categorie generato: {filepath}")
             return str(filepath)
@@ -0,0 +1,493 @@
+"""
+CDR Contract Store - Registro contratti su database (bind SQLAlchemy 'contracts')
+
+I contratti sono righe della tabella contracts (una per codice, con il JSON
+completo del contratto e le colonne indicizzate odoo_client_id,
+contract_type e contract_name) e i numeri di telefono righe di
+contract_phone_numbers. La riga unica di contract_registry_state conserva la
+revisione del registro e i metadati di contracts.json.
+
+Ogni scrittura è una transazione che come prima istruzione incrementa la
+revisione: su SQLite questo acquisisce subito il lock di scrittura, quindi le
+letture successive nella stessa transazione sono coerenti e due worker non
+possono perdere l'uno le modifiche dell'altro. La modifica di un contratto
+tocca una sola riga; l'estrazione da nuovi CDR legge e aggiorna solo i
+contratti presenti nei file.
+
+contracts.json resta come esportazione per compatibilità: viene riscritto
+subito dopo le operazioni massive e, dopo le modifiche singole, una sola
+volta ogni CONTRACTS_EXPORT_DELAY secondi. Al primo avvio un contracts.json
+esistente viene importato nel database.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, delete, event, func, insert, select, update
+
+from app import db
+from app.models.contract import Contract, ContractPhoneNumber, ContractRegistryState
+from app.utils.env_manager import *
+from app.voip_cdr import cdr_json
+
+logger = logging.getLogger(__name__)
+
+_contracts = Contract.__table__
+_phones = ContractPhoneNumber.__table__
+_state = ContractRegistryState.__table__
+
+# Parametri per IN (...) sotto il limite di variabili di SQLite
+_CHUNK = 500
+
+StateBuilder = Callable[[Dict[str, Any], Dict[str, Any], Dict[str, int]], Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]
+
+
+class _ContractNotFound(Exception):
+    """Annulla la transazione di update_contract per un codice inesistente"""
+
+
+def _chunks(items: List[Any]) -> Iterable[List[Any]]:
+    for i in range(0, len(items), _CHUNK):
+        yield items[i:i + _CHUNK]
+
+
+def _text(value: Any, max_length: int) -> Optional[str]:
+    """Valore per una colonna indicizzata: stringa senza spazi esterni o None"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value[:max_length] if value else None
+
+
+def _phone_list(contract: Dict[str, Any]) -> List[str]:
+    phone_numbers = contract.get('phone_numbers') or []
+    if not isinstance(phone_numbers, list):
+        phone_numbers = [phone_numbers]
+    return list(dict.fromkeys(str(number).strip() for number in phone_numbers if str(number).strip()))
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL: le letture dei worker non bloccano la scrittura (e viceversa)"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+class ContractStore:
+    """Accesso transazionale al registro contratti su database"""
+
+    BIND_KEY = 'contracts'
+    STATE_ID = 1
+
+    _ready_engines = set()
+    _ready_lock = threading.Lock()
+    _export_lock = threading.Lock()
+    _export_timer: Optional[threading.Timer] = None
+
+    def __init__(self, export_path: Any = None):
+        """
+        Args:
+            export_path: File JSON di esportazione/importazione (default CONTACT_FILE)
+        """
+        self.export_path = Path(export_path or CONTACT_FILE)
+
+    @classmethod
+    def available(cls) -> bool:
+        """True se c'è un contesto applicativo con il bind 'contracts' configurato"""
+        return has_app_context() and cls.BIND_KEY in (current_app.config.get('SQLALCHEMY_BINDS') or {})
+
+    # ------------------------------------------------------------------ #
+    # Inizializzazione e transazioni
+    # ------------------------------------------------------------------ #
+
+    def _engine(self):
+        """Engine del bind, con tabelle create e import iniziale eseguito una volta per processo"""
+        engine = db.engines[self.BIND_KEY]
+        if engine in self._ready_engines:
+            return engine
+
+        with self._ready_lock:
+            if engine in self._ready_engines:
+                return engine
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', _sqlite_pragmas)
+                if engine.url.database:
+                    Path(engine.url.database).parent.mkdir(parents=True, exist_ok=True)
+            db.metadatas[self.BIND_KEY].create_all(engine)
+
+            with engine.begin() as conn:
+                if conn.execute(select(_state.c.id).where(_state.c.id == self.STATE_ID)).first() is None:
+                    conn.execute(insert(_state).prefix_with('OR IGNORE', dialect='sqlite').values(
+                        id=self.STATE_ID, revision=0, exported_revision=0
+                    ))
+            self._ready_engines.add(engine)
+
+        self._import_json_if_needed()
+        return engine
+
+    @contextmanager
+    def _write(self):
+        """
+        Transazione di scrittura
+
+        Yields:
+            (connessione, nuova revisione del registro)
+        """
+        engine = self._engine()
+        with engine.begin() as conn:
+            # Prima istruzione: incremento della revisione (lock di scrittura immediato)
+            conn.execute(update(_state).where(_state.c.id == self.STATE_ID).values(revision=_state.c.revision + 1))
+            revision = conn.execute(select(_state.c.revision).where(_state.c.id == self.STATE_ID)).scalar_one()
+            yield conn, revision
+
+    def _read_state(self, conn) -> Dict[str, Any]:
+        row = conn.execute(select(_state).where(_state.c.id == self.STATE_ID)).mappings().one()
+        return {
+            'revision': row['revision'],
+            'exported_revision': row['exported_revision'],
+            'metadata': cdr_json.loads(row['metadata_json']) if row['metadata_json'] else {},
+            'last_extraction': cdr_json.loads(row['last_extraction_json']) if row['last_extraction_json'] else None,
+            'imported_at': row['imported_at']
+        }
+
+    def _write_state(self, conn, metadata: Dict[str, Any], last_extraction: Any = False, **values) -> None:
+        values['metadata_json'] = cdr_json.dumps(metadata)
+        if last_extraction is not False:
+            values['last_extraction_json'] = cdr_json.dumps(last_extraction) if last_extraction is not None else None
+        conn.execute(update(_state).where(_state.c.id == self.STATE_ID).values(**values))
+
+    # ------------------------------------------------------------------ #
+    # Righe contratto
+    # ------------------------------------------------------------------ #
+
+    @staticmethod
+    def _row_values(contract_code: str, contract: Dict[str, Any], revision: int) -> Dict[str, Any]:
+        return {
+            'contract_code': contract_code,
+            'contract_name': _text(contract.get('contract_name'), 255),
+            'odoo_client_id': _text(contract.get('odoo_client_id'), 64),
+            'contract_type': _text(contract.get('contract_type'), 64),
+            'data': cdr_json.dumps(contract),
+            'revision': revision,
+            'updated_at': datetime.utcnow()
+        }
+
+    def _load_rows(self, conn, contract_codes: List[str]) -> Dict[str, Tuple[int, Dict[str, Any]]]:
+        """Contratti esistenti tra i codici indicati: {codice: (id, contratto)}"""
+        rows = {}
+        for chunk in _chunks(contract_codes):
+            query = select(_contracts.c.id, _contracts.c.contract_code, _contracts.c.data).where(
+                _contracts.c.contract_code.in_(chunk)
+            )
+            for contract_id, contract_code, data in conn.execute(query):
+                rows[contract_code] = (contract_id, cdr_json.loads(data))
+        return rows
+
+    def _sync_phones(self, conn, phones_by_id: Dict[int, List[str]], replace: bool) -> None:
+        """Allinea contract_phone_numbers ai numeri dei contratti indicati"""
+        current = {}
+        if replace:
+            for chunk in _chunks(list(phones_by_id)):
+                query = select(_phones.c.contract_id, _phones.c.phone_number).where(_phones.c.contract_id.in_(chunk))
+                for contract_id, phone_number in conn.execute(query):
+                    current.setdefault(contract_id, set()).add(phone_number)
+
+        to_insert = []
+        to_delete = []
+        for contract_id, phone_numbers in phones_by_id.items():
+            existing = current.get(contract_id, set())
+            wanted = set(phone_numbers)
+            to_insert.extend({'contract_id': contract_id, 'phone_number': number[:64]}
+                             for number in phone_numbers if number not in existing)
+            to_delete.extend({'_contract_id': contract_id, '_phone_number': number} for number in existing - wanted)
+
+        if to_delete:
+            conn.execute(delete(_phones).where(
+                (_phones.c.contract_id == bindparam('_contract_id')) & (_phones.c.phone_number == bindparam('_phone_number'))
+            ), to_delete)
+        if to_insert:
+            conn.execute(insert(_phones), to_insert)
+
+    def _upsert(self, conn, revision: int, contracts: Dict[str, Dict[str, Any]],
+                existing: Dict[str, Tuple[int, Dict[str, Any]]]) -> int:
+        """
+        Inserisce i contratti nuovi e aggiorna quelli esistenti
+
+        Returns:
+            Numero di contratti inseriti
+        """
+        contracts = {str(contract_code): contract for contract_code, contract in contracts.items()}
+        updates = []
+        inserts = []
+        phones_by_id = {}
+        for contract_code, contract in contracts.items():
+            values = self._row_values(contract_code, contract, revision)
+            if contract_code in existing:
+                contract_id = existing[contract_code][0]
+                updates.append({'_id': contract_id, **values})
+                phones_by_id[contract_id] = _phone_list(contract)
+            else:
+                inserts.append(values)
+
+        if updates:
+            conn.execute(update(_contracts).where(_contracts.c.id == bindparam('_id')), updates)
+            self._sync_phones(conn, phones_by_id, replace=True)
+
+        if inserts:
+            conn.execute(insert(_contracts), inserts)
+            new_ids = {}
+            for chunk in _chunks([values['contract_code'] for values in inserts]):
+                query = select(_contracts.c.contract_code, _contracts.c.id).where(_contracts.c.contract_code.in_(chunk))
+                new_ids.update(conn.execute(query).all())
+            self._sync_phones(conn, {
+                contract_id: _phone_list(contracts[contract_code]) for contract_code, contract_id in new_ids.items()
+            }, replace=False)
+
+        return len(inserts)
+
+    def _count(self, conn) -> int:
+        return conn.execute(select(func.count()).select_from(_contracts)).scalar_one()
+
+    # ------------------------------------------------------------------ #
+    # Letture
+    # ------------------------------------------------------------------ #
+
+    def revision(self) -> int:
+        """Revisione corrente: cambia a ogni scrittura, da qualunque processo"""
+        with self._engine().connect() as conn:
+            return conn.execute(select(_state.c.revision).where(_state.c.id == self.STATE_ID)).scalar_one()
+
+    def export_data(self) -> Tuple[int, Dict[str, Any]]:
+        """
+        Contenuto del registro nel formato di contracts.json
+
+        Returns:
+            (revisione, {'metadata', 'contracts', 'last_extraction'})
+        """
+        engine = self._engine()
+        while True:
+            with engine.connect() as conn:
+                state = self._read_state(conn)
+                contracts = {
+                    contract_code: cdr_json.loads(data)
+                    for contract_code, data in conn.execute(
+                        select(_contracts.c.contract_code, _contracts.c.data).order_by(_contracts.c.id)
+                    )
+                }
+                # Scrittura concorrente durante la lettura: si rilegge
+                if self._read_state(conn)['revision'] != state['revision']:
+                    continue
+
+            data = {'metadata': state['metadata'], 'contracts': contracts}
+            if state['last_extraction'] is not None:
+                data['last_extraction'] = state['last_extraction']
+            return state['revision'], data
+
+    def get(self, contract_code: Any) -> Optional[Dict[str, Any]]:
+        """Singolo contratto per codice"""
+        with self._engine().connect() as conn:
+            data = conn.execute(
+                select(_contracts.c.data).where(_contracts.c.contract_code == str(contract_code).strip())
+            ).scalar_one_or_none()
+        return cdr_json.loads(data) if data is not None else None
+
+    def find_by_phone(self, phone_number: Any) -> List[Dict[str, Any]]:
+        """Contratti che contengono il numero di telefono"""
+        query = select(_contracts.c.data).join(_phones, _phones.c.contract_id == _contracts.c.id).where(
+            _phones.c.phone_number == str(phone_number).strip()
+        ).order_by(_contracts.c.id)
+        with self._engine().connect() as conn:
+            return [cdr_json.loads(data) for data in conn.execute(query).scalars()]
+
+    # ------------------------------------------------------------------ #
+    # Scritture
+    # ------------------------------------------------------------------ #
+
+    def update_contract(self, contract_code: Any, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Aggiorna i campi di un contratto (una riga, transazione atomica)
+
+        Args:
+            contract_code: Codice del contratto
+            changes: Campi da sostituire
+
+        Returns:
+            Contratto aggiornato o None se il codice non esiste
+        """
+        contract_code = str(contract_code).strip()
+        try:
+            with self._write() as (conn, revision):
+                existing = self._load_rows(conn, [contract_code])
+                if contract_code not in existing:
+                    raise _ContractNotFound(contract_code)
+
+                contract_id, contract = existing[contract_code]
+                now = datetime.now().isoformat()
+                contract.update(changes)
+                contract['last_updated'] = now
+                if 'phone_numbers' in changes:
+                    self._upsert(conn, revision, {contract_code: contract}, existing)
+                else:
+                    conn.execute(update(_contracts).where(_contracts.c.id == contract_id).values(
+                        **self._row_values(contract_code, contract, revision)
+                    ))
+
+                state = self._read_state(conn)
+                metadata = state['metadata']
+                metadata['last_updated'] = now
+                metadata['manual_updates'] = metadata.get('manual_updates', 0) + 1
+                self._write_state(conn, metadata)
+        except _ContractNotFound:
+            return None
+
+        self.schedule_export()
+        return contract
+
+    def merge_contracts(self, new_contracts: Dict[str, Dict[str, Any]],
+                        merge: Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]],
+                        build_state: StateBuilder) -> Dict[str, Any]:
+        """
+        Upsert massivo dei contratti estratti da nuovi CDR
+
+        Vengono letti e riscritti solo i contratti presenti in new_contracts.
+
+        Args:
+            new_contracts: Contratti estratti {codice: contratto}
+            merge: Funzione (esistenti, nuovi) -> contratti uniti, riceve solo
+                   gli esistenti con codice in new_contracts
+            build_state: Funzione (metadati esistenti, contratti uniti, conteggi)
+                         -> (metadati, last_extraction); conteggi contiene
+                         before, after e added
+
+        Returns:
+            Dict con conteggi e revisione
+        """
+        with self._write() as (conn, revision):
+            codes = [str(contract_code) for contract_code in new_contracts]
+            existing = self._load_rows(conn, codes)
+            before = self._count(conn)
+
+            merged = merge({code: contract for code, (_, contract) in existing.items()}, new_contracts)
+            added = self._upsert(conn, revision, merged, existing)
+
+            counts = {'before': before, 'after': before + added, 'added': added}
+            state = self._read_state(conn)
+            metadata, last_extraction = build_state(state['metadata'], merged, counts)
+            self._write_state(conn, metadata, last_extraction)
+
+        logger.info(f"✅ Registro contratti aggiornato: +{added} nuovi, {len(merged) - added} aggiornati "
+                    f"(totale {counts['after']}, revisione {revision})")
+        self.export_json()
+        return {**counts, 'updated': len(merged) - added, 'revision': revision}
+
+    def replace_all(self, data: Dict[str, Any], imported: bool = False) -> int:
+        """
+        Sostituisce l'intero registro con il contenuto di un contracts.json
+
+        Args:
+            data: {'metadata', 'contracts', 'last_extraction'}
+            imported: True per l'importazione iniziale (il file è già l'esportazione)
+
+        Returns:
+            Revisione del registro
+        """
+        with self._write() as (conn, revision):
+            self._replace(conn, revision, data, imported)
+
+        if not imported:
+            self.export_json()
+        return revision
+
+    def _replace(self, conn, revision: int, data: Dict[str, Any], imported: bool) -> None:
+        conn.execute(delete(_phones))
+        conn.execute(delete(_contracts))
+        self._upsert(conn, revision, data.get('contracts') or {}, {})
+        values = {'imported_at': datetime.utcnow()}
+        if imported:
+            values['exported_revision'] = revision
+        self._write_state(conn, data.get('metadata') or {}, data.get('last_extraction'), **values)
+
+    def _import_json_if_needed(self) -> None:
+        """Importa contracts.json al primo avvio (registro vuoto e mai importato)"""
+        with self._engine().connect() as conn:
+            state = self._read_state(conn)
+            if state['imported_at'] is not None or self._count(conn) > 0:
+                return
+
+        if not self.export_path.exists():
+            return
+        try:
+            data = cdr_json.load_file(self.export_path)
+        except Exception as e:
+            logger.error(f"❌ Import contratti da {self.export_path} non riuscito: {e}")
+            return
+
+        # Un altro worker potrebbe averlo già importato: si ricontrolla nella transazione
+        with self._write() as (conn, revision):
+            if self._read_state(conn)['imported_at'] is not None or self._count(conn) > 0:
+                return
+            self._replace(conn, revision, data, imported=True)
+        logger.info(f"📥 Importati {len(data.get('contracts') or {})} contratti da {self.export_path}")
+
+    # ------------------------------------------------------------------ #
+    # Esportazione JSON
+    # ------------------------------------------------------------------ #
+
+    def export_json(self, force: bool = False) -> bool:
+        """
+        Riscrive contracts.json dal database se non è già aggiornato
+
+        Args:
+            force: Esporta anche se la revisione esportata è quella corrente
+
+        Returns:
+            True se il file è stato scritto
+        """
+        with self._export_lock:
+            engine = self._engine()
+            with engine.connect() as conn:
+                state = self._read_state(conn)
+            if not force and state['exported_revision'] >= state['revision']:
+                return False
+
+            revision, data = self.export_data()
+            cdr_json.dump(data, self.export_path, pretty=True)
+            with engine.begin() as conn:
+                conn.execute(update(_state).where(
+                    (_state.c.id == self.STATE_ID) & (_state.c.exported_revision < revision)
+                ).values(exported_revision=revision))
+            logger.info(f"💾 Contratti esportati in {self.export_path} (revisione {revision})")
+            return True
+
+    def schedule_export(self) -> None:
+        """Esportazione differita di CONTRACTS_EXPORT_DELAY secondi, una per raffica di modifiche"""
+        if CONTRACTS_EXPORT_DELAY <= 0:
+            self.export_json()
+            return
+
+        app = current_app._get_current_object()
+        cls = type(self)
+        with cls._export_lock:
+            if cls._export_timer is not None and cls._export_timer.is_alive():
+                return
+
+            def run():
+                try:
+                    with app.app_context():
+                        self.export_json()
+                except Exception as e:
+                    logger.error(f"❌ Esportazione contratti non riuscita: {e}")
+                finally:
+                    cls._export_timer = None
+
+            timer = threading.Timer(CONTRACTS_EXPORT_DELAY, run)
+            timer.daemon = True
+            cls._export_timer = timer
+            timer.start()
@@ -0,0 +1,113 @@
+"""
+Job in background delle operazioni VoIP lunghe
+
+- aggiorna_dati_ftp: download dei CDR dall'FTP, conversione in JSON,
+  aggiornamento contratti, aggregazione e dettaglio per contratto. I file CDR
+  nuovi vengono letti una sola volta: contratti e statistiche per file
+  arrivano dai sink alimentati dalla conversione
+- genera_extra_soglia: inserimento del traffico extra soglia sugli abbonamenti Odoo
+
+Le route in app/routes/api_voip_cdr.py li mettono in coda e restituiscono
+l'id del job; stato e risultato si leggono da /api/jobs/<job_id>.
+"""
+import json
+
+from app.logger import get_logger
+from app.utils.background_jobs import job_runner, JobContext
+from app.utils.env_manager import *
+
+logger = get_logger(__name__)
+
+
+@job_runner.register('aggiorna_dati_ftp')
+def aggiorna_dati_ftp(job: JobContext, pattern=None, test_ftp=False):
+    """
+    Scarica dall'FTP i CDR aggiornati e rigenera i dati del mese
+
+    Args:
+        job: Contesto del job (avanzamento e annullamento)
+        pattern: Pattern dei file da scaricare (default SPECIFIC_FILENAME)
+        test_ftp: Usa l'FTP di test (default FTP_TEST)
+
+    Returns:
+        Risultato della suddivisione per contratto (split_aggregate_to_contracts)
+        con in più 'file_stats': statistiche dei file CDR letti
+    """
+    from app.voip_cdr.ftp_downloader import FTPDownloader
+
+    pattern_to_use = pattern or SPECIFIC_FILENAME
+    test_ftp_to_use = test_ftp or FTP_TEST
+
+    job.progress(5, 'Download dei file CDR dall\'FTP', force=True)
+    downloader = FTPDownloader()
+    ftp_response = downloader.process_files(pattern_to_use, test_ftp_to_use)  # 'RIV_20943_%Y-%m*.CDR', False
+    logger.info(f"Risultato: {ftp_response} ")
+
+    if ftp_response['success'] != True:
+        logger.error(f"Errore lettura configurazione: {ftp_response}")
+        raise RuntimeError(f'Errore lettura configurazione: {str(ftp_response)}')
+    job.check_cancelled()
+
+    # Elenco di file scaricati dall'ftp
+    files = ftp_response['files']
+
+    # Carico le classi necessarie
+    from app.voip_cdr.cdr_processor import CDRProcessor, CDRAggregator, CDRContractsGenerator
+    from app.voip_cdr.cdr_scan import CDRContractSink, CDRFileStatsSink
+
+    # Converte ogni CDR scaricato in un json inserendo già i prezzi con markup secondo la tabella nel json categorie
+    # Solo i file nuovi o modificati vengono rielaborati (manifest processed_files); nella stessa
+    # lettura vengono raccolti i contratti e le statistiche dei file
+    job.progress(25, f'Elaborazione di {len(files)} file CDR', force=True)
+    contract_sink = CDRContractSink()
+    file_stats = CDRFileStatsSink()
+    processor = CDRProcessor(files[0])
+    json_to_cdr = json.loads(processor.process_files(files, riprocessa=False, sinks=[contract_sink, file_stats],
+                                                     keep_records=True))
+    json_file = json_to_cdr['nome_file']
+    job.check_cancelled()
+
+    # Aggiorna i contatti attivi con quelli dei file appena letti
+    job.progress(50, 'Aggiornamento contratti', force=True)
+    if contract_sink.files:
+        generator = CDRContractsGenerator(json_file, contract_sink=contract_sink)
+        generator.save_contracts_json()
+    else:
+        logger.info("Nessun file CDR nuovo: contratti invariati")
+    job.check_cancelled()
+
+    # Unisce tutti i json appena elaborati in un unico json, aggrega le chiamate per ogni singolo Cliente(contratto),
+    # genera un record di costo totale per ogni categoria oltre ad un record costo globale che somma tutte le categorie.
+    # Vengono applicati solo i record dei file nuovi o modificati appena letti.
+    job.progress(65, 'Aggregazione delle chiamate', force=True)
+    aggregator = CDRAggregator()
+    aggregate_json = aggregator.aggregate_incremental(json_file, file_records=processor.file_records)
+    incremental = aggregate_json.get('incremental', {})
+    logger.info(f"Aggregazione {incremental.get('mode')}: nuovi file {incremental.get('new_files')}")
+    job.check_cancelled()
+
+    # Genera un file json per ogni Cliente (contratto) con tutti idati presenti nel json globale.
+    # In modalità incrementale vengono riscritti solo i contratti toccati dai nuovi file.
+    job.progress(85, 'Dettaglio per contratto', force=True)
+    aggregate_json_file = aggregate_json['file_name']
+    result = aggregator.split_aggregate_to_contracts(
+        aggregate_json_file, contract_ids=incremental.get('touched_contracts')
+    )
+    result['file_stats'] = file_stats.files
+    return result
+
+
+@job_runner.register('genera_extra_soglia')
+def genera_extra_soglia(job: JobContext, periodo=None):
+    """
+    Inserisce il traffico voip extra soglia nel contratto corrente del cliente su ODOO
+
+    Args:
+        job: Contesto del job (avanzamento e annullamento)
+        periodo: Lista di {'anno', 'mese'} (default mese corrente)
+
+    Returns:
+        Risultato di processa_contratti_attivi
+    """
+    from app.voip_cdr.fatturazione import processa_contratti_attivi
+    return processa_contratti_attivi(periodo, job=job)
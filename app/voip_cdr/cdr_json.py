@@ -0,0 +1,232 @@
+"""
+CDR JSON - Serializzazione JSON comune a tutti i writer
+
+Usa orjson se installato (molto più veloce, scrive direttamente bytes UTF-8),
+altrimenti il modulo json della libreria standard con le stesse regole:
+
+- compatto per default: i file letti solo dal codice (archivio mensile,
+  aggregati, manifest, indici di offset) non hanno indentazione
+- pretty=True (indentazione 2) per i file letti o modificati a mano
+  (configurazioni, contracts.json, listini, indice dei riepiloghi annuali,
+  report e riepiloghi di elaborazione)
+- caratteri non ASCII scritti in chiaro (come ensure_ascii=False), chiavi
+  intere convertite in stringa, CDRCall e oggetti con to_dict() serializzati
+  come dizionari
+
+I file vengono scritti su un temporaneo nella stessa cartella e poi
+sostituiti con os.replace, così un lettore concorrente non vede mai un file
+scritto a metà. dump_iter scrive una lista elemento per elemento senza
+costruire in memoria né la lista né la stringa completa.
+"""
+
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, IO, Iterable, Iterator, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dipende dall'ambiente
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+PathLike = Union[str, Path]
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    _ORJSON_PRETTY = _ORJSON_OPTIONS | orjson.OPT_INDENT_2
+
+
+def _default(obj: Any) -> Any:
+    """Conversione dei tipi non nativi (CDRCall, set, Path, Decimal, numpy...)"""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Path):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    # Scalari numpy/pandas
+    if hasattr(obj, 'item'):
+        return obj.item()
+    raise TypeError(f"Tipo non serializzabile in JSON: {type(obj).__name__}")
+
+
+def _prepare(obj: Any) -> Any:
+    """
+    Converte le NamedTuple con to_dict (CDRCall) prima della serializzazione
+
+    orjson serializza le tuple come liste senza passare da default, quindi un
+    CDRCall al primo livello va convertito esplicitamente.
+    """
+    if isinstance(obj, tuple) and hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    return obj
+
+
+def dumpb(obj: Any, pretty: bool = False) -> bytes:
+    """
+    Serializza in bytes UTF-8
+
+    Args:
+        obj: Oggetto da serializzare
+        pretty: Se True indenta di 2 spazi
+
+    Returns:
+        JSON codificato UTF-8
+    """
+    obj = _prepare(obj)
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_PRETTY if pretty else _ORJSON_OPTIONS)
+    if pretty:
+        return json.dumps(obj, indent=2, ensure_ascii=False, default=_default).encode('utf-8')
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=_default).encode('utf-8')
+
+
+def dumps(obj: Any, pretty: bool = False) -> str:
+    """Come dumpb ma restituisce una stringa (es. righe NDJSON, risposte)"""
+    return dumpb(obj, pretty).decode('utf-8')
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Deserializza JSON da stringa o bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load_file(file_path: PathLike) -> Any:
+    """
+    Legge un file JSON UTF-8
+
+    Args:
+        file_path: File da leggere
+
+    Returns:
+        Contenuto deserializzato
+    """
+    with open(file_path, 'rb') as f:
+        return loads(f.read())
+
+
+@contextmanager
+def open_atomic(file_path: PathLike) -> Iterator[IO[bytes]]:
+    """
+    Apre in scrittura binaria un temporaneo che sostituisce file_path all'uscita
+
+    Se il blocco solleva un'eccezione il temporaneo viene eliminato e la
+    destinazione resta invariata. Le cartelle mancanti vengono create.
+    """
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{file_path.name}.', suffix='.tmp', dir=file_path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        # mkstemp crea il file con permessi 0600: riallinea ai permessi standard
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_chunks(chunks: Iterable[bytes], file_path: PathLike) -> int:
+    """
+    Scrive in modo atomico una sequenza di blocchi di bytes
+
+    Il generatore dei blocchi viene esaurito prima della sostituzione del
+    file, quindi può leggere dalla versione precedente della destinazione.
+
+    Returns:
+        Numero di bytes scritti
+    """
+    size = 0
+    with open_atomic(file_path) as f:
+        for chunk in chunks:
+            f.write(chunk)
+            size += len(chunk)
+    return size
+
+
+def write_bytes(data: bytes, file_path: PathLike) -> int:
+    """
+    Scrive bytes su file in modo atomico
+
+    Returns:
+        Numero di bytes scritti
+    """
+    return write_chunks((data,), file_path)
+
+
+def dump(obj: Any, file_path: PathLike, pretty: bool = False) -> int:
+    """
+    Salva un oggetto in un file JSON (scrittura atomica)
+
+    Args:
+        obj: Oggetto da salvare
+        file_path: File di destinazione (le cartelle mancanti vengono create)
+        pretty: Se True indenta di 2 spazi
+
+    Returns:
+        Dimensione del file in bytes
+    """
+    return write_bytes(dumpb(obj, pretty), file_path)
+
+
+def _write_items(f: IO[bytes], items: Iterable[Any], pretty: bool) -> int:
+    """Scrive una lista JSON elemento per elemento, restituisce gli elementi scritti"""
+    count = 0
+    if pretty:
+        separator, indent = b',\n  ', b'\n  '
+        f.write(b'[')
+        for item in items:
+            f.write(separator if count else indent)
+            # Stessa forma di json.dump(lista, indent=2): ogni elemento rientra di 2 spazi
+            f.write(dumpb(item, True).replace(b'\n', b'\n  '))
+            count += 1
+        f.write(b'\n]' if count else b']')
+    else:
+        f.write(b'[')
+        for item in items:
+            if count:
+                f.write(b',')
+            f.write(dumpb(item))
+            count += 1
+        f.write(b']')
+    return count
+
+
+def dump_iter(items: Iterable[Any], file_path: PathLike, pretty: bool = False) -> int:
+    """
+    Salva una lista JSON in streaming (scrittura atomica)
+
+    Gli elementi (dizionari o CDRCall) vengono serializzati uno alla volta:
+    la memoria usata non dipende dal numero di elementi.
+
+    Args:
+        items: Elementi della lista, anche da un generatore
+        file_path: File di destinazione
+        pretty: Se True produce lo stesso formato di json.dump(lista, indent=2)
+
+    Returns:
+        Numero di elementi scritti
+    """
+    with open_atomic(file_path) as f:
+        return _write_items(f, items, pretty)
@@ -0,0 +1,172 @@
+"""
+CDR Parallel - Lettura dei file CDR su più processi
+
+I file (o blocchi di byte di un file grande, tagliati a fine riga) vengono
+elaborati in un ProcessPoolExecutor. I risultati tornano nell'ordine dei
+task, quindi l'unione è deterministica e identica all'elaborazione seriale.
+Dati condivisi come la tabella tariffe vengono passati una sola volta a ogni
+processo tramite l'initializer del pool.
+
+Con un solo worker, o con input piccoli, i chiamanti restano sul percorso
+seriale: avviare i processi costerebbe più del parsing. Il parallelismo è
+opzionale (CDR_PARSE_WORKERS = 1 di default) e i processi vengono avviati con
+spawn: il pool è usato da thread delle richieste e dei job, e un fork di un
+processo multithread copierebbe lock (logging, pool del database) già presi.
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple, Union
+from app.utils.env_manager import *
+
+logger = logging.getLogger(__name__)
+
+
+class CDRParallelReader:
+    """Pianificazione ed esecuzione su pool di processi della lettura CDR"""
+
+    # Sotto questa dimensione complessiva si resta seriali
+    MIN_PARALLEL_BYTES = 4 * 1024 * 1024
+    # Dimensione indicativa di un blocco quando un file viene diviso
+    CHUNK_BYTES = 16 * 1024 * 1024
+
+    def __init__(self, workers: Optional[int] = None, min_parallel_bytes: Optional[int] = None,
+                 chunk_bytes: Optional[int] = None):
+        """
+        Args:
+            workers: Numero di processi (None = CDR_PARSE_WORKERS, 0 = numero di CPU)
+            min_parallel_bytes: Soglia sotto cui l'elaborazione resta seriale
+            chunk_bytes: Dimensione dei blocchi in cui dividere i file grandi
+        """
+        self.workers = self.resolve_workers(workers)
+        self.min_parallel_bytes = self.MIN_PARALLEL_BYTES if min_parallel_bytes is None else min_parallel_bytes
+        self.chunk_bytes = chunk_bytes or self.CHUNK_BYTES
+
+    @staticmethod
+    def resolve_workers(workers: Optional[int] = None) -> int:
+        """Numero effettivo di processi da usare (almeno 1)"""
+        if workers is None:
+            workers = CDR_PARSE_WORKERS
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        return max(1, int(workers))
+
+    def should_parallelize(self, file_paths: Sequence[Union[str, Path]]) -> bool:
+        """
+        Indica se conviene usare il pool per questi file
+
+        Args:
+            file_paths: File da elaborare
+
+        Returns:
+            False con un solo worker o se i file sono complessivamente piccoli
+        """
+        if self.workers <= 1 or not file_paths:
+            return False
+
+        total_bytes = 0
+        for file_path in file_paths:
+            try:
+                total_bytes += os.path.getsize(file_path)
+            except OSError:
+                continue
+        return total_bytes >= self.min_parallel_bytes
+
+    def split_ranges(self, file_path: Union[str, Path]) -> List[Tuple[int, int]]:
+        """
+        Divide un file in intervalli di byte che terminano a fine riga
+
+        Args:
+            file_path: File da dividere
+
+        Returns:
+            Lista di (inizio, fine) contigui che coprono tutto il file
+        """
+        size = os.path.getsize(file_path)
+        ranges = []
+        start = 0
+
+        with open(file_path, 'rb') as f:
+            while start < size:
+                end = start + self.chunk_bytes
+                if end >= size:
+                    end = size
+                else:
+                    # Sposta il taglio subito dopo il primo '\n' successivo
+                    f.seek(end)
+                    f.readline()
+                    end = f.tell()
+                ranges.append((start, end))
+                start = end
+
+        return ranges or [(0, 0)]
+
+    def plan_chunks(self, file_paths: Sequence[Union[str, Path]]) -> List[Tuple[str, int, int]]:
+        """
+        Task (percorso, inizio, fine) per tutti i file, nell'ordine di input
+
+        I file più piccoli di chunk_bytes restano un unico task.
+        """
+        tasks = []
+        for file_path in file_paths:
+            for start, end in self.split_ranges(file_path):
+                tasks.append((str(file_path), start, end))
+        return tasks
+
+    def map(self, func: Callable[[Any], Any], tasks: Iterable[Any],
+            initializer: Optional[Callable[..., None]] = None, initargs: Tuple = ()) -> List[Any]:
+        """
+        Esegue func su ogni task nel pool e restituisce i risultati in ordine
+
+        Se il pool non può essere avviato o si interrompe, i task vengono
+        rieseguiti nel processo corrente.
+
+        Args:
+            func: Funzione di modulo (serializzabile) che riceve un task
+            tasks: Argomenti, uno per task
+            initializer: Funzione eseguita una volta per processo (es. tabella tariffe)
+            initargs: Argomenti dell'initializer
+
+        Returns:
+            Lista dei risultati nello stesso ordine dei task
+        """
+        tasks = list(tasks)
+        if not tasks:
+            return []
+
+        max_workers = min(self.workers, len(tasks))
+        if max_workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                         initializer=initializer, initargs=initargs) as executor:
+                    return list(executor.map(func, tasks))
+            except (BrokenProcessPool, OSError) as e:
+                logger.warning(f"Pool di processi non disponibile, elaborazione seriale: {e}")
+
+        if initializer is not None:
+            initializer(*initargs)
+        return [func(task) for task in tasks]
+
+
+def read_range_lines(file_path: Union[str, Path], start: int, end: int, encoding: str = 'latin1') -> io.StringIO:
+    """
+    Righe di un intervallo di byte, con gli stessi fine riga della lettura in modalità testo
+
+    Args:
+        file_path: File CDR
+        start: Offset iniziale (inizio riga)
+        end: Offset finale (fine riga o fine file)
+        encoding: Encoding del file
+
+    Returns:
+        Iterabile delle righe dell'intervallo
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return io.StringIO(data.decode(encoding), newline=None)
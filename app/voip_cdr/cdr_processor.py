@@ -2,13 +2,25 @@ import json
 import os
 import csv
 from datetime import datetime
-from typing import List, Union, Dict, Any, Optional
+from typing import List, Union, Dict, Any, Optional, Iterator, Iterable, Tuple
 from collections import defaultdict
 import re
 import hashlib
 import logging
+import time
 from pathlib import Path
+import numpy as np
 from app.utils.env_manager import *
+from app.voip_cdr.cdr_tariff import CDRTariffEngine
+from app.voip_cdr.cdr_store import CDRNDJSONStore, CDRMonthStore, CDRFileManifest, CDRAggregateFile, iter_cdr_records
+from app.voip_cdr.cdr_summary import CDRSummaryIndex
+from app.voip_cdr.cdr_parallel import CDRParallelReader, read_range_lines
+from app.voip_cdr.cdr_tokenizer import CDRLineTokenizer
+from app.voip_cdr.cdr_record import CDRCall, CDRFileInfo, to_record
+from app.voip_cdr.cdr_scan import CDRScanner, CDRScanSink, CDRRecordSink, CDRValidationSink, CDRContractSink
+from app.voip_cdr import cdr_json
+from app.voip_cdr.cdr_reports import CDRContractDetailStore
+from app.voip_cdr.cdr_contract_store import ContractStore
 import copy
 
 # json_file_name = f"cdr_data_{datetime.now().strftime('%Y_%m')}.json"
@@ -25,6 +37,22 @@ class CDRProcessor:
     Converte file di testo separati da punto e virgola in JSON strutturato
     """
     
+    # Definizione delle colonne del CDR
+    CDR_COLUMNS = [
+        "data_ora",
+        "numero_cliente", 
+        "numero_chiamato",
+        "durata_secondi",
+        "tipo_chiamata",
+        "operatore",
+        "costo_euro",
+        "codice_contratto",
+        "codice_servizio",
+        "cliente_finale",
+        "comune",
+        "prefisso_chiamato"
+    ]
+    
     def __init__(self, output_json_path):
         """
         Inizializza il processore CDR
@@ -43,23 +71,37 @@ class CDRProcessor:
         self.processed_files = PROCESSED_FILE+anno_mese+".json"
 
         self.output_json_path = Path(ARCHIVE_DIRECTORY) / CDR_JSON_FOLDER / self.json_file_name
+        self.ndjson_file_name = JSON_FILE_NAME+anno_mese+".ndjson"
+        self.output_ndjson_path = Path(ARCHIVE_DIRECTORY) / CDR_JSON_FOLDER / self.ndjson_file_name
         self.processed_files_path = Path(ARCHIVE_DIRECTORY) / CDR_JSON_FOLDER / self.processed_files
             
-        # Definizione delle colonne del CDR
-        self.cdr_columns = [
-            "data_ora",
-            "numero_cliente", 
-            "numero_chiamato",
-            "durata_secondi",
-            "tipo_chiamata",
-            "operatore",
-            "costo_euro",
-            "codice_contratto",
-            "codice_servizio",
-            "cliente_finale",
-            "comune",
-            "prefisso_chiamato"
-        ]
+        self.cdr_columns = list(self.CDR_COLUMNS)
+
+        # Motore tariffario caricato una sola volta per ogni elaborazione
+        self._tariff_engine = None
+        self._tokenizer = None
+        
+        # Somme parziali per file salvate nel manifest
+        self._aggregator = None
+        # Record dei file nuovi o modificati dell'ultima process_files(keep_records=True)
+        self.file_records: Dict[str, List[Any]] = {}
+    
+    @classmethod
+    def parser(cls, tariff_engine: CDRTariffEngine) -> 'CDRProcessor':
+        """
+        Processore usato solo per il parsing delle righe (processi worker)
+        
+        Non legge file né imposta i percorsi dell'archivio del mese.
+        
+        Args:
+            tariff_engine: Motore tariffario già caricato
+        """
+        processor = cls.__new__(cls)
+        processor.logger = processor._setup_logger()
+        processor.cdr_columns = list(cls.CDR_COLUMNS)
+        processor._tariff_engine = tariff_engine
+        processor._tokenizer = None
+        return processor
     
     def _setup_logger(self) -> logging.Logger:
         """Configura il logger per il processore"""
@@ -238,36 +280,49 @@ class CDRProcessor:
         
         return hash_md5.hexdigest()
     
-    def _load_processed_files(self) -> Dict[str, str]:
+    def _load_processed_files(self) -> Dict[str, Any]:
         """
-        Carica l'elenco dei file già processati
+        Carica il manifest dei file già processati
         
         Returns:
-            Dizionario con nome_file: hash_file
+            Manifest con 'files' ({nome_file: {hash, records, processed_at}})
+            e lo stato dell'ultima aggregazione ('aggregate')
         """
-        if not os.path.exists(self.processed_files_path):
-            return {}
-        
-        try:
-            with open(self.processed_files_path, 'r', encoding='latin1') as f:
-                return json.load(f)
-        except Exception as e:
-            self.logger.error(f"Errore nel caricamento file processati: {e}")
-            return {}
+        return CDRFileManifest(self.processed_files_path).load()
     
-    def _save_processed_files(self, processed_files: Dict[str, str]):
+    def _save_processed_files(self, manifest: Dict[str, Any]):
         """
-        Salva l'elenco dei file processati
+        Salva il manifest dei file processati
         
         Args:
-            processed_files: Dizionario con nome_file: hash_file
+            manifest: Manifest come restituito da _load_processed_files
         """
         try:
-            with open(self.processed_files_path, 'w', encoding='utf-8') as f:
-                json.dump(processed_files, f, indent=2, ensure_ascii=False)
+            CDRFileManifest(self.processed_files_path).save(manifest)
         except Exception as e:
             self.logger.error(f"Errore nel salvataggio file processati: {e}")
     
+    def _get_aggregator(self) -> 'CDRAggregator':
+        if self._aggregator is None:
+            self._aggregator = CDRAggregator()
+        return self._aggregator
+    
+    def _manifest_entry(self, file_hash: str, records_count: int, partial: Dict) -> Dict[str, Any]:
+        """
+        Voce del manifest per un file elaborato
+        
+        Args:
+            file_hash: Hash MD5 del file
+            records_count: Numero di record estratti
+            partial: Somme del file per contratto e tipo (accumulatore di CDRAggregator)
+        """
+        return {
+            'hash': file_hash,
+            'records': records_count,
+            'processed_at': datetime.now().isoformat(),
+            'partial': self._get_aggregator().file_partial(file_hash, partial)
+        }
+    
     def _load_existing_json(self) -> List[Dict[str, Any]]:
         """
         Carica il JSON esistente se presente
@@ -279,9 +334,8 @@ class CDRProcessor:
             return []
         
         try:
-            with open(self.output_json_path, 'r', encoding='latin1') as f:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
+            data = cdr_json.load_file(self.output_json_path)
+            return data if isinstance(data, list) else []
         except Exception as e:
             self.logger.error(f"Errore nel caricamento JSON esistente: {e}")
             return []
@@ -291,11 +345,11 @@ class CDRProcessor:
         Salva i dati in formato JSON
         
         Args:
-            data: Lista dei record CDR da salvare
+            data: Lista dei record CDR da salvare (dizionari o CDRCall)
         """
         try:
-            with open(self.output_json_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            # I CDRCall diventano dizionari solo qui, un record alla volta
+            cdr_json.dump_iter(data, self.output_json_path)
             self.logger.info(f"Salvati {len(data)} record in {self.output_json_path}")
         except Exception as e:
             self.logger.error(f"Errore nel salvataggio JSON: {e}")
@@ -310,11 +364,69 @@ class CDRProcessor:
         Returns:
             Dizionario con i dati strutturati
         """
-        parts = line.strip().split(';')
+        return self._parse_cdr_fields(line.strip().split(';'), line)
+    
+    def _parse_cdr_fields(self, parts: List[str], line: str) -> Dict[str, Any]:
+        """
+        Converte i campi di una riga CDR in dizionario
+        
+        Args:
+            parts: Campi della riga già divisi su ';' (da CDRScanner)
+            line: Riga originale (per i messaggi di errore)
+            
+        Returns:
+            Dizionario con i dati strutturati o None se la riga non è valida
+        """
+        if len(parts)-1 != len(self.cdr_columns):
+            self.logger.warning(f"Riga con numero colonne non valido: {len(parts)} vs {len(self.cdr_columns)}")
+            return None
+        
+        try:
+            return self._get_tokenizer().parse(parts)
+        except Exception as e:
+            self.logger.error(f"Errore nel parsing riga: {line[:50]}... - {e}")
+            return None
+    
+    def _parse_cdr_call(self, parts: List[str], line: str, file_info: CDRFileInfo, line_number: int) -> Optional[CDRCall]:
+        """
+        Come _parse_cdr_fields ma produce un CDRCall compatto
+        
+        Args:
+            parts: Campi della riga già divisi su ';'
+            line: Riga originale (per i messaggi di errore)
+            file_info: Metadati condivisi del file di origine
+            line_number: Numero di riga nel file
+            
+        Returns:
+            CDRCall o None se la riga non è valida
+        """
         if len(parts)-1 != len(self.cdr_columns):
             self.logger.warning(f"Riga con numero colonne non valido: {len(parts)} vs {len(self.cdr_columns)}")
             return None
         
+        try:
+            tokenizer = self._get_tokenizer()
+            return tokenizer.to_call(tokenizer.tokenize(parts), file_info, line_number)
+        except Exception as e:
+            self.logger.error(f"Errore nel parsing riga: {line[:50]}... - {e}")
+            return None
+    
+    def _get_tokenizer(self) -> CDRLineTokenizer:
+        """Tokenizer a tracciato fisso legato al motore tariffario corrente"""
+        tariff_engine = self._get_tariff_engine()
+        if self._tokenizer is None or self._tokenizer.tariff_engine is not tariff_engine:
+            self._tokenizer = CDRLineTokenizer(tariff_engine)
+        return self._tokenizer
+    
+    def _parse_cdr_fields_legacy(self, parts: List[str], line: str) -> Dict[str, Any]:
+        """
+        Parser colonna per colonna precedente a CDRLineTokenizer
+        
+        Mantenuto come riferimento per compare_parsers.
+        """
+        if len(parts)-1 != len(self.cdr_columns):
+            return None
+        
         try:
             # Costruisce il record strutturato
             record = {}
@@ -342,6 +454,14 @@ class CDRProcessor:
                         record[column] = float(value.replace(',', '.'))
                     except ValueError:
                         record[column] = 0.0
+                    
+                    # Prezzo con markup calcolato una sola volta per riga
+                    # (durata e tipo_chiamata precedono costo_euro nel tracciato)
+                    if record[column] != 0.0:
+                        record['costo_euro_with_markup'] = self._calculate_markup_price(
+                            record.get('tipo_chiamata', ''), 
+                            record.get('durata_secondi', 0)
+                        )
                         
                 elif column in ["codice_contratto", "codice_servizio"]:
                     try:
@@ -351,12 +471,6 @@ class CDRProcessor:
                         
                 else:
                     record[column] = value
-                
-                if(record.get('costo_euro') is not None and record.get('costo_euro') != 0.0):
-                    record['costo_euro_with_markup'] = self._calculate_markup_price(
-                        record.get('tipo_chiamata', ''), 
-                        record.get('durata_secondi', 0)
-                    )
             
             return record
             
@@ -364,12 +478,97 @@ class CDRProcessor:
             self.logger.error(f"Errore nel parsing riga: {line[:50]}... - {e}")
             return None
     
-    def _process_single_file(self, file_path: str) -> List[Dict[str, Any]]:
+    def compare_parsers(self, file_path: Union[str, Path], repeat: int = 3) -> Dict[str, Any]:
+        """
+        Misura le righe al secondo del tokenizer rispetto al parser precedente
+        
+        Entrambi ricevono gli stessi campi già divisi, quindi il confronto
+        riguarda solo la conversione dei valori.
+        
+        Args:
+            file_path: File CDR da usare come campione
+            repeat: Ripetizioni (si tiene il tempo migliore)
+            
+        Returns:
+            Dizionario con righe, righe/secondo dei due parser, speedup e
+            verifica che i record prodotti siano identici
+        """
+        with open(file_path, 'r', encoding='latin1') as f:
+            rows = [(line.strip().split(';'), line) for line in f if line.strip()]
+        
+        self._get_tariff_engine()
+        
+        def best_time(parse):
+            best = None
+            for _ in range(max(1, repeat)):
+                start = time.perf_counter()
+                for parts, line in rows:
+                    parse(parts, line)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            return best or 1e-9
+        
+        legacy_time = best_time(self._parse_cdr_fields_legacy)
+        fast_time = best_time(self._parse_cdr_fields)
+        identical = all(
+            self._parse_cdr_fields_legacy(parts, line) == self._parse_cdr_fields(parts, line)
+            for parts, line in rows
+        )
+        
+        result = {
+            'lines': len(rows),
+            'legacy_lines_per_sec': round(len(rows) / legacy_time),
+            'fast_lines_per_sec': round(len(rows) / fast_time),
+            'speedup': round(legacy_time / fast_time, 2),
+            'identical': identical
+        }
+        self.logger.info(f"Confronto parser su {file_path}: {result}")
+        return result
+    
+    def _scanner(self, sinks: Optional[List[CDRScanSink]] = None, compact: bool = False) -> CDRScanner:
+        """Scanner che produce i record prezzati e alimenta gli eventuali sink aggiuntivi"""
+        return CDRScanner([CDRRecordSink(self, compact)] + list(sinks or []))
+    
+    def _iter_file_records(self, file_path: str, sinks: Optional[List[CDRScanSink]] = None,
+                           compact: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Legge un file CDR riga per riga e restituisce i record già prezzati
+        
+        Args:
+            file_path: Percorso del file da processare
+            sinks: Sink aggiuntivi alimentati nella stessa lettura (contratti, statistiche...)
+            compact: Se True restituisce CDRCall invece di dizionari
+            
+        Returns:
+            Generatore dei record estratti dal file
+        """
+        return self._scanner(sinks, compact).iter_file(file_path)
+    
+    def _iter_line_records(self, lines: Iterable[str], source_file: str,
+                           sinks: Optional[List[CDRScanSink]] = None, compact: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Converte le righe CDR in record aggiungendo i metadati del file
+        
+        Args:
+            lines: Righe del file (o di un suo blocco)
+            source_file: Nome del file di origine
+            sinks: Sink aggiuntivi alimentati nella stessa lettura
+            compact: Se True restituisce CDRCall invece di dizionari
+            
+        Returns:
+            Generatore dei record, _line_number relativo alla prima riga ricevuta
+        """
+        return self._scanner(sinks, compact).iter_lines(lines, source_file)
+    
+    def _process_single_file(self, file_path: str, sinks: Optional[List[CDRScanSink]] = None,
+                             compact: bool = False) -> List[Dict[str, Any]]:
         """
         Processa un singolo file CDR
         
         Args:
             file_path: Percorso del file da processare
+            sinks: Sink aggiuntivi alimentati nella stessa lettura
+            compact: Se True restituisce CDRCall invece di dizionari
             
         Returns:
             Lista dei record estratti dal file
@@ -381,17 +580,7 @@ class CDRProcessor:
         records = []
         
         try:
-            with open(file_path, 'r', encoding='latin1') as f:
-                for line_num, line in enumerate(f, 1):
-                    if line.strip():  # Ignora righe vuote
-                        record = self._parse_cdr_line(line)
-                        if record:
-                            # Aggiunge metadati del file
-                            record['_source_file'] = os.path.basename(file_path)
-                            record['_line_number'] = line_num
-                            record['_processed_at'] = datetime.now().isoformat()
-                            records.append(record)
-            
+            records.extend(self._iter_file_records(file_path, sinks, compact))
             self.logger.info(f"Processati {len(records)} record da {file_path}")
             
         except Exception as e:
@@ -399,15 +588,71 @@ class CDRProcessor:
         
         return records
     
-    
+    def _parse_files_parallel(self, file_paths: List[Path], reader: CDRParallelReader,
+                              sinks: Optional[List[CDRScanSink]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Legge più file CDR su un pool di processi
+        
+        I file grandi vengono divisi in blocchi a fine riga; i blocchi tornano in
+        ordine e i numeri di riga vengono riallineati, quindi il risultato è
+        identico a _process_single_file file per file.
+        
+        Args:
+            file_paths: File da leggere
+            reader: Pianificatore del pool
+            sinks: Sink aggiuntivi: ogni blocco ne alimenta una copia vuota nel worker,
+                   poi le copie vengono unite nell'ordine dei blocchi
+            
+        Returns:
+            {percorso: CDRCall} oppure {} se conviene restare seriali
+        """
+        file_paths = [path for path in file_paths if os.path.exists(path)]
+        if not reader.should_parallelize(file_paths):
+            return {}
+        
+        tasks = reader.plan_chunks(file_paths)
+        self.logger.info(f"Lettura parallela di {len(file_paths)} file in {len(tasks)} blocchi su {reader.workers} processi")
+        
+        # La tabella tariffe viaggia una volta per processo, non per blocco
+        sinks = list(sinks or [])
+        results = reader.map(_parse_chunk_worker, tasks, initializer=_init_parse_worker,
+                             initargs=(self._load_categories(), [sink.spawn() for sink in sinks]))
+        
+        parsed = {}
+        line_offsets = {}
+        for (file_path, _start, _end), (records, line_count, chunk_sinks) in zip(tasks, results):
+            offset = line_offsets.get(file_path, 0)
+            if offset and records:
+                # Blocchi successivi: numeri di riga riallineati e metadati del primo blocco
+                file_info = parsed[file_path][0].file if parsed.get(file_path) else records[0].file
+                records = [record._replace(line_number=record.line_number + offset, file=file_info)
+                           for record in records]
+            for sink, chunk_sink in zip(sinks, chunk_sinks):
+                sink.merge(chunk_sink, line_offset=offset)
+            parsed.setdefault(file_path, []).extend(records)
+            line_offsets[file_path] = offset + line_count
+        
+        for file_path, records in parsed.items():
+            self.logger.info(f"Processati {len(records)} record da {file_path}")
+        
+        return parsed
 
-    def process_files(self, files: Union[str, List[str]], riprocessa: bool = True) -> Dict[str, Any]:
+    def process_files(self, files: Union[str, List[str]], riprocessa: bool = True, streaming: bool = False,
+                      workers: Optional[int] = None, sinks: Optional[List[CDRScanSink]] = None,
+                      keep_records: bool = False) -> Dict[str, Any]:
         """
         Processa uno o più file CDR e li converte in JSON
         
         Args:
             files: Nome file singolo o lista di nomi file
             riprocessa: Se True, riprocessa tutti i file da zero sovrascrivendo i dati esistenti
+            streaming: Se True, accoda i record all'archivio NDJSON del mese senza caricarlo
+            workers: Processi per la lettura parallela (None = CDR_PARSE_WORKERS, 1 = seriale);
+                     con input piccoli o in modalità streaming la lettura resta seriale
+            sinks: Sink aggiuntivi (es. CDRContractSink, CDRFileStatsSink) alimentati nella
+                   stessa lettura dei file nuovi o modificati
+            keep_records: Se True conserva in self.file_records i record dei file nuovi o
+                          modificati, per CDRAggregator.aggregate_incremental
             
         Returns:
             Dizionario con statistiche del processamento
@@ -418,17 +663,27 @@ class CDRProcessor:
         else:
             file_list = files
         
+        # Ricarica le categorie una sola volta per questa elaborazione
+        self._tariff_engine = CDRTariffEngine(self._load_categories())
+        self.file_records = {}
+        
+        if streaming:
+            return self._process_files_streaming(file_list, riprocessa, sinks, keep_records)
+        
         # Carica file già processati e JSON esistente
         if riprocessa:
             # Se riprocessa è True, inizializza tutto da zero
-            processed_files = {}
+            manifest = CDRFileManifest.empty()
+            # Le chiamate già registrate nei contratti servono a non sommarle due volte
+            manifest['contract_calls'] = self._load_processed_files()['contract_calls']
             existing_data = []
             self.logger.info("Modalità riprocessamento: inizializzazione da zero")
         else:
             # Carica file già processati
-            processed_files = self._load_processed_files()
+            manifest = self._load_processed_files()
             # Carica JSON esistente
             existing_data = self._load_existing_json()
+        processed_files = manifest['files']
         
         # Statistiche
         stats = {
@@ -436,15 +691,35 @@ class CDRProcessor:
             'files_skipped': 0,
             'records_added': 0,
             'total_records': len(existing_data),
+            'files_new': [],
+            'files_changed': [],
             'errors': []
         }
         
+        # Le righe scartate vengono raccolte nella stessa lettura dei file
+        validation = CDRValidationSink(max_errors=50)
+        sinks = [validation] + list(sinks or [])
+        
+        # Lettura parallela dei soli file nuovi o modificati
+        reader = CDRParallelReader(workers)
+        file_hashes = {}
+        parsed = {}
+        if reader.workers > 1:
+            pending = []
+            for file_name in file_list:
+                file_path = Path(ARCHIVE_DIRECTORY) / CDR_FTP_FOLDER / file_name
+                file_hash = file_hashes[file_name] = self._get_file_hash(file_path)
+                previous = processed_files.get(os.path.basename(file_path))
+                if file_hash and (riprocessa or not previous or previous.get('hash') != file_hash):
+                    pending.append(file_path)
+            parsed = self._parse_files_parallel(pending, reader, sinks)
+        
         # Processa ogni file
         for file_name in file_list:
             try:
                 # Calcola hash del file
                 file_path = Path(ARCHIVE_DIRECTORY) / CDR_FTP_FOLDER / file_name
-                file_hash = self._get_file_hash(file_path)
+                file_hash = file_hashes.get(file_name) or self._get_file_hash(file_path)
                 file_name = os.path.basename(file_path)
                 
                 if not file_hash:
@@ -452,17 +727,33 @@ class CDRProcessor:
                     continue
                 
                 # Controlla se il file è già stato processato (solo se riprocessa è False)
-                if not riprocessa and file_name in processed_files and processed_files[file_name] == file_hash:
+                previous = processed_files.get(file_name)
+                if not riprocessa and previous and previous.get('hash') == file_hash:
                     self.logger.info(f"File già processato, salto: {file_path}")
                     stats['files_skipped'] += 1
                     continue
                 
-                # Processa il file
-                new_records = self._process_single_file(file_path)
+                # Processa il file (se non già letto dal pool)
+                new_records = parsed.pop(str(file_path), None)
+                if new_records is None:
+                    new_records = self._process_single_file(file_path, sinks, compact=True)
                 
                 if new_records:
+                    if previous:
+                        # File modificato: i record della versione precedente vengono sostituiti
+                        existing_data = [r for r in existing_data if r.get('_source_file') != file_name]
+                        stats['files_changed'].append(file_name)
+                    else:
+                        stats['files_new'].append(file_name)
+                    
                     existing_data.extend(new_records)
-                    processed_files[file_name] = file_hash
+                    # In coda al manifest, come i suoi record nell'archivio
+                    processed_files.pop(file_name, None)
+                    processed_files[file_name] = self._manifest_entry(
+                        file_hash, len(new_records), self._get_aggregator()._aggregate_by_contract_and_type(new_records)
+                    )
+                    if keep_records:
+                        self.file_records[file_name] = new_records
                     stats['files_processed'] += 1
                     stats['records_added'] += len(new_records)
                     
@@ -478,9 +769,11 @@ class CDRProcessor:
         # Salva i risultati
         if stats['records_added'] > 0:
             self._save_json(existing_data)
-            self._save_processed_files(processed_files)
+            self._save_processed_files(manifest)
         
         stats['total_records'] = len(existing_data)
+        stats['invalid_lines'] = validation.error_count
+        stats['validation_errors'] = validation.errors
         
         # Log statistiche finali
         self.logger.info(f"Processamento completato:")
@@ -494,6 +787,141 @@ class CDRProcessor:
         
         return json.dumps({'stats': stats, 'nome_file': self.json_file_name})
     
+    def _process_files_streaming(self, file_list: List[str], riprocessa: bool,
+                                 sinks: Optional[List[CDRScanSink]] = None, keep_records: bool = False) -> str:
+        """
+        Variante a memoria costante di process_files: ogni file viene letto, prezzato
+        e accodato all'archivio NDJSON una riga alla volta
+        
+        Args:
+            file_list: Lista di nomi file
+            riprocessa: Se True, svuota archivio e file processati prima di iniziare
+            sinks: Sink aggiuntivi alimentati nella stessa lettura
+            keep_records: Se True conserva in self.file_records i record dei file scritti
+            
+        Returns:
+            JSON con statistiche del processamento e nome dell'archivio NDJSON
+        """
+        store = CDRNDJSONStore(self.output_ndjson_path)
+        
+        if riprocessa:
+            manifest = CDRFileManifest.empty()
+            manifest['contract_calls'] = self._load_processed_files()['contract_calls']
+            store.reset()
+            self.logger.info("Modalità riprocessamento (streaming): inizializzazione da zero")
+        else:
+            manifest = self._load_processed_files()
+        processed_files = manifest['files']
+        manifest_changed = False
+        
+        stats = {
+            'files_processed': 0,
+            'files_skipped': 0,
+            'records_added': 0,
+            'total_records': store.count(),
+            'files_new': [],
+            'files_changed': [],
+            'errors': []
+        }
+        
+        validation = CDRValidationSink(max_errors=50)
+        sinks = [validation] + list(sinks or [])
+        
+        try:
+            for file_name in file_list:
+                file_path = Path(ARCHIVE_DIRECTORY) / CDR_FTP_FOLDER / file_name
+                try:
+                    file_hash = self._get_file_hash(file_path)
+                    file_name = os.path.basename(file_path)
+                    
+                    if not file_hash:
+                        stats['errors'].append(f"Impossibile calcolare hash per {file_path}")
+                        continue
+                    
+                    previous = processed_files.get(file_name)
+                    if not riprocessa and previous and previous.get('hash') == file_hash:
+                        self.logger.info(f"File già processato, salto: {file_path}")
+                        stats['files_skipped'] += 1
+                        continue
+                    
+                    if previous:
+                        # File modificato: i record della versione precedente vengono sostituiti
+                        store.remove_source(file_name)
+                        processed_files.pop(file_name, None)
+                        manifest_changed = True
+                        stats['files_changed'].append(file_name)
+                    
+                    # Somme del file calcolate mentre i record vengono accodati
+                    aggregator = self._get_aggregator()
+                    partial = aggregator.new_partial()
+                    kept = [] if keep_records else None
+                    written = store.append(aggregator.accumulate(partial, self._iter_file_records(file_path, sinks), kept))
+                    
+                    if written:
+                        processed_files[file_name] = self._manifest_entry(file_hash, written, partial)
+                        if keep_records:
+                            self.file_records[file_name] = kept
+                        manifest_changed = True
+                        if not previous:
+                            stats['files_new'].append(file_name)
+                        stats['files_processed'] += 1
+                        stats['records_added'] += written
+                        self.logger.info(f"Processato {file_path}: {written} nuovi record")
+                    else:
+                        stats['errors'].append(f"Nessun record valido trovato in {file_path}")
+                        
+                except Exception as e:
+                    error_msg = f"Errore processamento {file_path}: {e}"
+                    self.logger.error(error_msg)
+                    stats['errors'].append(error_msg)
+        finally:
+            # Manifest salvato una volta per esecuzione, anche se l'elaborazione si interrompe
+            if manifest_changed or riprocessa:
+                self._save_processed_files(manifest)
+        
+        stats['total_records'] = store.count()
+        stats['invalid_lines'] = validation.error_count
+        stats['validation_errors'] = validation.errors
+        
+        self.logger.info(f"Processamento streaming completato:")
+        self.logger.info(f"  - File processati: {stats['files_processed']}")
+        self.logger.info(f"  - File saltati: {stats['files_skipped']}")
+        self.logger.info(f"  - Record aggiunti: {stats['records_added']}")
+        self.logger.info(f"  - Record totali: {stats['total_records']}")
+        
+        if stats['errors']:
+            self.logger.warning(f"  - Errori: {len(stats['errors'])}")
+        
+        return json.dumps({'stats': stats, 'nome_file': self.ndjson_file_name})
+    
+    def export_ndjson_to_json(self) -> int:
+        """
+        Genera la vista JSON classica (cdr_data_YYYY_MM.json) dall'archivio NDJSON
+        
+        Returns:
+            Numero di record esportati
+        """
+        exported = CDRNDJSONStore(self.output_ndjson_path).export_json(self.output_json_path)
+        self.logger.info(f"Esportati {exported} record in {self.output_json_path}")
+        return exported
+    
+    def build_month_store(self) -> CDRMonthStore:
+        """
+        Genera l'archivio colonnare del mese (cdr_data_YYYY_MM.cols) dall'archivio
+        NDJSON se presente, altrimenti dal JSON classico
+        
+        Returns:
+            Archivio colonnare aperto in lettura
+        """
+        if self.output_ndjson_path.exists():
+            source = self.output_ndjson_path
+        else:
+            source = self.output_json_path
+        
+        store = CDRMonthStore.from_month_file(source, CDRMonthStore.path_for(self.output_json_path))
+        self.logger.info(f"Archivio colonnare aggiornato: {store.path} ({len(store)} record)")
+        return store
+    
     def get_stats(self) -> Dict[str, Any]:
         """
         Restituisce statistiche sui dati processati
@@ -502,7 +930,7 @@ class CDRProcessor:
             Dizionario con statistiche
         """
         data = self._load_existing_json()
-        processed_files = self._load_processed_files()
+        processed_files = self._load_processed_files()['files']
         
         if not data:
             return {
@@ -558,6 +986,17 @@ class CDRProcessor:
             self.logger.error(f"Errore nel caricamento categorie: {e}")
             return {}
 
+    def _get_tariff_engine(self) -> CDRTariffEngine:
+        """
+        Restituisce il motore tariffario, caricando le categorie alla prima chiamata
+        
+        Returns:
+            Istanza di CDRTariffEngine
+        """
+        if self._tariff_engine is None:
+            self._tariff_engine = CDRTariffEngine(self._load_categories())
+        return self._tariff_engine
+
     def _calculate_markup_price(self, tipo_chiamata: str, durata_secondi: int) -> float:
         """
         Calcola il prezzo con markup basato su tipo_chiamata e durata
@@ -569,39 +1008,37 @@ class CDRProcessor:
         Returns:
             Prezzo calcolato con markup in euro
         """
-        if durata_secondi <= 0:
-            return 0.0
-        
-        # Carica le categorie
-        categories = self._load_categories()
-        
-        if not categories:
-            return 0.0
-        
-        # Cerca il pattern corrispondente
-        tipo_chiamata_upper = tipo_chiamata.upper().strip()
-        
-        for category_name, category_data in categories.items():
-            if not category_data.get('is_active', True):
-                continue
-                
-            patterns = category_data.get('patterns', [])
-            
-            # Controlla se il tipo_chiamata corrisponde a uno dei pattern
-            for pattern in patterns:
-                if pattern.upper() in tipo_chiamata_upper:
-                    # Calcola il prezzo: (durata_secondi / 60) * price_with_markup
-                    price_with_markup = category_data.get('price_with_markup', 0.0)
-                    durata_minuti = durata_secondi / 60.0
-                    prezzo_calcolato = durata_minuti * price_with_markup
-                    
-                    self.logger.debug(f"Tipo: {tipo_chiamata} -> Categoria: {category_name} -> "
-                                    f"Durata: {durata_minuti:.2f}min -> Prezzo: {prezzo_calcolato:.4f}€")
-                    return round(prezzo_calcolato, 4)
-        
-        # Se non trova corrispondenze, ritorna 0
-        self.logger.debug(f"Nessuna categoria trovata per tipo_chiamata: {tipo_chiamata}")
-        return 0.0
+        return self._get_tariff_engine().calculate_markup_price(tipo_chiamata, durata_secondi)
+
+
+# Parser del processo worker, creato una volta dall'initializer del pool
+_WORKER_PARSER = None
+
+
+_WORKER_SINKS = []
+
+
+def _init_parse_worker(categories: Dict[str, Any], sinks: List[CDRScanSink]) -> None:
+    """Initializer del pool: compila la tabella tariffe una sola volta per processo"""
+    global _WORKER_PARSER, _WORKER_SINKS
+    _WORKER_PARSER = CDRProcessor.parser(CDRTariffEngine(categories))
+    _WORKER_SINKS = sinks
+
+
+def _parse_chunk_worker(task) -> tuple:
+    """
+    Legge un blocco (percorso, inizio, fine) di un file CDR
+    
+    Returns:
+        (record con _line_number relativo al blocco, numero di righe del blocco,
+        sink aggiuntivi alimentati dal solo blocco)
+    """
+    file_path, start, end = task
+    lines = list(read_range_lines(file_path, start, end))
+    sinks = [sink.spawn() for sink in _WORKER_SINKS]
+    # CDRCall compatti: serializzazione verso il processo principale molto più leggera dei dizionari
+    records = list(_WORKER_PARSER._iter_line_records(lines, os.path.basename(file_path), sinks, compact=True))
+    return records, len(lines), sinks
 
 
 class CDRAggregator:
@@ -610,9 +1047,20 @@ class CDRAggregator:
     Aggrega i dati per codice_contratto e tipo_chiamata
     """
     
-    def __init__(self):
-        """Inizializza l'aggregatore CDR"""
+    BACKENDS = ('python', 'numpy')
+
+    def __init__(self, backend: str = 'python'):
+        """
+        Inizializza l'aggregatore CDR
+        
+        Args:
+            backend: 'python' (cicli sui dizionari) oppure 'numpy' (group-by vettoriale
+                     sull'archivio colonnare del mese)
+        """
         self.logger = self._setup_logger()
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Backend di aggregazione non valido: {backend}")
+        self.backend = backend
 
     def _setup_logger(self) -> logging.Logger:
         """Configura il logger per l'aggregatore"""
@@ -750,8 +1198,10 @@ class CDRAggregator:
             return []
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            if file_path.suffix in ('.ndjson', CDRMonthStore.SUFFIX):
+                data = list(iter_cdr_records(file_path))
+            else:
+                data = cdr_json.load_file(file_path)
                 
             if not isinstance(data, list):
                 self.logger.error(f"Il file {file_path} non contiene una lista")
@@ -803,16 +1253,40 @@ class CDRAggregator:
         Returns:
             Dizionario strutturato: {codice_contratto: {tipo_chiamata: {aggregati}}}
         """
+        aggregated = self.new_partial()
+        for _ in self.accumulate(aggregated, data):
+            pass
+        
+        return dict(aggregated)
+    
+    @staticmethod
+    def new_partial() -> Dict[int, Dict[str, Dict[str, Any]]]:
+        """Accumulatore vuoto {codice_contratto: {tipo_chiamata: {aggregati}}}"""
         # Struttura: {codice_contratto: {tipo_chiamata: {durata_totale, costo_totale, count, record_sample}}}
-        aggregated = defaultdict(lambda: defaultdict(lambda: {
+        return defaultdict(lambda: defaultdict(lambda: {
             'durata_secondi_totale': 0,
             'costo_euro_totale': 0.0,
             'costo_euro_totale_with_markup': 0.0,
             'numero_chiamate': 0,
             'record_sample': None
         }))
+    
+    def accumulate(self, aggregated: Dict, records: Iterable[Dict[str, Any]],
+                   collected: Optional[List[Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Somma i record in un accumulatore esistente restituendoli uno alla volta
         
-        for record in data:
+        Args:
+            aggregated: Accumulatore da new_partial()
+            records: Record CDR da sommare
+            collected: Se indicata, vi vengono aggiunti i record letti
+            
+        Returns:
+            Generatore degli stessi record (per concatenare la scrittura su archivio)
+        """
+        for record in records:
+            if collected is not None:
+                collected.append(record)
             try:
                 # Estrai i campi necessari
                 codice_contratto = record.get('codice_contratto')
@@ -824,6 +1298,7 @@ class CDRAggregator:
                 # Verifica che codice_contratto sia presente
                 if codice_contratto is None:
                     self.logger.warning(f"Record senza codice_contratto saltato: {record.get('_source_file', 'unknown')}")
+                    yield record
                     continue
                 
                 # Converte i tipi se necessario
@@ -849,32 +1324,93 @@ class CDRAggregator:
                 
             except Exception as e:
                 self.logger.error(f"Errore nell'aggregazione del record: {e}")
-                continue
+            
+            yield record
+    
+    def file_partial(self, file_hash: str, aggregated: Dict) -> Dict[str, Any]:
+        """Somme di un file per il manifest, valide per il contenuto con quell'hash"""
+        return {'hash': file_hash, 'contracts': self.partial_to_manifest(aggregated)}
+    
+    def combine_partials(self, partials: Iterable[Dict]) -> Dict:
+        """
+        Somma le somme parziali dei file nell'ordine dato
         
-        return dict(aggregated)
+        Contratti e tipi compaiono nell'ordine del primo file che li contiene e il
+        record di esempio è quello di quel file, come in una passata sui record del mese.
+        
+        Args:
+            partials: Accumulatori dei file (da partial_from_manifest), nell'ordine dell'archivio
+            
+        Returns:
+            Accumulatore del mese
+        """
+        aggregated = self.new_partial()
+        for partial in partials:
+            for codice_contratto, types_data in partial.items():
+                for tipo_chiamata, data in types_data.items():
+                    agg_data = aggregated[codice_contratto][tipo_chiamata]
+                    agg_data['durata_secondi_totale'] += data['durata_secondi_totale']
+                    agg_data['costo_euro_totale'] += data['costo_euro_totale']
+                    agg_data['costo_euro_totale_with_markup'] += data['costo_euro_totale_with_markup']
+                    agg_data['numero_chiamate'] += data['numero_chiamate']
+                    if agg_data['record_sample'] is None:
+                        agg_data['record_sample'] = data['record_sample']
+        return aggregated
+    
+    @staticmethod
+    def _contract_key(codice_contratto: Any) -> Any:
+        """Chiave di un contratto come in partial_from_manifest e _create_contract_structure"""
+        if isinstance(codice_contratto, str) and codice_contratto.lstrip('-').isdigit():
+            return int(codice_contratto)
+        return codice_contratto
+    
+    @staticmethod
+    def partial_to_manifest(aggregated: Dict) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Converte un accumulatore in dizionario serializzabile per il manifest"""
+        result = {}
+        for codice_contratto, types_data in aggregated.items():
+            result[str(codice_contratto)] = {
+                tipo_chiamata: dict(agg_data) for tipo_chiamata, agg_data in types_data.items()
+            }
+        return result
+    
+    def partial_from_manifest(self, data: Dict[str, Dict[str, Dict[str, Any]]]) -> Dict:
+        """Ripristina un accumulatore salvato con partial_to_manifest"""
+        aggregated = self.new_partial()
+        for contract_key, types_data in (data or {}).items():
+            codice_contratto = self._contract_key(contract_key)
+            for tipo_chiamata, agg_data in types_data.items():
+                aggregated[codice_contratto][tipo_chiamata].update(agg_data)
+        return aggregated
     
-    def _create_contract_structure(self, aggregated_data: Dict[int, Dict[str, Dict[str, Any]]], original_data: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    def _create_contract_structure(self, aggregated_data: Dict[int, Dict[str, Dict[str, Any]]], original_data: List[Dict[str, Any]],
+                                   calls_by_contract: Optional[Dict[int, List[Dict[str, Any]]]] = None) -> Dict[str, Dict[str, Any]]:
         """
         Crea la struttura finale organizzata per codice_contratto
         
         Args:
             aggregated_data: Dati aggregati per contratto e tipo chiamata
             original_data: Dati originali per creare lista_chiamate
+            calls_by_contract: Chiamate già raggruppate per contratto (backend numpy);
+                               se presente original_data non viene riletto
             
         Returns:
             Dizionario strutturato per codice_contratto
         """
         result_structure = {}
         
-        # Organizza i record originali per codice_contratto
-        original_by_contract = defaultdict(list)
-        for record in original_data:
-            codice_contratto = record.get('codice_contratto')
-            if codice_contratto is not None:
-                # Converte in int se necessario
-                if isinstance(codice_contratto, str) and codice_contratto.isdigit():
-                    codice_contratto = int(codice_contratto)
-                original_by_contract[codice_contratto].append(record)
+        if calls_by_contract is not None:
+            original_by_contract = defaultdict(list, calls_by_contract)
+        else:
+            # Organizza i record originali per codice_contratto
+            original_by_contract = defaultdict(list)
+            for record in original_data:
+                codice_contratto = record.get('codice_contratto')
+                if codice_contratto is not None:
+                    # Converte in int se necessario
+                    if isinstance(codice_contratto, str) and codice_contratto.isdigit():
+                        codice_contratto = int(codice_contratto)
+                    original_by_contract[codice_contratto].append(record)
         
         for codice_contratto, types_data in aggregated_data.items():
             # Calcola i totali generali per il contratto
@@ -972,31 +1508,225 @@ class CDRAggregator:
             }
         
         return result_structure
-    # def _create_contract_structure(self, aggregated_data: Dict[int, Dict[str, Dict[str, Any]]], original_data: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-    #     """
-    #     Crea la struttura finale organizzata per codice_contratto
+    def _load_month_stores(self, files: Union[str, List[str]]) -> List[CDRMonthStore]:
+        """
+        Apre gli archivi colonnari dei file indicati, generandoli se assenti o non aggiornati
         
-    #     Args:
-    #         aggregated_data: Dati aggregati per contratto e tipo chiamata
-    #         original_data: Dati originali per creare lista_chiamate
+        Args:
+            files: File singolo o lista di file (.json, .ndjson o cartella .cols)
             
-    #     Returns:
-    #         Dizionario strutturato per codice_contratto
-    #     """
-    #     result_structure = {}
+        Returns:
+            Lista degli archivi colonnari aperti
+        """
+        file_list = [files] if isinstance(files, str) else files
+        stores = []
         
-    #     # Organizza i record originali per codice_contratto
-    #     original_by_contract = defaultdict(list)
-    #     for record in original_data:
-    #         codice_contratto = record.get('codice_contratto')
-    #         if codice_contratto is not None:
-    #             # Converte in int se necessario
-    #             if isinstance(codice_contratto, str) and codice_contratto.isdigit():
-    #                 codice_contratto = int(codice_contratto)
-    #             original_by_contract[codice_contratto].append(record)
+        for file_name in file_list:
+            file_path = Path(ARCHIVE_DIRECTORY) / CDR_JSON_FOLDER / file_name
+            
+            if file_path.suffix == CDRMonthStore.SUFFIX:
+                store = CDRMonthStore(file_path).load()
+            else:
+                if not os.path.exists(file_path):
+                    self.logger.error(f"File non trovato: {file_path}")
+                    continue
+                store = CDRMonthStore(CDRMonthStore.path_for(file_path))
+                if not store.is_fresh(file_path):
+                    store = CDRMonthStore.from_month_file(file_path, store.path)
+            
+            self.logger.info(f"Aperto archivio colonnare {store.path}: {len(store)} record")
+            stores.append(store)
         
-    #     for codice_contratto, types_data in aggregated_data.items():
-    #         # Calcola i totali generali per il contratto
+        return stores
+    
+    def _records_for_rows(self, stores: List[CDRMonthStore], offsets: np.ndarray, rows: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        Ricostruisce i record per indici di riga globali (concatenazione degli archivi)
+        
+        Args:
+            stores: Archivi colonnari
+            offsets: Indice della prima riga di ogni archivio
+            rows: Indici di riga globali
+            
+        Returns:
+            Lista di record nello stesso ordine di rows
+        """
+        result = [None] * len(rows)
+        store_index = np.searchsorted(offsets, rows, side='right') - 1
+        
+        for i, store in enumerate(stores):
+            positions = np.flatnonzero(store_index == i)
+            if not len(positions):
+                continue
+            local_rows = rows[positions] - offsets[i]
+            for position, record in zip(positions.tolist(), store.iter_records(local_rows)):
+                result[position] = record
+        
+        return result
+    
+    def _aggregate_columnar(self, stores: List[CDRMonthStore]):
+        """
+        Aggrega per codice_contratto e tipo_chiamata con group-by NumPy
+        
+        Le somme usano np.bincount sui codici fattorizzati: l'accumulo avviene
+        nello stesso ordine dei record, quindi i totali coincidono con quelli di
+        _aggregate_by_contract_and_type. Anche l'ordine di contratti e tipi
+        (prima occorrenza) è lo stesso, così come le righe escluse per
+        codice_contratto mancante (CDRMonthStore.contract_masks).
+        
+        Args:
+            stores: Archivi colonnari da aggregare
+            
+        Returns:
+            Tupla (dati aggregati come _aggregate_by_contract_and_type, chiamate per contratto)
+        """
+        # Unifica i dizionari tipo_chiamata dei vari archivi
+        tipo_index = {}
+        tipo_parts = []
+        for store in stores:
+            local_values = store.dictionary('tipo_chiamata')
+            remap = np.array([tipo_index.setdefault(value, len(tipo_index)) for value in local_values], dtype=np.int64)
+            tipo_parts.append(remap[store.column('tipo_chiamata')] if len(local_values) else np.zeros(0, dtype=np.int64))
+        
+        tipo_values = list(tipo_index)
+        n_tipi = max(len(tipo_values), 1)
+        offsets = np.cumsum([0] + [len(store) for store in stores])[:-1]
+        
+        # Righe (indici globali) con un codice contratto da aggregare
+        masks = [store.contract_masks() for store in stores]
+        rows = np.flatnonzero(np.concatenate([aggregate for aggregate, _ in masks]))
+        calls_mask = np.concatenate([calls for _, calls in masks])[rows]
+        
+        contracts = np.concatenate([store.column('codice_contratto') for store in stores])[rows]
+        tipi = np.concatenate(tipo_parts)[rows]
+        durate = np.concatenate([store.column('durata_secondi') for store in stores])[rows]
+        costi = np.concatenate([store.column('costo_euro') for store in stores])[rows]
+        costi_markup = np.nan_to_num(np.concatenate([store.column('costo_euro_with_markup') for store in stores]), nan=0.0)[rows]
+        
+        # Fattorizzazione delle chiavi (contratto, tipo)
+        contract_values, contract_first, contract_inverse = np.unique(contracts, return_index=True, return_inverse=True)
+        keys = contract_inverse.astype(np.int64) * n_tipi + tipi
+        group_keys, group_first, group_inverse = np.unique(keys, return_index=True, return_inverse=True)
+        n_groups = len(group_keys)
+        
+        counts = np.bincount(group_inverse, minlength=n_groups)
+        durate_sum = np.bincount(group_inverse, weights=durate, minlength=n_groups)
+        costi_sum = np.bincount(group_inverse, weights=costi, minlength=n_groups)
+        costi_markup_sum = np.bincount(group_inverse, weights=costi_markup, minlength=n_groups)
+        
+        # Ordine di prima occorrenza: contratto, poi tipo all'interno del contratto
+        group_contract = group_keys // n_tipi
+        order = np.lexsort((group_first, contract_first[group_contract]))
+        samples = self._records_for_rows(stores, offsets, rows[group_first[order]])
+        
+        aggregated = {}
+        for sample, g in zip(samples, order.tolist()):
+            codice_contratto = int(contract_values[group_contract[g]])
+            tipo_chiamata = tipo_values[group_keys[g] % n_tipi]
+            aggregated.setdefault(codice_contratto, {})[tipo_chiamata] = {
+                'durata_secondi_totale': int(durate_sum[g]),
+                'costo_euro_totale': float(costi_sum[g]),
+                'costo_euro_totale_with_markup': float(costi_markup_sum[g]),
+                'numero_chiamate': int(counts[g]),
+                'record_sample': sample
+            }
+        
+        # lista_chiamate: righe ordinate per contratto mantenendo l'ordine originale
+        call_rows = np.flatnonzero(calls_mask)
+        call_contracts = contract_inverse.reshape(-1)[call_rows]
+        rows_by_contract = rows[call_rows[np.argsort(call_contracts, kind='stable')]]
+        bounds = np.cumsum(np.bincount(call_contracts, minlength=len(contract_values)))
+        all_calls = self._records_for_rows(stores, offsets, rows_by_contract)
+        
+        calls_by_contract = {}
+        start = 0
+        for contract_idx, end in enumerate(bounds.tolist()):
+            calls_by_contract[int(contract_values[contract_idx])] = all_calls[start:end]
+            start = end
+        
+        return aggregated, calls_by_contract
+    
+    def compare_backends(self, files: Union[str, List[str]]) -> Dict[str, Any]:
+        """
+        Esegue l'aggregazione con entrambi i backend e confronta aggregated_records
+        (escluso _aggregated_at, che l'archivio colonnare conserva per file) e
+        le righe di lista_chiamate (file e numero di riga), così da verificare
+        anche i record senza codice_contratto
+        
+        Args:
+            files: File JSON singolo o lista di file JSON
+            
+        Returns:
+            Dizionario con esito del confronto, differenze e tempi
+        """
+        started = time.perf_counter()
+        all_data = self._load_all_data(files)
+        python_structure = self._create_contract_structure(self._aggregate_by_contract_and_type(all_data), all_data)
+        python_time = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        stores = self._load_month_stores(files)
+        aggregated, calls_by_contract = self._aggregate_columnar(stores) if stores else ({}, {})
+        numpy_structure = self._create_contract_structure(aggregated, [], calls_by_contract)
+        numpy_time = time.perf_counter() - started
+        
+        def _comparable(structure):
+            return {
+                contract_id: (
+                    [
+                        {k: v for k, v in record.items() if k != '_aggregated_at'}
+                        for record in contract_data['aggregated_records']
+                    ],
+                    [
+                        (call.get('_source_file'), call.get('_line_number'))
+                        for call in contract_data['lista_chiamate']
+                    ]
+                )
+                for contract_id, contract_data in structure.items()
+            }
+        
+        python_records = _comparable(python_structure)
+        numpy_records = _comparable(numpy_structure)
+        differences = [
+            contract_id for contract_id in set(python_records) | set(numpy_records)
+            if python_records.get(contract_id) != numpy_records.get(contract_id)
+        ]
+        
+        return {
+            'equal': not differences and list(python_records) == list(numpy_records),
+            'contracts': len(python_records),
+            'differences': sorted(differences),
+            'timings': {
+                'python_seconds': round(python_time, 4),
+                'numpy_seconds': round(numpy_time, 4)
+            }
+        }
+
+    # def _create_contract_structure(self, aggregated_data: Dict[int, Dict[str, Dict[str, Any]]], original_data: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    #     """
+    #     Crea la struttura finale organizzata per codice_contratto
+        
+    #     Args:
+    #         aggregated_data: Dati aggregati per contratto e tipo chiamata
+    #         original_data: Dati originali per creare lista_chiamate
+            
+    #     Returns:
+    #         Dizionario strutturato per codice_contratto
+    #     """
+    #     result_structure = {}
+        
+    #     # Organizza i record originali per codice_contratto
+    #     original_by_contract = defaultdict(list)
+    #     for record in original_data:
+    #         codice_contratto = record.get('codice_contratto')
+    #         if codice_contratto is not None:
+    #             # Converte in int se necessario
+    #             if isinstance(codice_contratto, str) and codice_contratto.isdigit():
+    #                 codice_contratto = int(codice_contratto)
+    #             original_by_contract[codice_contratto].append(record)
+        
+    #     for codice_contratto, types_data in aggregated_data.items():
+    #         # Calcola i totali generali per il contratto
     #         durata_generale = 0
     #         costo_generale = 0.0
     #         costo_generale_with_markup = 0.0
@@ -1089,55 +1819,17 @@ class CDRAggregator:
         
     #     return result_structure
     
-    def aggregate_cdr_data(self, files: Union[str, List[str]] = None, output_file: str = None) -> Dict[str, Any]:
+    def _compute_statistics(self, contracts_structure: Dict[str, Dict[str, Any]], total_input_records: int) -> Dict[str, Any]:
         """
-        Aggrega i dati CDR dai file specificati
+        Calcola le statistiche globali del mese dalla struttura per contratto
         
         Args:
-            files: File JSON singolo o lista di file JSON (se None usa il default)
-            output_file: File di output per salvare i risultati aggregati (se None usa il default)
+            contracts_structure: Struttura prodotta da _create_contract_structure
+            total_input_records: Numero di record CDR aggregati
             
         Returns:
-            Dizionario con i risultati aggregati strutturati per codice_contratto
+            Dizionario delle statistiche del file aggregato
         """
-        # Nomi file predefiniti
-        # default_input_file = "cdr_data.json"
-        # default_output_file = "cdr_aggregated.json"
-              
-        data_mese = self.extract_year_month_from_filename_flexible(files)
-        anno = data_mese[0]
-        mese = data_mese[1]
-
-        if output_file is None:
-            nome_file = str(AGGREGATE_FILES)+str(anno)+'_'+str(mese)+'.json'
-            output_file = Path(ANALYTICS_OUTPUT_FOLDER) / anno / nome_file
-            output_file.parent.mkdir(parents=True, exist_ok=True)
-            self.logger.info(f"Usando file di output predefinito: {output_file}")
-        
-        # Carica tutti i dati
-        all_data = self._load_all_data(files)
-        
-        if not all_data:
-            self.logger.warning("Nessun dato da aggregare")
-            return {
-                'contracts': {},
-                'statistics': {
-                    'total_input_records': 0,
-                    'total_contracts': 0,
-                    'call_types_found': [],
-                    'total_duration': 0,
-                    'total_cost': 0.0
-                }
-            }
-        
-        # Aggrega i dati
-        self.logger.info("Inizio aggregazione dati...")
-        aggregated_data = self._aggregate_by_contract_and_type(all_data)
-        
-        # Crea la struttura finale organizzata per contratto
-        contracts_structure = self._create_contract_structure(aggregated_data, all_data)
-        
-        # Calcola statistiche
         call_types = set()
         total_duration = 0
         total_cost = 0.0
@@ -1170,8 +1862,8 @@ class CDRAggregator:
         # Arrotonda i costi per tipo di chiamata
         call_type_costs = {k: round(v, 3) for k, v in call_type_costs.items()}
 
-        statistics = {
-            'total_input_records': len(all_data),
+        return {
+            'total_input_records': total_input_records,
             'total_contracts': len(contracts_structure),
             'call_types_found': sorted(list(call_types)),
             'total_duration': total_duration,
@@ -1181,6 +1873,103 @@ class CDRAggregator:
                 'costs_by_type': call_type_costs
             }
         }
+    
+    def _save_aggregate(self, result: Dict[str, Any], output_file: Union[str, Path], anno: str, mese: str,
+                        contracts: Optional[Iterable[Tuple[str, Any]]] = None) -> bool:
+        """
+        Salva il file aggregato del mese (con indice degli offset) e aggiorna l'indice dei riepiloghi
+        
+        Args:
+            result: {'contracts', 'statistics', 'file_name'}
+            output_file: File aggregato
+            anno: Anno (YYYY)
+            mese: Mese (MM)
+            contracts: Coppie (codice, dati o bytes) da scrivere al posto di result['contracts'],
+                       che allora serve solo al riepilogo (bastano aggregated_records)
+        
+        Returns:
+            True se il file è stato salvato
+        """
+        try:
+            CDRAggregateFile(output_file).write(
+                result['contracts'].items() if contracts is None else contracts,
+                result['statistics'], result['file_name']
+            )
+            self.logger.info(f"Risultati aggregati salvati in {output_file}")
+        except Exception as e:
+            self.logger.error(f"Errore nel salvataggio in {output_file}: {e}")
+            return False
+        
+        # Aggiorna l'indice dei riepiloghi usato dalle viste mensili/annuali
+        try:
+            CDRSummaryIndex(Path(output_file).parent.parent).update_month(anno, mese, result, output_file)
+        except Exception as e:
+            self.logger.warning(f"Indice riepiloghi non aggiornato per {anno}/{mese}: {e}")
+        
+        return True
+    
+    def aggregate_cdr_data(self, files: Union[str, List[str]] = None, output_file: str = None, backend: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Aggrega i dati CDR dai file specificati
+        
+        Args:
+            files: File JSON singolo o lista di file JSON (se None usa il default)
+            output_file: File di output per salvare i risultati aggregati (se None usa il default)
+            backend: 'python' o 'numpy' (se None usa quello dell'istanza)
+            
+        Returns:
+            Dizionario con i risultati aggregati strutturati per codice_contratto
+        """
+        backend = backend or self.backend
+        # Nomi file predefiniti
+        # default_input_file = "cdr_data.json"
+        # default_output_file = "cdr_aggregated.json"
+              
+        data_mese = self.extract_year_month_from_filename_flexible(files)
+        anno = data_mese[0]
+        mese = data_mese[1]
+
+        if output_file is None:
+            nome_file = str(AGGREGATE_FILES)+str(anno)+'_'+str(mese)+'.json'
+            output_file = Path(ANALYTICS_OUTPUT_FOLDER) / anno / nome_file
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            self.logger.info(f"Usando file di output predefinito: {output_file}")
+        
+        # Carica tutti i dati
+        if backend == 'numpy':
+            all_data = []
+            stores = self._load_month_stores(files)
+            total_input_records = sum(len(store) for store in stores)
+        else:
+            all_data = self._load_all_data(files)
+            total_input_records = len(all_data)
+        
+        if not total_input_records:
+            self.logger.warning("Nessun dato da aggregare")
+            return {
+                'contracts': {},
+                'statistics': {
+                    'total_input_records': 0,
+                    'total_contracts': 0,
+                    'call_types_found': [],
+                    'total_duration': 0,
+                    'total_cost': 0.0
+                }
+            }
+        
+        # Aggrega i dati
+        self.logger.info(f"Inizio aggregazione dati (backend {backend})...")
+        if backend == 'numpy':
+            aggregated_data, calls_by_contract = self._aggregate_columnar(stores)
+            contracts_structure = self._create_contract_structure(aggregated_data, all_data, calls_by_contract)
+        else:
+            aggregated_data = self._aggregate_by_contract_and_type(all_data)
+            
+            # Crea la struttura finale organizzata per contratto
+            contracts_structure = self._create_contract_structure(aggregated_data, all_data)
+        
+        # Calcola statistiche
+        statistics = self._compute_statistics(contracts_structure, total_input_records)
         
         # Prepara il risultato finale
         result = {
@@ -1190,12 +1979,7 @@ class CDRAggregator:
         }
         
         # Salva i risultati
-        try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(result, f, indent=2, ensure_ascii=False)
-            self.logger.info(f"Risultati aggregati salvati in {output_file}")
-        except Exception as e:
-            self.logger.error(f"Errore nel salvataggio in {output_file}: {e}")
+        self._save_aggregate(result, output_file, anno, mese)
         
         # Log statistiche
         self.logger.info(f"Aggregazione completata:")
@@ -1206,13 +1990,243 @@ class CDRAggregator:
         return result
 
     
-    def split_aggregate_to_contracts(self,source_file_path, output_directory=None):
+    def aggregate_incremental(self, files: Union[str, List[str]], output_file: str = None,
+                              file_records: Optional[Dict[str, List[Any]]] = None) -> Dict[str, Any]:
         """
-        Divide un file JSON aggregato in file separati per ogni contratto.
+        Aggiorna l'aggregato del mese applicando solo i file CDR nuovi o modificati
+        
+        Ogni voce del manifest processed_files_YYYY_MM.json conserva le somme non
+        arrotondate del proprio file, legate al suo hash (CDRProcessor.process_files):
+        le somme del mese si ottengono combinandole e un file modificato sostituisce
+        solo le proprie. I record dei file da applicare arrivano da file_records,
+        senza rileggere l'archivio del mese; dal file aggregato vengono letti solo i
+        contratti toccati e nella riscrittura gli altri vengono copiati byte per byte
+        (indice degli offset di CDRAggregateFile).
+        
+        Ricostruisce tutto il mese (archivio letto una volta) se manca lo stato, il
+        file aggregato o il suo indice non è allineato, un file non ha somme parziali
+        valide o mancano i record di un file da applicare.
+        
+        Args:
+            files: Archivio/i del mese (es. cdr_data_YYYY_MM.json)
+            output_file: File aggregato (se None usa il default)
+            file_records: Record dei file appena elaborati {nome_file: record}
+                          (CDRProcessor.file_records dopo process_files(keep_records=True))
+            
+        Returns:
+            {'contracts', 'statistics', 'file_name', 'incremental': {'mode': 'full'|'incremental'|'unchanged',
+            'new_files', 'changed_files', 'touched_contracts'}}; in modalità incrementale 'contracts'
+            contiene solo i contratti ricostruiti, touched_contracts None significa tutti i contratti
+        """
+        file_list = [files] if isinstance(files, str) else list(files)
+        anno, mese = self.extract_year_month_from_filename_flexible(file_list[0])
+        
+        if output_file is None:
+            nome_file = str(AGGREGATE_FILES)+str(anno)+'_'+str(mese)+'.json'
+            output_file = Path(ANALYTICS_OUTPUT_FOLDER) / anno / nome_file
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+        
+        manifest_store = CDRFileManifest(Path(ARCHIVE_DIRECTORY) / CDR_JSON_FOLDER / f"{PROCESSED_FILE}{anno}_{mese}.json")
+        manifest = manifest_store.load()
+        processed_files = manifest['files']
+        state = manifest.get('aggregate')
+        file_records = file_records or {}
+        aggregate_file = CDRAggregateFile(output_file)
+        
+        # File da applicare rispetto all'ultima aggregazione
+        included = state['files'] if state else {}
+        new_files = [name for name in processed_files if name not in included]
+        changed_files = [name for name in processed_files
+                         if name in included and included[name].get('hash') != processed_files[name].get('hash')]
+        removed_files = [name for name in included if name not in processed_files]
+        applied = new_files + changed_files
+        
+        # Verifica che lo stato salvato sia ancora valido
+        full_reason = None
+        index = None
+        if not state:
+            full_reason = "stato aggregazione assente"
+        else:
+            index = aggregate_file.load_index()
+            if index is None:
+                full_reason = "file aggregato o indice degli offset assente o non allineato"
+        if not full_reason:
+            for name, entry in processed_files.items():
+                partial = entry.get('partial')
+                if not partial or partial.get('hash') != entry.get('hash'):
+                    full_reason = f"somme del file {name} assenti o non aggiornate"
+                    break
+        if not full_reason:
+            missing = [name for name in applied if name not in file_records]
+            if missing:
+                full_reason = f"record non disponibili per {', '.join(missing)}"
+        
+        if full_reason:
+            self.logger.info(f"Aggregazione completa del mese {anno}/{mese}: {full_reason}")
+            return self._aggregate_full(file_list, output_file, anno, mese, manifest_store, manifest)
+        
+        if not applied and not removed_files:
+            self.logger.info(f"Nessun nuovo file per il mese {anno}/{mese}: aggregato invariato")
+            return {
+                'contracts': {},
+                'statistics': index['statistics'],
+                'file_name': str(output_file),
+                'incremental': {'mode': 'unchanged', 'new_files': [], 'changed_files': [], 'touched_contracts': []}
+            }
+        
+        # Somme del mese dalle somme dei singoli file
+        running = self.combine_partials(
+            self.partial_from_manifest(entry['partial']['contracts']) for entry in processed_files.values()
+        )
+        
+        # Contratti toccati: quelli dei file applicati, nella versione nuova e in quella sostituita
+        touched_keys = set()
+        for name in changed_files + removed_files:
+            touched_keys.update(included[name].get('contracts', []))
+        for name in applied:
+            touched_keys.update(processed_files[name]['partial']['contracts'])
+        
+        # Chiamate dei contratti toccati: quelle nel file aggregato tranne i file sostituiti, più le nuove
+        replaced_sources = set(changed_files) | set(removed_files)
+        calls_by_contract = defaultdict(list)
+        for contract_key, contract_data in aggregate_file.read_contracts(index, touched_keys).items():
+            calls_by_contract[self._contract_key(contract_key)] = [
+                call for call in contract_data.get('lista_chiamate', [])
+                if call.get('_source_file') not in replaced_sources
+            ]
+        records_applied = 0
+        for name in applied:
+            for record in file_records[name]:
+                records_applied += 1
+                codice_contratto = record.get('codice_contratto')
+                if codice_contratto is not None:
+                    calls_by_contract[self._contract_key(codice_contratto)].append(to_record(record))
+        
+        touched = {codice_contratto: running[codice_contratto] for codice_contratto in running
+                   if str(codice_contratto) in touched_keys}
+        rebuilt = self._create_contract_structure(touched, [], calls_by_contract)
+        
+        # Ordine del file: contratti esistenti (senza quelli rimasti senza chiamate), nuovi in coda
+        order = [key for key in index['contracts'] if key in rebuilt or key not in touched_keys]
+        order += [key for key in rebuilt if key not in index['contracts']]
+        
+        # Statistiche e riepilogo dalle somme del mese, senza liste chiamate
+        totals = self._create_contract_structure(running, [], {})
+        if set(order) != set(totals):
+            self.logger.info(f"Aggregazione completa del mese {anno}/{mese}: file aggregato non coerente con le somme dei file")
+            return self._aggregate_full(file_list, output_file, anno, mese, manifest_store, manifest)
+        totals = {key: totals[key] for key in order}
+        
+        total_input_records = sum(entry.get('records', 0) for entry in processed_files.values())
+        result = {
+            'contracts': totals,
+            'statistics': self._compute_statistics(totals, total_input_records),
+            'file_name': str(output_file)
+        }
+        
+        with open(output_file, 'rb') as previous:
+            contracts = (
+                (key, rebuilt[key] if key in rebuilt else CDRAggregateFile.read_raw(previous, index['contracts'][key]))
+                for key in order
+            )
+            saved = self._save_aggregate(result, output_file, anno, mese, contracts)
+        
+        if saved:
+            for name in removed_files:
+                del included[name]
+            for name in applied:
+                entry = processed_files[name]
+                included[name] = {'hash': entry.get('hash'), 'contracts': list(entry['partial']['contracts'])}
+            state['total_input_records'] = total_input_records
+            state['updated_at'] = datetime.now().isoformat()
+            manifest_store.save(manifest)
+        
+        touched_contracts = list(rebuilt)
+        self.logger.info(
+            f"Aggregazione incrementale {anno}/{mese}: {len(new_files)} nuovi file, {len(changed_files)} modificati, "
+            f"{records_applied} record, {len(touched_contracts)} contratti aggiornati"
+        )
+        
+        result['contracts'] = rebuilt
+        result['incremental'] = {
+            'mode': 'incremental',
+            'new_files': new_files,
+            'changed_files': changed_files,
+            'touched_contracts': touched_contracts
+        }
+        return result
+    
+    def _aggregate_full(self, file_list: List[str], output_file: Union[str, Path], anno: str, mese: str,
+                        manifest_store: CDRFileManifest, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ricostruisce l'aggregato del mese dall'archivio e le somme parziali di ogni file
+        
+        Le somme del mese sono quelle dei file combinate come in aggregate_incremental,
+        così le esecuzioni incrementali successive producono gli stessi valori.
+        
+        Returns:
+            Risultato come aggregate_cdr_data con 'incremental' in modalità 'full'
+        """
+        processed_files = manifest['files']
+        all_data = self._load_all_data(file_list)
+        incremental = {'mode': 'full', 'new_files': list(processed_files), 'changed_files': [], 'touched_contracts': None}
+        
+        if not all_data:
+            self.logger.warning("Nessun dato da aggregare")
+            return {
+                'contracts': {},
+                'statistics': self._compute_statistics({}, 0),
+                'file_name': str(output_file),
+                'incremental': incremental
+            }
+        
+        # Somme per file di origine, nell'ordine dell'archivio
+        records_by_file = defaultdict(list)
+        for record in all_data:
+            records_by_file[record.get('_source_file')].append(record)
+        partials = {
+            source_file: self._aggregate_by_contract_and_type(records)
+            for source_file, records in records_by_file.items()
+        }
+        
+        contracts_structure = self._create_contract_structure(self.combine_partials(partials.values()), all_data)
+        result = {
+            'contracts': contracts_structure,
+            'statistics': self._compute_statistics(contracts_structure, len(all_data)),
+            'file_name': str(output_file)
+        }
+        
+        if self._save_aggregate(result, output_file, anno, mese):
+            included = {}
+            for name, entry in processed_files.items():
+                entry['partial'] = self.file_partial(entry.get('hash'), partials.get(name, {}))
+                included[name] = {'hash': entry.get('hash'), 'contracts': list(entry['partial']['contracts'])}
+            manifest['aggregate'] = {
+                'files': included,
+                'total_input_records': len(all_data),
+                'updated_at': datetime.now().isoformat()
+            }
+            manifest_store.save(manifest)
+        
+        self.logger.info(f"Aggregazione completa {anno}/{mese}: {len(all_data)} record, {len(contracts_structure)} contratti")
+        result['incremental'] = incremental
+        return result
+    
+    def split_aggregate_to_contracts(self,source_file_path, output_directory=None, contract_ids=None, workers=None):
+        """
+        Divide un file JSON aggregato nel dettaglio per contratto del mese.
+        
+        Il dettaglio è un unico file con un report per contratto e un indice per
+        offset (CDRContractDetailStore), letto un contratto alla volta. Con
+        contract_ids, se il file aggregato ha l'indice degli offset, vengono letti
+        solo i contratti da ricostruire.
         
         Args:
             source_file_path (str): Percorso del file JSON sorgente
-            output_directory (str, optional): Directory di output. Se None, usa una cartella 'contract_reports'
+            output_directory (str, optional): Directory di output. Se None, usa <anno>/<mese>_detail
+            contract_ids (list, optional): Se indicato, ricostruisce solo questi contratti
+                                           (es. touched_contracts di aggregate_incremental)
+            workers (int, optional): Thread di serializzazione (None = CDR_PARSE_WORKERS)
         
         Returns:
             dict: Dizionario con risultati dell'operazione
@@ -1223,16 +2237,6 @@ class CDRAggregator:
             if not os.path.exists(source_file_path):
                 raise FileNotFoundError(f"File sorgente non trovato: {source_file_path}")
             
-            # Leggi il file JSON
-            with open(source_file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-            
-            # Verifica struttura dati
-            if 'contracts' not in data:
-                raise ValueError("Il file JSON non contiene la chiave 'contracts'")
-            
-            contracts = data['contracts']
-            
             data_mese = self.extract_year_month_from_filename_flexible(source_file_path)
             anno = data_mese[0]
             mese = data_mese[1]
@@ -1244,72 +2248,79 @@ class CDRAggregator:
             
             # Crea la directory se non esiste
             os.makedirs(output_directory, exist_ok=True)
+            store = CDRContractDetailStore(output_directory, workers=workers)
+            
+            aggregate_file = CDRAggregateFile(source_file_path)
+            index = aggregate_file.load_index() if contract_ids is not None else None
+            if index is not None:
+                # Vengono letti solo i contratti da ricostruire e quelli assenti dal dettaglio precedente
+                detail = store.load_index(migrate=False)
+                detail_contracts = detail['contracts'] if detail else {}
+                selected = {str(contract_id) for contract_id in contract_ids}
+                loaded = aggregate_file.read_contracts(
+                    index, [key for key in index['contracts'] if key in selected or key not in detail_contracts]
+                )
+                contracts = {key: loaded.get(key) for key in index['contracts']}
+                statistics = index['statistics']
+            else:
+                # Leggi il file JSON
+                data = cdr_json.load_file(source_file_path)
+                
+                # Verifica struttura dati
+                if 'contracts' not in data:
+                    raise ValueError("Il file JSON non contiene la chiave 'contracts'")
+                
+                contracts = data['contracts']
+                statistics = data.get('statistics', {})
             
             results = {
                 'success': True,
-                'files_created': [],
-                'errors': [],
                 'total_contracts': len(contracts),
-                'statistics': data.get('statistics', {}),
+                'statistics': statistics,
                 'timestamp': datetime.now().isoformat()
             }
             
-            # Elabora ogni contratto
-            for contract_id, contract_data in contracts.items():
-                try:
-                    # Crea il nome del file
-                    filename = f"{contract_id}_reports.json"
-                    output_path = os.path.join(output_directory, filename)
-                    
-                    # Prepara i dati del contratto con metadati aggiuntivi
-                    contract_report = {
-                        'contract_id': int(contract_id),
-                        'generated_at': datetime.now().isoformat(),
-                        'source_file': os.path.basename(source_file_path),
-                        'contract_info': contract_data.get('contract_info', {}),
-                        'aggregated_records': contract_data.get('aggregated_records', []),
-                        'lista_chiamate': contract_data.get('lista_chiamate', []),
-                        'summary': {
-                            'numero_chiamate_totali': contract_data.get('contract_info', {}).get('numero_chiamate_totali', 0),
-                            'durata_totale_secondi': contract_data.get('contract_info', {}).get('durata_totale_secondi', 0),
-                            'costo_totale_euro': contract_data.get('contract_info', {}).get('costo_totale_euro', 0),
-                            'costo_totale_euro_with_markup': contract_data.get('contract_info', {}).get('costo_totale_euro_with_markup', 0),
-                            'numero_tipi_chiamata': contract_data.get('contract_info', {}).get('numero_tipi_chiamata', 0),
-                            'cliente_finale': contract_data.get('contract_info', {}).get('cliente_finale', ''),
-                            'numero_cliente': contract_data.get('contract_info', {}).get('numero_cliente', '')
-                        }
+            if contract_ids is not None:
+                selected = {str(contract_id) for contract_id in contract_ids}
+                results['contracts_skipped'] = len([c for c in contracts if c not in selected])
+            
+            # Prepara i dati di ogni contratto con metadati aggiuntivi (stesso timestamp per tutti)
+            generated_at = results['timestamp']
+            source_name = os.path.basename(source_file_path)
+            
+            def build_report(contract_id, contract_data):
+                contract_info = contract_data.get('contract_info', {})
+                return {
+                    'contract_id': int(contract_id),
+                    'generated_at': generated_at,
+                    'source_file': source_name,
+                    'contract_info': contract_info,
+                    'aggregated_records': contract_data.get('aggregated_records', []),
+                    'lista_chiamate': contract_data.get('lista_chiamate', []),
+                    'summary': {
+                        'numero_chiamate_totali': contract_info.get('numero_chiamate_totali', 0),
+                        'durata_totale_secondi': contract_info.get('durata_totale_secondi', 0),
+                        'costo_totale_euro': contract_info.get('costo_totale_euro', 0),
+                        'costo_totale_euro_with_markup': contract_info.get('costo_totale_euro_with_markup', 0),
+                        'numero_tipi_chiamata': contract_info.get('numero_tipi_chiamata', 0),
+                        'cliente_finale': contract_info.get('cliente_finale', ''),
+                        'numero_cliente': contract_info.get('numero_cliente', '')
                     }
-                    
-                    # Scrivi il file JSON
-                    with open(output_path, 'w', encoding='utf-8') as output_file:
-                        json.dump(contract_report, output_file, indent=2, ensure_ascii=False)
-                    
-                    results['files_created'].append({
-                        'contract_id': contract_id,
-                        'filename': filename,
-                        'path': output_path,
-                        'size_bytes': os.path.getsize(output_path),
-                        'calls_count': len(contract_data.get('lista_chiamate', [])),
-                        'client': contract_data.get('contract_info', {}).get('cliente_finale', 'N/A')
-                    })
-                    
-                    logging.info(f"Creato file per contratto {contract_id}: {filename}")
-                    
-                except Exception as e:
-                    error_msg = f"Errore durante l'elaborazione del contratto {contract_id}: {str(e)}"
-                    results['errors'].append({
-                        'contract_id': contract_id,
-                        'error': error_msg
-                    })
-                    logging.error(error_msg)
+                }
+            
+            # Preparazione e serializzazione in parallelo; i contratti invariati vengono copiati
+            results.update(store.write(contracts, build_report, generated_at, contract_ids=contract_ids,
+                                       source_file=source_name))
             
             # Log dei risultati
-            logging.info(f"Elaborazione completata: {len(results['files_created'])} file creati, {len(results['errors'])} errori")
+            logging.info(
+                f"Elaborazione completata: {len(results['contracts_written'])} contratti scritti, "
+                f"{len(results['contracts_unchanged'])} invariati, {len(results['errors'])} errori"
+            )
             
             # Crea un file di riepilogo
             summary_path = os.path.join(output_directory, '_elaboration_summary.json')
-            with open(summary_path, 'w', encoding='utf-8') as summary_file:
-                json.dump(results, summary_file, indent=2, ensure_ascii=False)
+            cdr_json.dump(results, summary_path, pretty=True)
             
             return results
             
@@ -1324,14 +2335,21 @@ class CDRAggregator:
          
 
 class CDRContractsGenerator:
-    def __init__(self, source_file_path: str):
+    def __init__(self, source_file_path: str, contract_sink: Optional[CDRContractSink] = None):
         """
         Inizializza il generatore di contratti CDR
         
         Args:
             source_file_path: Percorso del file CDR JSON da processare
+            contract_sink: Contratti raccolti nella lettura dei file CDR
+                           (CDRProcessor.process_files(..., sinks=[sink])); se presente
+                           l'archivio del mese non viene riletto
         """
         self.source_file_path = Path(ARCHIVE_DIRECTORY) / CDR_JSON_FOLDER / source_file_path
+        self.contract_sink = contract_sink
+        # Chiamate per file dell'ultima estrazione e quelle già registrate dei file rielaborati
+        self._file_calls: Dict[str, Dict[str, int]] = {}
+        self._replaced_calls: Dict[str, int] = {}
         self.contracts_data = {}
         self.metadata = {}
         self.output_path = Path(ARCHIVE_DIRECTORY) / CONTACTS_FOLDER / CONTACT_FILE
@@ -1412,6 +2430,12 @@ class CDRContractsGenerator:
             Lista dei record CDR
         """
         try:
+            if self.source_file_path.suffix in ('.ndjson', CDRMonthStore.SUFFIX):
+                if not self.source_file_path.exists():
+                    raise FileNotFoundError(self.source_file_path)
+                data = list(iter_cdr_records(self.source_file_path))
+                print(f"Caricati {len(data)} record CDR da {self.source_file_path}")
+                return data
             with open(self.source_file_path, 'r', encoding='utf-8') as file:
                 data = json.load(file)
                 print(f"Caricati {len(data)} record CDR da {self.source_file_path}")
@@ -1513,10 +2537,133 @@ class CDRContractsGenerator:
         
         return contracts
     
+    def extract_contracts_from_sink(self, sink: CDRContractSink) -> Dict:
+        """
+        Estrae i contratti dal CDRContractSink alimentato durante la lettura dei file
+        
+        Args:
+            sink: Sink con i contratti per file, nell'ordine di lettura
+            
+        Returns:
+            Dizionario con i contratti estratti, nel formato di extract_contracts_from_cdr
+        """
+        now = datetime.now().isoformat()
+        contract_stats = defaultdict(lambda: {
+            'phone_numbers': set(),
+            'files': set(),
+            'total_calls': 0,
+            'cliente_finale': None
+        })
+        
+        for source_file, file_state in sink.files.items():
+            for contract_code, data in file_state['contracts'].items():
+                stats = contract_stats[contract_code]
+                stats['phone_numbers'].update(data['phone_numbers'])
+                stats['files'].add(source_file)
+                stats['total_calls'] += data['calls_count']
+                # Cliente finale (prende l'ultimo visto, come extract_contracts_from_cdr)
+                if data['cliente_finale_ultimo']:
+                    stats['cliente_finale'] = data['cliente_finale_ultimo']
+        
+        return {
+            contract_code: {
+                "contract_code": contract_code,
+                "contract_name": None,
+                "odoo_client_id": "",  # Da compilare manualmente
+                "first_seen_file": sorted(stats['files'])[0],
+                "first_seen_date": now,
+                "last_seen_file": sorted(stats['files'])[-1],
+                "last_seen_date": now,
+                "total_calls_found": stats['total_calls'],
+                "files_found_in": sorted(stats['files']),
+                "notes": "",
+                "phone_numbers": sorted(stats['phone_numbers']),
+                "total_unique_numbers": len(stats['phone_numbers']),
+                "cliente_finale_comune": stats['cliente_finale'] or "",
+                "contract_type": "",  # Da compilare manualmente
+                "last_updated": now
+            }
+            for contract_code, stats in contract_stats.items()
+        }
+    
+    def extract_contracts(self) -> Tuple[Dict, int, int]:
+        """
+        Contratti da unire al registro, dal sink se presente altrimenti dall'archivio del mese
+        
+        Returns:
+            (contratti estratti, numero di file, numero di record)
+        """
+        if self.contract_sink is not None:
+            files = self.contract_sink.files
+            records = sum(state['records_count'] for state in files.values())
+            self._file_calls = {
+                source_file: {contract_code: data['calls_count'] for contract_code, data in state['contracts'].items()}
+                for source_file, state in files.items()
+            }
+            contracts = self.extract_contracts_from_sink(self.contract_sink)
+        else:
+            cdr_records = self.load_cdr_data()
+            self._file_calls = defaultdict(lambda: defaultdict(int))
+            for record in cdr_records:
+                contract_code = str(record.get('codice_contratto', ''))
+                if contract_code:
+                    self._file_calls[record.get('_source_file', '')][contract_code] += 1
+            records = len(cdr_records)
+            files = {source_file for source_file in self._file_calls if source_file}
+            contracts = self.extract_contracts_from_cdr(cdr_records)
+        
+        self._replaced_calls = self._load_replaced_calls()
+        return contracts, len(files), records
+    
+    def _file_manifest(self) -> Optional[CDRFileManifest]:
+        """Manifest dei file CDR del mese (processed_files_YYYY_MM.json) dell'archivio sorgente"""
+        match = re.search(r'(\d{4})_(\d{2})', self.source_file_path.name)
+        if not match:
+            return None
+        return CDRFileManifest(
+            Path(ARCHIVE_DIRECTORY) / CDR_JSON_FOLDER / f"{PROCESSED_FILE}{match.group(1)}_{match.group(2)}.json"
+        )
+    
+    def _load_replaced_calls(self) -> Dict[str, int]:
+        """
+        Chiamate già sommate nel registro dai file che vengono rielaborati
+        
+        Returns:
+            {codice_contratto: chiamate} dei file estratti ora e già registrati nel manifest
+        """
+        manifest = self._file_manifest()
+        if manifest is None:
+            return {}
+        
+        recorded = manifest.load()['contract_calls']
+        replaced_calls = defaultdict(int)
+        for source_file in self._file_calls:
+            for contract_code, calls in recorded.get(source_file, {}).items():
+                replaced_calls[contract_code] += calls
+        return dict(replaced_calls)
+    
+    def _save_file_calls(self) -> None:
+        """Registra nel manifest le chiamate per file appena sommate nel registro contratti"""
+        manifest_store = self._file_manifest()
+        if manifest_store is None:
+            return
+        
+        try:
+            manifest = manifest_store.load()
+            manifest['contract_calls'].update(
+                (source_file, dict(calls)) for source_file, calls in self._file_calls.items() if source_file
+            )
+            manifest_store.save(manifest)
+        except Exception as e:
+            self.logger.warning(f"Chiamate per file non registrate nel manifest: {e}")
+    
     def merge_contracts(self, existing_contracts: Dict, new_contracts: Dict) -> Dict:
         """
         Merge dei contratti esistenti con quelli nuovi
         
+        total_calls_found somma le chiamate nuove a quelle esistenti, tolte quelle
+        già registrate dai file che vengono rielaborati (manifest del mese).
+        
         Args:
             existing_contracts: Contratti già presenti nel file
             new_contracts: Contratti estratti dai nuovi dati CDR
@@ -1560,7 +2707,9 @@ class CDRContractsGenerator:
                     'phone_numbers': sorted(list(merged_phone_numbers)),
                     'total_unique_numbers': len(merged_phone_numbers),
                     'files_found_in': sorted(list(merged_files)),
-                    'total_calls_found': existing_contract.get('total_calls_found', 0) + new_contract['total_calls_found'],
+                    # Le chiamate di un file rielaborato sostituiscono quelle della versione precedente
+                    'total_calls_found': max(0, existing_contract.get('total_calls_found', 0)
+                                             - self._replaced_calls.get(contract_code, 0)) + new_contract['total_calls_found'],
                     
                     # Aggiorna date se più recenti
                     'first_seen_date': min(existing_contract.get('first_seen_date', new_contract['first_seen_date']), new_contract['first_seen_date']) if existing_contract.get('first_seen_date') else new_contract['first_seen_date'],
@@ -1607,13 +2756,12 @@ class CDRContractsGenerator:
         
         return name_part.strip()
     
-    def generate_metadata(self, contracts: Dict, cdr_records: List[Dict], existing_metadata: Dict = None) -> Dict:
+    def generate_metadata(self, contracts: Dict, existing_metadata: Dict = None) -> Dict:
         """
         Genera i metadati per il file contracts.json
         
         Args:
             contracts: Dizionario dei contratti
-            cdr_records: Record CDR originali
             existing_metadata: Metadati esistenti se presenti
             
         Returns:
@@ -1621,12 +2769,6 @@ class CDRContractsGenerator:
         """
         now = datetime.now().isoformat()
         
-        # Conta i file unici processati
-        files_processed = set()
-        for record in cdr_records:
-            if record.get('_source_file'):
-                files_processed.add(record['_source_file'])
-        
         if existing_metadata:
             # Aggiorna metadati esistenti
             extraction_runs = existing_metadata.get('extraction_runs', 0) + 1
@@ -1650,29 +2792,26 @@ class CDRContractsGenerator:
             "description": "Configurazione codici contratto estratti da file CDR"
         }
     
-    def generate_last_extraction_info(self, contracts: Dict, cdr_records: List[Dict], existing_contracts_count: int = 0) -> Dict:
+    def generate_last_extraction_info(self, contracts: Dict, files_processed: int, records_processed: int,
+                                      existing_contracts_count: int = 0) -> Dict:
         """
         Genera le informazioni sull'ultima estrazione
         
         Args:
             contracts: Dizionario dei contratti
-            cdr_records: Record CDR originali
+            files_processed: Numero di file CDR da cui sono stati estratti i contratti
+            records_processed: Numero di record CDR letti
             existing_contracts_count: Numero di contratti esistenti prima del merge
             
         Returns:
             Informazioni ultima estrazione
         """
-        files_processed = set()
-        for record in cdr_records:
-            if record.get('_source_file'):
-                files_processed.add(record['_source_file'])
-        
         new_contracts_added = len(contracts) - existing_contracts_count
         
         return {
             "timestamp": datetime.now().isoformat(),
-            "files_processed": len(files_processed),
-            "records_processed": len(cdr_records),
+            "files_processed": files_processed,
+            "records_processed": records_processed,
             "new_contracts_added": max(0, new_contracts_added),
             "existing_contracts_preserved": existing_contracts_count,
             "total_contracts_after": len(contracts)
@@ -1693,21 +2832,19 @@ class CDRContractsGenerator:
         existing_metadata = existing_data.get('metadata', {})
         existing_contracts_count = len(existing_contracts)
         
-        # Carica dati CDR
-        cdr_records = self.load_cdr_data()
-        
-        # Estrae contratti dai nuovi dati
-        new_contracts = self.extract_contracts_from_cdr(cdr_records)
+        # Estrae contratti dai nuovi dati CDR
+        new_contracts, files_processed, records_processed = self.extract_contracts()
         print(f"📊 Estratti {len(new_contracts)} contratti dai dati CDR")
         
         # Merge dei contratti
         merged_contracts = self.merge_contracts(existing_contracts, new_contracts)
         
         # Genera metadata aggiornati
-        metadata = self.generate_metadata(merged_contracts, cdr_records, existing_metadata)
+        metadata = self.generate_metadata(merged_contracts, existing_metadata)
         
         # Genera info ultima estrazione
-        last_extraction = self.generate_last_extraction_info(merged_contracts, cdr_records, existing_contracts_count)
+        last_extraction = self.generate_last_extraction_info(merged_contracts, files_processed, records_processed,
+                                                             existing_contracts_count)
         
         # Struttura finale
         contracts_json = {
@@ -1768,6 +2905,11 @@ class CDRContractsGenerator:
         import glob
 
         try:
+            # Registro su database: upsert dei soli contratti presenti nel CDR, poi esportazione JSON
+            store = ContractStore(self.output_path)
+            if store.available():
+                return self.save_contracts_to_store(store)
+
             # Se esiste il file, crea backup
             if self.output_path.exists():
                 backup_file = Path(str(self.output_path) + f'.backup.{datetime.now().strftime("%Y%m%d_%H%M%S")}')
@@ -1791,9 +2933,9 @@ class CDRContractsGenerator:
             # Genera dati da salvare
             contracts_data = self.generate_contracts_json()
 
-            # Salva file JSON principale
-            with open(self.output_path, 'w', encoding='utf-8') as f:
-                json.dump(contracts_data, f, indent=2, ensure_ascii=False)
+            # Salva file JSON principale (indentato: è un file di configurazione)
+            cdr_json.dump(contracts_data, self.output_path, pretty=True)
+            self._save_file_calls()
 
             self.logger.info(f"Categorie salvate in {self.output_path}")
             return True
@@ -1802,6 +2944,37 @@ class CDRContractsGenerator:
             self.logger.error(f"Errore salvataggio categorie: {e}")
             return False
 
+    def save_contracts_to_store(self, store: ContractStore) -> bool:
+        """
+        Aggiorna il registro contratti su database con i contratti del file CDR
+
+        Legge e riscrive solo i contratti presenti nel CDR, con le stesse regole
+        di merge_contracts; contracts.json viene poi riesportato dal database.
+
+        Args:
+            store: Registro contratti su database
+
+        Returns:
+            True se l'aggiornamento è riuscito
+        """
+        new_contracts, files_processed, records_processed = self.extract_contracts()
+        print(f"📊 Estratti {len(new_contracts)} contratti dai dati CDR")
+
+        def build_state(existing_metadata, merged_contracts, counts):
+            metadata = self.generate_metadata(merged_contracts, existing_metadata)
+            metadata['total_contracts'] = counts['after']
+            last_extraction = self.generate_last_extraction_info(merged_contracts, files_processed, records_processed,
+                                                                 counts['before'])
+            last_extraction['new_contracts_added'] = counts['added']
+            last_extraction['total_contracts_after'] = counts['after']
+            return metadata, last_extraction
+
+        result = store.merge_contracts(new_contracts, self.merge_contracts, build_state)
+        self._save_file_calls()
+        self.logger.info(f"Contratti salvati nel registro (revisione {result['revision']}): "
+                         f"+{result['added']} nuovi, {result['updated']} aggiornati")
+        return True
+
 class JSONFileManager:
     """
     Classe per la trasformazione dei dati CDR aggregati.
@@ -2148,8 +3321,7 @@ class JSONFileManager:
         output_path = Path(output_file)
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(output_path, 'w', encoding='utf-8') as file:
-            json.dump(transformed_data, file, indent=2, ensure_ascii=False)
+        cdr_json.dump(transformed_data, output_path)
         
         self.logger.info(f"Dati trasformati salvati in: {output_path}")
         
@@ -2447,8 +3619,7 @@ class JSONFileManager:
         output_path = Path(output_file)
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(output_path, 'w', encoding='utf-8') as file:
-            json.dump(unified_data, file, indent=2, ensure_ascii=False)
+        cdr_json.dump(unified_data, output_path)
         
         self.logger.info(f"Dati unificati salvati in: {output_path}")
         
@@ -2985,8 +4156,7 @@ class JSONAggregator:
             IOError: Se non riesce a scrivere il file
         """
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(self.aggregated_data, f, indent=2, ensure_ascii=False)
+            cdr_json.dump(self.aggregated_data, output_file)
             self.logger.info(f"File aggregato salvato in: {output_file}")
         except IOError as e:
             self.logger.error(f"Errore nel salvare il file {output_file}: {e}")
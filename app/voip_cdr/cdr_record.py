@@ -0,0 +1,92 @@
+"""
+CDR Record - Record compatto di una chiamata CDR
+
+CDRCall è una NamedTuple a schema fisso: occupa una frazione di un dizionario
+con 16 chiavi e le stringhe ripetute (cliente, tipo chiamata, operatore...)
+vengono internate dal tokenizer. I metadati di file (_source_file,
+_processed_at) stanno in un unico CDRFileInfo condiviso da tutte le chiamate
+dello stesso file.
+
+Il dizionario nel formato storico dell'archivio viene prodotto solo in
+serializzazione (to_dict); get() e copy() permettono di passare un CDRCall al
+codice che legge i record come dizionari (es. CDRAggregator.accumulate).
+"""
+
+from operator import attrgetter
+from typing import Any, Dict, NamedTuple, Optional
+
+
+class CDRFileInfo(NamedTuple):
+    """Metadati comuni a tutte le chiamate di un file"""
+    source_file: str
+    processed_at: str
+
+
+class CDRCall(NamedTuple):
+    """Chiamata CDR tipizzata (stessi campi del record dell'archivio mensile)"""
+    data_ora: str
+    numero_cliente: str
+    numero_chiamato: str
+    durata_secondi: int
+    tipo_chiamata: str
+    operatore: str
+    costo_euro: float
+    costo_euro_with_markup: Optional[float]
+    codice_contratto: int
+    codice_servizio: int
+    cliente_finale: str
+    comune: str
+    prefisso_chiamato: str
+    file: CDRFileInfo
+    line_number: int
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Accesso per chiave come sul record dizionario"""
+        getter = _RECORD_GETTERS.get(key)
+        if getter is None:
+            return default
+        value = getter(self)
+        return default if value is None else value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Record dizionario con chiavi e ordine dell'archivio mensile"""
+        record = {
+            'data_ora': self.data_ora,
+            'numero_cliente': self.numero_cliente,
+            'numero_chiamato': self.numero_chiamato,
+            'durata_secondi': self.durata_secondi,
+            'tipo_chiamata': self.tipo_chiamata,
+            'operatore': self.operatore,
+            'costo_euro': self.costo_euro
+        }
+        if self.costo_euro_with_markup is not None:
+            record['costo_euro_with_markup'] = self.costo_euro_with_markup
+        record['codice_contratto'] = self.codice_contratto
+        record['codice_servizio'] = self.codice_servizio
+        record['cliente_finale'] = self.cliente_finale
+        record['comune'] = self.comune
+        record['prefisso_chiamato'] = self.prefisso_chiamato
+        record['_source_file'] = self.file.source_file
+        record['_line_number'] = self.line_number
+        record['_processed_at'] = self.file.processed_at
+        return record
+
+    def copy(self) -> Dict[str, Any]:
+        """Come dict.copy(): restituisce un dizionario indipendente"""
+        return self.to_dict()
+
+
+# Chiavi del record dizionario -> accesso sul CDRCall
+_RECORD_GETTERS = {
+    field: attrgetter(field)
+    for field in CDRCall._fields
+    if field not in ('file', 'line_number')
+}
+_RECORD_GETTERS['_source_file'] = attrgetter('file.source_file')
+_RECORD_GETTERS['_processed_at'] = attrgetter('file.processed_at')
+_RECORD_GETTERS['_line_number'] = attrgetter('line_number')
+
+
+def to_record(record: Any) -> Dict[str, Any]:
+    """Dizionario serializzabile da un CDRCall o da un record già dizionario"""
+    return record.to_dict() if isinstance(record, CDRCall) else record
@@ -0,0 +1,391 @@
+"""
+CDR Registry - Registro in memoria dei contratti
+
+Per il file contratti predefinito (CONTACT_FILE) la sorgente è il database
+del registro (ContractStore, bind 'contracts') quando c'è un contesto
+applicativo: i dati vengono riletti solo quando cambia la revisione del
+database, incrementata da ogni scrittura di qualunque worker. Senza contesto
+applicativo, e per gli altri percorsi, la sorgente è il file JSON, riletto
+solo quando cambia la sua firma su disco (mtime, dimensione, inode: le
+scritture atomiche con os.replace cambiano sempre l'inode). Sopra i dati vengono
+mantenuti gli indici per codice contratto, odoo_client_id, tipo contratto e
+numero di telefono, più l'elenco dei contratti fatturabili (cliente Odoo, tipo
+e codice valorizzati), così le ricerche di DataTables e della fatturazione sono
+accessi a dizionario. Le strutture derivate dai dati (es. ContractSearchIndex
+per DataTables server-side) vengono memorizzate con derived() e ricostruite
+solo quando il file cambia.
+
+I dati restituiti sono condivisi tra le richieste e vanno considerati in
+sola lettura: le modifiche passano da update_contract o save.
+"""
+
+import copy
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from app.utils.env_manager import *
+from app.voip_cdr import cdr_json
+from app.voip_cdr.cdr_contract_store import ContractStore
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value: Any) -> str:
+    """Chiave di indice: stringa senza spazi esterni ('' per None)"""
+    return str(value).strip() if value is not None else ""
+
+
+class ContractRegistry:
+    """Contratti caricati da file con ricaricamento su modifica e indici secondari"""
+
+    _instances: Dict[str, 'ContractRegistry'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, file_path: Any, store: Optional[ContractStore] = None):
+        """
+        Args:
+            file_path: File JSON dei contratti (formato {'metadata', 'contracts', ...})
+            store: Registro su database da usare come sorgente quando disponibile
+        """
+        self.file_path = Path(file_path)
+        self._store = store
+        self._lock = threading.RLock()
+        self._signature: Optional[Tuple[Any, ...]] = None
+        self._data: Optional[Dict[str, Any]] = None
+        self._by_code: Dict[str, Dict[str, Any]] = {}
+        self._by_odoo_client: Dict[str, List[str]] = {}
+        self._by_type: Dict[str, List[str]] = {}
+        self._by_phone: Dict[str, List[str]] = {}
+        self._billable: List[str] = []
+        self._derived: Dict[str, Tuple[int, Any]] = {}
+        self.version = 0
+
+    @classmethod
+    def instance(cls, file_path: Any = None) -> 'ContractRegistry':
+        """
+        Registro condiviso del processo per un file contratti
+
+        Args:
+            file_path: File dei contratti (default CONTACT_FILE)
+
+        Returns:
+            Istanza unica per il percorso indicato
+        """
+        key = os.path.abspath(file_path or CONTACT_FILE)
+        with cls._instances_lock:
+            registry = cls._instances.get(key)
+            if registry is None:
+                store = ContractStore(key) if key == os.path.abspath(CONTACT_FILE) else None
+                registry = cls._instances[key] = cls(key, store)
+            return registry
+
+    def _use_store(self) -> bool:
+        return self._store is not None and self._store.available()
+
+    def _stat_signature(self) -> Optional[Tuple[Any, ...]]:
+        """Firma della sorgente: revisione del database oppure mtime/dimensione/inode del file"""
+        if self._use_store():
+            try:
+                return ('db', self._store.revision())
+            except Exception as e:
+                logger.error(f"❌ Registro contratti su database non disponibile, uso {self.file_path}: {e}")
+        try:
+            stat = self.file_path.stat()
+        except OSError:
+            return None
+        return ('file', stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _refresh(self) -> None:
+        """Ricarica i dati se la firma della sorgente è cambiata dall'ultima lettura"""
+        signature = self._stat_signature()
+        if signature == self._signature:
+            return
+
+        with self._lock:
+            signature = self._stat_signature()
+            if signature == self._signature:
+                return
+            if signature is None:
+                self._set_data(None, None)
+                return
+            try:
+                if signature[0] == 'db':
+                    revision, data = self._store.export_data()
+                    signature = ('db', revision)
+                    source = f"database (revisione {revision})"
+                else:
+                    data = cdr_json.load_file(self.file_path)
+                    source = str(self.file_path)
+            except Exception as e:
+                # File in scrittura o non valido: si tengono i dati precedenti
+                logger.error(f"❌ Errore caricamento contratti {self.file_path}: {e}")
+                return
+            self._set_data(data, signature)
+            logger.info(f"📋 Contratti caricati da {source}: {len(self._by_code)} (versione {self.version})")
+
+    def _set_data(self, data: Optional[Dict[str, Any]], signature: Optional[Tuple[Any, ...]]) -> None:
+        """Sostituisce i dati e ricostruisce gli indici"""
+        by_code = {}
+        by_odoo_client = {}
+        by_type = {}
+        by_phone = {}
+        billable = []
+
+        contracts = data.get('contracts', {}) if isinstance(data, dict) else {}
+        for contract_code, contract in contracts.items():
+            contract_code = str(contract_code)
+            by_code[contract_code] = contract
+
+            odoo_client_id = _normalize(contract.get('odoo_client_id'))
+            if odoo_client_id:
+                by_odoo_client.setdefault(odoo_client_id, []).append(contract_code)
+
+            contract_type = _normalize(contract.get('contract_type')).upper()
+            if contract_type:
+                by_type.setdefault(contract_type, []).append(contract_code)
+
+            if odoo_client_id and contract_type and _normalize(contract.get('contract_code')):
+                billable.append(contract_code)
+
+            phone_numbers = contract.get('phone_numbers') or []
+            if not isinstance(phone_numbers, list):
+                phone_numbers = [phone_numbers]
+            for phone_number in phone_numbers:
+                phone_number = _normalize(phone_number)
+                if phone_number:
+                    by_phone.setdefault(phone_number, []).append(contract_code)
+
+        self._data = data
+        self._by_code = by_code
+        self._by_odoo_client = by_odoo_client
+        self._by_type = by_type
+        self._by_phone = by_phone
+        self._billable = billable
+        self._derived = {}
+        self._signature = signature
+        self.version += 1
+
+    def exists(self) -> bool:
+        """True se il file contratti è presente e leggibile"""
+        self._refresh()
+        return self._data is not None
+
+    def data(self) -> Optional[Dict[str, Any]]:
+        """Contenuto completo del file (None se assente), in sola lettura"""
+        self._refresh()
+        return self._data
+
+    def contracts(self) -> Dict[str, Dict[str, Any]]:
+        """Contratti per codice, in sola lettura"""
+        self._refresh()
+        return self._by_code
+
+    def get(self, contract_code: Any) -> Optional[Dict[str, Any]]:
+        """Contratto con il codice indicato"""
+        self._refresh()
+        return self._by_code.get(_normalize(contract_code))
+
+    def _lookup(self, index_name: str, key: str) -> List[Dict[str, Any]]:
+        self._refresh()
+        with self._lock:
+            index = getattr(self, index_name)
+            return [self._by_code[contract_code] for contract_code in index.get(key, ())]
+
+    def by_odoo_client_id(self, odoo_client_id: Any) -> List[Dict[str, Any]]:
+        """Contratti associati a un cliente Odoo"""
+        return self._lookup('_by_odoo_client', _normalize(odoo_client_id))
+
+    def by_contract_type(self, contract_type: Any) -> List[Dict[str, Any]]:
+        """Contratti di un tipo (confronto senza distinzione maiuscole/minuscole)"""
+        return self._lookup('_by_type', _normalize(contract_type).upper())
+
+    def by_phone(self, phone_number: Any) -> List[Dict[str, Any]]:
+        """Contratti che contengono il numero di telefono"""
+        return self._lookup('_by_phone', _normalize(phone_number))
+
+    def odoo_client_ids(self) -> List[str]:
+        """Clienti Odoo che hanno almeno un contratto"""
+        self._refresh()
+        return list(self._by_odoo_client)
+
+    def billable(self) -> Dict[str, Dict[str, Any]]:
+        """Contratti fatturabili (cliente Odoo, tipo e codice valorizzati) per codice, nell'ordine del file"""
+        self._refresh()
+        with self._lock:
+            return {contract_code: self._by_code[contract_code] for contract_code in self._billable}
+
+    def derived(self, name: str, builder: Callable[[Optional[Dict[str, Any]]], Any]) -> Any:
+        """
+        Valore calcolato dai dati correnti, ricostruito solo quando il file cambia
+
+        Args:
+            name: Nome della struttura derivata
+            builder: Funzione che riceve data() e restituisce la struttura
+
+        Returns:
+            Risultato di builder per la versione corrente dei dati
+        """
+        self._refresh()
+        with self._lock:
+            cached = self._derived.get(name)
+            if cached is not None and cached[0] == self.version:
+                return cached[1]
+            value = builder(self._data)
+            self._derived[name] = (self.version, value)
+            return value
+
+    def save(self, data: Dict[str, Any]) -> None:
+        """
+        Sostituisce tutti i contratti (database ed esportazione, oppure solo il file)
+
+        Args:
+            data: Contenuto completo nel formato di contracts.json
+        """
+        with self._lock:
+            if self._use_store():
+                self._store.replace_all(data)
+                self._signature = None
+                return
+            cdr_json.dump(data, self.file_path, pretty=True)
+            self._set_data(data, self._stat_signature())
+
+    def update_contract(self, contract_code: Any, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Aggiorna i campi di un contratto
+
+        Con il database è l'aggiornamento atomico di una sola riga; sul file
+        il contenuto viene riscritto per intero.
+
+        Args:
+            contract_code: Codice del contratto
+            changes: Campi da sostituire
+
+        Returns:
+            Contratto aggiornato o None se il codice non esiste
+        """
+        if self._use_store():
+            return self._store.update_contract(contract_code, changes)
+
+        with self._lock:
+            self._refresh()
+            if self._data is None or _normalize(contract_code) not in self._by_code:
+                return None
+
+            # Copia: chi sta leggendo i dati correnti non vede modifiche a metà
+            data = copy.deepcopy(self._data)
+            contract = data['contracts'][_normalize(contract_code)]
+            now = datetime.now().isoformat()
+
+            contract.update(changes)
+            contract['last_updated'] = now
+
+            metadata = data.setdefault('metadata', {})
+            metadata['last_updated'] = now
+            metadata['manual_updates'] = metadata.get('manual_updates', 0) + 1
+
+            self.save(data)
+            return contract
+
+    def invalidate(self) -> None:
+        """Forza la rilettura del file al prossimo accesso"""
+        with self._lock:
+            self._signature = None
+
+
+class ContractSearchIndex:
+    """
+    Indice di ricerca e ordinamento per le tabelle server-side dei contratti
+
+    Per ogni colonna conserva le permutazioni ordinate (crescente e
+    decrescente, stabili come list.sort) e il rango di ogni riga; per la
+    ricerca un indice invertito di trigrammi sul testo della riga in
+    minuscolo. Una pagina costa O(risultati + pagina) invece di rielaborare
+    e riordinare tutte le righe a ogni richiesta.
+    """
+
+    NGRAM = 3
+
+    def __init__(self, rows: List[List[Any]]):
+        """
+        Args:
+            rows: Righe della tabella (liste di celle), nell'ordine naturale
+        """
+        self.rows = rows
+        self.columns = len(rows[0]) if rows else 0
+        # Stesso testo usato dalla ricerca lineare: celle in minuscolo separate da spazio
+        self.texts = [" ".join(str(cell).lower() for cell in row) for row in rows]
+
+        positions = range(len(rows))
+        self._orders: Dict[Tuple[int, bool], Tuple[List[int], List[int]]] = {}
+        for column in range(self.columns):
+            keys = [str(row[column]).lower() for row in rows]
+            for descending in (False, True):
+                permutation = sorted(positions, key=keys.__getitem__, reverse=descending)
+                rank = [0] * len(rows)
+                for position, row_id in enumerate(permutation):
+                    rank[row_id] = position
+                self._orders[(column, descending)] = (permutation, rank)
+
+        grams: Dict[str, set] = {}
+        for row_id, text in enumerate(self.texts):
+            for gram in {text[i:i + self.NGRAM] for i in range(len(text) - self.NGRAM + 1)}:
+                grams.setdefault(gram, set()).add(row_id)
+        self._grams: Dict[str, FrozenSet[int]] = {gram: frozenset(ids) for gram, ids in grams.items()}
+
+    def search(self, value: str) -> List[int]:
+        """
+        Righe il cui testo contiene value (già in minuscolo), in ordine naturale
+
+        Con almeno NGRAM caratteri i candidati sono l'intersezione dei
+        trigrammi della ricerca, verificati poi sul testo completo; le
+        ricerche più corte scorrono i testi precalcolati.
+        """
+        if len(value) < self.NGRAM:
+            return [row_id for row_id, text in enumerate(self.texts) if value in text]
+
+        postings = []
+        for gram in {value[i:i + self.NGRAM] for i in range(len(value) - self.NGRAM + 1)}:
+            posting = self._grams.get(gram)
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+
+        candidates = postings[0]
+        for posting in postings[1:]:
+            candidates = candidates & posting
+            if not candidates:
+                return []
+        return sorted(row_id for row_id in candidates if value in self.texts[row_id])
+
+    def query(self, start: int = 0, length: int = 10, search_value: str = "",
+              order_column: int = 0, order_dir: str = "asc") -> Tuple[int, List[List[Any]]]:
+        """
+        Pagina filtrata e ordinata
+
+        Args:
+            start: Indice di partenza
+            length: Numero di righe
+            search_value: Testo da cercare in tutte le colonne
+            order_column: Indice colonna per ordinamento
+            order_dir: Direzione ordinamento (asc/desc)
+
+        Returns:
+            (numero righe filtrate, righe della pagina)
+        """
+        row_ids: Optional[Sequence[int]] = None
+        if search_value and search_value.strip():
+            row_ids = self.search(search_value.lower().strip())
+
+        count = len(self.rows) if row_ids is None else len(row_ids)
+        if count and -self.columns <= order_column < self.columns:
+            permutation, rank = self._orders[(order_column % self.columns, order_dir.lower() == 'desc')]
+            ordered = permutation if row_ids is None else sorted(row_ids, key=rank.__getitem__)
+        else:
+            ordered = range(len(self.rows)) if row_ids is None else row_ids
+
+        return count, [self.rows[row_id] for row_id in ordered[start:start + length]]
@@ -0,0 +1,697 @@
+"""
+CDR Reports - Report dei contratti di un mese con accesso diretto per offset
+
+Il dettaglio mensile (ANALYTICS_OUTPUT_FOLDER/<anno>/<mese>_detail) contiene:
+
+- contracts_detail.ndjson: un report JSON compatto per riga, uno per contratto,
+  con lista_chiamate vuota
+- contracts_calls.ndjson: le chiamate, una per riga, contigue per contratto
+- contracts_calls.search: per ogni chiamata il testo (minuscolo) delle colonne
+  ricercabili, allineato riga per riga alle chiamate
+- contracts_calls.offsets.npy: offset di inizio di ogni riga delle chiamate
+- contracts_calls.order_<colonna>.npy: per ogni contratto la permutazione
+  delle sue chiamate ordinate per la colonna (indici locali al contratto)
+- contracts_detail.index.json: per ogni codice_contratto offset e lunghezza
+  del report, prima riga e numero delle chiamate, hash del contenuto
+
+Leggere un cliente è un seek più una read, senza caricare l'aggregato del mese
+né un file per contratto; una pagina di chiamate (query_calls) legge solo le
+righe richieste, nell'ordine precomputato.
+
+Scrittura (CDRAggregator.split_aggregate_to_contracts): i report vengono
+costruiti e serializzati in un pool di thread; l'hash del contenuto
+(generated_at escluso) è conservato nell'indice, così i contratti invariati
+vengono copiati dalla versione precedente senza riserializzarli. Lo stato di
+fatturazione (elaborato) sta nella voce di indice e resta finché il
+contenuto del contratto non cambia, come accadeva con i file per contratto.
+Le scritture dell'indice (mark_elaborato e write) sono serializzate da un
+lock file (fcntl.flock); write rilegge lo stato di fatturazione sotto il lock
+subito prima di salvare l'indice, così un contratto segnato durante la
+scrittura non torna da fatturare.
+
+I vecchi file <contratto>_reports.json vengono migrati alla prima scrittura
+e rimossi; vengono comunque ancora letti se il dettaglio indicizzato manca.
+Un indice di una versione precedente viene migrato alla prima lettura:
+i report vengono riscritti nel formato corrente e lo stato di fatturazione
+resta ai contratti il cui contenuto è rimasto lo stesso.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from app.utils.env_manager import *
+from app.voip_cdr import cdr_json
+from app.voip_cdr.cdr_parallel import CDRParallelReader
+
+logger = logging.getLogger(__name__)
+
+
+class CDRContractDetailStore:
+    """Dettaglio mensile dei contratti: file NDJSON con indice per offset"""
+
+    # 2: chiamate in un file separato con offset e ordinamenti precomputati
+    VERSION = 2
+    DATA_FILE = 'contracts_detail.ndjson'
+    INDEX_FILE = 'contracts_detail.index.json'
+    LOCK_FILE = 'contracts_detail.index.lock'
+    CALLS_FILE = 'contracts_calls.ndjson'
+    SEARCH_FILE = 'contracts_calls.search'
+    OFFSETS_FILE = 'contracts_calls.offsets.npy'
+    ORDER_FILE = 'contracts_calls.order_{}.npy'
+    # File per contratto del formato precedente
+    LEGACY_SUFFIX = '_reports.json'
+    LEGACY_INDEX_FILE = '_reports_index.json'
+    # Riferimento a un report: <percorso DATA_FILE>#<codice_contratto>
+    REF_SEPARATOR = '#'
+    # Campi di stato della fatturazione (non fanno parte del contenuto)
+    STATE_FIELDS = ('elaborato', 'elaborato_timestamp')
+
+    # Colonne delle chiamate ordinabili e ricercabili (ordine delle colonne DataTables)
+    CALL_COLUMNS = (
+        'data_ora',
+        'numero_cliente',
+        'numero_chiamato',
+        'durata_secondi',
+        'tipo_chiamata',
+        'operatore',
+        'costo_euro',
+        'costo_euro_with_markup'
+    )
+    NUMERIC_COLUMNS = frozenset(('durata_secondi', 'costo_euro', 'costo_euro_with_markup'))
+
+    def __init__(self, directory: Union[str, Path], workers: Optional[int] = None):
+        """
+        Args:
+            directory: Cartella <mese>_detail del mese
+            workers: Thread di serializzazione (None = CDR_PARSE_WORKERS, 0 = numero di CPU)
+        """
+        self.directory = str(directory)
+        self.data_path = os.path.join(self.directory, self.DATA_FILE)
+        self.index_path = os.path.join(self.directory, self.INDEX_FILE)
+        self.lock_path = os.path.join(self.directory, self.LOCK_FILE)
+        self.calls_path = os.path.join(self.directory, self.CALLS_FILE)
+        self.search_path = os.path.join(self.directory, self.SEARCH_FILE)
+        self.offsets_path = os.path.join(self.directory, self.OFFSETS_FILE)
+        self.workers = CDRParallelReader.resolve_workers(workers)
+
+    @classmethod
+    def for_month(cls, anno: Union[str, int], mese: Union[str, int],
+                  base_folder: Optional[str] = None) -> 'CDRContractDetailStore':
+        """Store della cartella <base>/<anno>/<mese>_detail"""
+        base_folder = base_folder or ANALYTICS_OUTPUT_FOLDER
+        return cls(os.path.join(base_folder, str(anno), f"{str(mese).zfill(2)}_detail"))
+
+    def order_path(self, column: str) -> str:
+        return os.path.join(self.directory, self.ORDER_FILE.format(column))
+
+    # ---------------------------------------------------------------- lettura
+
+    def load_index(self, migrate: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Carica l'indice se è allineato ai file dati
+
+        Args:
+            migrate: Se True un indice di una versione precedente viene migrato
+                     (da non usare sotto _index_lock: la migrazione lo acquisisce)
+
+        Returns:
+            Indice {'contracts': {codice: {offset, length, rows_start, calls_count, ...}}, ...}
+            oppure None se manca o se i file non corrispondono (scrittura in corso o interrotta)
+        """
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            index = cdr_json.load_file(self.index_path)
+            if not isinstance(index, dict):
+                return None
+            if index.get('version') != self.VERSION:
+                return self._migrate_previous_version() if migrate else None
+            sizes = [os.path.getsize(path) for path in (self.data_path, self.calls_path, self.search_path)]
+        except Exception as e:
+            logger.warning(f"Indice dettaglio contratti non leggibile {self.index_path}: {e}")
+            return None
+
+        if [index.get('data_size'), index.get('calls_size'), index.get('search_size')] != sizes:
+            logger.warning(f"Indice non allineato ai file di {self.directory}: ignorato")
+            return None
+        return index
+
+    def contract_ids(self) -> List[str]:
+        """Codici contratto presenti nel dettaglio"""
+        index = self.load_index()
+        return list(index['contracts']) if index else []
+
+    def _load_array(self, path: str, mmap: bool = True) -> np.ndarray:
+        if mmap:
+            try:
+                return np.load(path, mmap_mode='r')
+            except ValueError:
+                # Gli array vuoti non sono mappabili
+                pass
+        return np.load(path)
+
+    def _read_calls(self, f, offsets: np.ndarray, rows_start: int, rows: Iterable[int]) -> List[Dict[str, Any]]:
+        """Legge le righe indicate (indici locali al contratto) dal file delle chiamate"""
+        lines = []
+        for row in rows:
+            start = int(offsets[rows_start + row])
+            end = int(offsets[rows_start + row + 1])
+            f.seek(start)
+            lines.append(f.read(end - start - 1))
+        return cdr_json.loads(b'[' + b','.join(lines) + b']')
+
+    def read(self, contract_id: Union[str, int], with_calls: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Legge il report di un contratto
+
+        Args:
+            contract_id: Codice contratto
+            with_calls: Se False lista_chiamate resta vuota (solo il report, un solo accesso)
+
+        Returns:
+            Report del contratto (con elaborato se già fatturato) oppure None
+        """
+        index = self.load_index()
+        if not index:
+            return None
+        entry = index['contracts'].get(str(contract_id))
+        if entry is None:
+            return None
+
+        with open(self.data_path, 'rb') as f:
+            f.seek(entry['offset'])
+            report = cdr_json.loads(f.read(entry['length']))
+
+        if with_calls and entry['calls_count']:
+            offsets = self._load_array(self.offsets_path)
+            start = int(offsets[entry['rows_start']])
+            end = int(offsets[entry['rows_start'] + entry['calls_count']])
+            with open(self.calls_path, 'rb') as f:
+                f.seek(start)
+                block = f.read(end - start)
+            report['lista_chiamate'] = cdr_json.loads(b'[' + block.rstrip(b'\n').replace(b'\n', b',') + b']')
+
+        for field in self.STATE_FIELDS:
+            if field in entry:
+                report[field] = entry[field]
+        return report
+
+    def query_calls(self, contract_id: Union[str, int], start: int = 0, length: int = 10,
+                    order_column: Optional[str] = None, order_dir: str = 'asc',
+                    search_value: str = '') -> Optional[Dict[str, Any]]:
+        """
+        Pagina delle chiamate di un contratto (DataTables server-side)
+
+        Vengono lette solo le righe della pagina, nell'ordine precomputato.
+        Con una ricerca viene scandito il solo blocco di testo del contratto.
+
+        Args:
+            contract_id: Codice contratto
+            start: Prima riga della pagina
+            length: Righe per pagina (-1 = tutte)
+            order_column: Colonna di ordinamento (una di CALL_COLUMNS, None = ordine di arrivo)
+            order_dir: 'asc' o 'desc'
+            search_value: Testo da cercare nelle colonne CALL_COLUMNS
+
+        Returns:
+            {'recordsTotal', 'recordsFiltered', 'data'} oppure None se il contratto non c'è
+        """
+        index = self.load_index()
+        entry = index['contracts'].get(str(contract_id)) if index else None
+        if entry is None:
+            return None
+
+        count = entry['calls_count']
+        rows_start = entry['rows_start']
+        if not count:
+            return {'recordsTotal': 0, 'recordsFiltered': 0, 'data': []}
+
+        if order_column in self.CALL_COLUMNS:
+            order = self._load_array(self.order_path(order_column))[rows_start:rows_start + count]
+        else:
+            order = np.arange(count)
+
+        search_value = (search_value or '').strip().lower()
+        if search_value:
+            matches = np.zeros(count, dtype=bool)
+            with open(self.search_path, 'rb') as f:
+                f.seek(entry['search_offset'])
+                block = f.read(entry['search_length'])
+            term = search_value.encode('utf-8')
+            for row, line in enumerate(block.split(b'\n')[:count]):
+                if term in line:
+                    matches[row] = True
+            order = order[matches[order]]
+
+        if order_dir == 'desc':
+            order = order[::-1]
+
+        filtered = len(order)
+        page = order[start:] if length < 0 else order[start:start + length]
+
+        offsets = self._load_array(self.offsets_path)
+        with open(self.calls_path, 'rb') as f:
+            data = self._read_calls(f, offsets, rows_start, page.tolist())
+
+        return {'recordsTotal': count, 'recordsFiltered': filtered, 'data': data}
+
+    def ref(self, contract_id: Union[str, int]) -> str:
+        """Riferimento del report di un contratto (usato al posto del percorso del file)"""
+        return f"{self.data_path}{self.REF_SEPARATOR}{contract_id}"
+
+    @classmethod
+    def from_ref(cls, ref: str) -> Optional[Tuple['CDRContractDetailStore', str]]:
+        """
+        Store e codice contratto da un riferimento creato da ref()
+
+        Returns:
+            (store, codice_contratto) oppure None se ref è un normale percorso di file
+        """
+        path, separator, contract_id = str(ref).rpartition(cls.REF_SEPARATOR)
+        if not separator or os.path.basename(path) != cls.DATA_FILE:
+            return None
+        return cls(os.path.dirname(path)), contract_id
+
+    def mark_elaborato(self, contract_id: Union[str, int], elaborato: bool = True) -> bool:
+        """
+        Segna il report di un contratto come fatturato
+
+        Returns:
+            False se il contratto non è nel dettaglio
+        """
+        if not os.path.isdir(self.directory):
+            return False
+        # Eventuale migrazione di un indice precedente fuori dal lock
+        self.load_index()
+        with self._index_lock():
+            index = self.load_index(migrate=False)
+            entry = index['contracts'].get(str(contract_id)) if index else None
+            if entry is None:
+                return False
+            entry['elaborato'] = elaborato
+            entry['elaborato_timestamp'] = datetime.now().isoformat()
+            cdr_json.dump(index, self.index_path)
+        return True
+
+    @contextmanager
+    def _index_lock(self):
+        """Lock esclusivo (tra processi) sulle scritture dell'indice"""
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # -------------------------------------------------------------- scrittura
+
+    def _merge_state(self, entries: Dict[str, Dict[str, Any]], old_entries: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Riporta nelle nuove voci lo stato di fatturazione dell'indice su disco
+
+        Va chiamata sotto _index_lock. Lo stato viene ripreso solo per i contratti
+        il cui contenuto non è cambiato rispetto alla versione di partenza.
+
+        Args:
+            entries: Nuove voci dell'indice (modificate sul posto)
+            old_entries: Voci dell'indice letto all'inizio della scrittura
+        """
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            current = cdr_json.load_file(self.index_path)
+        except Exception as e:
+            logger.warning(f"Indice dettaglio contratti non leggibile {self.index_path}: {e}")
+            return
+        if not isinstance(current, dict) or current.get('version') != self.VERSION:
+            return
+
+        for contract_id, disk_entry in current.get('contracts', {}).items():
+            entry = entries.get(contract_id)
+            old = old_entries.get(contract_id)
+            if entry is None or old is None or entry.get('hash') != old.get('hash'):
+                continue
+            for field in self.STATE_FIELDS:
+                if field in disk_entry:
+                    entry[field] = disk_entry[field]
+                else:
+                    entry.pop(field, None)
+
+    def _load_previous_version(self) -> Optional[Dict[str, Any]]:
+        """
+        Indice di una versione precedente, se allineato al proprio file dati
+
+        Returns:
+            Indice grezzo oppure None
+        """
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            index = cdr_json.load_file(self.index_path)
+            data_size = os.path.getsize(self.data_path)
+        except Exception as e:
+            logger.warning(f"Indice dettaglio contratti non leggibile {self.index_path}: {e}")
+            return None
+
+        if not isinstance(index, dict) or not isinstance(index.get('version'), int):
+            return None
+        if index['version'] >= self.VERSION or index.get('data_size') != data_size:
+            return None
+        return index
+
+    def _migrate_previous_version(self) -> Optional[Dict[str, Any]]:
+        """
+        Riscrive nel formato corrente il dettaglio di una versione precedente
+
+        I report vengono riletti dal vecchio file dati e passati a write, che
+        conserva lo stato di fatturazione dei contratti (_previous_version_state).
+
+        Returns:
+            Nuovo indice oppure None se l'indice precedente non è utilizzabile
+        """
+        previous = self._load_previous_version()
+        if previous is None:
+            return None
+        logger.info(f"Migrazione del dettaglio contratti {self.directory} "
+                    f"dalla versione {previous['version']} alla {self.VERSION}")
+
+        def build_report(contract_id: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+            with open(self.data_path, 'rb') as f:
+                f.seek(entry['offset'])
+                return cdr_json.loads(f.read(entry['length']))
+
+        try:
+            results = self.write(previous.get('contracts', {}), build_report,
+                                 previous.get('generated_at') or datetime.now().isoformat(),
+                                 source_file=previous.get('source_file'))
+        except Exception as e:
+            logger.error(f"Migrazione del dettaglio contratti {self.directory} fallita: {e}")
+            return None
+        for error in results['errors']:
+            logger.warning(f"Migrazione {self.directory}: {error['error']}")
+        return self.load_index(migrate=False)
+
+    def _previous_version_state(self, previous: Dict[str, Any], contract_id: str,
+                                report: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Stato di fatturazione dall'indice di una versione precedente, se il contenuto è lo stesso
+
+        Nella versione 1 ogni riga del file dati contiene il report completo,
+        chiamate incluse: il confronto avviene sul report decodificato.
+        """
+        entry = previous.get('contracts', {}).get(contract_id)
+        if not entry or not entry.get('elaborato'):
+            return {}
+        try:
+            with open(self.data_path, 'rb') as f:
+                f.seek(entry['offset'])
+                old_report = cdr_json.loads(f.read(entry['length']))
+        except Exception as e:
+            logger.warning(f"Report precedente di {contract_id} non leggibile in {self.data_path}: {e}")
+            return {}
+
+        old_report.pop('generated_at', None)
+        current = {key: value for key, value in report.items() if key != 'generated_at'}
+        if old_report != current:
+            return {}
+        return {field: entry[field] for field in self.STATE_FIELDS if field in entry}
+
+    def _legacy_path(self, contract_id: str) -> str:
+        return os.path.join(self.directory, f"{contract_id}{self.LEGACY_SUFFIX}")
+
+    def _legacy_state(self, contract_id: str, report: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Stato di fatturazione dal vecchio file per contratto, se il contenuto è lo stesso
+        """
+        legacy_path = self._legacy_path(contract_id)
+        if not os.path.exists(legacy_path):
+            return {}
+        try:
+            legacy = cdr_json.load_file(legacy_path)
+        except Exception as e:
+            logger.warning(f"Report precedente non leggibile {legacy_path}: {e}")
+            return {}
+        if not legacy.get('elaborato'):
+            return {}
+
+        state = {field: legacy.pop(field) for field in self.STATE_FIELDS if field in legacy}
+        legacy.pop('generated_at', None)
+        current = {key: value for key, value in report.items() if key != 'generated_at'}
+        return state if legacy == current else {}
+
+    def _remove_legacy_files(self) -> int:
+        """Rimuove i file per contratto sostituiti dal dettaglio indicizzato"""
+        removed = 0
+        for file_path in Path(self.directory).glob(f"*{self.LEGACY_SUFFIX}"):
+            if not file_path.stem[:-len('_reports')].isdigit():
+                continue
+            try:
+                file_path.unlink()
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Impossibile eliminare {file_path}: {e}")
+        legacy_index = Path(self.directory) / self.LEGACY_INDEX_FILE
+        if legacy_index.exists():
+            legacy_index.unlink()
+        return removed
+
+    @classmethod
+    def _sort_key(cls, column: str) -> Callable[[Dict[str, Any]], Any]:
+        if column in cls.NUMERIC_COLUMNS:
+            def key(call):
+                value = call.get(column)
+                return float(value) if isinstance(value, (int, float)) else float('-inf')
+        else:
+            def key(call):
+                value = call.get(column)
+                return '' if value is None else str(value).lower()
+        return key
+
+    def _serialize(self, report: Dict[str, Any], timestamp: bytes) -> Dict[str, Any]:
+        """
+        Serializza report, chiamate, testo di ricerca e ordinamenti di un contratto
+
+        Returns:
+            {'report', 'calls': [bytes], 'search', 'orders': {colonna: array}, 'hash'}
+        """
+        calls = report.get('lista_chiamate') or []
+        # Il report resta con la chiave (vuota) nella stessa posizione
+        report_bytes = cdr_json.dumpb(dict(report, lista_chiamate=[]))
+        call_lines = [cdr_json.dumpb(call) for call in calls]
+        search = '\n'.join(
+            '\x1f'.join('' if call.get(column) is None else str(call.get(column)) for column in self.CALL_COLUMNS)
+            for call in calls
+        ).lower().encode('utf-8')
+
+        orders = {}
+        for column in self.CALL_COLUMNS:
+            key = self._sort_key(column)
+            orders[column] = array('i', sorted(range(len(calls)), key=lambda i: key(calls[i])))
+
+        content = hashlib.sha1()
+        # generated_at è il primo valore con il timestamp dell'esecuzione: lo esclude dall'hash
+        content.update(report_bytes.replace(timestamp, b'', 1))
+        for line in call_lines:
+            content.update(b'\n')
+            content.update(line)
+
+        return {
+            'report': report_bytes,
+            'calls': call_lines,
+            'search': search,
+            'orders': orders,
+            'hash': content.hexdigest()
+        }
+
+    def write(self, contracts: Dict[str, Any], build_report: Callable[[str, Any], Dict[str, Any]],
+              generated_at: str, contract_ids: Optional[Iterable[Union[str, int]]] = None,
+              source_file: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Riscrive il dettaglio del mese
+
+        Args:
+            contracts: Contratti dell'aggregato {codice: dati}, nell'ordine di scrittura
+            build_report: Costruisce il report di un contratto (eseguita nel pool)
+            generated_at: Timestamp dell'esecuzione, lo stesso di report['generated_at']
+            contract_ids: Se indicato, solo questi contratti vengono ricostruiti;
+                          gli altri già presenti vengono copiati dal dettaglio precedente
+            source_file: Nome del file aggregato di origine (salvato nell'indice)
+
+        Returns:
+            {'detail_file', 'index_file', 'contracts_written': [...],
+             'contracts_unchanged': [codici], 'errors': [...], 'legacy_files_removed'}
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        previous = self.load_index(migrate=False)
+        old_entries = previous['contracts'] if previous else {}
+        migrate_legacy = previous is None
+        # Indice di una versione precedente: non riutilizzabile, ma ne conserva lo stato
+        previous_version = self._load_previous_version() if migrate_legacy else None
+        selected = None if contract_ids is None else {str(contract_id) for contract_id in contract_ids}
+        timestamp = generated_at.encode('utf-8')
+
+        # Array precedenti letti in memoria: i file vengono sostituiti durante la scrittura
+        old_offsets = self._load_array(self.offsets_path, mmap=False) if old_entries else None
+        old_orders = {
+            column: self._load_array(self.order_path(column), mmap=False) for column in self.CALL_COLUMNS
+        } if old_entries else {}
+
+        def task(item: Tuple[str, Any]) -> Tuple[str, Optional[Tuple[Dict[str, Any], Dict[str, Any]]], Optional[str]]:
+            contract_id, contract_data = item
+            old = old_entries.get(contract_id)
+            if old is not None and selected is not None and contract_id not in selected:
+                return contract_id, None, None
+            try:
+                report = build_report(contract_id, contract_data)
+                # Un report migrato conserva il proprio generated_at
+                report_timestamp = report.get('generated_at')
+                serialized = self._serialize(
+                    report, report_timestamp.encode('utf-8') if isinstance(report_timestamp, str) else timestamp
+                )
+                if old is not None and old.get('hash') == serialized['hash']:
+                    return contract_id, None, None
+                return contract_id, (report, serialized), None
+            except Exception as e:
+                return contract_id, None, str(e)
+
+        results = {
+            'detail_file': self.data_path,
+            'index_file': self.index_path,
+            'contracts_written': [],
+            'contracts_unchanged': [],
+            'errors': []
+        }
+        entries = {}
+        offsets = array('q', [0])
+        orders = {column: array('i') for column in self.CALL_COLUMNS}
+        sizes = {'data': 0, 'calls': 0, 'search': 0}
+
+        # Il lock viene preso prima della sostituzione dei file dati e rilasciato
+        # dopo il salvataggio dell'indice: mark_elaborato non vede mai file e indice disallineati
+        with ExitStack() as locked:
+            with ExitStack() as output:
+                data_f = output.enter_context(cdr_json.open_atomic(self.data_path))
+                calls_f = output.enter_context(cdr_json.open_atomic(self.calls_path))
+                search_f = output.enter_context(cdr_json.open_atomic(self.search_path))
+
+                # I file precedenti vengono chiusi prima della sostituzione
+                with ExitStack() as old_files:
+                    if old_entries:
+                        old_data = old_files.enter_context(open(self.data_path, 'rb'))
+                        old_calls = old_files.enter_context(open(self.calls_path, 'rb'))
+                        old_search = old_files.enter_context(open(self.search_path, 'rb'))
+                    executor = old_files.enter_context(ThreadPoolExecutor(max_workers=self.workers))
+
+                    for contract_id, built, error in executor.map(task, contracts.items()):
+                        old = old_entries.get(contract_id)
+                        if error is not None:
+                            error_msg = f"Errore durante l'elaborazione del contratto {contract_id}: {error}"
+                            results['errors'].append({'contract_id': contract_id, 'error': error_msg})
+                            logger.error(error_msg)
+
+                        rows_start = len(offsets) - 1
+                        if built is None:
+                            # Invariato, non selezionato o in errore: resta la versione precedente
+                            if old is None:
+                                continue
+                            old_data.seek(old['offset'])
+                            report_bytes = old_data.read(old['length'])
+
+                            old_rows = old_offsets[old['rows_start']:old['rows_start'] + old['calls_count'] + 1]
+                            old_calls.seek(int(old_rows[0]))
+                            calls_f.write(old_calls.read(int(old_rows[-1] - old_rows[0])))
+                            base = sizes['calls'] - int(old_rows[0])
+                            offsets.extend(int(offset) + base for offset in old_rows[1:])
+                            for column in self.CALL_COLUMNS:
+                                orders[column].extend(
+                                    old_orders[column][old['rows_start']:old['rows_start'] + old['calls_count']].tolist()
+                                )
+
+                            old_search.seek(old['search_offset'])
+                            search_bytes = old_search.read(old['search_length'])
+                            calls_count = old['calls_count']
+                            entry = dict(old)
+                            if error is None:
+                                results['contracts_unchanged'].append(contract_id)
+                        else:
+                            report, serialized = built
+                            report_bytes = serialized['report']
+                            call_offset = sizes['calls']
+                            for line in serialized['calls']:
+                                calls_f.write(line)
+                                calls_f.write(b'\n')
+                                call_offset += len(line) + 1
+                                offsets.append(call_offset)
+                            for column, order in serialized['orders'].items():
+                                orders[column].extend(order)
+
+                            search_bytes = serialized['search'] + b'\n' if serialized['calls'] else b''
+                            calls_count = len(serialized['calls'])
+                            entry = {
+                                'hash': serialized['hash'],
+                                'client': report.get('contract_info', {}).get('cliente_finale', 'N/A'),
+                                'updated_at': generated_at
+                            }
+                            if migrate_legacy:
+                                entry.update(self._legacy_state(contract_id, report))
+                            if previous_version and 'elaborato' not in entry:
+                                entry.update(self._previous_version_state(previous_version, contract_id, report))
+                            results['contracts_written'].append({
+                                'contract_id': contract_id,
+                                'offset': sizes['data'],
+                                'size_bytes': len(report_bytes),
+                                'calls_count': calls_count,
+                                'client': entry['client']
+                            })
+
+                        data_f.write(report_bytes)
+                        data_f.write(b'\n')
+                        search_f.write(search_bytes)
+
+                        entry.update({
+                            'offset': sizes['data'],
+                            'length': len(report_bytes),
+                            'rows_start': rows_start,
+                            'calls_count': calls_count,
+                            'search_offset': sizes['search'],
+                            'search_length': len(search_bytes)
+                        })
+                        entries[contract_id] = entry
+                        sizes['data'] += len(report_bytes) + 1
+                        sizes['calls'] = offsets[-1]
+                        sizes['search'] += len(search_bytes)
+
+                locked.enter_context(self._index_lock())
+
+            with cdr_json.open_atomic(self.offsets_path) as f:
+                np.save(f, np.frombuffer(offsets, dtype=np.int64))
+            for column, order in orders.items():
+                with cdr_json.open_atomic(self.order_path(column)) as f:
+                    np.save(f, np.frombuffer(order, dtype=np.int32) if len(order) else np.zeros(0, np.int32))
+
+            # Stato di fatturazione aggiornato nel frattempo (mark_elaborato durante la scrittura)
+            self._merge_state(entries, old_entries)
+            cdr_json.dump({
+                'version': self.VERSION,
+                'data_file': self.DATA_FILE,
+                'data_size': sizes['data'],
+                'calls_size': sizes['calls'],
+                'search_size': sizes['search'],
+                'calls_total': len(offsets) - 1,
+                'source_file': source_file,
+                'generated_at': generated_at,
+                'contracts': entries
+            }, self.index_path)
+
+        results['legacy_files_removed'] = self._remove_legacy_files() if migrate_legacy else 0
+        return results
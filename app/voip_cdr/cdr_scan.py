@@ -0,0 +1,363 @@
+"""
+CDR Scan - Lettura in un solo passaggio dei file CDR con sink multipli
+
+Ogni file viene letto una volta e ogni riga divisa su ';' una volta sola;
+i campi vengono poi passati a tutti i sink registrati:
+
+- CDRRecordSink: record prezzati di CDRProcessor (dizionari o CDRCall compatti)
+- CDRRawRecordSink: record grezzi di FTPDownloader.convert_to_json
+- CDRContractSink: delta dei contratti (codici, numeri chiamante, cliente finale)
+- CDRFileStatsSink: statistiche per file
+- CDRValidationSink: righe con numero di colonne non valido
+
+I sink che producono record li restituiscono da feed(); gli altri accumulano
+stato per file. Lo stato è serializzabile e unibile con merge(), così lo
+stesso sink funziona anche sui blocchi letti in parallelo da CDRParallelReader.
+"""
+
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+from app.voip_cdr.cdr_record import CDRFileInfo
+
+logger = logging.getLogger(__name__)
+
+# Campi di una riga CDR completa: 12 colonne più il ';' finale
+CDR_FIELDS_COUNT = 13
+
+
+class CDRScanSink:
+    """Sink base: riceve ogni riga non vuota già divisa in campi"""
+
+    def feed(self, source_file: str, line_number: int, line: str, fields: List[str]) -> Optional[Any]:
+        """
+        Elabora una riga
+
+        Args:
+            source_file: Nome del file di origine
+            line_number: Numero di riga (da 1, relativo al testo ricevuto)
+            line: Riga senza spazi iniziali/finali
+            fields: Campi della riga (line.split(';'))
+
+        Returns:
+            Un valore da restituire al chiamante dello scanner, oppure None
+        """
+        return None
+
+    def merge(self, other: 'CDRScanSink', line_offset: int = 0) -> None:
+        """
+        Unisce lo stato di un sink dello stesso tipo
+
+        Args:
+            other: Sink che ha letto il blocco successivo
+            line_offset: Righe che precedono il blocco nel suo file
+        """
+
+    def spawn(self) -> 'CDRScanSink':
+        """Copia vuota con la stessa configurazione (per i processi worker)"""
+        return type(self)()
+
+
+class CDRScanner:
+    """Lettore unico dei file CDR che alimenta più sink"""
+
+    def __init__(self, sinks: Sequence[CDRScanSink], encoding: str = 'latin1'):
+        """
+        Args:
+            sinks: Sink da alimentare, nell'ordine di chiamata
+            encoding: Encoding dei file CDR
+        """
+        self.sinks = list(sinks)
+        self.encoding = encoding
+
+    def iter_lines(self, lines: Iterable[str], source_file: str) -> Iterator[Any]:
+        """
+        Alimenta i sink con le righe ricevute
+
+        Args:
+            lines: Righe di un file o di un suo blocco
+            source_file: Nome del file di origine
+
+        Returns:
+            Generatore dei valori restituiti dai sink (es. record prezzati)
+        """
+        sinks = self.sinks
+        for line_number, raw_line in enumerate(lines, 1):
+            line = raw_line.strip()
+            if not line:  # Ignora righe vuote
+                continue
+
+            fields = line.split(';')
+            for sink in sinks:
+                output = sink.feed(source_file, line_number, line, fields)
+                if output is not None:
+                    yield output
+
+    def iter_file(self, file_path: Union[str, Path]) -> Iterator[Any]:
+        """Legge un file CDR una volta sola alimentando tutti i sink"""
+        with open(file_path, 'r', encoding=self.encoding) as f:
+            yield from self.iter_lines(f, os.path.basename(file_path))
+
+    def scan(self, file_path: Union[str, Path]) -> int:
+        """
+        Legge un file quando serve solo lo stato dei sink
+
+        Returns:
+            Numero di valori prodotti dai sink
+        """
+        count = 0
+        for _ in self.iter_file(file_path):
+            count += 1
+        return count
+
+
+class CDRRecordSink(CDRScanSink):
+    """Record prezzati nel formato dell'archivio mensile (CDRProcessor)"""
+
+    def __init__(self, processor, compact: bool = False):
+        """
+        Args:
+            processor: CDRProcessor con motore tariffario caricato
+            compact: Se True produce CDRCall invece di dizionari
+        """
+        self.processor = processor
+        self.compact = compact
+        self._current_file = None
+        self._file_info = None
+
+    def spawn(self):
+        return type(self)(self.processor, self.compact)
+
+    def feed(self, source_file, line_number, line, fields):
+        # Metadati di file (istante di elaborazione) calcolati una volta per file
+        if source_file != self._current_file:
+            self._current_file = source_file
+            self._file_info = CDRFileInfo(source_file, datetime.now().isoformat())
+
+        if self.compact:
+            return self.processor._parse_cdr_call(fields, line, self._file_info, line_number)
+
+        record = self.processor._parse_cdr_fields(fields, line)
+        if record:
+            # Aggiunge metadati del file
+            record['_source_file'] = source_file
+            record['_line_number'] = line_number
+            record['_processed_at'] = self._file_info.processed_at
+        return record
+
+
+class CDRRawRecordSink(CDRScanSink):
+    """Record grezzi nel formato di FTPDownloader.convert_to_json"""
+
+    HEADERS = [
+        'data_ora_chiamata',
+        'numero_chiamante',
+        'numero_chiamato',
+        'durata_secondi',
+        'tipo_chiamata',
+        'operatore',
+        'costo_euro',
+        'codice_contratto',
+        'codice_servizio',
+        'cliente_finale_comune',
+        'prefisso_chiamato'
+    ]
+
+    def feed(self, source_file, line_number, line, fields):
+        record = {}
+        for i, header in enumerate(self.HEADERS):
+            value = fields[i].strip() if i < len(fields) else ''
+
+            # Conversioni di tipo specifiche
+            if header == 'costo_euro':
+                try:
+                    record[header] = float(value.replace(',', '.')) if value else 0.0
+                except ValueError:
+                    record[header] = 0.0
+            elif header in ('durata_secondi', 'codice_contratto', 'codice_servizio'):
+                try:
+                    record[header] = int(value) if value else 0
+                except ValueError:
+                    record[header] = 0
+            else:
+                record[header] = value
+
+        # Aggiungi metadati utili
+        record['record_number'] = line_number
+        record['raw_line'] = line
+        return record
+
+
+class CDRContractSink(CDRScanSink):
+    """Delta dei contratti per file: chiamate, numeri chiamante e cliente finale"""
+
+    def __init__(self):
+        # {file: {'contracts': {codice: {...}}, 'records_count': n}}
+        self.files: Dict[str, Dict[str, Any]] = {}
+
+    def _file_state(self, source_file: str) -> Dict[str, Any]:
+        state = self.files.get(source_file)
+        if state is None:
+            state = self.files[source_file] = {'contracts': {}, 'records_count': 0}
+        return state
+
+    def feed(self, source_file, line_number, line, fields):
+        contract_code = fields[7].strip() if len(fields) > 7 else ''
+        if not contract_code or not contract_code.isdigit():
+            return None
+
+        numero_chiamante = fields[1].strip()
+        cliente_finale_comune = fields[9].strip() if len(fields) > 9 else ''
+
+        state = self._file_state(source_file)
+        contract = state['contracts'].get(contract_code)
+        if contract is None:
+            # phone_numbers come dict: insieme che mantiene l'ordine di apparizione
+            # cliente_finale_comune è il primo valore del file, cliente_finale_ultimo l'ultimo
+            contract = state['contracts'][contract_code] = {
+                'calls_count': 0,
+                'phone_numbers': {},
+                'cliente_finale_comune': None,
+                'cliente_finale_ultimo': None
+            }
+
+        if cliente_finale_comune:
+            if not contract['cliente_finale_comune']:
+                contract['cliente_finale_comune'] = cliente_finale_comune
+            contract['cliente_finale_ultimo'] = cliente_finale_comune
+        contract['calls_count'] += 1
+        if numero_chiamante and numero_chiamante.isdigit():
+            contract['phone_numbers'][numero_chiamante] = None
+
+        state['records_count'] += 1
+        return None
+
+    def merge(self, other, line_offset=0):
+        for source_file, other_state in other.files.items():
+            state = self._file_state(source_file)
+            state['records_count'] += other_state['records_count']
+            for contract_code, other_contract in other_state['contracts'].items():
+                contract = state['contracts'].get(contract_code)
+                if contract is None:
+                    state['contracts'][contract_code] = other_contract
+                    continue
+                contract['calls_count'] += other_contract['calls_count']
+                contract['phone_numbers'].update(other_contract['phone_numbers'])
+                if not contract['cliente_finale_comune']:
+                    contract['cliente_finale_comune'] = other_contract['cliente_finale_comune']
+                if other_contract['cliente_finale_ultimo']:
+                    contract['cliente_finale_ultimo'] = other_contract['cliente_finale_ultimo']
+
+    def file_result(self, source_file: str) -> Dict[str, Any]:
+        """
+        Contratti trovati in un file, nel formato di extract_codes_from_single_file
+
+        Returns:
+            {'contracts': {codice: {calls_count, phone_numbers, total_unique_numbers,
+            cliente_finale_comune}}, 'records_count', 'file_name'}
+        """
+        state = self.files.get(source_file, {'contracts': {}, 'records_count': 0})
+        contracts = {
+            contract_code: {
+                'calls_count': data['calls_count'],
+                'phone_numbers': sorted(data['phone_numbers']),
+                'total_unique_numbers': len(data['phone_numbers']),
+                'cliente_finale_comune': data['cliente_finale_comune']
+            }
+            for contract_code, data in state['contracts'].items()
+        }
+        return {
+            'contracts': contracts,
+            'records_count': state['records_count'],
+            'file_name': source_file
+        }
+
+
+class CDRFileStatsSink(CDRScanSink):
+    """Statistiche per file: righe, durata, costo e intervallo date"""
+
+    def __init__(self):
+        self.files: Dict[str, Dict[str, Any]] = {}
+
+    def feed(self, source_file, line_number, line, fields):
+        stats = self.files.get(source_file)
+        if stats is None:
+            stats = self.files[source_file] = {
+                'lines': 0,
+                'valid_lines': 0,
+                'durata_secondi_totale': 0,
+                'costo_euro_totale': 0.0,
+                'first_call': None,
+                'last_call': None
+            }
+
+        stats['lines'] += 1
+        if len(fields) != CDR_FIELDS_COUNT:
+            return None
+
+        stats['valid_lines'] += 1
+        durata = fields[3].strip()
+        if durata.isdigit():
+            stats['durata_secondi_totale'] += int(durata)
+        try:
+            stats['costo_euro_totale'] += float(fields[6].strip().replace(',', '.'))
+        except ValueError:
+            pass
+
+        # Formato YYYY-MM-DD-HH.MM.SS: l'ordine lessicografico è quello temporale
+        data_ora = fields[0].strip()
+        if data_ora:
+            if stats['first_call'] is None or data_ora < stats['first_call']:
+                stats['first_call'] = data_ora
+            if stats['last_call'] is None or data_ora > stats['last_call']:
+                stats['last_call'] = data_ora
+        return None
+
+    def merge(self, other, line_offset=0):
+        for source_file, other_stats in other.files.items():
+            stats = self.files.get(source_file)
+            if stats is None:
+                self.files[source_file] = other_stats
+                continue
+            for key in ('lines', 'valid_lines', 'durata_secondi_totale', 'costo_euro_totale'):
+                stats[key] += other_stats[key]
+            for key, pick in (('first_call', min), ('last_call', max)):
+                values = [v for v in (stats[key], other_stats[key]) if v is not None]
+                stats[key] = pick(values) if values else None
+
+
+class CDRValidationSink(CDRScanSink):
+    """Errori di validazione (numero colonne) con file e numero di riga"""
+
+    def __init__(self, max_errors: int = 1000):
+        """
+        Args:
+            max_errors: Numero massimo di errori conservati (il conteggio resta completo)
+        """
+        self.max_errors = max_errors
+        self.errors: List[Dict[str, Any]] = []
+        self.error_count = 0
+
+    def spawn(self):
+        return type(self)(self.max_errors)
+
+    def feed(self, source_file, line_number, line, fields):
+        if len(fields) != CDR_FIELDS_COUNT:
+            self.error_count += 1
+            if len(self.errors) < self.max_errors:
+                self.errors.append({
+                    'file': source_file,
+                    'line': line_number,
+                    'error': f"Numero colonne non valido: {len(fields)} vs {CDR_FIELDS_COUNT - 1}",
+                    'sample': line[:50]
+                })
+        return None
+
+    def merge(self, other, line_offset=0):
+        self.error_count += other.error_count
+        for error in other.errors:
+            if len(self.errors) >= self.max_errors:
+                break
+            self.errors.append(dict(error, line=error['line'] + line_offset))
@@ -0,0 +1,735 @@
+"""
+CDR Store - Archivi mensili dei record CDR
+
+NDJSON: un record JSON per riga, scritto in append. Aggiungere un file
+giornaliero costa O(righe nuove) e la lettura avviene riga per riga.
+
+Colonnare: una cartella di array NumPy per il mese, letta via memory-mapping
+dalle fasi a valle (aggregazione, contratti) senza riparsare il JSON.
+
+Aggregato: il file aggregato del mese con l'indice degli offset dei contratti,
+per leggerne solo alcuni e riscriverlo copiando quelli invariati.
+"""
+
+import calendar
+import json
+import logging
+import os
+import shutil
+from array import array
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from app.voip_cdr import cdr_json
+
+logger = logging.getLogger(__name__)
+
+
+class CDRNDJSONStore:
+    """Archivio mensile append-only in formato NDJSON"""
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Args:
+            path: Percorso del file .ndjson del mese
+        """
+        self.path = Path(path)
+        self.meta_path = self.path.with_suffix('.meta.json')
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def _load_meta(self) -> Dict[str, Any]:
+        if not self.meta_path.exists():
+            return {}
+        try:
+            return cdr_json.load_file(self.meta_path)
+        except Exception as e:
+            logger.warning(f"Metadati NDJSON non leggibili {self.meta_path}: {e}")
+            return {}
+
+    def _save_meta(self, meta: Dict[str, Any]) -> None:
+        cdr_json.dump(meta, self.meta_path)
+
+    def reset(self) -> None:
+        """Svuota l'archivio (usato in modalità riprocessamento)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        open(self.path, 'w', encoding='utf-8').close()
+        self._save_meta({'records': 0})
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Accoda i record consumando l'iterabile un elemento alla volta
+
+        Se la lettura o la scrittura fallisce a metà, il file viene riportato
+        alla dimensione precedente: l'archivio non contiene mai un file a metà.
+
+        Args:
+            records: Iterabile (anche generatore) di record CDR
+
+        Returns:
+            Numero di record scritti
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        written = 0
+
+        dumpb = cdr_json.dumpb
+        with open(self.path, 'ab') as f:
+            start_size = f.tell()
+            try:
+                for record in records:
+                    f.write(dumpb(record))
+                    f.write(b'\n')
+                    written += 1
+            except BaseException:
+                f.truncate(start_size)
+                raise
+
+        meta = self._load_meta()
+        meta['records'] = meta.get('records', 0) + written
+        self._save_meta(meta)
+        return written
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Generatore dei record dell'archivio, letti riga per riga"""
+        if not self.path.exists():
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield cdr_json.loads(line)
+                except json.JSONDecodeError as e:
+                    # Riga troncata (es. scrittura interrotta): la salta
+                    logger.warning(f"Riga NDJSON non valida {self.path}:{line_num}: {e}")
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.iter_records()
+
+    def count(self) -> int:
+        """Numero di record, dai metadati se disponibili altrimenti contando le righe"""
+        meta = self._load_meta()
+        if 'records' in meta:
+            return meta['records']
+        return sum(1 for _ in self.iter_records())
+
+    def remove_source(self, source_file: str) -> int:
+        """
+        Elimina dall'archivio i record provenienti da un file CDR (riscrittura atomica)
+
+        Args:
+            source_file: Nome del file CDR (_source_file dei record)
+
+        Returns:
+            Numero di record rimossi
+        """
+        if not self.path.exists():
+            return 0
+
+        kept = 0
+        removed = 0
+        tmp_path = self.path.with_suffix('.ndjson.tmp')
+        with open(tmp_path, 'wb') as f:
+            for record in self.iter_records():
+                if record.get('_source_file') == source_file:
+                    removed += 1
+                    continue
+                f.write(cdr_json.dumpb(record))
+                f.write(b'\n')
+                kept += 1
+        os.replace(tmp_path, self.path)
+
+        meta = self._load_meta()
+        meta['records'] = kept
+        self._save_meta(meta)
+        return removed
+
+    def export_json(self, output_path: Union[str, Path]) -> int:
+        """
+        Esporta l'archivio come lista JSON (vista di compatibilità) senza caricarlo in memoria
+
+        Args:
+            output_path: Percorso del file JSON da scrivere
+
+        Returns:
+            Numero di record esportati
+        """
+        return cdr_json.dump_iter(self.iter_records(), output_path)
+
+
+class CDRFileManifest:
+    """
+    Manifest dei file CDR elaborati nel mese (processed_files_YYYY_MM.json)
+
+    Formato (versione 3):
+        files:     {nome_file: {hash, records, processed_at, partial}}
+                   partial: {hash, contracts}, somme non arrotondate del file per
+                   contratto e tipo, valide per il contenuto con quell'hash
+        aggregate: file inclusi nel file aggregato del mese
+                   ({nome_file: {hash, contracts: [codici]}}) e record totali
+        contract_calls: {nome_file: {codice: chiamate}} già sommate in total_calls_found
+                   del registro contratti, da sottrarre quando il file viene rielaborato
+
+    Dalla versione 2 vengono conservati i file (senza somme parziali); il vecchio
+    formato {nome_file: hash} viene letto e convertito.
+    """
+
+    VERSION = 3
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Args:
+            path: Percorso del file processed_files_YYYY_MM.json
+        """
+        self.path = Path(path)
+
+    @classmethod
+    def empty(cls) -> Dict[str, Any]:
+        return {'version': cls.VERSION, 'files': {}, 'aggregate': None, 'contract_calls': {}}
+
+    def load(self) -> Dict[str, Any]:
+        """Carica il manifest (vuoto se assente o illeggibile)"""
+        if not self.path.exists():
+            return self.empty()
+
+        try:
+            data = cdr_json.load_file(self.path)
+        except Exception as e:
+            logger.error(f"Errore nel caricamento file processati: {e}")
+            return self.empty()
+
+        if isinstance(data, dict) and data.get('version') == self.VERSION:
+            data.setdefault('files', {})
+            data.setdefault('aggregate', None)
+            data.setdefault('contract_calls', {})
+            return data
+
+        if isinstance(data, dict) and data.get('version') == 2:
+            # Le somme del mese della versione 2 non sono per file: l'aggregato viene ricostruito
+            manifest = self.empty()
+            manifest['files'] = data.get('files') or {}
+            manifest['contract_calls'] = data.get('contract_calls') or {}
+            return manifest
+
+        # Formato precedente: {nome_file: hash}
+        manifest = self.empty()
+        if isinstance(data, dict):
+            manifest['files'] = {
+                name: {'hash': file_hash} for name, file_hash in data.items() if isinstance(file_hash, str)
+            }
+        return manifest
+
+    def save(self, manifest: Dict[str, Any]) -> None:
+        """Salva il manifest con scrittura atomica"""
+        manifest['version'] = self.VERSION
+        cdr_json.dump(manifest, self.path)
+
+
+class CDRAggregateFile:
+    """
+    File aggregato del mese (aggregate_files_YYYY_MM.json) con indice degli offset
+
+    Il file resta il JSON compatto {"contracts": {...}, "statistics": {...},
+    "file_name": ...} di cdr_json.dump; accanto (<file>.offsets) vengono salvati
+    posizione e lunghezza di ogni contratto e le statistiche. Così si leggono
+    solo i contratti richiesti e nella riscrittura i contratti invariati vengono
+    copiati byte per byte senza deserializzarli.
+    """
+
+    VERSION = 1
+    INDEX_SUFFIX = '.offsets'
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Args:
+            path: Percorso del file aggregato del mese
+        """
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + self.INDEX_SUFFIX)
+
+    def _signature(self) -> Optional[List[int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def load_index(self) -> Optional[Dict[str, Any]]:
+        """
+        Indice degli offset, se allineato al file aggregato
+
+        Returns:
+            {'version', 'signature', 'statistics', 'contracts': {codice: [offset, lunghezza]}}
+            oppure None se assente, di un'altra versione o di un file modificato
+        """
+        signature = self._signature()
+        if signature is None or not self.index_path.exists():
+            return None
+
+        try:
+            index = cdr_json.load_file(self.index_path)
+        except Exception as e:
+            logger.warning(f"Indice offset non leggibile {self.index_path}: {e}")
+            return None
+
+        if index.get('version') != self.VERSION or index.get('signature') != signature:
+            return None
+        return index
+
+    @staticmethod
+    def read_raw(f, entry: List[int]) -> bytes:
+        """JSON di un contratto (bytes) dal file aggregato aperto in lettura binaria"""
+        f.seek(entry[0])
+        return f.read(entry[1])
+
+    def read_contracts(self, index: Dict[str, Any], contract_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Legge solo i contratti indicati
+
+        Args:
+            index: Indice restituito da load_index
+            contract_ids: Codici da leggere (quelli assenti vengono ignorati)
+
+        Returns:
+            {codice: dati del contratto}
+        """
+        offsets = index['contracts']
+        contracts = {}
+        with open(self.path, 'rb') as f:
+            for contract_id in contract_ids:
+                entry = offsets.get(contract_id)
+                if entry is not None:
+                    contracts[contract_id] = cdr_json.loads(self.read_raw(f, entry))
+        return contracts
+
+    def write(self, contracts: Iterable[Tuple[str, Union[Dict[str, Any], bytes]]],
+              statistics: Dict[str, Any], file_name: str) -> Dict[str, Any]:
+        """
+        Scrive il file aggregato e il suo indice (scrittura atomica)
+
+        Il contenuto è identico a cdr_json.dump({'contracts', 'statistics', 'file_name'}).
+
+        Args:
+            contracts: Coppie (codice, dati) nell'ordine del file; i dati possono essere
+                       bytes già serializzati (es. copiati dalla versione precedente)
+            statistics: Statistiche del mese
+            file_name: Valore della chiave 'file_name'
+
+        Returns:
+            Indice salvato
+        """
+        offsets = {}
+        with cdr_json.open_atomic(self.path) as f:
+            position = f.write(b'{"contracts":{')
+            for contract_id, data in contracts:
+                if not isinstance(data, bytes):
+                    data = cdr_json.dumpb(data)
+                position += f.write((b',' if offsets else b'') + cdr_json.dumpb(str(contract_id)) + b':')
+                offsets[str(contract_id)] = [position, len(data)]
+                position += f.write(data)
+            f.write(b'},"statistics":' + cdr_json.dumpb(statistics)
+                    + b',"file_name":' + cdr_json.dumpb(file_name) + b'}')
+
+        index = {
+            'version': self.VERSION,
+            'signature': self._signature(),
+            'statistics': statistics,
+            'contracts': offsets
+        }
+        cdr_json.dump(index, self.index_path)
+        return index
+
+
+def iter_cdr_records(file_path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+    """
+    Itera i record di un archivio mensile: NDJSON, colonnare o lista JSON
+
+    Args:
+        file_path: Percorso del file .ndjson, della cartella .cols o del file .json
+
+    Returns:
+        Generatore dei record CDR
+    """
+    file_path = Path(file_path)
+    if file_path.suffix == '.ndjson':
+        yield from CDRNDJSONStore(file_path).iter_records()
+        return
+    if file_path.suffix == CDRMonthStore.SUFFIX:
+        yield from CDRMonthStore(file_path).load().iter_records()
+        return
+
+    data = cdr_json.load_file(file_path)
+    if isinstance(data, list):
+        yield from data
+
+
+class CDRMonthStore:
+    """
+    Archivio mensile colonnare (NumPy) dei record CDR
+
+    Ogni colonna è un file .npy nella cartella cdr_data_YYYY_MM.cols: le colonne
+    numeriche sono array tipizzati, le stringhe a bassa cardinalità sono codificate
+    a dizionario (codici int32 + elenco valori in dictionaries.json). La lettura
+    usa il memory-mapping, quindi aprire il mese non richiede di caricarlo.
+
+    I codici contratto non interi (assenti, vuoti, non numerici) vengono
+    conservati nei metadati come le date non valide: nell'array vale -1 per un
+    codice assente e 0 per una stringa non numerica, come nel backend Python.
+    """
+
+    VERSION = 2
+    SUFFIX = '.cols'
+
+    # Colonne numeriche: nome -> dtype
+    NUMERIC_COLUMNS = {
+        'data_ora': np.int64,                 # epoch in secondi (ora locale senza fuso)
+        'durata_secondi': np.int64,
+        'costo_euro': np.float64,
+        'costo_euro_with_markup': np.float64,  # NaN se il record non ha il campo
+        'codice_contratto': np.int64,
+        'codice_servizio': np.int64,
+        '_line_number': np.int64,
+    }
+
+    # Colonne stringa codificate a dizionario
+    DICTIONARY_COLUMNS = (
+        'numero_cliente',
+        'tipo_chiamata',
+        'operatore',
+        'cliente_finale',
+        'comune',
+        'prefisso_chiamato',
+        '_source_file',
+    )
+
+    # Colonne stringa ad alta cardinalità (byte a larghezza fissa)
+    BYTES_COLUMNS = ('numero_chiamato',)
+
+    # Ordine dei campi nei record ricostruiti (come CDRProcessor._parse_cdr_line)
+    RECORD_FIELDS = (
+        'data_ora', 'numero_cliente', 'numero_chiamato', 'durata_secondi',
+        'tipo_chiamata', 'operatore', 'costo_euro', 'costo_euro_with_markup',
+        'codice_contratto', 'codice_servizio', 'cliente_finale', 'comune',
+        'prefisso_chiamato', '_source_file', '_line_number', '_processed_at',
+    )
+
+    INVALID_EPOCH = np.iinfo(np.int64).min
+    MISSING_CONTRACT = -1
+    _EPOCH = datetime(1970, 1, 1)
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Args:
+            path: Cartella dell'archivio colonnare (es. cdr_data_2025_07.cols)
+        """
+        self.path = Path(path)
+        self.meta: Dict[str, Any] = {}
+        self.dictionaries: Dict[str, List[Any]] = {}
+        self._columns: Dict[str, np.ndarray] = {}
+        self._mmap = True
+
+    @classmethod
+    def path_for(cls, month_file: Union[str, Path]) -> Path:
+        """Percorso dell'archivio colonnare associato a un file mensile .json/.ndjson"""
+        month_file = Path(month_file)
+        return month_file.with_suffix(cls.SUFFIX)
+
+    def exists(self) -> bool:
+        return (self.path / 'meta.json').exists()
+
+    # ---------------------------------------------------------------- scrittura
+
+    @classmethod
+    def _to_epoch(cls, value: Any) -> int:
+        if not value:
+            return cls.INVALID_EPOCH
+        try:
+            dt = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return cls.INVALID_EPOCH
+        return calendar.timegm(dt.timetuple())
+
+    @classmethod
+    def build(cls, path: Union[str, Path], records: Iterable[Dict[str, Any]],
+              source_file: Optional[Union[str, Path]] = None) -> 'CDRMonthStore':
+        """
+        Costruisce l'archivio colonnare consumando i record uno alla volta
+
+        Args:
+            path: Cartella di destinazione
+            records: Iterabile di record CDR (lista o generatore)
+            source_file: File da cui provengono i record, registrato nei metadati
+                         per verificare in seguito che l'archivio sia aggiornato
+
+        Returns:
+            Archivio aperto in lettura
+        """
+        path = Path(path)
+        int_buffers = {name: array('q') for name, dtype in cls.NUMERIC_COLUMNS.items() if dtype is np.int64}
+        float_buffers = {name: array('d') for name, dtype in cls.NUMERIC_COLUMNS.items() if dtype is np.float64}
+        codes = {name: array('i') for name in cls.DICTIONARY_COLUMNS}
+        encoders: Dict[str, Dict[Any, int]] = {name: {} for name in cls.DICTIONARY_COLUMNS}
+        bytes_values = {name: [] for name in cls.BYTES_COLUMNS}
+        processed_at_by_file: Dict[int, str] = {}
+        raw_dates: Dict[str, str] = {}
+        raw_contracts: Dict[str, Any] = {}
+        nan = float('nan')
+        rows = 0
+
+        for record in records:
+            epoch = cls._to_epoch(record.get('data_ora'))
+            if epoch == cls.INVALID_EPOCH and record.get('data_ora'):
+                raw_dates[str(rows)] = record.get('data_ora')
+            int_buffers['data_ora'].append(epoch)
+
+            for name in ('durata_secondi', 'codice_servizio', '_line_number'):
+                value = record.get(name, 0)
+                int_buffers[name].append(value if isinstance(value, int) else int(value or 0))
+
+            contract = record.get('codice_contratto')
+            if isinstance(contract, int):
+                int_buffers['codice_contratto'].append(contract)
+            elif isinstance(contract, str) and contract.isdigit():
+                int_buffers['codice_contratto'].append(int(contract))
+            elif contract is not None and not isinstance(contract, str):
+                int_buffers['codice_contratto'].append(int(contract))
+            else:
+                raw_contracts[str(rows)] = contract
+                int_buffers['codice_contratto'].append(cls.MISSING_CONTRACT if contract is None else 0)
+
+            float_buffers['costo_euro'].append(float(record.get('costo_euro', 0.0) or 0.0))
+            markup = record.get('costo_euro_with_markup')
+            float_buffers['costo_euro_with_markup'].append(nan if markup is None else float(markup))
+
+            for name in cls.DICTIONARY_COLUMNS:
+                value = record.get(name, '')
+                encoder = encoders[name]
+                code = encoder.get(value)
+                if code is None:
+                    code = encoder[value] = len(encoder)
+                codes[name].append(code)
+
+            # _processed_at viene conservato una volta per file sorgente
+            file_code = codes['_source_file'][-1]
+            if file_code not in processed_at_by_file:
+                processed_at_by_file[file_code] = record.get('_processed_at', '')
+
+            for name in cls.BYTES_COLUMNS:
+                bytes_values[name].append(str(record.get(name, '')).encode('utf-8'))
+
+            rows += 1
+
+        tmp_path = path.with_name(path.name + '.tmp')
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        tmp_path.mkdir(parents=True)
+
+        for name, buffer in int_buffers.items():
+            np.save(tmp_path / f'{name}.npy', np.frombuffer(buffer, dtype=np.int64) if rows else np.zeros(0, np.int64))
+        for name, buffer in float_buffers.items():
+            np.save(tmp_path / f'{name}.npy', np.frombuffer(buffer, dtype=np.float64) if rows else np.zeros(0, np.float64))
+        for name, buffer in codes.items():
+            np.save(tmp_path / f'{name}.npy', np.frombuffer(buffer, dtype=np.int32) if rows else np.zeros(0, np.int32))
+        for name, values in bytes_values.items():
+            np.save(tmp_path / f'{name}.npy', np.array(values, dtype=bytes) if values else np.zeros(0, dtype='S1'))
+
+        dictionaries = {name: list(encoder.keys()) for name, encoder in encoders.items()}
+        dictionaries['_processed_at'] = [
+            processed_at_by_file.get(i, '') for i in range(len(dictionaries['_source_file']))
+        ]
+        cdr_json.dump(dictionaries, tmp_path / 'dictionaries.json')
+
+        meta = {
+            'version': cls.VERSION,
+            'rows': rows,
+            'created_at': datetime.now().isoformat(),
+            'source_file': str(source_file) if source_file else None,
+            'source_signature': cls._file_signature(source_file) if source_file else None,
+            'data_ora_raw': raw_dates,
+            'codice_contratto_raw': raw_contracts,
+        }
+        cdr_json.dump(meta, tmp_path / 'meta.json')
+
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+        logger.info(f"Archivio colonnare creato: {path} ({rows} record)")
+        return cls(path).load()
+
+    @classmethod
+    def from_month_file(cls, month_file: Union[str, Path], path: Optional[Union[str, Path]] = None) -> 'CDRMonthStore':
+        """
+        Costruisce l'archivio colonnare da un file mensile .json o .ndjson
+
+        Args:
+            month_file: File mensile sorgente
+            path: Cartella di destinazione (default: accanto al file sorgente)
+        """
+        path = Path(path) if path else cls.path_for(month_file)
+        return cls.build(path, iter_cdr_records(month_file), source_file=month_file)
+
+    @staticmethod
+    def _file_signature(file_path: Union[str, Path]) -> Optional[List[int]]:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def is_fresh(self, source_file: Optional[Union[str, Path]] = None) -> bool:
+        """
+        True se l'archivio esiste ed è allineato al file sorgente da cui è stato generato
+
+        Args:
+            source_file: Se indicato, l'archivio deve provenire proprio da questo file
+        """
+        if not self.exists():
+            return False
+        if not self.meta:
+            self.load()
+        if self.meta.get('version') != self.VERSION:
+            return False
+        built_from = self.meta.get('source_file')
+        if source_file is not None and str(source_file) != built_from:
+            return False
+        if not built_from:
+            return True
+        return self._file_signature(built_from) == self.meta.get('source_signature')
+
+    # ---------------------------------------------------------------- lettura
+
+    def load(self, mmap: bool = True) -> 'CDRMonthStore':
+        """
+        Apre l'archivio: metadati e dizionari subito, colonne su richiesta
+
+        Args:
+            mmap: Se True le colonne vengono mappate in memoria invece che lette
+        """
+        self.meta = cdr_json.load_file(self.path / 'meta.json')
+        self.dictionaries = cdr_json.load_file(self.path / 'dictionaries.json')
+        self._columns = {}
+        self._mmap = mmap
+        return self
+
+    def __len__(self) -> int:
+        return self.meta.get('rows', 0)
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Restituisce l'array di una colonna (codici int32 per le colonne a dizionario)
+
+        Args:
+            name: Nome della colonna
+        """
+        if name not in self._columns:
+            file_path = self.path / f'{name}.npy'
+            if not file_path.exists():
+                raise KeyError(f"Colonna non presente nell'archivio: {name}")
+            # Gli array vuoti non sono mappabili
+            mmap_mode = 'r' if self._mmap and len(self) else None
+            self._columns[name] = np.load(file_path, mmap_mode=mmap_mode)
+        return self._columns[name]
+
+    def dictionary(self, name: str) -> List[Any]:
+        """Valori distinti di una colonna codificata a dizionario"""
+        return self.dictionaries[name]
+
+    def decoded(self, name: str) -> np.ndarray:
+        """Colonna a dizionario decodificata (array di oggetti)"""
+        values = np.array(self.dictionaries[name], dtype=object)
+        return values[self.column(name)] if len(values) else np.empty(0, dtype=object)
+
+    def contract_masks(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Righe valide per codice_contratto, con le regole del backend Python
+
+        Returns:
+            Tupla (righe da aggregare, righe da includere in lista_chiamate):
+            un codice assente esclude la riga da entrambe, una stringa non
+            numerica viene aggregata sul contratto 0 ma non compare tra le chiamate
+        """
+        aggregate = np.ones(len(self), dtype=bool)
+        calls = np.ones(len(self), dtype=bool)
+        for row, value in self.meta.get('codice_contratto_raw', {}).items():
+            calls[int(row)] = False
+            if value is None:
+                aggregate[int(row)] = False
+        return aggregate, calls
+
+    def _decode_date(self, epoch: int, row: int) -> str:
+        if epoch == self.INVALID_EPOCH:
+            return self.meta.get('data_ora_raw', {}).get(str(row), '')
+        return (self._EPOCH + timedelta(seconds=epoch)).isoformat()
+
+    def iter_records(self, rows: Optional[np.ndarray] = None, chunk_size: int = 65536) -> Iterator[Dict[str, Any]]:
+        """
+        Ricostruisce i record come dizionari (vista di compatibilità)
+
+        Args:
+            rows: Indici di riga da restituire (default: tutte)
+            chunk_size: Righe convertite per blocco
+        """
+        total = len(self) if rows is None else len(rows)
+        dictionaries = {name: self.dictionaries[name] for name in self.DICTIONARY_COLUMNS}
+        processed_at = self.dictionaries.get('_processed_at', [])
+        raw_contracts = self.meta.get('codice_contratto_raw', {})
+
+        for start in range(0, total, chunk_size):
+            if rows is None:
+                index = slice(start, min(start + chunk_size, total))
+                row_numbers = range(index.start, index.stop)
+            else:
+                index = rows[start:start + chunk_size]
+                row_numbers = index.tolist()
+
+            chunk = {name: self.column(name)[index].tolist() for name in self.NUMERIC_COLUMNS}
+            chunk.update({name: self.column(name)[index].tolist() for name in self.DICTIONARY_COLUMNS})
+            chunk.update({name: self.column(name)[index].tolist() for name in self.BYTES_COLUMNS})
+
+            for i, row in enumerate(row_numbers):
+                file_code = chunk['_source_file'][i]
+                record = {
+                    'data_ora': self._decode_date(chunk['data_ora'][i], row),
+                    'numero_cliente': dictionaries['numero_cliente'][chunk['numero_cliente'][i]],
+                    'numero_chiamato': chunk['numero_chiamato'][i].decode('utf-8'),
+                    'durata_secondi': chunk['durata_secondi'][i],
+                    'tipo_chiamata': dictionaries['tipo_chiamata'][chunk['tipo_chiamata'][i]],
+                    'operatore': dictionaries['operatore'][chunk['operatore'][i]],
+                    'costo_euro': chunk['costo_euro'][i],
+                }
+                markup = chunk['costo_euro_with_markup'][i]
+                if markup == markup:  # NaN = campo assente nel record originale
+                    record['costo_euro_with_markup'] = markup
+                record['codice_contratto'] = chunk['codice_contratto'][i]
+                if raw_contracts and str(row) in raw_contracts:
+                    record['codice_contratto'] = raw_contracts[str(row)]
+                record['codice_servizio'] = chunk['codice_servizio'][i]
+                record['cliente_finale'] = dictionaries['cliente_finale'][chunk['cliente_finale'][i]]
+                record['comune'] = dictionaries['comune'][chunk['comune'][i]]
+                record['prefisso_chiamato'] = dictionaries['prefisso_chiamato'][chunk['prefisso_chiamato'][i]]
+                record['_source_file'] = dictionaries['_source_file'][file_code]
+                record['_line_number'] = chunk['_line_number'][i]
+                record['_processed_at'] = processed_at[file_code] if file_code < len(processed_at) else ''
+                yield record
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.iter_records()
+
+    def to_records(self, rows: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Lista di record ricostruiti"""
+        return list(self.iter_records(rows))
+
+    def export_json(self, output_path: Union[str, Path]) -> int:
+        """
+        Esporta l'archivio come lista JSON (vista opzionale)
+
+        Returns:
+            Numero di record esportati
+        """
+        return cdr_json.dump_iter(self.iter_records(), output_path)
@@ -0,0 +1,329 @@
+"""
+CDR Summary Index - Riepiloghi per contratto e per mese
+
+Per ogni mese aggregato conserva solo i totali di contratto e per tipo di
+chiamata (nessuna lista_chiamate), nello stesso formato restituito da
+JSONFileManager alle tabelle DataTables. La vista annuale somma i mesi
+dell'indice invece di rileggere tutti i file aggregati.
+
+L'indice è un file per anno in ANALYTICS_OUTPUT_FOLDER/summary_index/<anno>.json
+e viene aggiornato da CDRAggregator.aggregate_cdr_data. Ogni mese ricorda la
+firma (mtime, dimensione) del file aggregato da cui deriva: se il file cambia
+per altre vie il mese viene ricostruito alla prima richiesta.
+"""
+
+import copy
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Union
+from app.utils.env_manager import *
+from app.voip_cdr import cdr_json
+
+logger = logging.getLogger(__name__)
+
+
+class CDRSummaryIndex:
+    """Indice persistente dei riepiloghi mensili per contratto"""
+
+    VERSION = 1
+    FOLDER = 'summary_index'
+
+    _lock = threading.Lock()
+    # Cache di processo: {anno: (firma file indice, dati indice)}
+    _cache: Dict[str, tuple] = {}
+
+    def __init__(self, base_folder: Optional[Union[str, Path]] = None):
+        """
+        Args:
+            base_folder: Cartella dei file aggregati (default ANALYTICS_OUTPUT_FOLDER)
+        """
+        self.base_folder = Path(base_folder or ANALYTICS_OUTPUT_FOLDER)
+        self.index_folder = self.base_folder / self.FOLDER
+
+    # ------------------------------------------------------------------ file
+
+    @staticmethod
+    def _file_signature(file_path: Union[str, Path]) -> Optional[List[int]]:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def index_path(self, anno: str) -> Path:
+        return self.index_folder / f"{anno}.json"
+
+    def aggregate_path(self, anno: str, mese: str) -> Path:
+        return self.base_folder / str(anno) / f"{AGGREGATE_FILES}{anno}_{mese}.json"
+
+    def _month_files(self, anno: str) -> Dict[str, Path]:
+        """File aggregati mensili presenti per l'anno, {mese: percorso}"""
+        year_folder = self.base_folder / str(anno)
+        if not year_folder.is_dir():
+            return {}
+
+        prefix = f"{AGGREGATE_FILES}{anno}_"
+        months = {}
+        for file_path in year_folder.glob(f"{prefix}*.json"):
+            mese = file_path.stem[len(prefix):]
+            if mese.isdigit():
+                months[mese.zfill(2)] = file_path
+        return dict(sorted(months.items()))
+
+    def _load(self, anno: str) -> Dict[str, Any]:
+        """Carica l'indice dell'anno, riusando la copia in memoria se invariato"""
+        path = self.index_path(anno)
+        signature = self._file_signature(path)
+        cache_key = str(path)
+
+        cached = self._cache.get(cache_key)
+        if cached and signature and cached[0] == signature:
+            return cached[1]
+
+        data = {'version': self.VERSION, 'anno': str(anno), 'months': {}}
+        if signature:
+            try:
+                loaded = cdr_json.load_file(path)
+                if loaded.get('version') == self.VERSION:
+                    data = loaded
+            except Exception as e:
+                logger.warning(f"Indice riepiloghi non leggibile {path}: {e}")
+
+        self._cache[cache_key] = (signature, data)
+        return data
+
+    def _save(self, anno: str, data: Dict[str, Any]) -> None:
+        path = self.index_path(anno)
+        data['updated_at'] = datetime.now().isoformat()
+        cdr_json.dump(data, path, pretty=True)
+
+        self._cache[str(path)] = (self._file_signature(path), data)
+
+    # -------------------------------------------------------------- riepiloghi
+
+    @staticmethod
+    def _summarize(aggregate_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Riduce un aggregato mensile ai soli totali, nel formato DataTables
+
+        Replica JSONFileManager.transform_from_multiple_files([file]) senza
+        copiare le liste chiamate.
+        """
+        from app.voip_cdr.cdr_processor import JSONFileManager
+
+        file_stats = aggregate_data.get('statistics', {}) or {}
+        file_call_type_stats = file_stats.get('call_type_statistics', {}) or {}
+
+        statistics = {
+            'total_input_records': file_stats.get('total_input_records', 0),
+            'total_contracts': len(aggregate_data.get('contracts', {})),
+            'call_types_found': sorted(file_stats.get('call_types_found', [])),
+            'total_duration': file_stats.get('total_duration', 0),
+            'total_cost': 0.0 + file_stats.get('total_cost', 0.0),
+            'total_cost_with_markup': 0.0 + file_stats.get('total_cost_with_markup', 0.0),
+            'call_type_statistics': {
+                key: dict(file_call_type_stats.get(key, {}))
+                for key in ('durations_by_type', 'costs_by_type', 'costs_by_type_with_markup', 'calls_by_type')
+            }
+        }
+
+        contracts = {
+            contract_id: {'aggregated_records': contract_data.get('aggregated_records', [])}
+            for contract_id, contract_data in aggregate_data.get('contracts', {}).items()
+        }
+
+        return JSONFileManager().transform_from_dict({
+            'contracts': contracts,
+            'statistics': statistics
+        })
+
+    def update_month(self, anno: str, mese: str, aggregate_data: Dict[str, Any],
+                     aggregate_file: Optional[Union[str, Path]] = None) -> Dict[str, Any]:
+        """
+        Aggiorna il riepilogo di un mese appena aggregato
+
+        Args:
+            anno: Anno (YYYY)
+            mese: Mese (MM)
+            aggregate_data: Risultato di CDRAggregator.aggregate_cdr_data
+            aggregate_file: File aggregato salvato (per la verifica di freschezza)
+
+        Returns:
+            Riepilogo del mese ({'data': [...], 'statistics': {...}})
+        """
+        anno, mese = str(anno), str(mese).zfill(2)
+        aggregate_file = aggregate_file or self.aggregate_path(anno, mese)
+        summary = self._summarize(aggregate_data)
+
+        with self._lock:
+            data = self._load(anno)
+            data['months'][mese] = {
+                'source_file': Path(aggregate_file).name,
+                'source_signature': self._file_signature(aggregate_file),
+                'updated_at': datetime.now().isoformat(),
+                'summary': summary
+            }
+            self._save(anno, data)
+
+        logger.info(f"Indice riepiloghi aggiornato: {anno}/{mese}, {len(summary['data'])} contratti")
+        return summary
+
+    def _refresh_year(self, anno: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Allinea l'indice ai file aggregati presenti e restituisce i mesi validi
+
+        I mesi con file modificato o non ancora indicizzato vengono ricostruiti
+        leggendo il file aggregato una sola volta.
+        """
+        month_files = self._month_files(anno)
+
+        with self._lock:
+            data = self._load(anno)
+            months = data['months']
+            changed = False
+
+            for mese in list(months):
+                if mese not in month_files:
+                    del months[mese]
+                    changed = True
+
+            for mese, file_path in month_files.items():
+                signature = self._file_signature(file_path)
+                entry = months.get(mese)
+                if entry and entry.get('source_signature') == signature:
+                    continue
+
+                try:
+                    aggregate_data = cdr_json.load_file(file_path)
+                except Exception as e:
+                    logger.error(f"Errore lettura file aggregato {file_path}: {e}")
+                    months.pop(mese, None)
+                    changed = True
+                    continue
+
+                logger.info(f"Ricostruzione riepilogo {anno}/{mese} da {file_path.name}")
+                months[mese] = {
+                    'source_file': file_path.name,
+                    'source_signature': signature,
+                    'updated_at': datetime.now().isoformat(),
+                    'summary': self._summarize(aggregate_data)
+                }
+                changed = True
+
+            if changed:
+                self._save(anno, data)
+
+            return dict(sorted(months.items()))
+
+    def get_month(self, anno: str, mese: str) -> Dict[str, Any]:
+        """
+        Riepilogo DataTables di un singolo mese
+
+        Raises:
+            FileNotFoundError: Se il mese non è mai stato aggregato
+        """
+        anno, mese = str(anno), str(mese).zfill(2)
+        months = self._refresh_year(anno)
+
+        if mese not in months:
+            raise FileNotFoundError(f"File aggregato non trovato: {self.aggregate_path(anno, mese)}")
+
+        return copy.deepcopy(months[mese]['summary'])
+
+    def get_year(self, anno: str) -> Dict[str, Any]:
+        """
+        Riepilogo DataTables dell'anno sommando i mesi dell'indice
+
+        Somme e arrotondamenti seguono JSONAggregator + JSONFileManager.transform_from_dict.
+
+        Raises:
+            FileNotFoundError: Se per l'anno non esiste nessun mese aggregato
+        """
+        anno = str(anno)
+        months = self._refresh_year(anno)
+
+        if not months:
+            raise FileNotFoundError(f"Nessun file aggregato trovato per l'anno {anno}")
+
+        contracts: Dict[str, Dict[str, Any]] = {}
+        total_input_records = 0
+        total_duration = 0
+        total_cost = 0.0
+        call_types = set()
+
+        for mese, entry in months.items():
+            summary = entry['summary']
+            stats = summary.get('statistics', {})
+
+            total_input_records += stats.get('total_input_records', 0)
+            total_duration += stats.get('total_duration', 0)
+            total_cost = round(total_cost + stats.get('total_cost', 0.0), 3)
+            call_types.update(stats.get('call_types_found', []))
+
+            for row in summary.get('data', []):
+                codice_contratto = row.get('codice_contratto')
+                existing = contracts.get(codice_contratto)
+
+                if existing is None:
+                    contracts[codice_contratto] = copy.deepcopy(row)
+                    continue
+
+                existing['durata_secondi_totale'] += row.get('durata_secondi_totale', 0)
+                existing['costo_euro_totale'] = round(
+                    existing['costo_euro_totale'] + row.get('costo_euro_totale', 0.0), 3
+                )
+                existing['costo_euro_totale_with_markup'] = round(
+                    existing['costo_euro_totale_with_markup'] + row.get('costo_euro_totale_with_markup', 0.0), 3
+                )
+                existing['numero_chiamate'] += row.get('numero_chiamate', 0)
+
+                for tipo_chiamata, values in row.get('tipi_chiamata', {}).items():
+                    existing_type = existing['tipi_chiamata'].get(tipo_chiamata)
+                    if existing_type is None:
+                        existing['tipi_chiamata'][tipo_chiamata] = dict(values)
+                        continue
+
+                    existing_type['durata_secondi_totale'] += values.get('durata_secondi_totale', 0)
+                    existing_type['costo_euro_totale'] = round(
+                        existing_type['costo_euro_totale'] + values.get('costo_euro_totale', 0.0), 3
+                    )
+                    existing_type['costo_euro_totale_with_markup'] = round(
+                        existing_type['costo_euro_totale_with_markup'] + values.get('costo_euro_totale_with_markup', 0.0), 3
+                    )
+                    existing_type['numero_chiamate'] += values.get('numero_chiamate', 0)
+
+        # Totali con markup ricalcolati come in transform_from_dict
+        costs_by_type_with_markup: Dict[str, float] = {}
+        for row in contracts.values():
+            for tipo_chiamata, values in row.get('tipi_chiamata', {}).items():
+                if tipo_chiamata:
+                    costs_by_type_with_markup[tipo_chiamata] = (
+                        costs_by_type_with_markup.get(tipo_chiamata, 0.0)
+                        + values.get('costo_euro_totale_with_markup', 0.0)
+                    )
+
+        statistics = {
+            'total_input_records': total_input_records,
+            'total_contracts': len(contracts),
+            'call_types_found': sorted(call_types),
+            'total_duration': total_duration,
+            'total_cost': total_cost,
+            'call_type_statistics': {
+                'durations_by_type': {},
+                'costs_by_type': {},
+                'costs_by_type_with_markup': {
+                    call_type: round(cost, 2) for call_type, cost in costs_by_type_with_markup.items()
+                }
+            },
+            'total_cost_with_markup': round(
+                sum(row.get('costo_euro_totale_with_markup', 0.0) for row in contracts.values()), 2
+            )
+        }
+
+        return {
+            'data': list(contracts.values()),
+            'statistics': statistics
+        }
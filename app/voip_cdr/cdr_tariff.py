@@ -0,0 +1,154 @@
+"""
+CDR Tariff Engine - Classificazione tipo_chiamata e calcolo prezzo con markup
+
+Carica le categorie una sola volta e compila tutti i pattern attivi in un'unica
+regex. La priorità segue l'ordine delle categorie nel file: vince la prima
+categoria che ha almeno un pattern contenuto nel tipo_chiamata, esattamente
+come nei vecchi cicli annidati.
+"""
+
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple
+from app.utils.env_manager import *
+
+logger = logging.getLogger(__name__)
+
+
+class CDRTariffEngine:
+    """Matcher precompilato delle categorie CDR con memo per tipo_chiamata"""
+
+    def __init__(self, categories: Dict[str, Any]):
+        """
+        Compila le categorie attive in un unico matcher
+
+        Args:
+            categories: Dizionario {nome_categoria: dati_categoria} nel formato
+                        del file cdr_categories.json (ordine = priorità)
+        """
+        self._categories: List[Tuple[str, Dict[str, Any]]] = []
+        groups = []
+
+        for category_name, category_data in (categories or {}).items():
+            if not isinstance(category_data, dict):
+                continue
+            if not category_data.get('is_active', True):
+                continue
+
+            patterns = [str(p).upper().strip() for p in category_data.get('patterns', []) or []]
+            if not patterns:
+                continue
+
+            self._categories.append((category_name, category_data))
+            groups.append('(' + '|'.join(re.escape(p) for p in patterns) + ')')
+
+        # Lookahead a larghezza zero: trova il match su ogni posizione del testo,
+        # il gruppo catturato (lastindex) indica la categoria e quindi la priorità
+        self._regex = re.compile('(?=(?:' + '|'.join(groups) + '))') if groups else None
+        self._memo: Dict[str, Optional[int]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_file(cls, categories_file: Optional[str] = None) -> 'CDRTariffEngine':
+        """
+        Crea il motore leggendo il file categorie una sola volta
+
+        Args:
+            categories_file: Percorso del file categorie (default da .env)
+
+        Returns:
+            Istanza di CDRTariffEngine (vuota se il file non esiste o è illeggibile)
+        """
+        if categories_file is None:
+            categories_file = Path(ARCHIVE_DIRECTORY) / CATEGORIES_FOLDER / CATEGORIES_FILE
+
+        if not os.path.exists(categories_file):
+            logger.warning(f"File categorie non trovato: {categories_file}")
+            return cls({})
+
+        try:
+            with open(categories_file, 'r', encoding='utf-8') as f:
+                return cls(json.load(f))
+        except Exception as e:
+            logger.error(f"Errore nel caricamento categorie: {e}")
+            return cls({})
+
+    def __len__(self) -> int:
+        return len(self._categories)
+
+    def _match_index(self, tipo_chiamata: str) -> Optional[int]:
+        """Restituisce l'indice (priorità) della categoria corrispondente"""
+        try:
+            index = self._memo[tipo_chiamata]
+            self.hits += 1
+            return index
+        except KeyError:
+            pass
+
+        self.misses += 1
+        index = None
+
+        if self._regex is not None and tipo_chiamata:
+            text = tipo_chiamata.upper().strip()
+            for match in self._regex.finditer(text):
+                group_index = match.lastindex - 1
+                if index is None or group_index < index:
+                    index = group_index
+                    if index == 0:
+                        break
+
+        self._memo[tipo_chiamata] = index
+        return index
+
+    def classify(self, tipo_chiamata: str) -> Optional[str]:
+        """
+        Classifica un tipo di chiamata
+
+        Args:
+            tipo_chiamata: Tipo di chiamata dal record CDR
+
+        Returns:
+            Nome della categoria corrispondente o None
+        """
+        index = self._match_index(tipo_chiamata)
+        return self._categories[index][0] if index is not None else None
+
+    def get_category(self, tipo_chiamata: str) -> Optional[Dict[str, Any]]:
+        """Restituisce i dati della categoria corrispondente o None"""
+        index = self._match_index(tipo_chiamata)
+        return self._categories[index][1] if index is not None else None
+
+    def calculate_markup_price(self, tipo_chiamata: str, durata_secondi: int) -> float:
+        """
+        Calcola il prezzo con markup basato su tipo_chiamata e durata
+
+        Args:
+            tipo_chiamata: Tipo di chiamata dal record CDR
+            durata_secondi: Durata della chiamata in secondi
+
+        Returns:
+            Prezzo calcolato con markup in euro (0.0 se nessuna categoria)
+        """
+        if durata_secondi <= 0:
+            return 0.0
+
+        category_data = self.get_category(tipo_chiamata)
+        if category_data is None:
+            return 0.0
+
+        price_with_markup = category_data.get('price_with_markup') or 0.0
+        durata_minuti = durata_secondi / 60.0
+        return round(durata_minuti * price_with_markup, 4)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche di utilizzo del memo"""
+        return {
+            'active_categories': len(self._categories),
+            'memo_size': len(self._memo),
+            'hits': self.hits,
+            'misses': self.misses
+        }
@@ -0,0 +1,220 @@
+"""
+CDR Tokenizer - Conversione veloce delle righe CDR a tracciato fisso
+
+Il tracciato CDR ha 12 colonne in posizione nota, quindi le conversioni di tipo
+sono scritte una per colonna invece di un ciclo con catena di if sui nomi.
+Il timestamp (YYYY-MM-DD-HH.MM.SS, larghezza fissa) viene decodificato per
+slicing: la parte data viene validata una volta per giorno e memorizzata,
+l'ora viene solo controllata. I valori non canonici passano da strptime come
+prima, quindi l'output è identico al vecchio parser.
+
+Le tuple possono diventare record dizionario (to_record) o CDRCall compatti
+con le stringhe ripetute internate (to_call).
+"""
+
+import logging
+import sys
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+from app.voip_cdr.cdr_record import CDRCall, CDRFileInfo
+
+logger = logging.getLogger(__name__)
+
+_DIGITS = frozenset('0123456789')
+
+
+class CDRLineTokenizer:
+    """Tokenizer del tracciato CDR a 12 colonne con prezzatura markup"""
+
+    COLUMNS = (
+        "data_ora",
+        "numero_cliente",
+        "numero_chiamato",
+        "durata_secondi",
+        "tipo_chiamata",
+        "operatore",
+        "costo_euro",
+        "codice_contratto",
+        "codice_servizio",
+        "cliente_finale",
+        "comune",
+        "prefisso_chiamato"
+    )
+    # 12 colonne più il ';' finale
+    FIELDS_COUNT = len(COLUMNS) + 1
+
+    # Limite della cache giorni (un mese ne usa al massimo 31)
+    MAX_CACHED_DAYS = 4096
+
+    def __init__(self, tariff_engine=None):
+        """
+        Args:
+            tariff_engine: CDRTariffEngine per costo_euro_with_markup (None = nessun markup)
+        """
+        self.tariff_engine = tariff_engine
+        # {'YYYY-MM-DD': 'YYYY-MM-DD' validata, oppure None se la data non esiste}
+        self._days: Dict[str, Optional[str]] = {}
+
+    def decode_timestamp(self, value: str) -> str:
+        """
+        Converte 'YYYY-MM-DD-HH.MM.SS' in ISO 8601 ('YYYY-MM-DDTHH:MM:SS')
+
+        Equivale a datetime.strptime(value, "%Y-%m-%d-%H.%M.%S").isoformat(),
+        restituendo il valore originale se non è una data valida.
+        """
+        if (len(value) == 19 and value[4] == '-' and value[7] == '-' and value[10] == '-'
+                and value[13] == '.' and value[16] == '.'):
+            time_digits = value[11:13] + value[14:16] + value[17:19]
+            if _DIGITS.issuperset(time_digits):
+                day_part = value[:10]
+                try:
+                    day = self._days[day_part]
+                except KeyError:
+                    day = self._decode_day(day_part)
+
+                if day is not None and time_digits[0:2] <= '23' and time_digits[2:4] <= '59' and time_digits[4:6] <= '59':
+                    return f"{day}T{value[11:13]}:{value[14:16]}:{value[17:19]}"
+                if day is None:
+                    return value
+
+        # Formati non canonici (es. campi senza zeri iniziali): stesso percorso del vecchio parser
+        try:
+            return datetime.strptime(value, "%Y-%m-%d-%H.%M.%S").isoformat()
+        except ValueError:
+            return value
+
+    def _decode_day(self, day_part: str) -> Optional[str]:
+        """Valida e memorizza la parte data di un timestamp"""
+        day = None
+        digits = day_part[0:4] + day_part[5:7] + day_part[8:10]
+        if _DIGITS.issuperset(digits):
+            try:
+                day = date(int(day_part[0:4]), int(day_part[5:7]), int(day_part[8:10])).isoformat()
+            except ValueError:
+                day = None
+
+        if len(self._days) >= self.MAX_CACHED_DAYS:
+            self._days.clear()
+        self._days[day_part] = day
+        return day
+
+    def tokenize(self, fields: List[str]) -> Optional[Tuple[Any, ...]]:
+        """
+        Converte i campi di una riga in una tupla tipizzata a schema fisso
+
+        Args:
+            fields: Campi della riga (line.split(';'))
+
+        Returns:
+            Tupla nell'ordine di COLUMNS più costo_euro_with_markup (None se il
+            costo è zero), oppure None se il numero di campi non è valido
+        """
+        if len(fields) != self.FIELDS_COUNT:
+            return None
+
+        (data_ora, numero_cliente, numero_chiamato, durata_secondi, tipo_chiamata, operatore,
+         costo_euro, codice_contratto, codice_servizio, cliente_finale, comune, prefisso_chiamato,
+         _) = fields
+
+        tipo_chiamata = tipo_chiamata.strip()
+
+        try:
+            durata_secondi = int(durata_secondi)
+        except ValueError:
+            durata_secondi = 0
+
+        try:
+            costo_euro = float(costo_euro.strip().replace(',', '.'))
+        except ValueError:
+            costo_euro = 0.0
+
+        try:
+            codice_contratto = int(codice_contratto)
+        except ValueError:
+            codice_contratto = 0
+
+        try:
+            codice_servizio = int(codice_servizio)
+        except ValueError:
+            codice_servizio = 0
+
+        # Prezzo con markup calcolato una sola volta per riga
+        costo_euro_with_markup = None
+        if costo_euro != 0.0:
+            if self.tariff_engine is not None:
+                costo_euro_with_markup = self.tariff_engine.calculate_markup_price(tipo_chiamata, durata_secondi)
+            else:
+                costo_euro_with_markup = 0.0
+
+        return (
+            self.decode_timestamp(data_ora.strip()),
+            numero_cliente.strip(),
+            numero_chiamato.strip(),
+            durata_secondi,
+            tipo_chiamata,
+            operatore.strip(),
+            costo_euro,
+            codice_contratto,
+            codice_servizio,
+            cliente_finale.strip(),
+            comune.strip(),
+            prefisso_chiamato.strip(),
+            costo_euro_with_markup
+        )
+
+    @staticmethod
+    def to_record(values: Tuple[Any, ...]) -> Dict[str, Any]:
+        """
+        Record dizionario con lo stesso ordine di chiavi del vecchio parser
+
+        costo_euro_with_markup compare subito dopo costo_euro, solo se il costo non è zero.
+        """
+        record = {
+            "data_ora": values[0],
+            "numero_cliente": values[1],
+            "numero_chiamato": values[2],
+            "durata_secondi": values[3],
+            "tipo_chiamata": values[4],
+            "operatore": values[5],
+            "costo_euro": values[6]
+        }
+        if values[12] is not None:
+            record['costo_euro_with_markup'] = values[12]
+        record["codice_contratto"] = values[7]
+        record["codice_servizio"] = values[8]
+        record["cliente_finale"] = values[9]
+        record["comune"] = values[10]
+        record["prefisso_chiamato"] = values[11]
+        return record
+
+    @staticmethod
+    def to_call(values: Tuple[Any, ...], file_info: CDRFileInfo, line_number: int) -> CDRCall:
+        """
+        CDRCall compatto dalla tupla di tokenize
+
+        Le colonne con pochi valori distinti (cliente, tipo chiamata, operatore,
+        comune...) vengono internate: ogni valore è in memoria una sola volta.
+        """
+        intern = sys.intern
+        return CDRCall(
+            values[0],
+            intern(values[1]),
+            values[2],
+            values[3],
+            intern(values[4]),
+            intern(values[5]),
+            values[6],
+            values[12],
+            values[7],
+            values[8],
+            intern(values[9]),
+            intern(values[10]),
+            intern(values[11]),
+            file_info,
+            line_number
+        )
+
+    def parse(self, fields: List[str]) -> Optional[Dict[str, Any]]:
+        """Converte i campi di una riga direttamente in record dizionario"""
+        values = self.tokenize(fields)
+        return self.to_record(values) if values is not None else None
@@ -3,7 +3,7 @@
 CDR Contracts Service - Servizio per gestire i dati dei contratti CDR
 Converte i dati per DataTables in formato serverside e ajax
 """
-from flask import request, jsonify, render_template, redirect, url_for, flash, g
+from flask import request, render_template, redirect, url_for, flash, g
 import requests
 import logging
 from typing import Dict, List, Any, Optional, Tuple, Callable, Set
@@ -12,6 +12,11 @@ import json
 from app.utils.env_manager import *
 from pathlib import Path
 from collections import defaultdict
+from app.voip_cdr.cdr_parallel import CDRParallelReader
+from app.voip_cdr.cdr_scan import CDRScanner, CDRContractSink
+from app.voip_cdr import cdr_json
+from app.voip_cdr.cdr_registry import ContractRegistry, ContractSearchIndex
+from app.voip_cdr.cdr_contract_store import ContractStore
 
 logger = logging.getLogger(__name__)
 
@@ -48,19 +53,10 @@ class CDRContractsService:
             #     if response.status_code != 200:
             #         logger.error(f"API response status: {response.status_code}")
             #         return None
-            contracts_file = Path(CONTACT_FILE)
-            if not contracts_file.exists():
-                return jsonify({
-                    'success': False,
-                    'message': 'File configurazione contratti non trovato',
-                    'suggestion': 'Esegui prima estrazione codici contratto'
-                })
-            
-            with open(contracts_file, 'r', encoding='utf-8') as f:
-                contracts_data = json.load(f)
-                data = contracts_data
+            # Contratti dal registro in memoria: il file viene riletto solo se modificato
+            data = ContractRegistry.instance().data()
             if not data:
-                logger.error(f"API response non successful: {data.get('message', 'Unknown error')}")
+                logger.error(f"File configurazione contratti non trovato o vuoto: {CONTACT_FILE}")
                 return None
             
             return data
@@ -199,9 +195,9 @@ class CDRContractsService:
         try:
             logger.info(f"Preparazione dati contratti per formato Server-side - draw: {draw}, start: {start}, length: {length}")
             
-            # Recupera dati dall'API
-            api_data = self._fetch_contracts_data()
-            if not api_data:
+            # Indice di ricerca/ordinamento, ricostruito solo quando cambia il file contratti
+            index = ContractRegistry.instance().derived('contracts_serverside', self._build_serverside_index)
+            if index is None:
                 logger.error("Impossibile recuperare dati dall'API")
                 return {
                     'draw': draw,
@@ -210,9 +206,7 @@ class CDRContractsService:
                     'data': []
                 }
             
-            # Estrai i contratti
-            contracts = api_data.get('contracts', {})
-            if not contracts:
+            if not index.rows:
                 logger.warning("Nessun contratto trovato nei dati")
                 return {
                     'draw': draw,
@@ -221,55 +215,9 @@ class CDRContractsService:
                     'data': []
                 }
             
-            # Converti ogni contratto in array per server-side
-            all_data = []
-            
-            for contract_id, contract_info in contracts.items():
-                try:
-                    extracted_fields = self._extract_contract_fields(contract_info)
-                    
-                    # Formato Server-side: array di valori
-                    contract_array = [
-                        extracted_fields['contract_code'],
-                        extracted_fields['phone_number'],
-                        extracted_fields['contract_name'],
-                        extracted_fields['odoo_client_id'],
-                        extracted_fields['contract_type'],
-                        extracted_fields['notes']
-                    ]
-                    
-                    all_data.append(contract_array)
-                    
-                except Exception as e:
-                    logger.error(f"Errore elaborazione contratto {contract_id}: {e}")
-                    continue
-            
-            # Applica filtro di ricerca se presente
-            filtered_data = all_data
-            if search_value and search_value.strip():
-                search_lower = search_value.lower().strip()
-                filtered_data = []
-                
-                for row in all_data:
-                    # Cerca in tutti i campi della riga
-                    row_text = " ".join(str(cell).lower() for cell in row)
-                    if search_lower in row_text:
-                        filtered_data.append(row)
-            
-            # Applica ordinamento
-            if order_column < len(filtered_data[0]) if filtered_data else False:
-                reverse_order = (order_dir.lower() == 'desc')
-                try:
-                    filtered_data.sort(key=lambda x: str(x[order_column]).lower(), reverse=reverse_order)
-                except Exception as e:
-                    logger.warning(f"Errore ordinamento: {e}")
-            
-            # Applica paginazione
-            total_records = len(all_data)
-            total_filtered = len(filtered_data)
-            
-            end_index = start + length
-            paginated_data = filtered_data[start:end_index]
+            # Ricerca, ordinamento e paginazione sull'indice
+            total_records = len(index.rows)
+            total_filtered, paginated_data = index.query(start, length, search_value, order_column, order_dir)
             
             logger.info(f"Server-side: {total_records} totali, {total_filtered} filtrati, {len(paginated_data)} in pagina")
             
@@ -289,6 +237,40 @@ class CDRContractsService:
                 'data': []
             }
     
+    def _build_serverside_index(self, api_data: Optional[Dict[str, Any]]) -> Optional[ContractSearchIndex]:
+        """
+        Costruisce le righe server-side (array di valori) e il loro indice
+        
+        Args:
+            api_data: Contenuto del file contratti
+            
+        Returns:
+            ContractSearchIndex o None se i dati non sono disponibili
+        """
+        if not api_data:
+            return None
+        
+        all_data = []
+        for contract_id, contract_info in api_data.get('contracts', {}).items():
+            try:
+                extracted_fields = self._extract_contract_fields(contract_info)
+                
+                # Formato Server-side: array di valori
+                all_data.append([
+                    extracted_fields['contract_code'],
+                    extracted_fields['phone_number'],
+                    extracted_fields['contract_name'],
+                    extracted_fields['odoo_client_id'],
+                    extracted_fields['contract_type'],
+                    extracted_fields['notes']
+                ])
+                
+            except Exception as e:
+                logger.error(f"Errore elaborazione contratto {contract_id}: {e}")
+                continue
+        
+        return ContractSearchIndex(all_data)
+    
     def get_contracts_summary(self) -> Dict[str, Any]:
         """
         Restituisce un riassunto dei contratti
@@ -515,46 +497,47 @@ class ElaborazioneContratti:
         total_records = 0
         now = datetime.now().isoformat()
 
+        # Lettura unica di ogni file: codice contratto e numero chiamante dalle colonne del tracciato CDR
+        sink = CDRContractSink()
+        scanner = CDRScanner([sink])
+        seen_numbers = defaultdict(set)
+
         for cdr_file in cdr_files:
             # cdr_file_and_path = os.path.join(ARCHIVE_DIRECTORY,CDR_FTP_FOLDER,cdr_file)
-            cdr_path = cdr_path = Path(ARCHIVE_DIRECTORY) / CDR_FTP_FOLDER / cdr_file
+            cdr_path = Path(ARCHIVE_DIRECTORY) / CDR_FTP_FOLDER / cdr_file
             if not cdr_path.exists():
                 print(f"⚠️ File non trovato: {cdr_path}")
                 continue
 
-            with cdr_path.open("r", encoding="latin1") as f:
-                for line in f:
-                    if line.strip() == "":
-                        continue
-
-                    parts = line.strip().split(";")
-                    if len(parts) < 5:
-                        continue
-
-                    contract_code = parts[0].strip()
-                    phone_number = parts[2].strip()
+            scanner.scan(cdr_path)
+            file_state = sink.files.pop(cdr_path.name, None)
+            if not file_state:
+                continue
 
-                    contract = contracts[contract_code]
-                    contract["contract_code"] = contract_code
+            for contract_code, data in file_state["contracts"].items():
+                contract = contracts[contract_code]
+                contract["contract_code"] = contract_code
 
-                    # Prima volta che lo vediamo?
-                    if not contract["first_seen_file"]:
-                        contract["first_seen_file"] = cdr_path.name
-                        contract["first_seen_date"] = now
+                # Prima volta che lo vediamo?
+                if not contract["first_seen_file"]:
+                    contract["first_seen_file"] = cdr_path.name
+                    contract["first_seen_date"] = now
 
-                    # Ultimo file dove compare
-                    contract["last_seen_file"] = cdr_path.name
-                    contract["last_seen_date"] = now
+                # Ultimo file dove compare
+                contract["last_seen_file"] = cdr_path.name
+                contract["last_seen_date"] = now
 
-                    if cdr_path.name not in contract["files_found_in"]:
-                        contract["files_found_in"].append(cdr_path.name)
+                if cdr_path.name not in contract["files_found_in"]:
+                    contract["files_found_in"].append(cdr_path.name)
 
-                    contract["total_calls_found"] += 1
-                    if phone_number not in contract["phone_numbers"]:
+                contract["total_calls_found"] += data["calls_count"]
+                for phone_number in data["phone_numbers"]:
+                    if phone_number not in seen_numbers[contract_code]:
+                        seen_numbers[contract_code].add(phone_number)
                         contract["phone_numbers"].append(phone_number)
                         contract["total_unique_numbers"] += 1
 
-                    total_records += 1
+            total_records += file_state["records_count"]
 
         json_data = {
             "metadata": {
@@ -579,8 +562,8 @@ class ElaborazioneContratti:
             }
         }
 
-        with json_output_path.open("w", encoding="utf-8") as f:
-            json.dump(json_data, f, indent=2, ensure_ascii=False)
+        # Database del registro (con esportazione JSON) se disponibile, altrimenti solo il file
+        ContractRegistry.instance(json_output_path).save(json_data)
 
         print(f"✅ File JSON creato: {json_output_path}")
 
@@ -1100,6 +1083,8 @@ class CDRContractsServiceStandalone:
         """
         self.contracts_data = contracts_data_source
         self._cached_contracts = None
+        # Registro da cui provengono i dati (indici per i contratti fatturabili)
+        self.registry: Optional[ContractRegistry] = None
     
     def set_contracts_data(self, contracts_data: Dict[str, Any]) -> None:
         """
@@ -1110,6 +1095,7 @@ class CDRContractsServiceStandalone:
         """
         self.contracts_data = contracts_data
         self._cached_contracts = None  # Reset cache
+        self.registry = None
     
     def load_contracts_from_file(self, file_path: str) -> bool:
         """
@@ -1122,9 +1108,14 @@ class CDRContractsServiceStandalone:
             True se il caricamento è riuscito, False altrimenti
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                self.contracts_data = json.load(file)
+            # Registro condiviso: il file viene riletto solo se modificato
+            registry = ContractRegistry.instance(file_path)
+            contracts_data = registry.data()
+            if contracts_data is None:
+                raise FileNotFoundError(f"File contratti non trovato o non valido: {file_path}")
+            self.contracts_data = contracts_data
             self._cached_contracts = None
+            self.registry = registry
             logger.info(f"✅ Contratti caricati da file: {file_path}")
             return True
         except Exception as e:
@@ -1229,6 +1220,29 @@ class CDRContractsServiceStandalone:
         except Exception as e:
             logger.error(f"Errore nella conversione contratti: {e}")
             return []
+    
+    def get_billable_contracts(self) -> List[Dict[str, Any]]:
+        """
+        Contratti validi per la fatturazione (odoo_client_id, contract_type e contract_code valorizzati)
+        
+        Con i dati caricati dal registro usa il suo indice dei contratti
+        fatturabili, senza scorrere ed estrarre tutti i contratti.
+        
+        Returns:
+            Lista di contratti nel formato di get_contracts_list
+        """
+        if self.registry is not None:
+            return [
+                {'id': contract_id, **self._extract_contract_fields(contract_info)}
+                for contract_id, contract_info in self.registry.billable().items()
+            ]
+        
+        return [
+            contract for contract in self.get_contracts_list()
+            if contract.get('odoo_client_id', '').strip()
+            and contract.get('contract_type', '').strip()
+            and contract.get('contract_code', '').strip()
+        ]
 
 
 class ElaborazioneContrattiStandalone:
@@ -1397,6 +1411,17 @@ class ElaborazioneContrattiStandalone:
                 'processing_timestamp': datetime.now().isoformat()
             }
     
+    def elabora_contratti_fatturabili(self) -> List[Dict[str, Any]]:
+        """
+        Elabora solo i contratti fatturabili (dall'indice del registro)
+        
+        Returns:
+            Risultati di _elabora_contratto_standard, tutti con status 'processed'
+        """
+        contracts = self.contracts_service.get_billable_contracts()
+        logger.info(f"📊 Contratti fatturabili da elaborare: {len(contracts)}")
+        return [self._elabora_contratto_standard(contract) for contract in contracts]
+    
     def _elabora_contratto_standard(self, contract: Dict[str, Any]) -> Dict[str, Any]:
         """
         Elaborazione standard di un contratto (da personalizzare)
@@ -1447,9 +1472,10 @@ class ElaborazioneContrattiStandalone:
             Statistiche sui contratti
         """
         try:
-            contracts = self.contracts_service.get_contracts_list()
+            contracts_data = self.contracts_service.contracts_data or {}
+            total = len(contracts_data.get('contracts', {}))
             
-            if not contracts:
+            if not total:
                 return {
                     'total': 0,
                     'valid': 0,
@@ -1458,25 +1484,21 @@ class ElaborazioneContrattiStandalone:
                     'message': 'Nessun contratto disponibile'
                 }
             
-            # Conta contratti validi/invalidi
-            valid = 0
+            # Conta solo i contratti validi (indice dei fatturabili)
+            billable = self.contracts_service.get_billable_contracts()
+            valid = len(billable)
             contract_types = {}
             odoo_ids = set()
             
-            for contract in contracts:
-                odoo_id = contract.get('odoo_client_id', '').strip()
-                contract_type = contract.get('contract_type', '').strip()
-                contract_code = contract.get('contract_code', '').strip()
-                
-                if odoo_id and contract_type and contract_code:
-                    valid += 1
-                    contract_types[contract_type] = contract_types.get(contract_type, 0) + 1
-                    odoo_ids.add(odoo_id)
+            for contract in billable:
+                contract_type = contract['contract_type'].strip()
+                contract_types[contract_type] = contract_types.get(contract_type, 0) + 1
+                odoo_ids.add(contract['odoo_client_id'].strip())
             
             return {
-                'total': len(contracts),
+                'total': total,
                 'valid': valid,
-                'invalid': len(contracts) - valid,
+                'invalid': total - valid,
                 'types': contract_types,
                 'unique_odoo_ids': len(odoo_ids),
                 'analysis_timestamp': datetime.now().isoformat()
@@ -1492,13 +1514,15 @@ CDR Contract Extractor - Estrazione codici contratto da file CDR
 Funzione per scaricare tutti i CDR dall'FTP ed estrarre codici contratto unici
 """
 class CDRContractsExtractor:
-    def extract_contracts_from_files(self, downloaded_files: List[str], force_redownload: bool = False) -> Dict[str, Any]:
+    def extract_contracts_from_files(self, downloaded_files: List[str], force_redownload: bool = False,
+                                     workers: Optional[int] = None) -> Dict[str, Any]:
         """
         Estrae codici contratto da una lista di file CDR
         
         Args:
             downloaded_files: Lista percorsi file scaricati
             force_redownload: Se forzare riprocessamento file già elaborati
+            workers: Processi per la lettura parallela dei file (None = CDR_PARSE_WORKERS, 1 = seriale)
             
         Returns:
             Dict con contratti unici e statistiche
@@ -1514,9 +1538,18 @@ class CDRContractsExtractor:
             'processing_errors': []
         }
         
+        # Lettura parallela dei file; l'unione sotto avviene sempre nell'ordine della lista
+        base_path = Path(os.path.join(ARCHIVE_DIRECTORY, CDR_FTP_FOLDER))
+        reader = CDRParallelReader(workers)
+        cdr_paths = [base_path / name for name in downloaded_files if self.is_cdr_file(base_path / name)]
+        parallel_results = {}
+        if reader.should_parallelize(cdr_paths):
+            logger.info(f"🔀 Lettura parallela di {len(cdr_paths)} file su {reader.workers} processi")
+            results = reader.map(_extract_codes_worker, [str(path) for path in cdr_paths])
+            parallel_results = dict(zip((str(path) for path in cdr_paths), results))
+        
         for file_path in downloaded_files:
             try:
-                base_path = Path(os.path.join(ARCHIVE_DIRECTORY, CDR_FTP_FOLDER))
                 file_path = Path(base_path / file_path)
                 # Verifica se è un file CDR
                 if not self.is_cdr_file(file_path):
@@ -1526,7 +1559,10 @@ class CDRContractsExtractor:
                 logger.info(f"📄 Elaborazione file: {file_path.name}")
                 
                 # Estrai contratti dal file
-                file_contracts = self.extract_codes_from_single_file(file_path)
+                if str(file_path) in parallel_results:
+                    file_contracts = parallel_results.pop(str(file_path))
+                else:
+                    file_contracts = self.extract_codes_from_single_file(file_path)
                 
                 if file_contracts:
                     statistics['total_records_processed'] += file_contracts['records_count']
@@ -1606,62 +1642,13 @@ class CDRContractsExtractor:
             Dict con contratti e numeri chiamante trovati nel file
         """
         try:
-            contracts = defaultdict(lambda: {
-                'calls_count': 0, 
-                'phone_numbers': set(),  # Solo numeri chiamante
-                'cliente_finale_comune': None
-            })
-            total_records = 0
-            
-            # Headers standard per file CDR (dal codice esistente)
-            cdr_headers = [
-                'data_ora_chiamata', 'numero_chiamante', 'numero_chiamato',
-                'durata_secondi', 'tipo_chiamata', 'operatore', 'costo_euro',
-                'codice_contratto', 'codice_servizio', 'cliente_finale_comune', 'prefisso_chiamato'
-            ]
+            # Lettura unica del file tramite lo scanner condiviso
+            sink = CDRContractSink()
+            CDRScanner([sink]).scan(file_path)
             
-            with open(file_path, 'r', encoding='latin1') as f:
-                for line_num, line in enumerate(f, 1):
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    fields = line.split(';')
-                    
-                    # Assicura che ci siano abbastanza campi
-                    while len(fields) < len(cdr_headers):
-                        fields.append('')
-                    
-                    # Estrai campi principali
-                    if len(fields) > 7:
-                        numero_chiamante = fields[1].strip()  # Index 1 - SOLO QUESTO
-                        contract_code_raw = fields[7].strip() # Index 7
-                        cliente_finale_comune = fields[9].strip()  
-                        
-                        if contract_code_raw and contract_code_raw.isdigit():
-                            contract_code = str(contract_code_raw)
-                            
-                            if cliente_finale_comune and not contracts[contract_code]['cliente_finale_comune']:
-                                contracts[contract_code]['cliente_finale_comune'] = cliente_finale_comune
-
-                            # ✅ AGGIORNA CONTATORI
-                            contracts[contract_code]['calls_count'] += 1
-                            
-                            # ✅ AGGIUNGI SOLO NUMERO CHIAMANTE
-                            if numero_chiamante and numero_chiamante.isdigit():
-                                contracts[contract_code]['phone_numbers'].add(numero_chiamante)
-                            
-                            total_records += 1
-            
-            # ✅ CONVERTE SET IN LISTE ORDINATE PER JSON SERIALIZATION
-            processed_contracts = {}
-            for contract_code, data in contracts.items():
-                processed_contracts[contract_code] = {
-                    'calls_count': data['calls_count'],
-                    'phone_numbers': sorted(list(data['phone_numbers'])),
-                    'total_unique_numbers': len(data['phone_numbers']),
-                    'cliente_finale_comune': data['cliente_finale_comune']
-                }
+            file_result = sink.file_result(file_path.name)
+            processed_contracts = file_result['contracts']
+            total_records = file_result['records_count']
             
             if processed_contracts:
                 logger.debug(f"File {file_path.name}: {len(processed_contracts)} contratti, {total_records} record")
@@ -1718,6 +1705,11 @@ class CDRContractsExtractor:
             Dict con risultati operazione e statistiche
         """
         try:
+            # Registro su database: upsert dei soli contratti estratti, poi esportazione JSON
+            store = ContractStore(CONTACT_FILE)
+            if store.available():
+                return self._save_contracts_to_store(store, contracts_data)
+            
             # ✅ LEGGI PERCORSI DA .ENV
             # config_dir = Path(config.get('CONTRACTS_CONFIG_DIRECTORY', config.get('config_directory', 'config')))
             # contracts_filename = config.get('CONTRACTS_CONFIG_FILE', 'cdr_contracts.json')
@@ -1766,73 +1758,20 @@ class CDRContractsExtractor:
                 logger.info(f"🆕 Creazione nuovo file: {contracts_file}")
             
             # ✅ UNIFICA CONTRATTI: AGGIUNGI SOLO QUELLI NON PRESENTI
-            new_contracts_added = 0
-            updated_contracts = existing_contracts.copy()  # Mantieni tutti i contratti esistenti
-            
-            for contract_code, contract_info in contracts_data['contracts'].items():
-                if contract_code not in updated_contracts:
-                    # ✅ NUOVO CONTRATTO - AGGIUNGILO
-                    updated_contracts[contract_code] = contract_info
-                    new_contracts_added += 1
-                    logger.info(f"➕ Nuovo contratto aggiunto: {contract_code}")
-                else:
-                    # ✅ CONTRATTO ESISTENTE - AGGIORNA SOLO STATISTICHE TECNICHE (NON I DATI MANUALI)
-                    existing_contract = updated_contracts[contract_code]
-                    
-                    # Aggiorna solo campi tecnici, mantieni quelli manuali
-                    existing_contract['last_seen_file'] = contract_info['last_seen_file']
-                    existing_contract['last_seen_date'] = contract_info['last_seen_date']
-                    existing_contract['total_calls_found'] = existing_contract.get('total_calls_found', 0) + contract_info['total_calls_found']
-                    
-                    # Aggiungi nuovo file alla lista se non presente
-                    files_list = existing_contract.get('files_found_in', [])
-                    if contract_info['last_seen_file'] not in files_list:
-                        files_list.append(contract_info['last_seen_file'])
-                        existing_contract['files_found_in'] = files_list
-                    
-                    logger.debug(f"🔄 Contratto esistente aggiornato (statistiche): {contract_code}")
+            updated_contracts, new_contracts_added = self._merge_extracted_contracts(existing_contracts, contracts_data['contracts'])
             
             # ✅ PREPARA METADATA AGGIORNATA
-            now = datetime.now().isoformat()
-            
-            if file_existed:
-                # Aggiorna metadata esistente
-                metadata = existing_metadata.copy()
-                metadata['last_updated'] = now
-                metadata['total_contracts'] = len(updated_contracts)
-                metadata['last_extraction_added_contracts'] = new_contracts_added
-                metadata['extraction_runs'] = metadata.get('extraction_runs', 0) + 1
-            else:
-                # Nuova metadata
-                metadata = {
-                    'version': '1.0',
-                    'created_date': now,
-                    'last_updated': now,
-                    'total_contracts': len(updated_contracts),
-                    'extraction_source': 'FTP_CDR_Files',
-                    'manual_updates': 0,
-                    'extraction_runs': 1,
-                    'last_extraction_added_contracts': new_contracts_added,
-                    'description': 'Configurazione codici contratto estratti da file CDR'
-                }
+            metadata = self._extraction_metadata(existing_metadata if file_existed else None, len(updated_contracts), new_contracts_added)
             
             # ✅ PREPARA DATI FINALI
             final_data = {
                 'metadata': metadata,
                 'contracts': updated_contracts,
-                'last_extraction': {
-                    'timestamp': contracts_data['extraction_timestamp'],
-                    'files_processed': contracts_data['statistics']['total_files_processed'],
-                    'records_processed': contracts_data['statistics']['total_records_processed'],
-                    'new_contracts_added': new_contracts_added,
-                    'existing_contracts_preserved': len(existing_contracts),
-                    'total_contracts_after': len(updated_contracts)
-                }
+                'last_extraction': self._last_extraction_info(contracts_data, new_contracts_added, len(existing_contracts), len(updated_contracts))
             }
             
             # ✅ SALVA FILE AGGIORNATO
-            with open(contracts_file, 'w', encoding='utf-8') as f:
-                json.dump(final_data, f, indent=2, ensure_ascii=False)
+            cdr_json.dump(final_data, contracts_file, pretty=True)
             
             result = {
                 'file_path': str(contracts_file),
@@ -1854,6 +1793,126 @@ class CDRContractsExtractor:
             logger.error(f"❌ Errore salvataggio configurazione contratti: {e}")
             raise
 
+    
+    def _merge_extracted_contracts(self, existing_contracts: Dict[str, Any], new_contracts: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+        """
+        Aggiunge i contratti non presenti; di quelli esistenti aggiorna solo le statistiche tecniche
+        
+        Args:
+            existing_contracts: Contratti già salvati
+            new_contracts: Contratti estratti dai CDR
+            
+        Returns:
+            (contratti uniti, numero di contratti aggiunti)
+        """
+        new_contracts_added = 0
+        updated_contracts = existing_contracts.copy()  # Mantieni tutti i contratti esistenti
+        
+        for contract_code, contract_info in new_contracts.items():
+            if contract_code not in updated_contracts:
+                # ✅ NUOVO CONTRATTO - AGGIUNGILO
+                updated_contracts[contract_code] = contract_info
+                new_contracts_added += 1
+                logger.info(f"➕ Nuovo contratto aggiunto: {contract_code}")
+            else:
+                # ✅ CONTRATTO ESISTENTE - AGGIORNA SOLO STATISTICHE TECNICHE (NON I DATI MANUALI)
+                existing_contract = updated_contracts[contract_code]
+                
+                # Aggiorna solo campi tecnici, mantieni quelli manuali
+                existing_contract['last_seen_file'] = contract_info['last_seen_file']
+                existing_contract['last_seen_date'] = contract_info['last_seen_date']
+                existing_contract['total_calls_found'] = existing_contract.get('total_calls_found', 0) + contract_info['total_calls_found']
+                
+                # Aggiungi nuovo file alla lista se non presente
+                files_list = existing_contract.get('files_found_in', [])
+                if contract_info['last_seen_file'] not in files_list:
+                    files_list.append(contract_info['last_seen_file'])
+                    existing_contract['files_found_in'] = files_list
+                
+                logger.debug(f"🔄 Contratto esistente aggiornato (statistiche): {contract_code}")
+        
+        return updated_contracts, new_contracts_added
+    
+    def _extraction_metadata(self, existing_metadata: Optional[Dict[str, Any]], total_contracts: int, new_contracts_added: int) -> Dict[str, Any]:
+        """
+        Metadati della configurazione contratti dopo un'estrazione
+        
+        Args:
+            existing_metadata: Metadati esistenti (None se la configurazione è nuova)
+            total_contracts: Contratti dopo l'estrazione
+            new_contracts_added: Contratti aggiunti dall'estrazione
+        """
+        now = datetime.now().isoformat()
+        
+        if existing_metadata:
+            # Aggiorna metadata esistente
+            metadata = existing_metadata.copy()
+            metadata['last_updated'] = now
+            metadata['total_contracts'] = total_contracts
+            metadata['last_extraction_added_contracts'] = new_contracts_added
+            metadata['extraction_runs'] = metadata.get('extraction_runs', 0) + 1
+            return metadata
+        
+        # Nuova metadata
+        return {
+            'version': '1.0',
+            'created_date': now,
+            'last_updated': now,
+            'total_contracts': total_contracts,
+            'extraction_source': 'FTP_CDR_Files',
+            'manual_updates': 0,
+            'extraction_runs': 1,
+            'last_extraction_added_contracts': new_contracts_added,
+            'description': 'Configurazione codici contratto estratti da file CDR'
+        }
+    
+    def _last_extraction_info(self, contracts_data: Dict[str, Any], new_contracts_added: int,
+                              contracts_before: int, contracts_after: int) -> Dict[str, Any]:
+        """Riepilogo dell'ultima estrazione salvato insieme ai contratti"""
+        return {
+            'timestamp': contracts_data['extraction_timestamp'],
+            'files_processed': contracts_data['statistics']['total_files_processed'],
+            'records_processed': contracts_data['statistics']['total_records_processed'],
+            'new_contracts_added': new_contracts_added,
+            'existing_contracts_preserved': contracts_before,
+            'total_contracts_after': contracts_after
+        }
+    
+    def _save_contracts_to_store(self, store: ContractStore, contracts_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Salva i contratti estratti nel registro su database
+        
+        Args:
+            store: Registro contratti su database
+            contracts_data: Dati contratti estratti
+            
+        Returns:
+            Dict con risultati operazione e statistiche (come save_contracts_config)
+        """
+        def merge(existing_contracts, new_contracts):
+            return self._merge_extracted_contracts(existing_contracts, new_contracts)[0]
+        
+        def build_state(existing_metadata, merged_contracts, counts):
+            metadata = self._extraction_metadata(existing_metadata or None, counts['after'], counts['added'])
+            return metadata, self._last_extraction_info(contracts_data, counts['added'], counts['before'], counts['after'])
+        
+        result = store.merge_contracts(contracts_data['contracts'], merge, build_state)
+        
+        return {
+            'file_path': str(store.export_path),
+            'file_existed': result['before'] > 0,
+            'contracts_before': result['before'],
+            'new_contracts_added': result['added'],
+            'total_contracts_after': result['after'],
+            'preserved_existing_data': result['before'] > 0
+        }
+
+
+def _extract_codes_worker(file_path: str) -> Optional[Dict[str, Any]]:
+    """Task del pool: estrae contratti e numeri chiamante da un singolo file CDR"""
+    return CDRContractsExtractor().extract_codes_from_single_file(Path(file_path))
+
+
 # Esempio di utilizzo
 if __name__ == "__main__":
     try:
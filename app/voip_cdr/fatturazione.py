@@ -9,6 +9,8 @@ from app.odoo.odoo_subscriptions import OdooSubscriptionManager
 from app.utils.message_tools import return_message
 from pathlib import Path
 from app.utils.env_manager import *
+from app.voip_cdr import cdr_json
+from app.voip_cdr.cdr_reports import CDRContractDetailStore
 # Carica le variabili dal file .env
 # Carica variabili dal file .env (opzionale)
 # try:
@@ -20,7 +22,18 @@ from app.utils.env_manager import *
 #     print("⚠️ python-dotenv non installato - usando solo variabili d'ambiente del sistema")
  
 
-def processa_contratti_attivi(periodo):
+def processa_contratti_attivi(periodo, job=None):
+    """
+    Inserisce il traffico extra soglia dei contratti attivi sugli abbonamenti Odoo
+    
+    Args:
+        periodo (list): Lista di {'anno', 'mese'} (None = mese corrente)
+        job (JobContext): Contesto del job in background per avanzamento e annullamento (opzionale).
+            L'annullamento è possibile solo prima dell'invio in blocco degli addebiti.
+    
+    Returns:
+        dict: Risultato unificato della run
+    """
     # Struttura per raccogliere tutti i risultati
     risultati_unificati = []
     
@@ -28,10 +41,8 @@ def processa_contratti_attivi(periodo):
     elaboratore_instance = ElaborazioneContrattiStandalone()
     contract_file = Path(ARCHIVE_DIRECTORY)  / CONTACTS_FOLDER / CONTACT_FILE
     elaboratore_instance.load_contracts_from_file(contract_file)
-    result = elaboratore_instance.elabora_tutti_contratti_standalone()
-    result = [c for c in result['results'] if c.get('status') == 'processed']
-    # return
-    json_data = result
+    # Solo i contratti fatturabili, dall'indice del registro contratti
+    json_data = elaboratore_instance.elabora_contratti_fatturabili()
     
     # Periodo corrente
     oggi = datetime.now()
@@ -54,10 +65,24 @@ def processa_contratti_attivi(periodo):
     # Processa ogni contratto
     # results = data.get('results', [])
     results = data
-    for item in results:
+    
+    # Indice abbonamenti della run: una sola interrogazione Odoo per tutti i contratti
+    from app.odoo.odoo_manager import get_odoo_manager
+    subscription_index = get_odoo_manager().subscriptions.build_subscription_index(
+        [int(item.get('contract_type')) for item in results]
+    )
+    if subscription_index is None:
+        message_return = return_message(False, None, str('Errore nel recupero dei dati da Odoo'))
+        return message_return
+    
+    addebiti_pendenti = []
+    for index, item in enumerate(results):
+        if job is not None:
+            job.check_cancelled()
+            job.progress(100 * index / len(results), f'Contratto {index + 1} di {len(results)}')
         # print(item.get('contract_type'))
         # return
-        response = OdooSubscriptionManager.verifica_abbonamento(int(item.get('contract_type')), '')
+        response = OdooSubscriptionManager.verifica_abbonamento(int(item.get('contract_type')), '', subscription_index)
         response = json.dumps(response[0])
         if isinstance(response, str):
             response_data = json.loads(response)
@@ -79,7 +104,8 @@ def processa_contratti_attivi(periodo):
                 contract_code, 
                 periodi_corrente, 
                 contract_type, 
-                odoo_id
+                odoo_id,
+                addebiti_pendenti
             )
             # Aggiunge info del contratto al risultato
             if not risultato_contratto is None:
@@ -104,6 +130,12 @@ def processa_contratti_attivi(periodo):
             # print("Campo 'success' non trovato")
             return            
     
+    # Invio in blocco di tutti gli addebiti della run
+    if job is not None:
+        job.check_cancelled()
+        job.progress(95, f'Invio di {len(addebiti_pendenti)} addebiti a Odoo', force=True)
+    applica_addebiti_pendenti(addebiti_pendenti)
+    
     # JSON finale unificato
     json_finale = {
         "success":True,
@@ -118,6 +150,74 @@ def processa_contratti_attivi(periodo):
     return json_finale
 
 
+def applica_addebiti_pendenti(addebiti_pendenti):
+    """
+    Invia a Odoo in un'unica operazione gli addebiti accodati da elabora_cdr
+    
+    Ogni esito viene riportato nel risultato del contratto di provenienza
+    (risposte_api o errori) e solo i report addebitati con successo vengono
+    marcati come elaborati.
+    
+    Args:
+        addebiti_pendenti (list): Addebiti raccolti da elabora_cdr(addebiti_pendenti=...)
+    
+    Returns:
+        dict: Riepilogo di Abbonamenti.aggiungi_addebiti_batch o None se non ci sono addebiti
+    """
+    if not addebiti_pendenti:
+        return None
+    
+    from app.odoo.odoo_abbonamenti import Abbonamenti
+    batch_result = Abbonamenti().aggiungi_addebiti_batch(addebiti_pendenti)
+    
+    for addebito, result_singolo in zip(addebiti_pendenti, batch_result['risultati']):
+        risultato = addebito['risultato']
+        periodo = addebito['periodo']
+        
+        if result_singolo.get('success'):
+            risultato['risposte_api'].append({
+                "periodo": periodo,
+                "nome_file": addebito['nome_file'],
+                "odoo_id": addebito['odoo_id'],
+                "contract_type": addebito['contract_type'],
+                "response_data": result_singolo,
+                "success": True
+            })
+            try:
+                add_elaborato_to_metadata(addebito['json_file'])
+                risultato['error_message'] = str(f'Fattura generata con successo per {periodo}')
+            except Exception as e:
+                # Addebito inviato ma non segnato: va verificato prima di una nuova fatturazione
+                risultato['errori'].append({
+                    "periodo": periodo,
+                    "nome_file": addebito['nome_file'],
+                    "odoo_id": addebito['odoo_id'],
+                    "contract_type": addebito['contract_type'],
+                    "error": f'Fattura generata ma stato elaborato non salvato: {e}',
+                    "status_code": None,
+                    "success": False
+                })
+                risultato['success'] = False
+                risultato['error_message'] = str(f'Fattura generata per {periodo} ma stato elaborato non salvato: {e}')
+        else:
+            risultato['errori'].append({
+                "periodo": periodo,
+                "nome_file": addebito['nome_file'],
+                "odoo_id": addebito['odoo_id'],
+                "contract_type": addebito['contract_type'],
+                "error": result_singolo.get('error'),
+                "status_code": None,
+                "success": False
+            })
+            risultato['success'] = False
+            risultato['error_message'] = str(f'Errore nella richiesta per {periodo}: {result_singolo.get("error")}')
+        
+        risultato['riepilogo']['chiamate_api_riuscite'] = len(risultato['risposte_api'])
+        risultato['riepilogo']['chiamate_api_fallite'] = len(risultato['errori'])
+    
+    return batch_result
+
+
 #RECUPERO LE INFORMAZIONI PER LA FATTURAZIONE
 def leggi_json_report(nome_file, anno=None, mese=None):
     """
@@ -153,6 +253,17 @@ def leggi_json_report(nome_file, anno=None, mese=None):
     if len(mese) == 1:
         mese = mese.zfill(2)
     
+    # Dettaglio indicizzato del mese: legge solo la riga del contratto
+    store = CDRContractDetailStore.for_month(anno, mese, cartella_principale)
+    try:
+        dati = store.read(nome_file)
+    except Exception as e:
+        message_return = str(f'Errore nella lettura del dettaglio contratti: {e}')
+        return None
+    if dati is not None:
+        return [dati, store.ref(nome_file)]
+    
+    # Formato precedente: un file per contratto
     # Costruisce il percorso completo
     percorso_file = os.path.join(
         cartella_principale,
@@ -214,9 +325,9 @@ def ottieni_cartelle_mesi(cartella_anno):
 
 
 
-def elabora_cdr(nome_file, periodi=None, contract_type=None, odoo_id=None):
+def elabora_cdr(nome_file, periodi=None, contract_type=None, odoo_id=None, addebiti_pendenti=None):
     from app.odoo.odoo_abbonamenti import Abbonamenti
-    abbonamenti = Abbonamenti()
+    abbonamenti = Abbonamenti() if addebiti_pendenti is None else None
     """
     Processa file JSON per più periodi e restituisce tutte le risposte API
     
@@ -227,6 +338,8 @@ def elabora_cdr(nome_file, periodi=None, contract_type=None, odoo_id=None):
                                  Se None, elabora l'anno corrente
         contract_type (str, optional): Tipo di contratto. Se None, usa un valore di default
         odoo_id (int, optional): ID Odoo. Se None, salta le operazioni che lo richiedono
+        addebiti_pendenti (list, optional): Se fornita, gli addebiti non vengono inviati
+                                 subito ma accodati qui per applica_addebiti_pendenti()
     
     Returns:
         dict: Dizionario contenente tutti i risultati e le risposte API
@@ -263,6 +376,7 @@ def elabora_cdr(nome_file, periodi=None, contract_type=None, odoo_id=None):
     fatturaData = []
     api_responses = []  
     errori = []         
+    pendenti = []
     success = True
     message_return = ''
     for periodo in periodi:
@@ -370,6 +484,21 @@ def elabora_cdr(nome_file, periodi=None, contract_type=None, odoo_id=None):
                                 message_return = str(f'Saltando operazioni di fatturazione per {mese}/{anno} (odoo_id non fornito)')
                                 continue
                             
+                            if addebiti_pendenti is not None:
+                                # Addebito accodato: verrà inviato in blocco a fine run
+                                pendenti.append({
+                                    "periodo": f"{mese}/{anno}",
+                                    "nome_file": nome_file,
+                                    "odoo_id": odoo_id,
+                                    "contract_code": nome_file,
+                                    "contract_type": contract_type,
+                                    "importo": costo_cliente_totale_euro,
+                                    "descrizione": costo_cliente_totale_euro_by_category,
+                                    "json_file": json_file
+                                })
+                                message_return = str(f'Addebito accodato per {mese}/{anno}')
+                                continue
+                            
                             result_singolo = abbonamenti.aggiungi_addebito_singolo(
                                 contract_code = nome_file,
                                 contract_type = contract_type,
@@ -394,6 +523,20 @@ def elabora_cdr(nome_file, periodi=None, contract_type=None, odoo_id=None):
                                 success = True
                                 message_return = str(f'Fattura generata con successo per {mese}/{anno}')
 
+                            except RuntimeError as e:
+                                # Addebito inviato ma non segnato: va verificato prima di una nuova fatturazione
+                                errori.append({
+                                    "periodo": f"{mese}/{anno}",
+                                    "nome_file": nome_file,
+                                    "odoo_id": odoo_id,
+                                    "contract_type": contract_type,
+                                    "error": f'Fattura generata ma stato elaborato non salvato: {e}',
+                                    "status_code": None,
+                                    "success": False
+                                })
+                                success = False
+                                message_return = str(f'Fattura generata per {mese}/{anno} ma stato elaborato non salvato: {e}')
+
                             except requests.exceptions.RequestException as e:
                                 # ⭐ Salva l'errore
                                 error_item = {
@@ -440,6 +583,12 @@ def elabora_cdr(nome_file, periodi=None, contract_type=None, odoo_id=None):
         "success": success
     }
     
+    # Collega gli addebiti accodati al risultato del contratto
+    if addebiti_pendenti is not None:
+        for addebito in pendenti:
+            addebito['risultato'] = risultato_finale
+        addebiti_pendenti.extend(pendenti)
+    
     # # Stampa riepilogo
     # print(f"\n--- RIEPILOGO ---")
     # print(f"Periodi processati: {risultato_finale['riepilogo']['periodi_processati']}")
@@ -454,14 +603,27 @@ def add_elaborato_to_metadata(json_file_path, output_file_path=None):
     Aggiunge il campo 'elaborato' al metadata del JSON report
     
     Args:
-        json_file_path (str): Percorso del file JSON di input
+        json_file_path (str): Percorso del file JSON di input, oppure riferimento
+                              restituito da leggi_json_report per il dettaglio indicizzato
         output_file_path (str, optional): Percorso del file di output. 
                                         Se None, sovrascrive il file originale
     
     Returns:
         dict: Il JSON modificato
+    
+    Raises:
+        RuntimeError: Se il contratto non è presente nel dettaglio indicizzato
+                      e lo stato non può essere salvato
     """
     
+    # Dettaglio indicizzato: lo stato viene salvato nell'indice del mese
+    detail_ref = CDRContractDetailStore.from_ref(json_file_path)
+    if detail_ref is not None:
+        store, contract_id = detail_ref
+        if not store.mark_elaborato(contract_id):
+            raise RuntimeError(f"Impossibile segnare come elaborato il contratto {contract_id} in {store.directory}")
+        return store.read(contract_id)
+    
     # Leggi il file JSON
     with open(json_file_path, 'r', encoding='utf-8') as file:
         data = json.load(file)
@@ -478,8 +640,7 @@ def add_elaborato_to_metadata(json_file_path, output_file_path=None):
         output_file_path = json_file_path
     
     # Scrivi il file JSON modificato
-    with open(output_file_path, 'w', encoding='utf-8') as file:
-        json.dump(data, file, indent=2, ensure_ascii=False)
+    cdr_json.dump(data, output_file_path)
     
     message_return = str(f'Campo \'elaborato\' aggiunto con successo al metadata. File salvato in: {output_file_path}')
     # print(f"Campo 'elaborato' aggiunto con successo al metadata")
@@ -14,6 +14,8 @@ import json
 from collections import OrderedDict
 from flask import render_template, request, jsonify, redirect, url_for, Response
 from app.utils.env_manager import *
+from app.voip_cdr.cdr_scan import CDRScanner, CDRRawRecordSink
+from app.voip_cdr import cdr_json
 # Utility varie
 from app.utils.utils import extract_data_from_api
 #Gestione log
@@ -468,10 +470,15 @@ class FTPDownloader:
         logger.info(f"Pattern '{pattern_type}' -> '{result}'")
         return result
     
-    def convert_to_json(self, file_path):
+    def convert_to_json(self, file_path, sinks=None):
         """
         Converte un file in formato JSON
         Supporta CSV, TXT, Excel, e file CDR
+        
+        Args:
+            file_path: File da convertire
+            sinks: Sink CDRScanner aggiuntivi (es. CDRContractSink) alimentati nella
+                   stessa lettura dei file CDR
         """
         try:
             file_path = Path(file_path)
@@ -485,64 +492,10 @@ class FTPDownloader:
             
             # Controlla se è un file CDR (Call Detail Record) basandosi sul nome o estensione
             if file_extension == '.cdr' or 'CDR' in file_path.name.upper():
-                # File CDR - parsing personalizzato
-                cdr_headers = [
-                    'data_ora_chiamata',
-                    'numero_chiamante', 
-                    'numero_chiamato',
-                    'durata_secondi',
-                    'tipo_chiamata',
-                    'operatore',
-                    'costo_euro',
-                    'codice_contratto',
-                    'codice_servizio',
-                    'cliente_finale_comune',
-                    'prefisso_chiamato'
-                ]
-                
-                data = []
-                with open(file_path, 'r', encoding='cp1252') as f:
-                    for line_num, line in enumerate(f, 1):
-                        line = line.strip()
-                        if line:  # Ignora righe vuote
-                            fields = line.split(';')
-                            
-                            # Assicurati che ci siano abbastanza campi
-                            while len(fields) < len(cdr_headers):
-                                fields.append('')
-                            
-                            # Crea record con conversioni di tipo appropriate
-                            record = {}
-                            for i, header in enumerate(cdr_headers):
-                                if i < len(fields):
-                                    value = fields[i].strip()
-                                    
-                                    # Conversioni di tipo specifiche
-                                    if header == 'durata_secondi':
-                                        try:
-                                            record[header] = int(value) if value else 0
-                                        except ValueError:
-                                            record[header] = 0
-                                    elif header == 'costo_euro':
-                                        try:
-                                            record[header] = float(value.replace(',', '.')) if value else 0.0
-                                        except ValueError:
-                                            record[header] = 0.0
-                                    elif header in ['codice_contratto', 'codice_servizio']:
-                                        try:
-                                            record[header] = int(value) if value else 0
-                                        except ValueError:
-                                            record[header] = 0
-                                    else:
-                                        record[header] = value
-                                else:
-                                    record[header] = ''
-                            
-                            # Aggiungi metadati utili
-                            record['record_number'] = line_num
-                            record['raw_line'] = line
-                            
-                            data.append(record)
+                # File CDR - lettura unica tramite lo scanner condiviso,
+                # che alimenta anche gli eventuali sink aggiuntivi
+                scanner = CDRScanner([CDRRawRecordSink()] + list(sinks or []), encoding='cp1252')
+                data = list(scanner.iter_file(file_path))
                 
                 logger.info(f"File CDR processato: {len(data)} record trovati")
             
@@ -632,8 +585,7 @@ class FTPDownloader:
                 final_data = data
             
             # Salva il file JSON
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(final_data, f, indent=2, ensure_ascii=False)
+            cdr_json.dump(final_data, json_path)
             
             logger.info(f"File convertito in JSON: {json_path}")
             return str(json_path)
@@ -6,6 +6,8 @@ from datetime import datetime
 from collections import defaultdict, Counter
 import statistics
 from app.utils.env_manager import *
+from app.voip_cdr.cdr_parallel import CDRParallelReader
+from app.voip_cdr import cdr_json
 
 try:
     from dotenv import load_dotenv
@@ -662,8 +664,7 @@ def _generate_global_summary(contracts: Dict) -> Dict[str, Any]:
 
 def save_unified_data(unified_data: Dict, output_path: str) -> None:
     """Salva i dati unificati in un file JSON."""
-    with open(output_path, 'w', encoding='utf-8') as file:
-        json.dump(unified_data, file, indent=2, ensure_ascii=False)
+    cdr_json.dump(unified_data, output_path)
 
 
 def print_summary(unified_data: Dict) -> None:
@@ -1071,8 +1072,7 @@ def export_contracts_to_files(unified_data: Dict[str, Any], ARCHIVE_DIRECTORY: s
             }
             
             # Salva il file JSON
-            with open(file_path, 'w', encoding='utf-8') as file:
-                json.dump(single_contract_data, file, indent=2, ensure_ascii=False)
+            cdr_json.dump(single_contract_data, file_path)
             
             created_files[contract_id] = str(file_path)
             # print(f"✅ Contratto {contract_id} esportato: {file_path}")
@@ -1133,8 +1133,7 @@ def export_single_contract(unified_data: Dict[str, Any], contract_id: str,
         }
         
         # Salva il file JSON
-        with open(output_file_path, 'w', encoding='utf-8') as file:
-            json.dump(single_contract_data, file, indent=2, ensure_ascii=False)
+        cdr_json.dump(single_contract_data, output_file_path)
         
         print(f"✅ Contratto {contract_id} esportato: {output_file_path}")
         return True
@@ -1196,8 +1195,7 @@ def export_contracts_summary(unified_data: Dict[str, Any], output_file_path: str
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
         # Salva il file JSON
-        with open(output_file_path, 'w', encoding='utf-8') as file:
-            json.dump(summary_data, file, indent=2, ensure_ascii=False)
+        cdr_json.dump(summary_data, output_file_path)
         
         print(f"✅ Riepilogo contratti esportato: {output_file_path}")
         return True
@@ -1289,8 +1287,22 @@ def convert_cdr_to_json(input_file_path: str, output_file_path: Optional[str] =
     return json_data
 
 
+def _convert_cdr_task(task: tuple) -> Optional[str]:
+    """
+    Task del pool di convert_multiple_cdr_to_json: converte un file e restituisce
+    il percorso del JSON creato (None in caso di errore).
+    """
+    input_file, output_file, encoding = task
+    try:
+        convert_cdr_to_json(input_file, output_file, encoding)
+        return output_file
+    except Exception as e:
+        print(f"❌ Errore nella conversione di '{input_file}': {e}")
+        return None
+
+
 def convert_multiple_cdr_to_json(input_files: List[str], ARCHIVE_DIRECTORY: str, 
-                                encoding: str = 'utf-8') -> Dict[str, str]:
+                                encoding: str = 'utf-8', workers: Optional[int] = None) -> Dict[str, str]:
     """
     Converte più file CDR in formato JSON.
     
@@ -1298,32 +1310,32 @@ def convert_multiple_cdr_to_json(input_files: List[str], ARCHIVE_DIRECTORY: str,
         input_files: Lista dei percorsi dei file CDR da convertire
         ARCHIVE_DIRECTORY: Directory dove salvare i file JSON
         encoding: Encoding dei file CDR (default: utf-8)
+        workers: Processi per la conversione parallela (None = CDR_PARSE_WORKERS, 1 = seriale).
+                 Con file piccoli la conversione resta seriale.
         
     Returns:
-        Dict con mapping file_cdr -> file_json_creato
+        Dict con mapping file_cdr -> file_json_creato (nell'ordine di input_files)
     """
-    
     # Crea la directory di output se non esiste
     output_path = Path(ARCHIVE_DIRECTORY)
     output_path.mkdir(parents=True, exist_ok=True)
     
-    converted_files = {}
+    # Genera il nome del file JSON per ogni file CDR
+    tasks = [
+        (input_file, str(output_path / (Path(input_file).stem + '.json')), encoding)
+        for input_file in input_files
+    ]
     
-    for input_file in input_files:
-        try:
-            input_path = Path(input_file)
-            
-            # Genera il nome del file JSON
-            json_filename = input_path.stem + '.json'
-            output_file = output_path / json_filename
-            
-            # Converte il file
-            convert_cdr_to_json(input_file, str(output_file), encoding)
-            converted_files[input_file] = str(output_file)
-            
-        except Exception as e:
-            print(f"❌ Errore nella conversione di '{input_file}': {e}")
-            continue
+    reader = CDRParallelReader(workers)
+    if reader.should_parallelize(input_files):
+        results = reader.map(_convert_cdr_task, tasks)
+    else:
+        results = [_convert_cdr_task(task) for task in tasks]
+    
+    converted_files = {}
+    for (input_file, _output_file, _encoding), output_file in zip(tasks, results):
+        if output_file:
+            converted_files[input_file] = output_file
     
     # print(f"\n📊 RIEPILOGO CONVERSIONE:")
     # print(f"File processati: {len(input_files)}")
@@ -1432,8 +1444,7 @@ def _save_json_file(data: Dict[str, Any], output_path: str) -> None:
         Path(output_path).parent.mkdir(parents=True, exist_ok=True)
         
         # Salva il file JSON
-        with open(output_path, 'w', encoding='utf-8') as file:
-            json.dump(data, file, indent=2, ensure_ascii=False)
+        cdr_json.dump(data, output_path)
             
     except Exception as e:
         raise ValueError(f"Errore nel salvataggio del file JSON '{output_path}': {e}")